@@ -1,22 +1,120 @@
+"""
+应用包
+
+导入本包不加载 FastAPI 与各路由模块：多进程模式的主进程只需要配置和日志，
+工作进程在 create_app 中才导入完整的应用。
+"""
+import asyncio
 import logging
-from fastapi import FastAPI
-from fastapi.middleware.cors import CORSMiddleware
-from app.api.endpoints import chat
-from app.core.config import settings
-
-# 配置日志
-logging.basicConfig(
-    level=getattr(logging, settings.LOG_LEVEL.upper()),
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+import signal
+import time
+from contextlib import asynccontextmanager
+from typing import TYPE_CHECKING
+
+from app.core.config import log_settings_summary, settings
+
+if TYPE_CHECKING:
+    from fastapi import FastAPI
+
 logger = logging.getLogger(__name__)
 
-def create_app() -> FastAPI:
+
+def configure_logging():
+    """配置日志：根日志器通过非阻塞管道输出（重复调用无副作用）"""
+    from app.core.log_pipeline import log_pipeline
+    log_pipeline.install(
+        level=settings.LOG_LEVEL,
+        fmt=settings.LOG_FORMAT,
+        queue_size=settings.LOG_QUEUE_SIZE,
+        sample_rates=settings.LOG_SAMPLE_RATES,
+        message_max_chars=settings.LOG_MESSAGE_MAX_CHARS,
+    )
+
+
+async def warmup(app: "FastAPI"):
+    """预热：导入流式响应用到的模块并预先建立上游连接，完成前 /health 报告未就绪"""
+    from starlette.concurrency import run_in_threadpool
+    from app.services.agent_service import agent_service
+
+    started = time.perf_counter()
+    try:
+        import sse_starlette.sse  # noqa: F401
+        connected = await run_in_threadpool(
+            agent_service.warmup, settings.SERVER_WARMUP_CONNECTIONS, settings.SERVER_WARMUP_TIMEOUT
+        )
+        logger.info("预热完成: 建立 %d/%d 个上游连接，耗时 %.0f ms",
+                    connected, settings.SERVER_WARMUP_CONNECTIONS, (time.perf_counter() - started) * 1000)
+    except Exception as e:
+        logger.warning("预热失败: %s", e)
+    finally:
+        app.state.warming = False
+
+
+def reload_from_signal():
+    """收到 SIGHUP 时重新加载可调参数，校验失败时保持原配置"""
+    from app.core.tunables import ReloadError, reload_settings
+    try:
+        reload_settings()
+    except ReloadError as e:
+        logger.error("重新加载配置失败，保持原配置: %s", e)
+
+
+def install_reload_handler() -> bool:
+    """在当前事件循环上注册 SIGHUP 处理器，重新加载在线程池中进行；非主线程或平台不支持时返回 False"""
+    if not hasattr(signal, "SIGHUP"):
+        return False
+    loop = asyncio.get_running_loop()
+    try:
+        loop.add_signal_handler(signal.SIGHUP, lambda: loop.run_in_executor(None, reload_from_signal))
+    except (RuntimeError, ValueError, NotImplementedError):
+        return False
+    return True
+
+
+@asynccontextmanager
+async def lifespan(app: "FastAPI"):
+    """应用生命周期：启动和停止后台任务"""
+    from app.api.endpoints import batches
+    from app.services.runtime_monitor import runtime_monitor
+    from app.services.usage_ledger import usage_ledger
+    if settings.MONITOR_ENABLED:
+        runtime_monitor.start(settings.MONITOR_INTERVAL, settings.LOOP_LAG_THRESHOLD)
+    if settings.USAGE_ENABLED:
+        usage_ledger.start(settings.USAGE_FILE, settings.USAGE_FLUSH_INTERVAL)
+    batches.resume_batches()
+    warmup_task = None
+    if settings.SERVER_WARMUP:
+        app.state.warming = True
+        warmup_task = asyncio.create_task(warmup(app))
+    reload_handler = install_reload_handler()
+    yield
+    if reload_handler:
+        asyncio.get_running_loop().remove_signal_handler(signal.SIGHUP)
+    if warmup_task is not None:
+        warmup_task.cancel()
+    await runtime_monitor.stop()
+    # 写出尚未落盘的用量
+    usage_ledger.stop()
+
+
+def create_app() -> "FastAPI":
     """创建 FastAPI 应用实例"""
+    from fastapi import FastAPI
+    from fastapi.middleware.cors import CORSMiddleware
+    from fastapi.responses import JSONResponse
+    from app.api.endpoints import admin, batches, chat, jobs, ws
+    from app.core.compression import CompressionMiddleware, compression_stats
+    from app.core.drain import DrainMiddleware, drain_controller
+    from app.core.log_pipeline import CorrelationIdMiddleware, log_pipeline
+    from app.services.runtime_monitor import InflightMiddleware, runtime_monitor
+
+    configure_logging()
+    log_settings_summary()
     app = FastAPI(
         title="Agent API",
         description="OpenAI 风格的 Agent API",
-        version="1.0.0"
+        version="1.0.0",
+        lifespan=lifespan
     )
     
     # 添加 CORS 中间件
@@ -28,8 +126,30 @@ def create_app() -> FastAPI:
         allow_headers=["*"],
     )
     
+    # 响应压缩（SSE 按事件刷新）
+    if settings.COMPRESSION_ENABLED:
+        app.add_middleware(
+            CompressionMiddleware,
+            encodings=settings.COMPRESSION_ENCODINGS,
+            min_size=settings.COMPRESSION_MIN_SIZE
+        )
+    
+    # drain 状态下拒绝新请求
+    app.add_middleware(DrainMiddleware, controller=drain_controller)
+    
+    # 登记在途请求，事件循环阻塞告警据此列出可能的路由
+    if settings.MONITOR_ENABLED:
+        app.add_middleware(InflightMiddleware, monitor=runtime_monitor)
+    
+    # 请求关联 ID（最外层，所有日志都带有该 ID）
+    app.add_middleware(CorrelationIdMiddleware)
+    
     # 注册路由
     app.include_router(chat.router, prefix="/v1", tags=["chat"])
+    app.include_router(ws.router, prefix="/v1", tags=["chat"])
+    app.include_router(jobs.router, prefix="/v1", tags=["jobs"])
+    app.include_router(batches.router, prefix="/v1", tags=["batches"])
+    app.include_router(admin.router, prefix="/admin", tags=["admin"])
     
     # 健康检查和根路由
     @app.get("/")
@@ -38,14 +158,41 @@ def create_app() -> FastAPI:
     
     @app.get("/health")
     async def health():
+        if drain_controller.draining:
+            return JSONResponse(
+                status_code=503,
+                content={"status": "draining", **drain_controller.snapshot()}
+            )
+        if getattr(app.state, "warming", False):
+            return JSONResponse(status_code=503, content={"status": "warming_up"})
         return {"status": "healthy"}
     
     @app.get("/stats")
     async def stats():
+        from app.core.deadline import deadline_stats
         from app.services.agent_service import agent_service
+        from app.services.context_compactor import context_compactor
+        from app.services.job_service import job_service
+        from app.services.prompt_cache import prompt_cache
+        from app.services.prompt_index import prompt_index
+        from app.services.runtime_monitor import runtime_monitor
+        from app.services.stream_buffer import stream_registry
+        from app.services.usage_ledger import usage_ledger
+        session_count = len(agent_service.sessions)
         return {
-            "active_conversations": len(agent_service.conversations),
-            "total_conversations": len(agent_service.conversation_timestamps)
+            "active_conversations": session_count,
+            "total_conversations": session_count,
+            "runtime": runtime_monitor.snapshot(),
+            "drain": drain_controller.snapshot(),
+            "stream_buffer": stream_registry.snapshot(),
+            "jobs": job_service.snapshot(),
+            "context": context_compactor.snapshot(),
+            "prompts": prompt_index.snapshot(),
+            "prompt_cache": prompt_cache.snapshot(),
+            "deadlines": deadline_stats.snapshot(),
+            "compression": compression_stats.snapshot(),
+            "logging": log_pipeline.snapshot(),
+            "usage": usage_ledger.snapshot()
         }
     
     return app 
@@ -0,0 +1,48 @@
+import os
+from typing import Optional
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import PlainTextResponse
+from starlette.concurrency import run_in_threadpool
+
+from app.core.auth import get_admin_dependency
+from app.core.tunables import ReloadError, reload_settings
+from app.services.profiler import profiler
+from app.services.usage_ledger import usage_ledger
+
+router = APIRouter()
+
+# 管理接口认证依赖
+dependencies = get_admin_dependency()
+
+
+@router.get("/profile", response_class=PlainTextResponse, dependencies=dependencies)
+async def profile(
+    seconds: float = Query(5.0, gt=0, le=60, description="采样时长（秒）"),
+    interval_ms: float = Query(5.0, ge=1, le=1000, description="采样间隔（毫秒）"),
+    route: Optional[str] = Query(None, description="仅采样正在处理该路由的线程，如 /v1/chat/completions"),
+    include_idle: bool = Query(False, description="是否包含空闲等待的线程栈"),
+):
+    """对运行中的进程进行采样分析，返回 collapsed stacks（可用于生成火焰图）"""
+    try:
+        counts = await run_in_threadpool(
+            profiler.profile, seconds, interval_ms / 1000, route, include_idle
+        )
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return PlainTextResponse(profiler.format_collapsed(counts))
+
+
+@router.post("/reload", dependencies=dependencies)
+async def reload():
+    """重新读取配置文件并切换可调参数（仅作用于处理该请求的进程，多进程模式请向主进程发送 SIGHUP）"""
+    try:
+        report = await run_in_threadpool(reload_settings)
+    except ReloadError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"pid": os.getpid(), **report}
+
+
+@router.get("/usage", dependencies=dependencies)
+async def usage():
+    """本进程启动以来按模型与调用方（API 密钥摘要）汇总的用量"""
+    return {"pid": os.getpid(), **usage_ledger.snapshot(by_caller=True)}
@@ -0,0 +1,123 @@
+import uuid
+from typing import Dict, Optional
+from fastapi import APIRouter, File, Form, Header, HTTPException, Query, UploadFile
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
+
+from app.core.auth import ANONYMOUS_CALLER, caller_key, get_auth_dependency
+from app.core.config import settings
+from app.models.batch import Batch, BatchCreateRequest, BatchList, FileObject
+from app.models.chat import ChatCompletionRequest
+from app.services.batch_service import batch_service
+from app.api.endpoints.chat import format_messages_for_agent, run_blocking_completion
+from app.utils.text import check_stop
+
+router = APIRouter()
+
+# 获取认证依赖
+dependencies = get_auth_dependency()
+
+# 文件与批处理记录了创建方，不在响应中返回
+HIDDEN_FIELDS = {"caller"}
+
+
+def execute_batch_request(body: Dict, caller: Optional[str]) -> Dict:
+    """以批处理创建方的身份执行单个聊天完成请求（批处理中始终使用非流式），用量计入创建方"""
+    request = ChatCompletionRequest(**body)
+    if not request.messages:
+        raise ValueError("消息列表不能为空")
+    if request.n > settings.MAX_CHOICES:
+        raise ValueError(f"n 不能超过 {settings.MAX_CHOICES}")
+    check_stop(request.stop)
+    result = run_blocking_completion(
+        request,
+        str(uuid.uuid4()),
+        format_messages_for_agent(request.messages),
+        f"chatcmpl-{uuid.uuid4().hex}",
+        caller or ANONYMOUS_CALLER
+    )
+    return result.model_dump()
+
+
+def resume_batches():
+    """启动时继续执行未完成的批处理"""
+    batch_service.resume(execute_batch_request)
+
+
+@router.post("/files", response_model=FileObject, response_model_exclude=HIDDEN_FIELDS, dependencies=dependencies)
+async def upload_file(
+    file: UploadFile = File(...),
+    purpose: str = Form("batch"),
+    authorization: Optional[str] = Header(None)
+):
+    """上传批处理输入文件（JSONL）"""
+    return await run_in_threadpool(
+        batch_service.save_file, file.file, file.filename or "input.jsonl", purpose, caller_key(authorization)
+    )
+
+
+@router.get("/files/{file_id}", response_model=FileObject, response_model_exclude=HIDDEN_FIELDS,
+            dependencies=dependencies)
+async def get_file(file_id: str, authorization: Optional[str] = Header(None)):
+    """获取文件信息（只能访问本调用方的文件）"""
+    file_obj = batch_service.get_file(file_id, caller_key(authorization))
+    if file_obj is None:
+        raise HTTPException(status_code=404, detail="文件不存在")
+    return file_obj
+
+
+@router.get("/files/{file_id}/content", dependencies=dependencies)
+async def get_file_content(file_id: str, authorization: Optional[str] = Header(None)):
+    """下载文件内容（批处理进行中也可下载已完成的部分，只包含此刻已写完的行）"""
+    snapshot = await run_in_threadpool(batch_service.file_snapshot, file_id, caller_key(authorization))
+    if snapshot is None:
+        raise HTTPException(status_code=404, detail="文件不存在")
+    path, length = snapshot
+    return StreamingResponse(
+        batch_service.read_range(path, length),
+        media_type="application/jsonl",
+        headers={"Content-Length": str(length)}
+    )
+
+
+@router.post("/batches", response_model=Batch, response_model_exclude=HIDDEN_FIELDS, dependencies=dependencies)
+async def create_batch(request: BatchCreateRequest, authorization: Optional[str] = Header(None)):
+    """创建批处理任务"""
+    try:
+        return await run_in_threadpool(
+            batch_service.create_batch,
+            request.input_file_id,
+            request.completion_window,
+            request.metadata,
+            execute_batch_request,
+            caller_key(authorization)
+        )
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+
+@router.get("/batches", response_model=BatchList, response_model_exclude={"data": {"__all__": HIDDEN_FIELDS}},
+            dependencies=dependencies)
+async def list_batches(limit: int = Query(20, ge=1, le=100), authorization: Optional[str] = Header(None)):
+    """列出本调用方最近的批处理任务"""
+    return BatchList(data=await run_in_threadpool(batch_service.list_batches, caller_key(authorization), limit))
+
+
+@router.get("/batches/{batch_id}", response_model=Batch, response_model_exclude=HIDDEN_FIELDS,
+            dependencies=dependencies)
+async def get_batch(batch_id: str, authorization: Optional[str] = Header(None)):
+    """获取批处理状态与进度"""
+    batch = batch_service.get_batch(batch_id, caller_key(authorization))
+    if batch is None:
+        raise HTTPException(status_code=404, detail="批处理不存在")
+    return batch
+
+
+@router.post("/batches/{batch_id}/cancel", response_model=Batch, response_model_exclude=HIDDEN_FIELDS,
+             dependencies=dependencies)
+async def cancel_batch(batch_id: str, authorization: Optional[str] = Header(None)):
+    """取消批处理"""
+    batch = batch_service.cancel_batch(batch_id, caller_key(authorization))
+    if batch is None:
+        raise HTTPException(status_code=404, detail="批处理不存在")
+    return batch
@@ -1,28 +1,68 @@
+import contextvars
+import queue
+import threading
 import time
 import uuid
-from typing import List
-from fastapi import APIRouter, HTTPException, Response
-from sse_starlette.sse import ServerSentEvent, EventSourceResponse
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import TYPE_CHECKING, Callable, Iterator, List, Optional, Sequence, Union
+from fastapi import APIRouter, Header, HTTPException, Request, Response
+from starlette.concurrency import run_in_threadpool
 
 from app.models.chat import (
     ModelList, ModelCard, ChatCompletionRequest, ChatCompletionResponse,
     ChatCompletionResponseChoice, ChatCompletionResponseStreamChoice,
     ChatMessage, DeltaMessage
 )
-from app.services.agent_service import agent_service
-from app.core.auth import get_auth_dependency
+from app.models.slim import SlimChatRequest, SlimMessage, parse_chat_request
+from app.core.drain import drain_controller
+from app.services.agent_service import UpstreamError, agent_service
+from app.services.context_compactor import context_compactor
+from app.services.profiler import profiler
+from app.services.prompt_cache import cache_key, prompt_cache
+from app.services.prompt_index import prompt_index
+from app.services.runtime_monitor import runtime_monitor
+from app.services.stream_buffer import BufferedStream, StreamCapacityError, stream_registry
+from app.services.usage_ledger import make_usage, record_usage
+from app.core.auth import ANONYMOUS_CALLER, caller_key, get_auth_dependency
+from app.core.config import settings
+from app.core.deadline import (
+    TIMEOUT_HEADER, DeadlineExceeded, check_deadline, deadline_expired, deadline_var, request_deadline
+)
+from app.utils.text import CompletionLimiter, TokenCounter, check_stop, estimate_tokens
+
+if TYPE_CHECKING:
+    from sse_starlette.sse import EventSourceResponse
 
 router = APIRouter()
 
+# 用于采样分析按路由过滤的标记
+CHAT_COMPLETIONS_ROUTE = "/v1/chat/completions"
+
+# n > 1 时合并各选择增量的队列容量，以及队列已满时重新检查合并是否已结束的间隔（秒）
+MERGE_QUEUE_SIZE = 64
+MERGE_PUT_INTERVAL = 0.1
+
 # 获取认证依赖
 dependencies = get_auth_dependency()
 
+# 聊天接口使用轻量请求对象，异步任务与批处理使用 pydantic 模型，两者属性一致
+ChatRequest = Union[ChatCompletionRequest, SlimChatRequest]
 
-def format_messages_for_agent(messages: List[ChatMessage]) -> str:
+
+def format_messages_for_agent(messages: Sequence[Union[ChatMessage, SlimMessage]]) -> str:
     """
     将 OpenAI 格式的消息列表格式化为适合后端 API 的字符串格式
-    正确标注系统提示词、用户消息和助手回复
+    正确标注系统提示词、用户消息和助手回复；配置了上下文预算时压缩超出预算的较早消息
     """
+    if settings.CONTEXT_MAX_TOKENS > 0:
+        return context_compactor.format(
+            messages,
+            settings.CONTEXT_MAX_TOKENS,
+            settings.CONTEXT_SUMMARY_TOKENS,
+            settings.CONTEXT_SUMMARY_LINE_TOKENS
+        )
+    
     formatted_parts = []
     
     for message in messages:
@@ -30,7 +70,8 @@ def format_messages_for_agent(messages: List[ChatMessage]) -> str:
         content = message.content
         
         if role == "system":
-            formatted_parts.append(f"[SYSTEM]: {content}")
+            # 重复使用的长系统提示词直接复用驻留的片段
+            formatted_parts.append(prompt_index.system_segment(content))
         elif role == "user":
             formatted_parts.append(f"[USER]: {content}")
         elif role == "assistant":
@@ -47,12 +88,269 @@ async def list_models():
     ])
 
 
-@router.post("/chat/completions", response_model=ChatCompletionResponse, dependencies=dependencies)
-async def create_chat_completion(request: ChatCompletionRequest, response: Response):
+class UpstreamConnectError(Exception):
+    """无法建立上游流式连接"""
+
+
+def check_choice_count(request: ChatRequest):
+    """校验 n 参数不超过配置的上限"""
+    if request.n > settings.MAX_CHOICES:
+        raise HTTPException(status_code=400, detail=f"n 不能超过 {settings.MAX_CHOICES}")
+
+
+def check_stop_sequences(request: ChatRequest):
+    """校验 stop 的数量与长度不超过上限"""
+    try:
+        check_stop(request.stop)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+def cacheable(request: ChatRequest, finish_reason: Optional[str]) -> bool:
+    """回答能否写入近似重复缓存
+
+    只缓存上游正常结束（收到 message_end）的完整回答：上游失败、中断或超过截止时间时在此之前已抛出异常，
+    被停止序列或 max_tokens 截断的回答也不缓存。
+    """
+    return finish_reason == "stop" and not request.stop and request.token_limit is None
+
+
+def choice_session_id(session_id: str, index: int, n: int) -> str:
+    """n > 1 时每个选择使用独立的上游会话"""
+    return session_id if n == 1 else f"{session_id}-{index}"
+
+
+def complete_choice(
+    request: ChatRequest,
+    session_id: str,
+    formatted_conversation: str,
+    index: int
+) -> ChatCompletionResponseChoice:
+    """生成单个非流式选择"""
+    limiter = CompletionLimiter(request.stop, request.token_limit)
+    with profiler.route(CHAT_COMPLETIONS_ROUTE):
+        answer = agent_service.chat_blocking(session_id, formatted_conversation, limiter)
+    if answer is None:
+        # 上游超时已按剩余时间收紧，此时失败是因为过了截止时间
+        if deadline_expired():
+            raise DeadlineExceeded("upstream")
+        raise HTTPException(status_code=500, detail="Agent API 调用失败")
+    return ChatCompletionResponseChoice(
+        index=index,
+        message=ChatMessage(role="assistant", content=answer),
+        finish_reason=limiter.finish_reason
+    )
+
+
+def run_blocking_completion(
+    request: ChatRequest,
+    session_id: str,
+    formatted_conversation: str,
+    completion_id: str,
+    caller: str = ANONYMOUS_CALLER
+) -> ChatCompletionResponse:
+    """执行一次非流式聊天完成，供同步接口与异步任务共用
+
+    n > 1 时各选择在独立的上游会话中并发生成（并发数受 CHOICE_CONCURRENCY 限制），全部完成后返回。
+    用量按发送给上游的对话内容与各选择的回答估算，并计入调用方的用量台账。
+    """
+    n = request.n
+    if n == 1:
+        choices = [complete_choice(request, session_id, formatted_conversation, 0)]
+    else:
+        # 各选择沿用请求的上下文（日志关联 ID、截止时间）
+        contexts = [contextvars.copy_context() for _ in range(n)]
+
+        def run(index: int) -> ChatCompletionResponseChoice:
+            with runtime_monitor.choice_thread():
+                return contexts[index].run(
+                    complete_choice,
+                    request, choice_session_id(session_id, index, n), formatted_conversation, index
+                )
+
+        with ThreadPoolExecutor(max_workers=min(n, settings.CHOICE_CONCURRENCY)) as pool:
+            choices = list(pool.map(run, range(n)))
+    
+    usage = make_usage(
+        estimate_tokens(formatted_conversation),
+        sum(estimate_tokens(choice.message.content) for choice in choices)
+    )
+    record_usage(caller, request.model, usage)
+    return ChatCompletionResponse(
+        id=completion_id,
+        model=request.model,
+        object="chat.completion",
+        choices=choices,
+        usage=usage
+    )
+
+
+def stream_choice(
+    request: ChatRequest,
+    session_id: str,
+    formatted_conversation: str,
+    index: int
+) -> Iterator[ChatCompletionResponseStreamChoice]:
+    """单个选择的流式增量：角色、内容、结束原因"""
+    stream_generator = agent_service.chat_stream(session_id, formatted_conversation)
+    if not stream_generator:
+        raise UpstreamConnectError("无法创建流式连接")
+    
+    yield ChatCompletionResponseStreamChoice(
+        index=index,
+        delta=DeltaMessage(role="assistant"),
+        finish_reason=None
+    )
+    
+    # 命中 stop / max_tokens 时 limiter 提前结束并关闭上游连接
+    limiter = CompletionLimiter(request.stop, request.token_limit)
+    if limiter.enabled:
+        stream_generator = limiter.apply(stream_generator)
+    try:
+        for content in stream_generator:
+            yield ChatCompletionResponseStreamChoice(
+                index=index,
+                delta=DeltaMessage(content=content),
+                finish_reason=None
+            )
+    finally:
+        stream_generator.close()
+    
+    yield ChatCompletionResponseStreamChoice(
+        index=index,
+        delta=DeltaMessage(),
+        finish_reason=limiter.finish_reason
+    )
+
+
+def cached_choice(answer: str) -> Iterator[ChatCompletionResponseStreamChoice]:
+    """以流式增量重放缓存的回答"""
+    yield ChatCompletionResponseStreamChoice(index=0, delta=DeltaMessage(role="assistant"), finish_reason=None)
+    yield ChatCompletionResponseStreamChoice(index=0, delta=DeltaMessage(content=answer), finish_reason=None)
+    yield ChatCompletionResponseStreamChoice(index=0, delta=DeltaMessage(), finish_reason="stop")
+
+
+def merge_choice_streams(
+    sources: List[Callable[[], Iterator[ChatCompletionResponseStreamChoice]]],
+    concurrency: int
+) -> Iterator[ChatCompletionResponseStreamChoice]:
+    """并发读取多个选择的流并按到达顺序合并
+
+    最多 concurrency 个选择同时连接上游，其余排队；任一选择出错或合并被提前关闭时，停止其余选择。
+    合并队列有界：读取方（流缓冲的生产者）因客户端过慢暂停时，各选择放不进队列即停止读取上游。
+    """
+    events: "queue.Queue" = queue.Queue(maxsize=MERGE_QUEUE_SIZE)
+    cancelled = threading.Event()
+
+    def put(kind, item=None):
+        """放入合并队列，队列已满时等待；合并已结束时放弃"""
+        while not cancelled.is_set():
+            try:
+                events.put((kind, item), timeout=MERGE_PUT_INTERVAL)
+                return
+            except queue.Full:
+                continue
+
+    def run(source):
+        if cancelled.is_set():
+            put("done")
+            return
+        stream = None
+        try:
+            with runtime_monitor.choice_thread(), profiler.route(CHAT_COMPLETIONS_ROUTE):
+                stream = source()
+                for item in stream:
+                    if cancelled.is_set():
+                        break
+                    put("item", item)
+        except Exception as e:
+            put("error", e)
+        finally:
+            if stream is not None:
+                stream.close()
+            put("done")
+
+    pool = ThreadPoolExecutor(max_workers=min(len(sources), concurrency), thread_name_prefix="choice")
+    for source in sources:
+        pool.submit(contextvars.copy_context().run, run, source)
+    try:
+        remaining = len(sources)
+        while remaining:
+            kind, item = events.get()
+            if kind == "done":
+                remaining -= 1
+            elif kind == "error":
+                raise item
+            else:
+                yield item
+    finally:
+        cancelled.set()
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+async def stream_events(buffered: BufferedStream, start: int = 0):
+    """将缓冲中的事件转换为带编号的 SSE 事件，事件 ID 形如 ``<completion_id>:<序号>``"""
+    from sse_starlette.sse import ServerSentEvent
+    async for seq, (event, data) in buffered.aiter_from(start):
+        yield ServerSentEvent(data=data, event=event, id=f"{buffered.stream_id}:{seq}")
+
+
+def resume_stream(last_event_id: str, caller: str) -> "EventSourceResponse":
+    """根据 Last-Event-ID 重新连接到 caller 发起的仍在进行或已缓存的流，不会重新请求上游
+
+    流缓冲只在发起流的工作进程中，多进程部署时重连落到其他进程会返回 404。
+    """
+    from sse_starlette.sse import EventSourceResponse
+    stream_id, _, seq = last_event_id.rpartition(":")
+    buffered = stream_registry.get(stream_id) if seq.isdigit() else None
+    # 内存紧张时已发送的事件可能已被丢弃，无法从更早的位置续传；其他调用方的流按不存在处理
+    if buffered is None or buffered.caller != caller or int(seq) + 1 < buffered.base:
+        raise HTTPException(status_code=404, detail="流不存在或已过期，无法续传")
+    return EventSourceResponse(drain_controller.track(stream_events(buffered, int(seq) + 1)))
+
+
+@router.post(
+    "/chat/completions",
+    response_model=ChatCompletionResponse,
+    dependencies=dependencies,
+    # 请求体由 parse_chat_request 直接解析，OpenAPI 文档中仍使用 ChatCompletionRequest 的结构
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {"application/json": {"schema": {"$ref": "#/components/schemas/ChatCompletionRequest"}}}
+        }
+    }
+)
+async def create_chat_completion(
+    http_request: Request,
+    response: Response,
+    last_event_id: Optional[str] = Header(None, alias="Last-Event-ID")
+):
     """创建聊天完成"""
+    started = time.monotonic()
+    # 快速解析：只校验用到的字段，消息构建为轻量对象，长对话不再逐条构建 pydantic 模型
+    request = parse_chat_request(await http_request.body())
+    
+    # 断线重连：携带 Last-Event-ID 时续传原有的流
+    if request.stream and last_event_id:
+        return resume_stream(last_event_id, caller_key(http_request.headers.get("authorization")))
+    check_choice_count(request)
+    check_stop_sequences(request)
+    caller = caller_key(http_request.headers.get("authorization"))
+    
+    # 截止时间从收到请求时开始计算，之后在创建会话、查询上游与流式读取前检查，并随上下文传给生产者线程
     try:
+        deadline = request_deadline(http_request.headers.get(TIMEOUT_HEADER), caller, started)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="X-Request-Timeout 必须为正数（秒）")
+    deadline_var.set(deadline)
+    
+    try:
+        check_deadline("admission")
+        
         # 生成会话ID
         session_id = str(uuid.uuid4())
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
         
         # 验证消息列表不为空
         if not request.messages:
@@ -61,78 +359,117 @@ async def create_chat_completion(request: ChatCompletionRequest, response: Respo
         # 格式化完整的对话上下文，包括系统提示词、用户消息和助手回复
         formatted_conversation = format_messages_for_agent(request.messages)
         
+        # 近似重复缓存：开启缓存的调用方提出的单轮问题与缓存中的问题足够相似时直接返回缓存的回答
+        key = cache_key(request.messages, caller, request.model, request.n, request.stop, request.token_limit)
+        hit = prompt_cache.lookup(*key) if key else None
+        cache_headers = {}
+        if key:
+            cache_headers["X-Prompt-Cache"] = f"hit; similarity={hit.similarity}" if hit else "miss"
+        
         if request.stream:
-            # 流式响应
+            # 流式响应：上游内容由独立线程写入缓冲，客户端断线后可通过 Last-Event-ID 续传
             def generate():
+                # 用量随增量逐片累计；结束块暂存到下一个事件或流结束，最后一个块附带用量
+                prompt_tokens = estimate_tokens(formatted_conversation)
+                completion = TokenCounter()
+                connected = False
+                # 未命中缓存时累计回答，上游正常结束后写入缓存
+                answer_parts = [] if key and not hit else None
+                finish_reason = None
                 try:
-                    stream_generator = agent_service.chat_stream(session_id, formatted_conversation)
-                    if not stream_generator:
-                        yield ServerSentEvent(
-                            data='{"error": "无法创建流式连接"}',
-                            event="error"
+                    n = request.n
+                    if hit:
+                        choices = cached_choice(hit.answer)
+                    elif n == 1:
+                        choices = stream_choice(request, session_id, formatted_conversation, 0)
+                    else:
+                        # 多个选择在独立的上游会话中并发生成，合并为一个 SSE 流，以 index 区分
+                        choices = merge_choice_streams(
+                            [
+                                partial(stream_choice, request, choice_session_id(session_id, index, n),
+                                        formatted_conversation, index)
+                                for index in range(n)
+                            ],
+                            settings.CHOICE_CONCURRENCY
                         )
-                        return
-                    
-                    # 发送开始事件
-                    chunk = ChatCompletionResponse(
-                        model=request.model,
-                        object="chat.completion.chunk",
-                        choices=[ChatCompletionResponseStreamChoice(
-                            index=0,
-                            delta=DeltaMessage(role="assistant"),
-                            finish_reason=None
-                        )]
-                    )
-                    yield ServerSentEvent(data=chunk.json())
-                    
-                    # 发送内容
-                    for content in stream_generator:
+                    held = None
+                    for choice in choices:
+                        connected = True
+                        completion.add(choice.delta.content)
+                        if answer_parts is not None and choice.delta.content:
+                            answer_parts.append(choice.delta.content)
+                        if choice.finish_reason is not None:
+                            finish_reason = choice.finish_reason
                         chunk = ChatCompletionResponse(
+                            id=completion_id,
                             model=request.model,
                             object="chat.completion.chunk",
-                            choices=[ChatCompletionResponseStreamChoice(
-                                index=0,
-                                delta=DeltaMessage(content=content),
-                                finish_reason=None
-                            )]
+                            choices=[choice]
                         )
-                        yield ServerSentEvent(data=chunk.json())
-                    
-                    # 发送结束事件
-                    chunk = ChatCompletionResponse(
-                        model=request.model,
-                        object="chat.completion.chunk",
-                        choices=[ChatCompletionResponseStreamChoice(
-                            index=0,
-                            delta=DeltaMessage(),
-                            finish_reason="stop"
-                        )]
-                    )
-                    yield ServerSentEvent(data=chunk.json())
-                    yield ServerSentEvent(data="[DONE]")
+                        if held is not None:
+                            yield None, held.json(exclude={"usage"})
+                            held = None
+                        if choice.finish_reason is not None:
+                            held = chunk
+                        else:
+                            yield None, chunk.json(exclude={"usage"})
+                    if held is not None:
+                        held.usage = make_usage(prompt_tokens, completion.tokens)
+                        yield None, held.json()
+                    # 所有选择都已读到 message_end
+                    if answer_parts is not None and cacheable(request, finish_reason):
+                        prompt_cache.store(*key, "".join(answer_parts))
+                    yield None, "[DONE]"
                     
+                except (UpstreamConnectError, UpstreamError) as e:
+                    yield "error", f'{{"error": "{str(e)}"}}'
                 except Exception as e:
-                    yield ServerSentEvent(
-                        data=f'{{"error": "流式处理错误: {str(e)}"}}',
-                        event="error"
-                    )
+                    # 截止时间到达时的读取超时也按超时报告
+                    if isinstance(e, DeadlineExceeded) or deadline_expired():
+                        yield "error", '{"error": "请求已超过截止时间"}'
+                    else:
+                        yield "error", f'{{"error": "流式处理错误: {str(e)}"}}'
+                finally:
+                    # 客户端断开或出错时按已生成的部分计入用量
+                    if connected:
+                        record_usage(caller, request.model, make_usage(prompt_tokens, completion.tokens))
             
-            return EventSourceResponse(generate())
+            # sse_starlette 只在流式响应时导入，不计入启动耗时
+            from sse_starlette.sse import EventSourceResponse
+            buffered = stream_registry.start(completion_id, generate(), route=CHAT_COMPLETIONS_ROUTE, caller=caller)
+            return EventSourceResponse(drain_controller.track(stream_events(buffered)), headers=cache_headers)
         else:
             # 非流式响应
-            answer = agent_service.chat_blocking(session_id, formatted_conversation)
-            if answer is None:
-                raise HTTPException(status_code=500, detail="Agent API 调用失败")
-            
-            return ChatCompletionResponse(
-                model=request.model,
-                object="chat.completion",
-                choices=[ChatCompletionResponseChoice(
-                    index=0,
-                    message=ChatMessage(role="assistant", content=answer),
-                    finish_reason="stop"
-                )]
+            response.headers.update(cache_headers)
+            if hit:
+                usage = make_usage(estimate_tokens(formatted_conversation), estimate_tokens(hit.answer))
+                record_usage(caller, request.model, usage)
+                return ChatCompletionResponse(
+                    id=completion_id,
+                    model=request.model,
+                    object="chat.completion",
+                    choices=[ChatCompletionResponseChoice(
+                        index=0,
+                        message=ChatMessage(role="assistant", content=hit.answer),
+                        finish_reason="stop"
+                    )],
+                    usage=usage
+                )
+            # 上游请求是阻塞调用，放到线程池中执行，避免阻塞事件循环（截止时间等上下文变量随之传入）
+            result = await run_in_threadpool(
+                run_blocking_completion, request, session_id, formatted_conversation, completion_id, caller
             )
+            if key and cacheable(request, result.choices[0].finish_reason):
+                prompt_cache.store(*key, result.choices[0].message.content)
+            return result
             
+    except HTTPException:
+        raise
+    except DeadlineExceeded as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except UpstreamError as e:
+        raise HTTPException(status_code=502, detail=str(e))
+    except StreamCapacityError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"处理请求时发生错误: {str(e)}") 
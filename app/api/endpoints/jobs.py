@@ -0,0 +1,72 @@
+import uuid
+from typing import Optional
+from fastapi import APIRouter, Header, HTTPException, Query
+from starlette.concurrency import run_in_threadpool
+
+from app.core.auth import caller_key, get_auth_dependency
+from app.core.config import settings
+from app.models.chat import ChatCompletionRequest
+from app.models.job import JobStatus
+from app.services.job_service import Job, JobQueueFullError, job_service
+from app.api.endpoints.chat import (
+    check_choice_count, check_stop_sequences, format_messages_for_agent, run_blocking_completion
+)
+
+router = APIRouter()
+
+# 获取认证依赖
+dependencies = get_auth_dependency()
+
+
+def to_job_status(job: Job) -> JobStatus:
+    """将任务转换为响应模型"""
+    return JobStatus(
+        id=job.id,
+        status=job.status,
+        created=int(job.created),
+        completed=int(job.completed) if job.completed is not None else None,
+        result=job.result,
+        error=job.error
+    )
+
+
+@router.post("/jobs", response_model=JobStatus, status_code=202, dependencies=dependencies)
+async def submit_job(request: ChatCompletionRequest, authorization: Optional[str] = Header(None)):
+    """提交异步聊天完成任务，立即返回任务ID"""
+    if request.stream:
+        raise HTTPException(status_code=400, detail="异步任务不支持流式响应")
+    if not request.messages:
+        raise HTTPException(status_code=400, detail="消息列表不能为空")
+    check_choice_count(request)
+    check_stop_sequences(request)
+    
+    formatted_conversation = format_messages_for_agent(request.messages)
+    caller = caller_key(authorization)
+    try:
+        job = await run_in_threadpool(
+            job_service.submit,
+            run_blocking_completion,
+            request,
+            str(uuid.uuid4()),
+            formatted_conversation,
+            f"chatcmpl-{uuid.uuid4().hex}",
+            caller,
+            caller=caller
+        )
+    except JobQueueFullError as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    return to_job_status(job)
+
+
+@router.get("/jobs/{job_id}", response_model=JobStatus, dependencies=dependencies)
+async def get_job(
+    job_id: str,
+    wait: float = Query(0, ge=0, description="长轮询：最多等待任务结束的秒数"),
+    authorization: Optional[str] = Header(None)
+):
+    """查询任务状态与结果（只能查询本调用方提交的任务）"""
+    job = await run_in_threadpool(job_service.get, job_id)
+    if job is None or job.caller != caller_key(authorization):
+        raise HTTPException(status_code=404, detail="任务不存在或结果已过期")
+    job = await job_service.wait(job, min(wait, settings.JOB_MAX_WAIT))
+    return to_job_status(job)
@@ -0,0 +1,182 @@
+"""
+WebSocket 多轮聊天
+
+一个连接对应一个上游会话（AppConversationID）：握手时认证一次，之后每一轮只发送新的用户消息，
+历史由上游会话保存。上游会话在连接的整个生命周期内固定，不受会话存储的数量上限与空闲超时影响。
+每一轮与 SSE 流一样在 ``STREAM_WORKERS`` 线程池中读取上游，不占用默认线程池。所有帧均为紧凑的 JSON 文本。
+
+客户端 -> 服务端：
+    {"content": "用户消息", "system": "系统提示词（可选，仅第一轮生效）", "stop": [...], "max_tokens": 100}
+
+服务端 -> 客户端：
+    {"t": "ready", "s": "<session_id>"}     连接就绪
+    {"t": "d", "c": "增量内容"}              回答增量
+    {"t": "e", "r": "stop" | "length", "u": [prompt_tokens, completion_tokens]}
+                                            本轮结束、结束原因及本轮估算的 token 用量
+    {"t": "err", "m": "错误信息"}            本轮失败，连接保持可用
+
+服务进入 drain 状态后不再开始新的一轮：进行中的一轮正常结束后以关闭码 1013（稍后重试）关闭连接。
+"""
+import uuid
+from contextlib import aclosing
+from typing import Dict, Iterator, Optional
+
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect, status
+
+from app.core.auth import verify_websocket_key, websocket_caller_key
+from app.core.drain import drain_controller
+from app.services.agent_service import agent_service
+from app.services.prompt_index import prompt_index
+from app.services.stream_buffer import StreamCapacityError, StreamEvent, stream_registry
+from app.services.usage_ledger import make_usage, record_usage
+from app.utils.json_codec import JSONDecodeError, dumps, loads
+from app.utils.text import CompletionLimiter, TokenCounter, check_stop, estimate_tokens
+
+router = APIRouter()
+
+# 用于采样分析按路由过滤的标记
+CHAT_WS_ROUTE = "/v1/chat/ws"
+
+# 用量台账中 WebSocket 聊天计入的模型名
+WS_MODEL = "agent-model"
+
+
+def parse_turn(raw: str) -> Dict:
+    """解析一轮客户端消息，格式错误时抛出 ValueError"""
+    try:
+        frame = loads(raw)
+    except JSONDecodeError:
+        raise ValueError("消息不是有效的 JSON")
+    if not isinstance(frame, dict) or not isinstance(frame.get("content"), str) or not frame["content"]:
+        raise ValueError("content 不能为空")
+    system = frame.get("system")
+    if system is not None and not isinstance(system, str):
+        raise ValueError("system 必须是字符串")
+    stop = frame.get("stop")
+    if stop is not None and not isinstance(stop, str) and not (
+        isinstance(stop, list) and all(isinstance(item, str) for item in stop)
+    ):
+        raise ValueError("stop 必须是字符串或字符串列表")
+    check_stop(stop)
+    max_tokens = frame.get("max_tokens")
+    if max_tokens is not None and (not isinstance(max_tokens, int) or isinstance(max_tokens, bool) or max_tokens < 1):
+        raise ValueError("max_tokens 必须是正整数")
+    return frame
+
+
+def format_turn(content: str, system: Optional[str]) -> str:
+    """格式化一轮的 Query：上游会话已保存历史，只需发送新消息（第一轮附带系统提示词）"""
+    if system:
+        return f"{prompt_index.system_segment(system)}\n\n[USER]: {content}"
+    return f"[USER]: {content}"
+
+
+class ChatSocket:
+    """一个 WebSocket 连接的状态
+
+    上游会话在第一轮创建后固定在连接上，不放入会话存储：存储中的会话会因数量上限或空闲超时被淘汰，
+    淘汰后重新创建的上游会话没有历史，而每轮只发送新消息，历史会丢失。
+    """
+
+    __slots__ = ("session_id", "caller", "conversation", "started", "turns", "usage")
+
+    def __init__(self, session_id: str, caller: str):
+        self.session_id = session_id
+        self.caller = caller
+        self.conversation: Optional[Dict] = None  # 上游会话信息，第一轮创建
+        self.started = False  # 是否已有一轮连上上游（系统提示词仅第一轮发送）
+        self.turns = 0
+        self.usage = None  # 最近一轮的用量
+
+    def turn_events(self, query: str, limiter: CompletionLimiter, completion: TokenCounter) -> Iterator[StreamEvent]:
+        """一轮的上游读取，在流生产者线程池中运行；失败时输出 error 事件"""
+        deltas = None
+        try:
+            if self.conversation is None:
+                self.conversation = agent_service.new_conversation(self.session_id)
+                if self.conversation is None:
+                    yield "error", dumps({"error": "无法创建上游会话"})
+                    return
+            stream = agent_service.query_stream(self.conversation, query)
+            if stream is None:
+                yield "error", dumps({"error": "无法创建流式连接"})
+                return
+            self.started = True
+            # 命中 stop / max_tokens 时 limiter 提前结束并关闭上游连接
+            deltas = limiter.apply(stream)
+            for content in deltas:
+                completion.add(content)
+                yield None, content
+        except Exception as e:
+            yield "error", dumps({"error": f"流式处理错误: {e}"})
+        finally:
+            if deltas is not None:
+                # 客户端断开或出错时立即关闭上游连接，已生成的部分计入用量
+                deltas.close()
+                self.usage = make_usage(estimate_tokens(query), completion.tokens)
+                record_usage(self.caller, WS_MODEL, self.usage)
+
+
+@router.websocket("/chat/ws")
+async def chat_websocket(websocket: WebSocket):
+    """WebSocket 多轮聊天"""
+    if not verify_websocket_key(websocket):
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    await websocket.accept()
+
+    # 整个连接绑定同一个上游 AppConversationID
+    socket = ChatSocket(str(uuid.uuid4()), websocket_caller_key(websocket))
+    await websocket.send_text(dumps({"t": "ready", "s": socket.session_id}))
+
+    try:
+        while True:
+            raw = await websocket.receive_text()
+            if drain_controller.draining:
+                # 服务正在关闭，不再开始新的一轮
+                await websocket.close(code=status.WS_1013_TRY_AGAIN_LATER)
+                return
+            try:
+                frame = parse_turn(raw)
+            except ValueError as e:
+                await websocket.send_text(dumps({"t": "err", "m": str(e)}))
+                continue
+
+            query = format_turn(frame["content"], None if socket.started else frame.get("system"))
+            limiter = CompletionLimiter(frame.get("stop"), frame.get("max_tokens"))
+            completion = TokenCounter()
+            socket.turns += 1
+            socket.usage = None
+            # 与 SSE 相同，上游在 STREAM_WORKERS 线程池中读取，并受同样的缓冲上限与暂停策略约束
+            try:
+                buffered = stream_registry.start(
+                    f"{socket.session_id}-{socket.turns}", socket.turn_events(query, limiter, completion),
+                    route=CHAT_WS_ROUTE, caller=socket.caller
+                )
+            except StreamCapacityError as e:
+                await websocket.send_text(dumps({"t": "err", "m": str(e)}))
+                continue
+
+            failed = False
+            try:
+                async with aclosing(drain_controller.track(buffered.aiter_from(0))) as events:
+                    async for _, (event, data) in events:
+                        if event is None:
+                            await websocket.send_text(dumps({"t": "d", "c": data}))
+                        else:
+                            failed = True
+                            await websocket.send_text(dumps({"t": "err", "m": loads(data)["error"]}))
+            finally:
+                # 每轮的缓冲不用于续传；客户端断开时取消生产者，由其关闭上游连接
+                stream_registry.discard(buffered)
+            if not failed:
+                usage = socket.usage or make_usage(estimate_tokens(query), completion.tokens)
+                await websocket.send_text(dumps({
+                    "t": "e", "r": limiter.finish_reason, "u": [usage.prompt_tokens, usage.completion_tokens]
+                }))
+            if drain_controller.draining:
+                # 本轮结束后关闭连接，客户端可重连到其他工作进程
+                await websocket.close(code=status.WS_1013_TRY_AGAIN_LATER)
+                return
+    except WebSocketDisconnect:
+        pass
@@ -1,6 +1,11 @@
-from fastapi import HTTPException, Header, Depends
+import hashlib
+from typing import Optional
+from fastapi import HTTPException, Header, Depends, WebSocket
 from app.core.config import settings
 
+# 未携带 API 密钥的调用方
+ANONYMOUS_CALLER = "anonymous"
+
 
 def verify_api_key(Authorization: str = Header(None)):
     """验证 API 密钥"""
@@ -15,7 +20,51 @@ def verify_api_key(Authorization: str = Header(None)):
     raise HTTPException(status_code=403, detail="Unauthorized")
 
 
+def verify_websocket_key(websocket: WebSocket) -> bool:
+    """验证 WebSocket 握手的 API 密钥（浏览器无法设置请求头时可使用 api_key 查询参数）"""
+    if not settings.API_AUTH_KEY:
+        return True
+    
+    authorization = websocket.headers.get("Authorization")
+    if authorization and authorization.startswith("Bearer "):
+        return authorization[7:] == settings.API_AUTH_KEY
+    return websocket.query_params.get("api_key") == settings.API_AUTH_KEY
+
+
+def verify_admin_key(Authorization: str = Header(None)):
+    """验证管理接口密钥，未配置管理密钥时拒绝所有管理请求"""
+    if not settings.ADMIN_AUTH_KEY:
+        raise HTTPException(status_code=403, detail="管理接口未启用")
+    
+    if Authorization and Authorization.startswith("Bearer "):
+        token = Authorization[7:]
+        if token == settings.ADMIN_AUTH_KEY:
+            return True
+    
+    raise HTTPException(status_code=403, detail="Unauthorized")
+
+
+def caller_key(authorization: Optional[str]) -> str:
+    """调用方标识：Bearer 密钥 SHA-256 摘要的前 16 位（不保存明文密钥），未携带密钥时为 anonymous"""
+    if authorization and authorization.startswith("Bearer ") and len(authorization) > 7:
+        return hashlib.sha256(authorization[7:].encode("utf-8")).hexdigest()[:16]
+    return ANONYMOUS_CALLER
+
+
+def websocket_caller_key(websocket: WebSocket) -> str:
+    """WebSocket 连接的调用方标识，密钥可来自请求头或 api_key 查询参数"""
+    authorization = websocket.headers.get("Authorization")
+    if not authorization and websocket.query_params.get("api_key"):
+        authorization = f"Bearer {websocket.query_params['api_key']}"
+    return caller_key(authorization)
+
+
 # 依赖项
 def get_auth_dependency():
-    """获取认证依赖项"""
-    return [Depends(verify_api_key)] if settings.API_AUTH_KEY else [] 
+    """获取认证依赖项（是否启用认证在请求时判断，导入路由时不读取配置）"""
+    return [Depends(verify_api_key)]
+
+
+def get_admin_dependency():
+    """获取管理接口认证依赖项"""
+    return [Depends(verify_admin_key)]
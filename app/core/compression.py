@@ -0,0 +1,291 @@
+"""
+响应压缩中间件
+
+根据请求的 Accept-Encoding 协商 zstd / br / gzip 压缩响应体。与 starlette 的 GZipMiddleware 不同：
+- 每个响应使用一个持续的压缩上下文，流式响应（SSE）的每个 ``http.response.body`` 消息即一个事件，
+  压缩后立即以同步刷新（sync flush）发出，客户端可以马上解压出完整事件，不会因缓冲增加延迟；
+  同一个流中后续事件可以引用前面事件建立的字典，重复的 JSON 字段名和 ID 压缩效果很好
+- 一次发送完毕且小于 ``min_size`` 的响应体不压缩，避免压缩头部开销和无谓的 CPU
+- 只压缩文本类响应，已设置 Content-Encoding 的响应原样发出
+
+br 与 zstd 依赖可选组件 ``brotli`` 与 ``zstandard``，未安装时只使用 gzip。
+"""
+import logging
+import time
+import zlib
+from typing import Dict, List, Optional, Sequence, Union
+
+from starlette.datastructures import Headers, MutableHeaders
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - 取决于运行环境
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - 取决于运行环境
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+# 各编码的压缩级别：流式场景每个事件都要压缩一次，取压缩率与 CPU 开销的折中
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 4
+ZSTD_LEVEL = 3
+
+# 除 text/* 外需要压缩的内容类型
+_COMPRESSIBLE_TYPES = {
+    "application/json",
+    "application/jsonl",
+    "application/x-ndjson",
+    "application/javascript",
+    "application/xml",
+}
+
+
+class _GzipEncoder:
+    __slots__ = ("_compressor",)
+
+    def __init__(self):
+        self._compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def update(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush(zlib.Z_FINISH)
+
+
+class _BrotliEncoder:
+    __slots__ = ("_compressor",)
+
+    def __init__(self):
+        self._compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+
+    def update(self, data: bytes) -> bytes:
+        return self._compressor.process(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush()
+
+    def finish(self) -> bytes:
+        return self._compressor.finish()
+
+
+class _ZstdEncoder:
+    __slots__ = ("_compressor",)
+
+    def __init__(self):
+        self._compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compressobj()
+
+    def update(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_FINISH)
+
+
+def available_encoders() -> Dict[str, type]:
+    """当前环境可用的编码及其压缩器"""
+    encoders = {"gzip": _GzipEncoder}
+    if brotli is not None:
+        encoders["br"] = _BrotliEncoder
+    if zstandard is not None:
+        encoders["zstd"] = _ZstdEncoder
+    return encoders
+
+
+def parse_encodings(value: Union[str, Sequence[str]]) -> List[str]:
+    """解析配置中的编码优先级（逗号分隔的字符串或列表），忽略当前环境不可用的编码"""
+    names = value.split(",") if isinstance(value, str) else value
+    encoders = available_encoders()
+    result = []
+    for name in names:
+        name = name.strip().lower()
+        if not name:
+            continue
+        if name not in encoders:
+            if name in ("br", "zstd"):
+                logger.info("未安装压缩编码 %s 的依赖，已忽略", name)
+            else:
+                logger.warning("无效的压缩编码 %s，已忽略", name)
+            continue
+        if name not in result:
+            result.append(name)
+    return result
+
+
+def negotiate(accept_encoding: str, encodings: Sequence[str]) -> Optional[str]:
+    """按 Accept-Encoding 的 q 值选择编码，q 值相同时按服务端优先级"""
+    if not accept_encoding:
+        return None
+    weights: Dict[str, float] = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.partition(";")
+        name = name.strip().lower()
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        if name:
+            weights[name] = q
+    wildcard = weights.get("*", 0.0)
+    best, best_q = None, 0.0
+    for name in encodings:
+        q = weights.get(name, wildcard)
+        if q > best_q:
+            best, best_q = name, q
+    return best
+
+
+def is_compressible(headers: Headers) -> bool:
+    if "content-encoding" in headers:
+        return False
+    content_type = headers.get("content-type", "").split(";", 1)[0].strip().lower()
+    return (
+        content_type.startswith("text/")
+        or content_type in _COMPRESSIBLE_TYPES
+        or content_type.endswith("+json")
+    )
+
+
+class CompressionStats:
+    """压缩统计：各编码的响应数、压缩前后字节数与压缩耗时"""
+
+    def __init__(self):
+        self.skipped_small = 0
+        self._encodings: Dict[str, Dict[str, float]] = {}
+
+    def record(self, encoding: str, bytes_in: int, bytes_out: int, seconds: float, new_response: bool = False):
+        entry = self._encodings.get(encoding)
+        if entry is None:
+            entry = self._encodings[encoding] = {"responses": 0, "bytes_in": 0, "bytes_out": 0, "seconds": 0.0}
+        if new_response:
+            entry["responses"] += 1
+        entry["bytes_in"] += bytes_in
+        entry["bytes_out"] += bytes_out
+        entry["seconds"] += seconds
+
+    def snapshot(self) -> Dict:
+        encodings = {}
+        for name, entry in self._encodings.items():
+            encodings[name] = {
+                "responses": entry["responses"],
+                "bytes_in": entry["bytes_in"],
+                "bytes_out": entry["bytes_out"],
+                "ratio": round(entry["bytes_out"] / entry["bytes_in"], 3) if entry["bytes_in"] else None,
+                "cpu_ms": round(entry["seconds"] * 1000, 1),
+            }
+        return {"skipped_small": self.skipped_small, "encodings": encodings}
+
+
+class _CompressedResponder:
+    """包装单个响应的 send：推迟发送响应头，直到看到第一段响应体后决定是否压缩"""
+
+    __slots__ = ("send", "encoding", "min_size", "stats", "start", "encoder")
+
+    def __init__(self, send, encoding: str, min_size: int, stats: CompressionStats):
+        self.send = send
+        self.encoding = encoding
+        self.min_size = min_size
+        self.stats = stats
+        self.start = None
+        self.encoder = None
+
+    async def __call__(self, message):
+        message_type = message["type"]
+        if message_type == "http.response.start":
+            self.start = message
+            return
+        if message_type != "http.response.body":
+            # trailers / pathsend 等扩展消息：尚未发出的响应头原样发出
+            if self.start is not None:
+                await self.send(self.start)
+                self.start = None
+            await self.send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        if self.start is not None:
+            await self._send_start(body, more_body)
+            return
+        if self.encoder is None:
+            await self.send(message)
+            return
+        if more_body and not body:
+            return
+        await self._send_compressed(body, more_body)
+
+    async def _send_start(self, body: bytes, more_body: bool):
+        start, self.start = self.start, None
+        headers = MutableHeaders(scope=start)
+        if not is_compressible(headers) or start["status"] < 200 or start["status"] in (204, 304):
+            await self.send(start)
+            await self.send({"type": "http.response.body", "body": body, "more_body": more_body})
+            return
+        if not more_body and len(body) < self.min_size:
+            self.stats.skipped_small += 1
+            await self.send(start)
+            await self.send({"type": "http.response.body", "body": body, "more_body": False})
+            return
+
+        self.encoder = available_encoders()[self.encoding]()
+        started = time.perf_counter()
+        if more_body:
+            data = self.encoder.update(body) + self.encoder.flush() if body else b""
+            if "content-length" in headers:
+                del headers["content-length"]
+        else:
+            data = self.encoder.update(body) + self.encoder.finish()
+            headers["Content-Length"] = str(len(data))
+        self.stats.record(self.encoding, len(body), len(data), time.perf_counter() - started, new_response=True)
+        headers["Content-Encoding"] = self.encoding
+        headers.add_vary_header("Accept-Encoding")
+        await self.send(start)
+        await self.send({"type": "http.response.body", "body": data, "more_body": more_body})
+
+    async def _send_compressed(self, body: bytes, more_body: bool):
+        started = time.perf_counter()
+        if more_body:
+            # 同步刷新：每个事件都能被客户端立即完整解压
+            data = self.encoder.update(body) + self.encoder.flush()
+        else:
+            data = self.encoder.update(body) + self.encoder.finish()
+        self.stats.record(self.encoding, len(body), len(data), time.perf_counter() - started)
+        await self.send({"type": "http.response.body", "body": data, "more_body": more_body})
+
+
+class CompressionMiddleware:
+    """按 Accept-Encoding 协商压缩响应体的 ASGI 中间件，流式响应按事件刷新"""
+
+    def __init__(self, app, encodings: Union[str, Sequence[str]] = "zstd,gzip,br", min_size: int = 512,
+                 stats: Optional[CompressionStats] = None):
+        self.app = app
+        self.encodings = parse_encodings(encodings)
+        self.min_size = min_size
+        self.stats = stats if stats is not None else compression_stats
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.encodings:
+            await self.app(scope, receive, send)
+            return
+        encoding = negotiate(Headers(scope=scope).get("accept-encoding", ""), self.encodings)
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        await self.app(scope, receive, _CompressedResponder(send, encoding, self.min_size, self.stats))
+
+
+# 创建全局压缩统计
+compression_stats = CompressionStats()
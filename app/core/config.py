@@ -1,10 +1,15 @@
+import logging
 import os
 import yaml
 from pathlib import Path
-from typing import Optional
+from typing import Dict, List, Optional
 from pydantic import Field
 from pydantic_settings import BaseSettings
 
+from app.utils.lazy import LazyObject
+
+logger = logging.getLogger(__name__)
+
 
 PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent
 DEFAULT_CONFIG_FILENAMES = ("config.local.yaml", "config.yaml")
@@ -19,19 +24,108 @@ class Settings(BaseSettings):
     API_BASE_URL: str = Field(default="https://agent.bit.edu.cn", env="AGENT_API_BASE_URL")
     APP_ID: str = Field(env="AGENT_APP_ID")
     API_KEY: str = Field(env="AGENT_API_KEY")
+    UPSTREAM_POOL_SIZE: int = Field(default=100, env="AGENT_UPSTREAM_POOL_SIZE")
+    UPSTREAM_TIMEOUT: float = Field(default=30, env="AGENT_UPSTREAM_TIMEOUT")
+    UPSTREAM_CONNECT_TIMEOUT: float = Field(default=10, env="AGENT_UPSTREAM_CONNECT_TIMEOUT")
+    UPSTREAM_IDLE_TIMEOUT: float = Field(default=60, env="AGENT_UPSTREAM_IDLE_TIMEOUT")
+    BLOCKING_VIA_STREAM: bool = Field(default=False, env="AGENT_BLOCKING_VIA_STREAM")
+    MAX_CHOICES: int = Field(default=8, env="AGENT_MAX_CHOICES")
+    CHOICE_CONCURRENCY: int = Field(default=4, env="AGENT_CHOICE_CONCURRENCY")
+    UPSTREAM_HTTP2: bool = Field(default=False, env="AGENT_UPSTREAM_HTTP2")
+    UPSTREAM_HTTP2_MAX_STREAMS: int = Field(default=100, env="AGENT_UPSTREAM_HTTP2_MAX_STREAMS")
+    UPSTREAM_HTTP2_MAX_CONNECTIONS: int = Field(default=10, env="AGENT_UPSTREAM_HTTP2_MAX_CONNECTIONS")
     
     # 服务器配置
     SERVER_HOST: str = Field(default="0.0.0.0", env="SERVER_HOST")
     SERVER_PORT: int = Field(default=8000, env="SERVER_PORT")
+    SERVER_WORKERS: int = Field(default=0, env="SERVER_WORKERS")
+    SERVER_GRACEFUL_TIMEOUT: int = Field(default=30, env="SERVER_GRACEFUL_TIMEOUT")
+    SERVER_DRAIN_TIMEOUT: int = Field(default=30, env="SERVER_DRAIN_TIMEOUT")
+    SERVER_HTTP2: bool = Field(default=False, env="SERVER_HTTP2")
+    SERVER_HTTP2_MAX_STREAMS: int = Field(default=100, env="SERVER_HTTP2_MAX_STREAMS")
+    SERVER_CERTFILE: str = Field(default="", env="SERVER_CERTFILE")
+    SERVER_KEYFILE: str = Field(default="", env="SERVER_KEYFILE")
+    SERVER_WARMUP: bool = Field(default=False, env="SERVER_WARMUP")
+    SERVER_WARMUP_CONNECTIONS: int = Field(default=4, env="SERVER_WARMUP_CONNECTIONS")
+    SERVER_WARMUP_TIMEOUT: float = Field(default=10, env="SERVER_WARMUP_TIMEOUT")
     API_AUTH_KEY: Optional[str] = Field(default="", env="API_AUTH_KEY")
+    ADMIN_AUTH_KEY: Optional[str] = Field(default="", env="ADMIN_AUTH_KEY")
+    
+    # 响应压缩配置
+    COMPRESSION_ENABLED: bool = Field(default=True, env="COMPRESSION_ENABLED")
+    COMPRESSION_ENCODINGS: str = Field(default="zstd,gzip,br", env="COMPRESSION_ENCODINGS")
+    COMPRESSION_MIN_SIZE: int = Field(default=512, env="COMPRESSION_MIN_SIZE")
     
     # 会话管理配置
     MAX_CONVERSATIONS: int = Field(default=1000, env="MAX_CONVERSATIONS")
     CONVERSATION_TIMEOUT: int = Field(default=3600, env="CONVERSATION_TIMEOUT")
+    SESSION_STORE: str = Field(default="memory", env="SESSION_STORE")
+    SESSION_STORE_PATH: str = Field(default="data/sessions.db", env="SESSION_STORE_PATH")
     
     # 日志配置
     LOG_LEVEL: str = Field(default="INFO", env="LOG_LEVEL")
     VERBOSE_LOGGING: bool = Field(default=False, env="VERBOSE_LOGGING")
+    LOG_FORMAT: str = Field(default="text", env="LOG_FORMAT")
+    LOG_QUEUE_SIZE: int = Field(default=10000, env="LOG_QUEUE_SIZE")
+    LOG_MESSAGE_MAX_CHARS: int = Field(default=4096, env="LOG_MESSAGE_MAX_CHARS")
+    LOG_SAMPLE_RATES: Dict[str, float] = Field(default_factory=dict, env="LOG_SAMPLE_RATES")
+    
+    # 上下文预算配置
+    CONTEXT_MAX_TOKENS: int = Field(default=0, env="CONTEXT_MAX_TOKENS")
+    CONTEXT_SUMMARY_TOKENS: int = Field(default=512, env="CONTEXT_SUMMARY_TOKENS")
+    CONTEXT_SUMMARY_LINE_TOKENS: int = Field(default=48, env="CONTEXT_SUMMARY_LINE_TOKENS")
+    CONTEXT_CACHE_SIZE: int = Field(default=1024, env="CONTEXT_CACHE_SIZE")
+    
+    # 系统提示词索引配置
+    PROMPT_INDEX_SIZE: int = Field(default=256, env="PROMPT_INDEX_SIZE")
+    PROMPT_INDEX_MIN_LENGTH: int = Field(default=256, env="PROMPT_INDEX_MIN_LENGTH")
+    PROMPT_INDEX_MAX_BYTES: int = Field(default=16 * 1024 * 1024, env="PROMPT_INDEX_MAX_BYTES")
+    PROMPT_INDEX_TOP: int = Field(default=10, env="PROMPT_INDEX_TOP")
+    
+    # 近似重复提示词缓存配置
+    PROMPT_CACHE_ENABLED: bool = Field(default=False, env="PROMPT_CACHE_ENABLED")
+    PROMPT_CACHE_CALLERS: List[str] = Field(default_factory=list, env="PROMPT_CACHE_CALLERS")
+    PROMPT_CACHE_SHARED: bool = Field(default=False, env="PROMPT_CACHE_SHARED")
+    PROMPT_CACHE_SIZE: int = Field(default=100000, env="PROMPT_CACHE_SIZE")
+    PROMPT_CACHE_THRESHOLD: float = Field(default=0.85, env="PROMPT_CACHE_THRESHOLD")
+    PROMPT_CACHE_TTL: int = Field(default=3600, env="PROMPT_CACHE_TTL")
+    
+    # 异步任务配置
+    JOB_MAX_WORKERS: int = Field(default=16, env="JOB_MAX_WORKERS")
+    JOB_MAX_PENDING: int = Field(default=1000, env="JOB_MAX_PENDING")
+    JOB_RESULT_TTL: int = Field(default=3600, env="JOB_RESULT_TTL")
+    JOB_MAX_WAIT: int = Field(default=60, env="JOB_MAX_WAIT")
+    
+    # 批处理配置
+    BATCH_DIR: str = Field(default="data/batches", env="BATCH_DIR")
+    BATCH_CONCURRENCY: int = Field(default=8, env="BATCH_CONCURRENCY")
+    
+    # 流式响应缓冲配置（断线续传）
+    STREAM_BUFFER_TTL: int = Field(default=300, env="STREAM_BUFFER_TTL")
+    STREAM_BUFFER_MAX_BYTES: int = Field(default=64 * 1024 * 1024, env="STREAM_BUFFER_MAX_BYTES")
+    STREAM_BUFFER_STREAM_MAX_BYTES: int = Field(default=1024 * 1024, env="STREAM_BUFFER_STREAM_MAX_BYTES")
+    STREAM_BUFFER_OVERFLOW: str = Field(default="pause", env="STREAM_BUFFER_OVERFLOW")
+    STREAM_BUFFER_GRACE: float = Field(default=30, env="STREAM_BUFFER_GRACE")
+    STREAM_WORKERS: int = Field(default=256, env="STREAM_WORKERS")
+    
+    # 用量统计配置
+    USAGE_ENABLED: bool = Field(default=True, env="USAGE_ENABLED")
+    USAGE_FILE: str = Field(default="data/usage.jsonl", env="USAGE_FILE")
+    USAGE_FLUSH_INTERVAL: float = Field(default=10, env="USAGE_FLUSH_INTERVAL")
+    
+    # 请求截止时间配置
+    DEADLINE_DEFAULT_TIMEOUT: float = Field(default=0, env="DEADLINE_DEFAULT_TIMEOUT")
+    DEADLINE_CALLER_TIMEOUTS: Dict[str, float] = Field(default_factory=dict, env="DEADLINE_CALLER_TIMEOUTS")
+    
+    # 运行时监控配置
+    MONITOR_ENABLED: bool = Field(default=True, env="MONITOR_ENABLED")
+    MONITOR_INTERVAL: float = Field(default=0.5, env="MONITOR_INTERVAL")
+    LOOP_LAG_THRESHOLD: float = Field(default=0.2, env="LOOP_LAG_THRESHOLD")
+    
+    # 上游流量录制/回放配置
+    RECORD_MODE: str = Field(default="off", env="RECORD_MODE")
+    RECORD_FILE: str = Field(default="recordings/upstream.jsonl", env="RECORD_FILE")
+    REPLAY_SPEED: float = Field(default=1.0, env="REPLAY_SPEED")
     
     class Config:
         env_file = ".env"
@@ -43,6 +137,7 @@ class ConfigLoader:
     
     def __init__(self):
         self._config = {}
+        self.source: Optional[Path] = None  # 实际加载的配置文件，未找到时为 None
         self._load_config()
     
     def _load_config(self):
@@ -56,14 +151,14 @@ class ConfigLoader:
             try:
                 with config_path.open('r', encoding='utf-8') as f:
                     self._config = yaml.safe_load(f) or {}
-                print(f"已加载配置文件: {config_path}")
+                self.source = config_path
                 return
             except FileNotFoundError:
                 continue
             except Exception as e:
-                print(f"加载配置文件 {config_path} 失败: {e}")
+                logger.warning("加载配置文件 %s 失败: %s", config_path, e)
 
-        print("警告: 未找到配置文件，使用默认配置")
+        logger.warning("未找到配置文件，使用默认配置")
         self._config = self._get_default_config()
 
     def _build_candidate_paths(self):
@@ -109,20 +204,91 @@ class ConfigLoader:
             'agent': {
                 'api_base_url': 'https://agent.bit.edu.cn',
                 'app_id': '',
-                'api_key': ''
+                'api_key': '',
+                'pool_size': 100,
+                'http2': False,
+                'http2_max_streams': 100,
+                'http2_max_connections': 10
             },
             'server': {
                 'host': '0.0.0.0',
                 'port': 8000,
-                'auth_key': ''
+                'workers': 0,
+                'graceful_timeout': 30,
+                'drain_timeout': 30,
+                'http2': False,
+                'http2_max_streams': 100,
+                'certfile': '',
+                'keyfile': '',
+                'warmup': False,
+                'warmup_connections': 4,
+                'warmup_timeout': 10,
+                'auth_key': '',
+                'admin_key': ''
+            },
+            'compression': {
+                'enabled': True,
+                'encodings': 'zstd,gzip,br',
+                'min_size': 512
             },
             'session': {
                 'max_conversations': 1000,
-                'timeout': 3600
+                'timeout': 3600,
+                'store': 'memory',
+                'store_path': 'data/sessions.db'
             },
             'logging': {
                 'level': 'INFO',
-                'verbose': False
+                'verbose': False,
+                'format': 'text',
+                'queue_size': 10000,
+                'message_max_chars': 4096,
+                'sample_rates': {}
+            },
+            'prompt_cache': {
+                'enabled': False,
+                'callers': [],
+                'shared': False,
+                'size': 100000,
+                'threshold': 0.85,
+                'ttl': 3600
+            },
+            'jobs': {
+                'max_workers': 16,
+                'max_pending': 1000,
+                'result_ttl': 3600,
+                'max_wait': 60
+            },
+            'batch': {
+                'dir': 'data/batches',
+                'concurrency': 8
+            },
+            'stream': {
+                'buffer_ttl': 300,
+                'buffer_max_bytes': 64 * 1024 * 1024,
+                'stream_max_bytes': 1024 * 1024,
+                'overflow': 'pause',
+                'overflow_grace': 30,
+                'workers': 256
+            },
+            'usage': {
+                'enabled': True,
+                'file': 'data/usage.jsonl',
+                'flush_interval': 10
+            },
+            'deadline': {
+                'default_timeout': 0,
+                'caller_timeouts': {}
+            },
+            'monitor': {
+                'enabled': True,
+                'interval': 0.5,
+                'lag_threshold': 0.2
+            },
+            'recording': {
+                'mode': 'off',
+                'file': 'recordings/upstream.jsonl',
+                'replay_speed': 1.0
             }
         }
     
@@ -138,32 +304,112 @@ class ConfigLoader:
         return value
 
 
-# 创建配置加载器实例
-config_loader = ConfigLoader()
-
-# 创建设置实例，优先使用配置文件中的值
-settings = Settings(
-    API_BASE_URL=config_loader.get("agent.api_base_url", "https://agent.bit.edu.cn"),
-    APP_ID=config_loader.get("agent.app_id", ""),
-    API_KEY=config_loader.get("agent.api_key", ""),
-    SERVER_HOST=config_loader.get("server.host", "0.0.0.0"),
-    SERVER_PORT=config_loader.get("server.port", 8000),
-    API_AUTH_KEY=config_loader.get("server.auth_key", ""),
-    MAX_CONVERSATIONS=config_loader.get("session.max_conversations", 1000),
-    CONVERSATION_TIMEOUT=config_loader.get("session.timeout", 3600),
-    LOG_LEVEL=config_loader.get("logging.level", "INFO"),
-    VERBOSE_LOGGING=config_loader.get("logging.verbose", False)
-)
-
-# 验证必需的配置
-if not settings.APP_ID:
-    raise ValueError("APP_ID 未配置！请在 config.local.yaml 中设置 agent.app_id 或设置环境变量 AGENT_APP_ID")
-if not settings.API_KEY:
-    raise ValueError("API_KEY 未配置！请在 config.local.yaml 中设置 agent.api_key 或设置环境变量 AGENT_API_KEY")
-
-print(f"配置加载完成:")
-print(f"  API Base URL: {settings.API_BASE_URL}")
-print(f"  APP ID: {settings.APP_ID[:8]}..." if settings.APP_ID else "  APP ID: 未配置")
-print(f"  API Key: {'已配置' if settings.API_KEY else '未配置'}")
-print(f"  服务器: {settings.SERVER_HOST}:{settings.SERVER_PORT}")
-print(f"  认证: {'已启用' if settings.API_AUTH_KEY else '未启用'}") 
+# 实际加载的配置文件，由 load_settings 记录
+config_source: Optional[Path] = None
+
+
+def load_settings() -> Settings:
+    """读取配置文件并创建设置实例，优先使用配置文件中的值"""
+    global config_source
+    config_loader = ConfigLoader()
+    config_source = config_loader.source
+    loaded = Settings(
+        API_BASE_URL=config_loader.get("agent.api_base_url", "https://agent.bit.edu.cn"),
+        APP_ID=config_loader.get("agent.app_id", ""),
+        API_KEY=config_loader.get("agent.api_key", ""),
+        UPSTREAM_POOL_SIZE=config_loader.get("agent.pool_size", 100),
+        UPSTREAM_TIMEOUT=config_loader.get("agent.timeout", 30),
+        UPSTREAM_CONNECT_TIMEOUT=config_loader.get("agent.connect_timeout", 10),
+        UPSTREAM_IDLE_TIMEOUT=config_loader.get("agent.idle_timeout", 60),
+        BLOCKING_VIA_STREAM=config_loader.get("agent.blocking_via_stream", False),
+        MAX_CHOICES=config_loader.get("agent.max_choices", 8),
+        CHOICE_CONCURRENCY=config_loader.get("agent.choice_concurrency", 4),
+        UPSTREAM_HTTP2=config_loader.get("agent.http2", False),
+        UPSTREAM_HTTP2_MAX_STREAMS=config_loader.get("agent.http2_max_streams", 100),
+        UPSTREAM_HTTP2_MAX_CONNECTIONS=config_loader.get("agent.http2_max_connections", 10),
+        SERVER_HOST=config_loader.get("server.host", "0.0.0.0"),
+        SERVER_PORT=config_loader.get("server.port", 8000),
+        SERVER_WORKERS=config_loader.get("server.workers", 0),
+        SERVER_GRACEFUL_TIMEOUT=config_loader.get("server.graceful_timeout", 30),
+        SERVER_DRAIN_TIMEOUT=config_loader.get("server.drain_timeout", 30),
+        SERVER_HTTP2=config_loader.get("server.http2", False),
+        SERVER_HTTP2_MAX_STREAMS=config_loader.get("server.http2_max_streams", 100),
+        SERVER_CERTFILE=config_loader.get("server.certfile", ""),
+        SERVER_KEYFILE=config_loader.get("server.keyfile", ""),
+        SERVER_WARMUP=config_loader.get("server.warmup", False),
+        SERVER_WARMUP_CONNECTIONS=config_loader.get("server.warmup_connections", 4),
+        SERVER_WARMUP_TIMEOUT=config_loader.get("server.warmup_timeout", 10),
+        API_AUTH_KEY=config_loader.get("server.auth_key", ""),
+        ADMIN_AUTH_KEY=config_loader.get("server.admin_key", ""),
+        COMPRESSION_ENABLED=config_loader.get("compression.enabled", True),
+        COMPRESSION_ENCODINGS=config_loader.get("compression.encodings", "zstd,gzip,br"),
+        COMPRESSION_MIN_SIZE=config_loader.get("compression.min_size", 512),
+        MAX_CONVERSATIONS=config_loader.get("session.max_conversations", 1000),
+        CONVERSATION_TIMEOUT=config_loader.get("session.timeout", 3600),
+        SESSION_STORE=config_loader.get("session.store", "memory"),
+        SESSION_STORE_PATH=config_loader.get("session.store_path", "data/sessions.db"),
+        LOG_LEVEL=config_loader.get("logging.level", "INFO"),
+        VERBOSE_LOGGING=config_loader.get("logging.verbose", False),
+        LOG_FORMAT=config_loader.get("logging.format", "text"),
+        LOG_QUEUE_SIZE=config_loader.get("logging.queue_size", 10000),
+        LOG_MESSAGE_MAX_CHARS=config_loader.get("logging.message_max_chars", 4096),
+        LOG_SAMPLE_RATES=config_loader.get("logging.sample_rates", None) or {},
+        CONTEXT_MAX_TOKENS=config_loader.get("context.max_tokens", 0),
+        CONTEXT_SUMMARY_TOKENS=config_loader.get("context.summary_tokens", 512),
+        CONTEXT_SUMMARY_LINE_TOKENS=config_loader.get("context.summary_line_tokens", 48),
+        CONTEXT_CACHE_SIZE=config_loader.get("context.cache_size", 1024),
+        PROMPT_INDEX_SIZE=config_loader.get("prompt_index.size", 256),
+        PROMPT_INDEX_MIN_LENGTH=config_loader.get("prompt_index.min_length", 256),
+        PROMPT_INDEX_MAX_BYTES=config_loader.get("prompt_index.max_bytes", 16 * 1024 * 1024),
+        PROMPT_INDEX_TOP=config_loader.get("prompt_index.top", 10),
+        PROMPT_CACHE_ENABLED=config_loader.get("prompt_cache.enabled", False),
+        PROMPT_CACHE_CALLERS=config_loader.get("prompt_cache.callers", None) or [],
+        PROMPT_CACHE_SHARED=config_loader.get("prompt_cache.shared", False),
+        PROMPT_CACHE_SIZE=config_loader.get("prompt_cache.size", 100000),
+        PROMPT_CACHE_THRESHOLD=config_loader.get("prompt_cache.threshold", 0.85),
+        PROMPT_CACHE_TTL=config_loader.get("prompt_cache.ttl", 3600),
+        JOB_MAX_WORKERS=config_loader.get("jobs.max_workers", 16),
+        JOB_MAX_PENDING=config_loader.get("jobs.max_pending", 1000),
+        JOB_RESULT_TTL=config_loader.get("jobs.result_ttl", 3600),
+        JOB_MAX_WAIT=config_loader.get("jobs.max_wait", 60),
+        BATCH_DIR=config_loader.get("batch.dir", "data/batches"),
+        BATCH_CONCURRENCY=config_loader.get("batch.concurrency", 8),
+        STREAM_BUFFER_TTL=config_loader.get("stream.buffer_ttl", 300),
+        STREAM_BUFFER_MAX_BYTES=config_loader.get("stream.buffer_max_bytes", 64 * 1024 * 1024),
+        STREAM_BUFFER_STREAM_MAX_BYTES=config_loader.get("stream.stream_max_bytes", 1024 * 1024),
+        STREAM_BUFFER_OVERFLOW=config_loader.get("stream.overflow", "pause"),
+        STREAM_BUFFER_GRACE=config_loader.get("stream.overflow_grace", 30),
+        STREAM_WORKERS=config_loader.get("stream.workers", 256),
+        USAGE_ENABLED=config_loader.get("usage.enabled", True),
+        USAGE_FILE=config_loader.get("usage.file", "data/usage.jsonl"),
+        USAGE_FLUSH_INTERVAL=config_loader.get("usage.flush_interval", 10),
+        DEADLINE_DEFAULT_TIMEOUT=config_loader.get("deadline.default_timeout", 0),
+        DEADLINE_CALLER_TIMEOUTS=config_loader.get("deadline.caller_timeouts", None) or {},
+        MONITOR_ENABLED=config_loader.get("monitor.enabled", True),
+        MONITOR_INTERVAL=config_loader.get("monitor.interval", 0.5),
+        LOOP_LAG_THRESHOLD=config_loader.get("monitor.lag_threshold", 0.2),
+        RECORD_MODE=config_loader.get("recording.mode", "off"),
+        RECORD_FILE=config_loader.get("recording.file", "recordings/upstream.jsonl"),
+        REPLAY_SPEED=config_loader.get("recording.replay_speed", 1.0)
+    )
+
+    # 验证必需的配置
+    if not loaded.APP_ID:
+        raise ValueError("APP_ID 未配置！请在 config.local.yaml 中设置 agent.app_id 或设置环境变量 AGENT_APP_ID")
+    if not loaded.API_KEY:
+        raise ValueError("API_KEY 未配置！请在 config.local.yaml 中设置 agent.api_key 或设置环境变量 AGENT_API_KEY")
+    return loaded
+
+
+def log_settings_summary():
+    """在日志中输出配置摘要（日志配置完成后调用）"""
+    logger.info("配置加载完成: %s", config_source or "未找到配置文件，使用默认配置")
+    logger.info("  API Base URL: %s", settings.API_BASE_URL)
+    logger.info("  APP ID: %s...", settings.APP_ID[:8])
+    logger.info("  API Key: 已配置")
+    logger.info("  服务器: %s:%s", settings.SERVER_HOST, settings.SERVER_PORT)
+    logger.info("  认证: %s", "已启用" if settings.API_AUTH_KEY else "未启用")
+
+
+# 全局设置：首次访问属性时才读取配置文件并校验，导入本模块不做任何 I/O
+settings: Settings = LazyObject(load_settings)  # type: ignore[assignment]
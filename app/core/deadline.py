@@ -0,0 +1,126 @@
+"""
+请求截止时间
+
+客户端有自己的超时，超时后仍在排队、创建会话或读取上游的工作都是浪费。每个聊天请求可以携带一个截止时间：
+- 来源：请求头 ``X-Request-Timeout``（秒），未携带时使用调用方（API 密钥摘要）的默认值
+  ``deadline.caller_timeouts``，再没有时使用 ``deadline.default_timeout``（0 表示不限制）
+- 传递：截止时间保存在上下文变量中，随请求进入流式生产者线程与多选择的线程池，无需逐层传参
+- 检查：准入、创建上游会话前、发起上游查询前与流式读取的每个分片，已过期时抛出 ``DeadlineExceeded``
+  并按阶段计数，被省下的工作见 ``/stats`` 的 ``deadlines``
+- 收紧：上游请求的超时不超过剩余时间
+"""
+import threading
+import time
+from contextvars import ContextVar
+from typing import Dict, Optional, Tuple, Union
+
+from app.core.config import settings
+
+TIMEOUT_HEADER = "x-request-timeout"
+
+# 检查截止时间的阶段，依次对应省下的工作：整个请求、创建上游会话、上游查询、剩余的流式输出
+STAGES = ("admission", "conversation", "query", "stream")
+
+
+class DeadlineExceeded(Exception):
+    """请求已超过截止时间"""
+
+    def __init__(self, stage: str):
+        super().__init__(f"请求已超过截止时间（{stage}）")
+        self.stage = stage
+
+
+class Deadline:
+    """单个请求的截止时间（单调时钟）"""
+
+    __slots__ = ("timeout", "expires_at")
+
+    def __init__(self, timeout: float, started: Optional[float] = None):
+        self.timeout = timeout
+        self.expires_at = (time.monotonic() if started is None else started) + timeout
+
+    def remaining(self) -> float:
+        return self.expires_at - time.monotonic()
+
+    @property
+    def expired(self) -> bool:
+        return time.monotonic() >= self.expires_at
+
+
+# 当前请求的截止时间，未设置时为 None（异步任务、批处理等不受限制）
+deadline_var: ContextVar[Optional[Deadline]] = ContextVar("deadline", default=None)
+
+
+class DeadlineStats:
+    """截止时间统计：携带截止时间的请求数、各阶段因过期放弃的次数、被收紧的上游超时次数"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.expired: Dict[str, int] = dict.fromkeys(STAGES, 0)
+        self.clamped = 0
+
+    def count_request(self):
+        with self._lock:
+            self.requests += 1
+
+    def count_expired(self, stage: str):
+        with self._lock:
+            self.expired[stage] = self.expired.get(stage, 0) + 1
+
+    def count_clamped(self):
+        with self._lock:
+            self.clamped += 1
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {"requests": self.requests, "expired": dict(self.expired), "clamped_timeouts": self.clamped}
+
+
+def request_deadline(header: Optional[str], caller: str, started: Optional[float] = None) -> Optional[Deadline]:
+    """根据请求头或调用方的默认值确定截止时间，请求头无效时抛出 ValueError"""
+    if header is not None:
+        timeout = float(header)
+        if not timeout > 0:
+            raise ValueError("X-Request-Timeout 必须为正数（秒）")
+    else:
+        timeout = settings.DEADLINE_CALLER_TIMEOUTS.get(caller, settings.DEADLINE_DEFAULT_TIMEOUT)
+        if timeout <= 0:
+            return None
+    deadline_stats.count_request()
+    return Deadline(timeout, started)
+
+
+def check_deadline(stage: str):
+    """当前请求已超过截止时间时计数并抛出 DeadlineExceeded"""
+    deadline = deadline_var.get()
+    if deadline is not None and deadline.expired:
+        deadline_stats.count_expired(stage)
+        raise DeadlineExceeded(stage)
+
+
+def deadline_expired() -> bool:
+    deadline = deadline_var.get()
+    return deadline is not None and deadline.expired
+
+
+Timeout = Union[float, Tuple[float, float]]
+
+
+def clamp_timeout(timeout: Timeout) -> Timeout:
+    """把上游请求的超时（单个值或 (连接, 读取) 元组）收紧到当前请求的剩余时间以内"""
+    deadline = deadline_var.get()
+    if deadline is None:
+        return timeout
+    remaining = max(deadline.remaining(), 0.001)
+    if isinstance(timeout, tuple):
+        clamped = tuple(min(value, remaining) for value in timeout)
+    else:
+        clamped = min(timeout, remaining)
+    if clamped != timeout:
+        deadline_stats.count_clamped()
+    return clamped
+
+
+# 创建全局截止时间统计
+deadline_stats = DeadlineStats()
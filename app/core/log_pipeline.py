@@ -0,0 +1,254 @@
+"""
+非阻塞日志管道
+
+请求路径上的日志调用只做过滤、合并消息参数与入队，时间戳、文本 / JSON 格式化与写 stderr
+都在后台写线程中完成，stdout/stderr 写满或变慢时不会拖慢请求：
+- 有界队列：队列满时丢弃 WARNING 以下的新日志并计数，从不阻塞调用方；WARNING 及以上的日志始终入队
+  （可以超出容量），不会因 debug / info 日志过多而丢失；单条消息超过 ``message_max_chars`` 时截断
+- 带异常的日志在调用方线程中格式化堆栈并丢弃异常对象，队列中的记录不会让异常的栈帧及其局部变量继续存活
+- 按类别采样：日志调用通过 ``extra={"category": "token"}`` 标注类别，按 ``sample_rates`` 中的比例保留
+  （例如只记录 1% 的 token 事件），未标注或未配置的类别全部保留
+- 关联 ID：``CorrelationIdMiddleware`` 为每个请求设置 ``request_id``（沿用客户端的 X-Request-ID 或新生成，
+  并在响应头中返回），同一请求的所有日志都带有该 ID，包括线程池中运行的流式生成器与异步任务
+- 输出格式：``text`` 为可读文本，``json`` 为每行一个 JSON 对象，便于日志系统采集
+"""
+import atexit
+import copy
+import logging
+import logging.handlers
+import queue
+import random
+import re
+import sys
+import threading
+import uuid
+from contextvars import ContextVar
+from typing import Dict, List, Mapping, Optional
+
+from app.core.tunables import on_reload
+from app.utils import json_codec
+
+# 当前请求的关联 ID，请求之外为 "-"
+request_id_var: ContextVar[str] = ContextVar("request_id", default="-")
+
+# 接受客户端传入的 X-Request-ID 的格式，其他值一律重新生成，避免日志注入
+_REQUEST_ID_PATTERN = re.compile(r"^[A-Za-z0-9._:-]{1,64}$")
+
+TEXT_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - [%(request_id)s] %(message)s"
+
+
+def check_sample_rates(rates: Mapping[str, float]) -> List[str]:
+    """检查采样比例配置，返回错误信息列表"""
+    errors = []
+    for category, rate in rates.items():
+        if not isinstance(rate, (int, float)) or isinstance(rate, bool) or not 0 <= rate <= 1:
+            errors.append(f"日志类别 {category} 的采样比例必须在 0 到 1 之间（当前为 {rate!r}）")
+    return errors
+
+
+class PipelineStats:
+    """日志管道统计：入队、采样丢弃、队列满丢弃的条数"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.enqueued = 0
+        self.dropped = 0
+        self.sampled_out: Dict[str, int] = {}
+
+    def count_sampled_out(self, category: str):
+        with self._lock:
+            self.sampled_out[category] = self.sampled_out.get(category, 0) + 1
+
+    def count_enqueued(self, dropped: bool):
+        with self._lock:
+            if dropped:
+                self.dropped += 1
+            else:
+                self.enqueued += 1
+
+
+class SamplingFilter(logging.Filter):
+    """按类别采样，并为日志记录附加当前请求的关联 ID（在调用方线程中执行）"""
+
+    def __init__(self, sample_rates: Mapping[str, float], stats: PipelineStats):
+        super().__init__()
+        self.sample_rates = dict(sample_rates)
+        self.stats = stats
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        category = getattr(record, "category", None)
+        if category is not None:
+            rate = self.sample_rates.get(category, 1.0)
+            if rate < 1.0 and random.random() >= rate:
+                self.stats.count_sampled_out(category)
+                return False
+        record.request_id = request_id_var.get()
+        return True
+
+
+class BoundedQueueHandler(logging.handlers.QueueHandler):
+    """写入有界队列的日志处理器：队列满时丢弃 WARNING 以下的日志并计数，不阻塞调用方
+
+    队列本身不限长度，容量由 max_size 在入队时检查，WARNING 及以上的日志不受容量限制。
+    """
+
+    def __init__(self, log_queue: queue.Queue, stats: PipelineStats, message_max_chars: int, max_size: int):
+        super().__init__(log_queue)
+        self.stats = stats
+        self.message_max_chars = message_max_chars
+        self.max_size = max(max_size, 1)
+        self._exception_formatter = logging.Formatter()
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # 调用方线程中只合并参数（参数可能是之后会被修改的对象）并截断，时间戳与输出格式留给后台写线程
+        message = record.getMessage()
+        if self.message_max_chars and len(message) > self.message_max_chars:
+            omitted = len(message) - self.message_max_chars
+            message = f"{message[:self.message_max_chars]}...（截断 {omitted} 个字符）"
+        record = copy.copy(record)
+        record.msg = message
+        record.args = None
+        record.message = message
+        if record.exc_info:
+            # 异常的 traceback 引用了栈帧及其全部局部变量（可能是整个请求体或响应），
+            # 入队前格式化为文本并丢弃，不让它们在队列中存活到后台线程写出为止
+            if not record.exc_text:
+                record.exc_text = self._exception_formatter.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        if record.levelno < logging.WARNING and self.queue.qsize() >= self.max_size:
+            self.stats.count_enqueued(dropped=True)
+            return
+        self.queue.put_nowait(record)
+        self.stats.count_enqueued(dropped=False)
+
+
+class JsonFormatter(logging.Formatter):
+    """每条日志输出为一行 JSON"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "request_id": getattr(record, "request_id", "-"),
+            "message": record.getMessage(),
+        }
+        category = getattr(record, "category", None)
+        if category is not None:
+            entry["category"] = category
+        # 经过管道的记录只带有在调用方线程中格式化好的 exc_text
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc_info"] = record.exc_text
+        if record.stack_info:
+            entry["stack_info"] = self.formatStack(record.stack_info)
+        return json_codec.dumps(entry)
+
+
+class LogPipeline:
+    """根日志器的非阻塞输出管道：调用方只入队，后台线程写出"""
+
+    def __init__(self):
+        self.stats = PipelineStats()
+        self.handler: Optional[BoundedQueueHandler] = None
+        self.sampler: Optional[SamplingFilter] = None
+        self.listener: Optional[logging.handlers.QueueListener] = None
+        self._lock = threading.Lock()
+
+    @property
+    def installed(self) -> bool:
+        return self.listener is not None
+
+    def install(self, level: str = "INFO", fmt: str = "text", queue_size: int = 10000,
+                sample_rates: Optional[Mapping[str, float]] = None, message_max_chars: int = 4096,
+                stream=None):
+        """替换根日志器的处理器并启动后台写线程（重复调用无副作用）"""
+        with self._lock:
+            if self.listener is not None:
+                return
+            output = logging.StreamHandler(stream or sys.stderr)
+            output.setFormatter(JsonFormatter() if fmt == "json" else logging.Formatter(TEXT_FORMAT))
+            log_queue: queue.Queue = queue.Queue()
+            self.sampler = SamplingFilter(sample_rates or {}, self.stats)
+            self.handler = BoundedQueueHandler(log_queue, self.stats, message_max_chars, queue_size)
+            self.handler.addFilter(self.sampler)
+
+            root = logging.getLogger()
+            for existing in list(root.handlers):
+                root.removeHandler(existing)
+            root.addHandler(self.handler)
+            root.setLevel(level.upper())
+
+            self.listener = logging.handlers.QueueListener(log_queue, output)
+            self.listener.start()
+            atexit.register(self.stop)
+
+    def stop(self):
+        """写出队列中剩余的日志并停止后台写线程"""
+        with self._lock:
+            if self.listener is None:
+                return
+            self.listener.stop()
+            self.listener = None
+
+    def set_sample_rates(self, sample_rates: Mapping[str, float]):
+        if self.sampler is not None:
+            self.sampler.sample_rates = dict(sample_rates)
+
+    def snapshot(self) -> Dict:
+        """导出管道统计"""
+        handler = self.handler
+        return {
+            "enqueued": self.stats.enqueued,
+            "dropped": self.stats.dropped,
+            "sampled_out": dict(self.stats.sampled_out),
+            "queue_depth": handler.queue.qsize() if handler else 0,
+            "queue_size": handler.max_size if handler else 0,
+            "sample_rates": dict(self.sampler.sample_rates) if self.sampler else {},
+        }
+
+
+class CorrelationIdMiddleware:
+    """为每个 HTTP 请求 / WebSocket 连接设置关联 ID，并在响应头 X-Request-ID 中返回"""
+
+    def __init__(self, app, header: str = "x-request-id"):
+        self.app = app
+        self.header = header.lower().encode("latin-1")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] not in ("http", "websocket"):
+            await self.app(scope, receive, send)
+            return
+        request_id = None
+        for name, value in scope.get("headers", ()):
+            if name == self.header:
+                request_id = value.decode("latin-1")
+                break
+        if request_id is None or not _REQUEST_ID_PATTERN.match(request_id):
+            request_id = uuid.uuid4().hex
+        token = request_id_var.set(request_id)
+        header = (self.header, request_id.encode("latin-1"))
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = [*message.get("headers", ()), header]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_id if scope["type"] == "http" else send)
+        finally:
+            request_id_var.reset(token)
+
+
+# 创建全局日志管道
+log_pipeline = LogPipeline()
+
+
+@on_reload
+def _apply_settings(new, changed):
+    if "LOG_SAMPLE_RATES" in changed:
+        log_pipeline.set_sample_rates(new.LOG_SAMPLE_RATES)
@@ -0,0 +1,402 @@
+"""
+多进程（pre-fork）生产服务器
+
+主进程只负责管理工作进程：每个工作进程各自以 SO_REUSEPORT 绑定同一端口，由内核在进程间分配连接；
+不支持 SO_REUSEPORT 的平台退化为主进程预先绑定、工作进程共享同一个监听套接字。
+
+启用 HTTP/2（server.http2）时工作进程改用 hypercorn：配置了证书时通过 ALPN 协商 h2，
+否则为明文 h2c（prior knowledge 或 Upgrade），同时兼容 HTTP/1.1 客户端。
+
+信号：
+- SIGTERM / SIGINT：优雅关闭所有工作进程（工作进程先进入 drain 状态，等待在途 SSE 流结束）
+- SIGUSR2：滚动重启，逐个启动新进程、待其就绪后再优雅关闭旧进程；重启在监控循环中逐步推进，
+  期间照常响应退出信号、回收并重启意外退出的工作进程
+- SIGHUP：转发给所有工作进程，重新加载可调参数（见 app.core.tunables），不重启进程
+
+意外退出的工作进程会被重新启动；启动后很快就退出（配置错误、端口不可用等）时按指数退避延迟重启，
+连续多次快速退出后主进程放弃并以非零状态退出，避免无休止地重启。
+"""
+import asyncio
+import importlib
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import uvicorn
+
+logger = logging.getLogger(__name__)
+
+APP_IMPORT_STRING = "main:app"
+# 等待新工作进程就绪的最长时间（秒）
+WORKER_READY_TIMEOUT = 60
+# 启动后在该时间（秒）内退出的工作进程视为快速退出
+WORKER_FAST_EXIT = 10
+# 连续快速退出后重启的延迟（秒）：从 RESPAWN_BACKOFF_BASE 开始逐次翻倍，不超过 RESPAWN_BACKOFF_MAX
+RESPAWN_BACKOFF_BASE = 0.5
+RESPAWN_BACKOFF_MAX = 30
+# 连续快速退出达到该次数后主进程放弃
+WORKER_MAX_FAST_EXITS = 5
+
+
+def bind_socket(host: str, port: int, reuse_port: bool) -> socket.socket:
+    """创建并绑定监听套接字"""
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if reuse_port:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+class WorkerServer(uvicorn.Server):
+    """工作进程中的 uvicorn 服务器
+
+    启动完成后通知主进程；收到第一个退出信号时先进入 drain 状态，
+    等待在途 SSE 流结束（或超过 drain_timeout 后中断）再真正关闭，再次收到信号则立即关闭。
+    """
+
+    def __init__(self, config: uvicorn.Config, ready_event=None, drain_timeout: float = 30):
+        super().__init__(config)
+        self.ready_event = ready_event
+        self.drain_timeout = drain_timeout
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._drain_task: Optional[asyncio.Task] = None
+
+    async def startup(self, sockets: Optional[List[socket.socket]] = None) -> None:
+        self._loop = asyncio.get_running_loop()
+        await super().startup(sockets=sockets)
+        if self.started and self.ready_event is not None:
+            self.ready_event.set()
+
+    def handle_exit(self, sig, frame) -> None:
+        if self._loop is None or self._drain_task is not None or self.should_exit:
+            super().handle_exit(sig, frame)
+            return
+        self._loop.call_soon_threadsafe(self._start_drain, sig)
+
+    def _start_drain(self, sig):
+        if self._drain_task is None:
+            self._drain_task = self._loop.create_task(self._drain(sig))
+
+    async def _drain(self, sig):
+        from app.core.drain import drain_controller
+        from app.services.agent_service import close_agent_service
+
+        # 立即停止接受新连接，已建立的连接继续处理
+        for server in self.servers:
+            server.close()
+        await drain_controller.drain(self.drain_timeout, on_cut=close_agent_service)
+        close_agent_service()
+        super().handle_exit(sig, None)
+
+
+def _load_app():
+    module_name, attr = APP_IMPORT_STRING.split(":")
+    return getattr(importlib.import_module(module_name), attr)
+
+
+def _notify_ready(app, ready_event):
+    """包装 ASGI 应用：lifespan 启动完成时通知主进程"""
+    async def wrapped(scope, receive, send):
+        if scope["type"] != "lifespan" or ready_event is None:
+            await app(scope, receive, send)
+            return
+
+        async def notify(message):
+            await send(message)
+            if message["type"] == "lifespan.startup.complete":
+                ready_event.set()
+
+        await app(scope, receive, notify)
+
+    return wrapped
+
+
+def _serve_hypercorn(sock: socket.socket, log_level: str, graceful_timeout: int, drain_timeout: int, ready_event):
+    """以 hypercorn 运行工作进程（HTTP/2）
+
+    第一个退出信号先进入 drain 状态，等待在途 SSE 流结束后再关闭；再次收到信号则立即关闭。
+    """
+    from hypercorn.asyncio import serve as hypercorn_serve
+    from hypercorn.config import Config
+
+    from app.core.config import settings
+
+    config = Config()
+    config.bind = [f"fd://{sock.fileno()}"]
+    config.loglevel = log_level.upper()
+    # 交给应用的日志配置输出，避免 hypercorn 自带的处理器重复打印
+    config.errorlog = logging.getLogger("hypercorn.error")
+    config.graceful_timeout = graceful_timeout
+    config.h2_max_concurrent_streams = settings.SERVER_HTTP2_MAX_STREAMS
+    if settings.SERVER_CERTFILE and settings.SERVER_KEYFILE:
+        config.certfile = settings.SERVER_CERTFILE
+        config.keyfile = settings.SERVER_KEYFILE
+    app = _notify_ready(_load_app(), ready_event)
+
+    async def run():
+        from app.core.drain import drain_controller
+        from app.services.agent_service import close_agent_service
+
+        loop = asyncio.get_running_loop()
+        drain_requested = asyncio.Event()
+        force_exit = asyncio.Event()
+
+        def handle_exit():
+            if drain_requested.is_set():
+                force_exit.set()
+            drain_requested.set()
+
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(sig, handle_exit)
+
+        async def shutdown_trigger():
+            await drain_requested.wait()
+            drain = asyncio.ensure_future(drain_controller.drain(drain_timeout, on_cut=close_agent_service))
+            force = asyncio.ensure_future(force_exit.wait())
+            await asyncio.wait({drain, force}, return_when=asyncio.FIRST_COMPLETED)
+            force.cancel()
+            close_agent_service()
+
+        await hypercorn_serve(app, config, shutdown_trigger=shutdown_trigger)
+
+    asyncio.run(run())
+
+
+def _worker_main(host: str, port: int, log_level: str, graceful_timeout: int, drain_timeout: int,
+                 ready_event, shared_socket: Optional[socket.socket], http2: bool = False):
+    """工作进程入口"""
+    if http2:
+        sock = shared_socket if shared_socket is not None else bind_socket(host, port, reuse_port=True)
+        _serve_hypercorn(sock, log_level, graceful_timeout, drain_timeout, ready_event)
+        return
+
+    config = uvicorn.Config(
+        APP_IMPORT_STRING,
+        host=host,
+        port=port,
+        log_level=log_level,
+        timeout_graceful_shutdown=graceful_timeout,
+    )
+    server = WorkerServer(config, ready_event, drain_timeout)
+    sock = shared_socket if shared_socket is not None else bind_socket(host, port, reuse_port=True)
+    server.run(sockets=[sock])
+
+
+class PreforkServer:
+    """多进程服务器主进程"""
+
+    def __init__(self, host: str, port: int, workers: int, log_level: str = "info",
+                 graceful_timeout: int = 30, drain_timeout: int = 30, http2: bool = False):
+        self.host = host
+        self.port = port
+        self.worker_count = max(1, workers)
+        self.log_level = log_level
+        self.graceful_timeout = graceful_timeout
+        self.drain_timeout = drain_timeout
+        self.http2 = http2
+        # 等待工作进程退出的最长时间：drain + uvicorn 优雅关闭 + 余量
+        self.stop_timeout = drain_timeout + graceful_timeout + 5
+        self.reuse_port = hasattr(socket, "SO_REUSEPORT")
+        self.shared_socket = None if self.reuse_port else bind_socket(host, port, reuse_port=False)
+        self.ctx = multiprocessing.get_context("spawn")
+        self.workers: List[multiprocessing.Process] = []
+        self._started: Dict[int, float] = {}  # 工作进程 pid -> 启动时间
+        # 工作进程 pid -> 就绪事件：主进程须一直持有，事件被回收时底层信号量随之删除，尚未读取参数的子进程会启动失败
+        self._ready_events: Dict[int, object] = {}
+        self._fast_exits = 0  # 连续快速退出的次数
+        self._respawns: List[float] = []  # 待重启的工作进程的计划启动时间
+        self._crashed = False
+        # 滚动重启的进度：待替换的旧进程、正在启动的新进程 (进程, 就绪事件, 就绪截止时间)
+        self._restart_queue: List[multiprocessing.Process] = []
+        self._incoming: Optional[Tuple[multiprocessing.Process, object, float]] = None
+        # 已发送 SIGTERM、等待退出的旧进程：pid -> (进程, 强制结束的时间)
+        self._retiring: Dict[int, Tuple[multiprocessing.Process, float]] = {}
+        self._should_exit = threading.Event()
+        self._restart_requested = threading.Event()
+        self._reload_requested = threading.Event()
+
+    def _spawn(self) -> Tuple[multiprocessing.Process, object]:
+        ready_event = self.ctx.Event()
+        process = self.ctx.Process(
+            target=_worker_main,
+            args=(self.host, self.port, self.log_level, self.graceful_timeout, self.drain_timeout,
+                  ready_event, self.shared_socket, self.http2),
+            daemon=False,
+        )
+        process.start()
+        self._started[process.pid] = time.monotonic()
+        self._ready_events[process.pid] = ready_event
+        return process, ready_event
+
+    def _forget(self, process: multiprocessing.Process):
+        """工作进程退出后释放其记录"""
+        self._started.pop(process.pid, None)
+        self._ready_events.pop(process.pid, None)
+
+    def _retire(self, process: multiprocessing.Process):
+        """优雅停止工作进程，不等待其退出；超过 stop_timeout 仍未退出时由 _check_retiring 强制结束"""
+        self._started.pop(process.pid, None)
+        process.terminate()
+        self._retiring[process.pid] = (process, time.monotonic() + self.stop_timeout)
+
+    def _check_retiring(self):
+        """回收已退出的旧进程，强制结束超时未退出的"""
+        now = time.monotonic()
+        for pid, (process, kill_at) in list(self._retiring.items()):
+            if not process.is_alive():
+                process.join()
+            elif now >= kill_at:
+                logger.warning("工作进程 %s 未能在超时时间内退出，强制结束", pid)
+                process.kill()
+                process.join()
+            else:
+                continue
+            del self._retiring[pid]
+            self._forget(process)
+
+    def _install_signal_handlers(self):
+        signal.signal(signal.SIGTERM, lambda *_: self._should_exit.set())
+        signal.signal(signal.SIGINT, lambda *_: self._should_exit.set())
+        if hasattr(signal, "SIGUSR2"):
+            signal.signal(signal.SIGUSR2, lambda *_: self._restart_requested.set())
+        if hasattr(signal, "SIGHUP"):
+            signal.signal(signal.SIGHUP, lambda *_: self._reload_requested.set())
+
+    def reload_workers(self):
+        """把 SIGHUP 转发给所有工作进程，各自重新加载可调参数"""
+        logger.info("通知 %d 个工作进程重新加载配置", len(self.workers))
+        for process in self.workers:
+            if process.is_alive():
+                os.kill(process.pid, signal.SIGHUP)
+
+    def rolling_restart(self):
+        """开始滚动重启：逐个替换工作进程，始终保持至少 N 个进程在接受连接
+
+        只记录待替换的进程并启动第一个新进程，之后由监控循环中的 _advance_restart 推进，不阻塞主进程。
+        """
+        if self._restart_queue or self._incoming is not None:
+            logger.info("滚动重启正在进行，忽略本次请求")
+            return
+        logger.info("开始滚动重启 %d 个工作进程", len(self.workers))
+        self._restart_queue = list(self.workers)
+        self._advance_restart()
+
+    def _advance_restart(self):
+        """推进滚动重启：新进程就绪后关闭对应的旧进程，再启动下一个新进程"""
+        if self._incoming is not None:
+            new, ready_event, ready_by = self._incoming
+            if ready_event.is_set():
+                self._incoming = None
+                self.workers.append(new)
+                old = self._restart_queue.pop(0)
+                # 旧进程可能已意外退出并被回收重启，此时无需再关闭
+                if old in self.workers:
+                    self.workers.remove(old)
+                    self._retire(old)
+                logger.info("工作进程 %s 已替换为 %s", old.pid, new.pid)
+                if not self._restart_queue:
+                    logger.info("滚动重启完成")
+            elif not new.is_alive() or time.monotonic() >= ready_by:
+                logger.error("新工作进程 %s 启动失败或超时，终止滚动重启", new.pid)
+                self._incoming = None
+                self._restart_queue = []
+                self._retire(new)
+                return
+            else:
+                return
+        if not self._restart_queue:
+            return
+        new, ready_event = self._spawn()
+        self._incoming = (new, ready_event, time.monotonic() + WORKER_READY_TIMEOUT)
+
+    def run(self):
+        self._install_signal_handlers()
+        mode = "SO_REUSEPORT" if self.reuse_port else "共享监听套接字"
+        protocol = "HTTP/2" if self.http2 else "HTTP/1.1"
+        logger.info("以多进程模式启动: %d 个工作进程，%s:%d（%s，%s）",
+                    self.worker_count, self.host, self.port, mode, protocol)
+
+        for _ in range(self.worker_count):
+            process, _ready = self._spawn()
+            self.workers.append(process)
+
+        while not self._should_exit.wait(0.5):
+            if self._restart_requested.is_set():
+                self._restart_requested.clear()
+                self.rolling_restart()
+            if self._reload_requested.is_set():
+                self._reload_requested.clear()
+                self.reload_workers()
+            self._reap_workers()
+            self._advance_restart()
+            self._check_retiring()
+
+        self._shutdown()
+        if self._crashed:
+            raise SystemExit(1)
+
+    def _shutdown(self):
+        """优雅关闭全部工作进程，包括滚动重启中正在启动的新进程和正在退出的旧进程"""
+        processes = list(self.workers)
+        if self._incoming is not None:
+            processes.append(self._incoming[0])
+            self._incoming = None
+        self._restart_queue = []
+        logger.info("正在关闭 %d 个工作进程", len(processes) + len(self._retiring))
+        for process in processes:
+            process.terminate()
+        # 正在退出的旧进程已收到过 SIGTERM，再次发送会使其跳过 drain 立即关闭
+        processes.extend(process for process, _kill_at in self._retiring.values())
+        self._retiring = {}
+        for process in processes:
+            process.join(self.stop_timeout)
+            if process.is_alive():
+                process.kill()
+                process.join()
+        if self.shared_socket is not None:
+            self.shared_socket.close()
+
+    def _reap_workers(self):
+        """检查意外退出的工作进程并安排重启；连续快速退出时按指数退避延迟，达到上限后停止服务"""
+        now = time.monotonic()
+        for process in list(self.workers):
+            if process.is_alive():
+                continue
+            self.workers.remove(process)
+            uptime = now - self._started.get(process.pid, now)
+            self._forget(process)
+            self._fast_exits = self._fast_exits + 1 if uptime < WORKER_FAST_EXIT else 0
+            if self._fast_exits >= WORKER_MAX_FAST_EXITS:
+                logger.error("工作进程连续 %d 次在启动后 %d 秒内退出（最近退出码 %s），停止服务",
+                             self._fast_exits, WORKER_FAST_EXIT, process.exitcode)
+                self._crashed = True
+                self._should_exit.set()
+                return
+            delay = 0.0
+            if self._fast_exits:
+                delay = min(RESPAWN_BACKOFF_BASE * 2 ** (self._fast_exits - 1), RESPAWN_BACKOFF_MAX)
+            logger.warning("工作进程 %s 意外退出（退出码 %s），%.1f 秒后重新启动", process.pid, process.exitcode, delay)
+            self._respawns.append(now + delay)
+
+        due = [at for at in self._respawns if at <= now]
+        if not due:
+            return
+        self._respawns = [at for at in self._respawns if at > now]
+        for _ in due:
+            replacement, _ready = self._spawn()
+            self.workers.append(replacement)
+
+
+def serve(host: str, port: int, workers: int, log_level: str = "info",
+          graceful_timeout: int = 30, drain_timeout: int = 30, http2: bool = False):
+    """以多进程生产模式运行服务"""
+    PreforkServer(host, port, workers, log_level, graceful_timeout, drain_timeout, http2).run()
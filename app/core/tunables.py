@@ -0,0 +1,156 @@
+"""
+运行时可调参数
+
+收到 SIGHUP（多进程模式下由主进程转发给所有工作进程）或 ``POST /admin/reload`` 时重新读取配置文件与环境变量：
+- 先完整校验：配置无法解析、缺少必需项或可调参数越界时整体拒绝，运行中的配置保持不变
+- 校验通过后以一次引用替换原子地切换 ``settings``，之后的请求立即使用新值，在途请求和 SSE 流不受影响
+- 只切换 ``TUNABLES`` 中的限制、超时、缓存大小与并发上限；监听地址、会话存储、上游地址与密钥等
+  其他配置的变化只在结果中报告为需要重启
+- 需要重建资源的参数（线程池、连接池、缓存容量）由各服务通过 ``on_reload`` 注册的回调应用
+"""
+import logging
+import threading
+from typing import Callable, Dict, List, Optional, Set
+
+from pydantic import ValidationError
+
+from app.core.config import Settings, load_settings, settings
+from app.utils.lazy import replace, resolve
+
+logger = logging.getLogger(__name__)
+
+# 可在运行时调整的配置项及其下限（None 表示不检查下限）
+TUNABLES: Dict[str, Optional[float]] = {
+    "UPSTREAM_POOL_SIZE": 1,
+    "UPSTREAM_TIMEOUT": 1,
+    "UPSTREAM_CONNECT_TIMEOUT": 1,
+    "UPSTREAM_IDLE_TIMEOUT": 1,
+    "BLOCKING_VIA_STREAM": None,
+    "MAX_CHOICES": 1,
+    "CHOICE_CONCURRENCY": 1,
+    "MAX_CONVERSATIONS": 1,
+    "CONVERSATION_TIMEOUT": 1,
+    "LOG_LEVEL": None,
+    "VERBOSE_LOGGING": None,
+    "LOG_SAMPLE_RATES": None,
+    "CONTEXT_MAX_TOKENS": 0,
+    "CONTEXT_SUMMARY_TOKENS": 1,
+    "CONTEXT_SUMMARY_LINE_TOKENS": 1,
+    "CONTEXT_CACHE_SIZE": 0,
+    "PROMPT_INDEX_SIZE": 0,
+    "PROMPT_INDEX_MIN_LENGTH": 0,
+    "PROMPT_INDEX_MAX_BYTES": 0,
+    "PROMPT_INDEX_TOP": 0,
+    "PROMPT_CACHE_ENABLED": None,
+    "PROMPT_CACHE_CALLERS": None,
+    "PROMPT_CACHE_SHARED": None,
+    "PROMPT_CACHE_SIZE": 0,
+    "PROMPT_CACHE_THRESHOLD": 0,
+    "PROMPT_CACHE_TTL": 0,
+    "JOB_MAX_WORKERS": 1,
+    "JOB_MAX_PENDING": 1,
+    "JOB_RESULT_TTL": 0,
+    "JOB_MAX_WAIT": 0,
+    "BATCH_CONCURRENCY": 1,
+    "STREAM_BUFFER_TTL": 0,
+    "STREAM_BUFFER_MAX_BYTES": 0,
+    "STREAM_BUFFER_STREAM_MAX_BYTES": 0,
+    "STREAM_BUFFER_OVERFLOW": None,
+    "STREAM_BUFFER_GRACE": 0,
+    "STREAM_WORKERS": 1,
+    "USAGE_FLUSH_INTERVAL": 0.1,
+    "DEADLINE_DEFAULT_TIMEOUT": 0,
+    "DEADLINE_CALLER_TIMEOUTS": None,
+    "MONITOR_INTERVAL": 0.01,
+    "LOOP_LAG_THRESHOLD": 0.01,
+}
+
+ReloadCallback = Callable[[Settings, Set[str]], None]
+
+
+class ReloadError(ValueError):
+    """新配置未通过校验，运行中的配置保持不变"""
+
+
+_subscribers: List[ReloadCallback] = []
+_reload_lock = threading.Lock()
+
+
+def on_reload(callback: ReloadCallback) -> ReloadCallback:
+    """注册配置切换后的回调，参数为新配置与发生变化的可调参数名；可作为装饰器使用"""
+    _subscribers.append(callback)
+    return callback
+
+
+def validate(candidate: Settings, names: Set[str]) -> List[str]:
+    """检查可调参数的取值，返回错误信息列表"""
+    errors = []
+    for name in sorted(names):
+        value = getattr(candidate, name)
+        minimum = TUNABLES[name]
+        if minimum is not None and value < minimum:
+            errors.append(f"{name} 不能小于 {minimum}（当前为 {value}）")
+    if "LOG_LEVEL" in names and not isinstance(logging.getLevelName(str(candidate.LOG_LEVEL).upper()), int):
+        errors.append(f"LOG_LEVEL 无效: {candidate.LOG_LEVEL}")
+    if "PROMPT_CACHE_THRESHOLD" in names and not 0 < candidate.PROMPT_CACHE_THRESHOLD <= 1:
+        errors.append(f"PROMPT_CACHE_THRESHOLD 必须在 0 到 1 之间（当前为 {candidate.PROMPT_CACHE_THRESHOLD}）")
+    if "STREAM_BUFFER_OVERFLOW" in names and candidate.STREAM_BUFFER_OVERFLOW not in ("pause", "drop"):
+        errors.append(f"STREAM_BUFFER_OVERFLOW 必须为 pause 或 drop（当前为 {candidate.STREAM_BUFFER_OVERFLOW}）")
+    if "DEADLINE_CALLER_TIMEOUTS" in names:
+        for caller, timeout in candidate.DEADLINE_CALLER_TIMEOUTS.items():
+            if timeout < 0:
+                errors.append(f"调用方 {caller} 的默认截止时间不能小于 0（当前为 {timeout}）")
+    if "LOG_SAMPLE_RATES" in names:
+        from app.core.log_pipeline import check_sample_rates
+        errors.extend(check_sample_rates(candidate.LOG_SAMPLE_RATES))
+    return errors
+
+
+def reload_settings() -> Dict:
+    """重新读取配置并切换可调参数，返回变化的参数与需要重启才能生效的配置项
+
+    校验失败时抛出 ReloadError，不做任何修改。
+    """
+    with _reload_lock:
+        try:
+            candidate = load_settings()
+        except (ValidationError, ValueError) as e:
+            raise ReloadError(f"配置无效: {e}") from e
+
+        current = resolve(settings)
+        changed = {
+            name for name in type(current).model_fields
+            if getattr(candidate, name) != getattr(current, name)
+        }
+        tunable = {name for name in changed if name in TUNABLES}
+        restart_required = sorted(changed - tunable)
+
+        errors = validate(candidate, tunable)
+        if errors:
+            raise ReloadError("；".join(errors))
+
+        report = {
+            "changed": {name: [getattr(current, name), getattr(candidate, name)] for name in sorted(tunable)},
+            "restart_required": restart_required,
+        }
+        if tunable:
+            updated = current.model_copy(update={name: getattr(candidate, name) for name in tunable})
+            replace(settings, updated)
+            for callback in _subscribers:
+                try:
+                    callback(updated, tunable)
+                except Exception:
+                    logger.exception("应用配置变更失败: %s", getattr(callback, "__qualname__", callback))
+
+        logger.info(
+            "配置已重新加载: %s%s",
+            ", ".join(f"{name}={old!r}->{new!r}" for name, (old, new) in report["changed"].items()) or "无变化",
+            f"；以下配置需要重启才能生效: {', '.join(restart_required)}" if restart_required else "",
+        )
+        return report
+
+
+@on_reload
+def _apply_log_level(new: Settings, changed: Set[str]):
+    if "LOG_LEVEL" in changed:
+        logging.getLogger().setLevel(str(new.LOG_LEVEL).upper())
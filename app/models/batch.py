@@ -0,0 +1,57 @@
+import time
+from typing import Dict, List, Literal, Optional
+from pydantic import BaseModel, Field
+
+
+class FileObject(BaseModel):
+    """文件对象（OpenAI Files API 格式）"""
+    id: str
+    object: Literal["file"] = "file"
+    bytes: int
+    created_at: int = Field(default_factory=lambda: int(time.time()))
+    filename: str
+    purpose: str
+    caller: Optional[str] = None  # 上传方（API 密钥摘要），只有上传方可以访问，不在响应中返回
+
+
+class BatchCreateRequest(BaseModel):
+    """创建批处理请求"""
+    input_file_id: str
+    endpoint: Literal["/v1/chat/completions"] = "/v1/chat/completions"
+    completion_window: str = "24h"
+    metadata: Optional[Dict[str, str]] = None
+
+
+class BatchRequestCounts(BaseModel):
+    """批处理请求计数"""
+    total: int = 0
+    completed: int = 0
+    failed: int = 0
+
+
+class Batch(BaseModel):
+    """批处理对象（OpenAI Batch API 格式），throughput 为本服务的扩展字段"""
+    id: str
+    object: Literal["batch"] = "batch"
+    endpoint: str
+    errors: Optional[Dict] = None
+    input_file_id: str
+    completion_window: str
+    status: Literal["validating", "in_progress", "completed", "failed", "cancelling", "cancelled"]
+    output_file_id: Optional[str] = None
+    error_file_id: Optional[str] = None
+    created_at: int = Field(default_factory=lambda: int(time.time()))
+    in_progress_at: Optional[int] = None
+    completed_at: Optional[int] = None
+    failed_at: Optional[int] = None
+    cancelled_at: Optional[int] = None
+    request_counts: BatchRequestCounts = Field(default_factory=BatchRequestCounts)
+    metadata: Optional[Dict[str, str]] = None
+    throughput: Optional[float] = None  # 每秒完成的请求数
+    caller: Optional[str] = None  # 创建方（API 密钥摘要），只有创建方可以访问，不在响应中返回
+
+
+class BatchList(BaseModel):
+    """批处理列表"""
+    object: Literal["list"] = "list"
+    data: List[Batch] = []
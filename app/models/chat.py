@@ -39,8 +39,16 @@ class ChatCompletionRequest(BaseModel):
     temperature: Optional[float] = None
     top_p: Optional[float] = None
     max_length: Optional[int] = None
+    max_tokens: Optional[int] = Field(default=None, ge=1)
+    stop: Optional[Union[str, List[str]]] = None
+    n: int = Field(default=1, ge=1)
     stream: Optional[bool] = False
 
+    @property
+    def token_limit(self) -> Optional[int]:
+        """回答的最大 token 数，max_tokens 优先，兼容旧的 max_length"""
+        return self.max_tokens if self.max_tokens is not None else self.max_length
+
 
 class ChatCompletionResponseChoice(BaseModel):
     """聊天完成响应选择"""
@@ -56,9 +64,19 @@ class ChatCompletionResponseStreamChoice(BaseModel):
     finish_reason: Optional[Literal["stop", "length"]]
 
 
+class UsageInfo(BaseModel):
+    """token 用量（由本服务估算，上游不返回用量）"""
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    total_tokens: int = 0
+
+
 class ChatCompletionResponse(BaseModel):
     """聊天完成响应"""
+    id: Optional[str] = None
     model: str
     object: Literal["chat.completion", "chat.completion.chunk"]
     choices: List[Union[ChatCompletionResponseChoice, ChatCompletionResponseStreamChoice]]
-    created: Optional[int] = Field(default_factory=lambda: int(time.time())) 
+    created: Optional[int] = Field(default_factory=lambda: int(time.time()))
+    usage: Optional[UsageInfo] = None
+
@@ -0,0 +1,15 @@
+from typing import Literal, Optional
+from pydantic import BaseModel
+
+from app.models.chat import ChatCompletionResponse
+
+
+class JobStatus(BaseModel):
+    """异步聊天完成任务状态"""
+    id: str
+    object: Literal["chat.completion.job"] = "chat.completion.job"
+    status: Literal["queued", "running", "succeeded", "failed"]
+    created: int
+    completed: Optional[int] = None
+    result: Optional[ChatCompletionResponse] = None
+    error: Optional[str] = None
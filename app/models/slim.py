@@ -0,0 +1,144 @@
+"""
+聊天请求的轻量表示
+
+/v1/chat/completions 的请求体可能包含上千条消息，逐条构建 pydantic 模型的开销很大。
+这里只对实际用到的字段做结构校验，构建带 __slots__ 的轻量对象，属性名与
+ChatCompletionRequest / ChatMessage 保持一致，下游代码可以直接使用。
+"""
+from typing import Any, Dict, List, Optional, Union
+
+from fastapi.exceptions import RequestValidationError
+
+from app.utils.json_codec import JSONDecodeError, loads
+
+_ROLES = ("user", "assistant", "system")
+_OPTIONAL_NUMBER_FIELDS = ("temperature", "top_p")
+
+
+class SlimMessage:
+    """轻量聊天消息"""
+
+    __slots__ = ("role", "content")
+
+    def __init__(self, role: str, content: str):
+        self.role = role
+        self.content = content
+
+
+class SlimChatRequest:
+    """轻量聊天完成请求"""
+
+    __slots__ = ("model", "messages", "temperature", "top_p", "max_length", "max_tokens", "stop", "n", "stream")
+
+    def __init__(self, model: str, messages: List[SlimMessage], temperature: Optional[float] = None,
+                 top_p: Optional[float] = None, max_length: Optional[int] = None,
+                 max_tokens: Optional[int] = None, stop: Optional[Union[str, List[str]]] = None,
+                 n: int = 1, stream: bool = False):
+        self.model = model
+        self.messages = messages
+        self.temperature = temperature
+        self.top_p = top_p
+        self.max_length = max_length
+        self.max_tokens = max_tokens
+        self.stop = stop
+        self.n = n
+        self.stream = stream
+
+    @property
+    def token_limit(self) -> Optional[int]:
+        """回答的最大 token 数，max_tokens 优先，兼容旧的 max_length"""
+        return self.max_tokens if self.max_tokens is not None else self.max_length
+
+
+def _error(errors: List[Dict], error_type: str, loc: tuple, msg: str, value: Any):
+    errors.append({"type": error_type, "loc": ("body", *loc), "msg": msg, "input": value})
+
+
+def _is_int(value: Any) -> bool:
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def parse_chat_request(body: bytes) -> SlimChatRequest:
+    """解析并校验聊天请求体，错误格式与 FastAPI 的请求校验错误一致（422）"""
+    try:
+        data = loads(body)
+    except (JSONDecodeError, ValueError) as e:
+        raise RequestValidationError([{
+            "type": "json_invalid", "loc": ("body", getattr(e, "pos", 0)), "msg": "JSON decode error", "input": {},
+            "ctx": {"error": getattr(e, "msg", str(e))}
+        }])
+
+    errors: List[Dict] = []
+    if not isinstance(data, dict):
+        _error(errors, "model_attributes_type", (), "Input should be a valid dictionary or object to extract fields from", data)
+        raise RequestValidationError(errors)
+
+    model = data.get("model")
+    if model is None:
+        _error(errors, "missing", ("model",), "Field required", data)
+    elif not isinstance(model, str):
+        _error(errors, "string_type", ("model",), "Input should be a valid string", model)
+
+    raw_messages = data.get("messages")
+    messages: List[SlimMessage] = []
+    if raw_messages is None:
+        _error(errors, "missing", ("messages",), "Field required", data)
+    elif not isinstance(raw_messages, list):
+        _error(errors, "list_type", ("messages",), "Input should be a valid list", raw_messages)
+    else:
+        for index, item in enumerate(raw_messages):
+            if not isinstance(item, dict):
+                _error(errors, "model_attributes_type", ("messages", index),
+                       "Input should be a valid dictionary", item)
+                continue
+            role = item.get("role")
+            content = item.get("content")
+            if role not in _ROLES:
+                _error(errors, "literal_error", ("messages", index, "role"),
+                       "Input should be 'user', 'assistant' or 'system'", role)
+            if not isinstance(content, str):
+                _error(errors, "string_type", ("messages", index, "content"),
+                       "Input should be a valid string", content)
+            messages.append(SlimMessage(role, content))
+
+    for name in _OPTIONAL_NUMBER_FIELDS:
+        value = data.get(name)
+        if value is not None and (isinstance(value, bool) or not isinstance(value, (int, float))):
+            _error(errors, "float_type", (name,), "Input should be a valid number", value)
+
+    max_length = data.get("max_length")
+    if max_length is not None and not _is_int(max_length):
+        _error(errors, "int_type", ("max_length",), "Input should be a valid integer", max_length)
+
+    max_tokens = data.get("max_tokens")
+    if max_tokens is not None and (not _is_int(max_tokens) or max_tokens < 1):
+        _error(errors, "greater_than_equal", ("max_tokens",), "Input should be an integer greater than or equal to 1", max_tokens)
+
+    stop = data.get("stop")
+    if stop is not None and not isinstance(stop, str) and not (
+        isinstance(stop, list) and all(isinstance(item, str) for item in stop)
+    ):
+        _error(errors, "union_type", ("stop",), "Input should be a valid string or list of strings", stop)
+
+    n = data.get("n", 1)
+    if not _is_int(n) or n < 1:
+        _error(errors, "greater_than_equal", ("n",), "Input should be an integer greater than or equal to 1", n)
+
+    stream = data.get("stream")
+    if stream is not None and not isinstance(stream, bool):
+        _error(errors, "bool_type", ("stream",), "Input should be a valid boolean", stream)
+
+    if errors:
+        raise RequestValidationError(errors)
+
+    return SlimChatRequest(
+        model=model,
+        messages=messages,
+        temperature=data.get("temperature"),
+        top_p=data.get("top_p"),
+        max_length=max_length,
+        max_tokens=max_tokens,
+        stop=stop,
+        n=n,
+        stream=bool(stream)
+    )
@@ -1,8 +1,25 @@
 import json
+import logging
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 import requests
+from requests.adapters import HTTPAdapter
+from pathlib import Path
 from typing import Dict, Optional, Generator
-from app.core.config import settings
+from app.core.config import settings, PROJECT_ROOT
+from app.core.deadline import DeadlineExceeded, check_deadline, clamp_timeout, deadline_var
+from app.core.tunables import on_reload
+from app.services.session_store import MemorySessionStore, SqliteSessionStore, user_id_for
+from app.services.traffic_recorder import TrafficRecorder, TrafficReplayer
+from app.utils.lazy import LazyObject
+from app.utils.text import CompletionLimiter
+
+logger = logging.getLogger(__name__)
+
+
+class UpstreamError(Exception):
+    """上游回答失败：返回 message_failed，或流在 message_end 之前结束"""
 
 
 class AgentService:
@@ -12,72 +29,156 @@ class AgentService:
         self.api_base_url = settings.API_BASE_URL
         self.api_key = settings.API_KEY
         self.app_id = settings.APP_ID
-        self.conversations: Dict[str, Dict] = {}  # 存储会话ID映射
-        self.conversation_timestamps: Dict[str, float] = {}  # 存储会话时间戳
-        
+        self.sessions = self._create_session_store()  # 会话ID -> 上游会话映射
+        self.http = self._create_http_session()  # 复用连接的上游 HTTP 会话
+        self._active_streams = set()  # 正在读取的上游流式响应
+        self._streams_lock = threading.Lock()
+        self.recorder: Optional[TrafficRecorder] = None  # 上游流量录制器
+        self.replayer: Optional[TrafficReplayer] = None  # 上游流量回放器
+        self._setup_recording()
+
+    def _create_http_session(self) -> requests.Session:
+        """创建带连接池的上游 HTTP 会话，启用 HTTP/2 时所有请求复用少量连接"""
+        session = requests.Session()
+        adapter = None
+        if settings.UPSTREAM_HTTP2:
+            # 只在启用时导入，避免未启用 HTTP/2 的部署为 httpx 付出启动开销
+            from app.services.http2_transport import HTTP2Adapter, http2_available
+            if http2_available():
+                adapter = HTTP2Adapter(settings.UPSTREAM_HTTP2_MAX_STREAMS, settings.UPSTREAM_HTTP2_MAX_CONNECTIONS)
+            else:
+                logger.warning("未安装 httpx[http2]，上游回退到 HTTP/1.1")
+        if adapter is None:
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=settings.UPSTREAM_POOL_SIZE)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
+    def resize_pool(self, pool_size: int):
+        """调整 HTTP/1.1 连接池大小
+
+        urllib3 连接池的容量不能修改，因此挂载一个新的连接池：新请求使用新连接池，
+        在途请求（包括 SSE 流）继续使用旧连接池中的连接直至结束。HTTP/2 传输不使用该连接池。
+        """
+        old_adapter = self.http.get_adapter(self.api_base_url)
+        if not isinstance(old_adapter, HTTPAdapter):
+            return
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.http.mount("http://", adapter)
+        self.http.mount("https://", adapter)
+        # 只关闭旧连接池中的空闲连接，在途连接归还时随已关闭的连接池一起关闭
+        old_adapter.close()
+
+    def close(self):
+        """关闭所有上游流式响应和连接池"""
+        with self._streams_lock:
+            streams = list(self._active_streams)
+            self._active_streams.clear()
+        for response in streams:
+            try:
+                response.close()
+            except Exception:
+                pass
+        self.http.close()
+
+    def warmup(self, connections: int, timeout: float) -> int:
+        """并发向上游发送 HEAD 请求，预先建立连接（含 TLS 握手）放入连接池，返回成功建立的连接数
+
+        只关心连接是否建立，上游返回任何状态码都算成功；回放模式不访问上游。
+        """
+        if self.replayer or connections <= 0:
+            return 0
+
+        def connect(_):
+            try:
+                self.http.head(self.api_base_url, timeout=timeout).close()
+                return True
+            except requests.exceptions.RequestException:
+                return False
+
+        with ThreadPoolExecutor(max_workers=connections, thread_name_prefix="warmup") as pool:
+            return sum(pool.map(connect, range(connections)))
+
+    def _create_session_store(self):
+        """根据配置创建会话存储，多进程部署时应使用 sqlite 以共享会话状态"""
+        if str(settings.SESSION_STORE).lower() == "sqlite":
+            store_path = Path(settings.SESSION_STORE_PATH).expanduser()
+            if not store_path.is_absolute():
+                store_path = PROJECT_ROOT / store_path
+            return SqliteSessionStore(store_path)
+        return MemorySessionStore()
+
+    def _setup_recording(self):
+        """根据配置启用上游流量录制或回放"""
+        mode = str(settings.RECORD_MODE).lower()
+        if mode not in ("record", "replay"):
+            return
+        record_path = Path(settings.RECORD_FILE).expanduser()
+        if not record_path.is_absolute():
+            record_path = PROJECT_ROOT / record_path
+        if mode == "record":
+            self.recorder = TrafficRecorder(record_path)
+        else:
+            self.replayer = TrafficReplayer(record_path, speed=settings.REPLAY_SPEED)
+
     def cleanup_old_conversations(self):
         """清理过期的会话"""
-        current_time = time.time()
-        expired_sessions = []
-        
-        for session_id, timestamp in self.conversation_timestamps.items():
-            if current_time - timestamp > settings.CONVERSATION_TIMEOUT:
-                expired_sessions.append(session_id)
-        
-        for session_id in expired_sessions:
-            if session_id in self.conversations:
-                del self.conversations[session_id]
-            if session_id in self.conversation_timestamps:
-                del self.conversation_timestamps[session_id]
-        
-        # 如果会话数量超过限制，删除最旧的会话
-        if len(self.conversations) > settings.MAX_CONVERSATIONS:
-            sorted_sessions = sorted(self.conversation_timestamps.items(), key=lambda x: x[1])
-            sessions_to_remove = len(self.conversations) - settings.MAX_CONVERSATIONS
-            
-            for i in range(sessions_to_remove):
-                session_id = sorted_sessions[i][0]
-                if session_id in self.conversations:
-                    del self.conversations[session_id]
-                if session_id in self.conversation_timestamps:
-                    del self.conversation_timestamps[session_id]
+        self.sessions.cleanup(settings.CONVERSATION_TIMEOUT, settings.MAX_CONVERSATIONS)
         
     def make_api_request(self, endpoint: str, method: str = "POST", data: Optional[Dict] = None) -> Optional[Dict]:
         """执行 API 请求并返回 JSON 响应"""
+        if self.replayer:
+            return self.replayer.replay_request(endpoint, data)
+
         url = f"{self.api_base_url}{endpoint}"
         headers = {
             "Apikey": self.api_key,
             "Content-Type": "application/json"
         }
+        # 请求带有截止时间时，上游超时不超过剩余时间
+        timeout = clamp_timeout(settings.UPSTREAM_TIMEOUT)
+        started = time.perf_counter()
         try:
             if method.upper() == "POST":
-                response = requests.post(url, headers=headers, json=data, timeout=30)
+                response = self.http.post(url, headers=headers, json=data, timeout=timeout)
             elif method.upper() == "GET":
-                response = requests.get(url, headers=headers, params=data, timeout=30)
+                response = self.http.get(url, headers=headers, params=data, timeout=timeout)
             else:
                 return None
 
             response.raise_for_status()
-            return response.json()
+            response_data = response.json()
+            if self.recorder:
+                self.recorder.record_request(endpoint, method, data, response.status_code,
+                                             response_data, time.perf_counter() - started)
+            return response_data
         except Exception as e:
-            print(f"API 请求错误: {e}")
+            logger.error("API 请求错误: %s", e, extra={"category": "upstream"})
             return None
 
     def make_streaming_request(self, endpoint: str, data: Optional[Dict] = None):
         """执行流式 API 请求"""
+        if self.replayer:
+            return self.replayer.replay_stream(endpoint, data)
+
         url = f"{self.api_base_url}{endpoint}"
         headers = {
             "Apikey": self.api_key,
             "Content-Type": "application/json; charset=utf-8",
             "Accept": "text/event-stream; charset=utf-8"
         }
+        # 读超时作用于两次收到数据之间，即分片间的空闲超时，而不是整体耗时
+        timeout = clamp_timeout((settings.UPSTREAM_CONNECT_TIMEOUT, settings.UPSTREAM_IDLE_TIMEOUT))
+        started = time.perf_counter()
         try:
-            response = requests.post(url, headers=headers, json=data, stream=True, timeout=60)
+            response = self.http.post(url, headers=headers, json=data, stream=True, timeout=timeout)
             response.raise_for_status()
             response.encoding = 'utf-8'
+            if self.recorder:
+                return self.recorder.wrap_stream(endpoint, data, response, started)
             return response
         except Exception as e:
-            print(f"流式请求错误: {e}")
+            logger.error("流式请求错误: %s", e, extra={"category": "upstream"})
             return None
 
     def parse_sse_line(self, line: str) -> Optional[Dict]:
@@ -106,34 +207,48 @@ class AgentService:
             return response_data["Conversation"]["AppConversationID"]
         return None
 
+    def new_conversation(self, session_id: str) -> Optional[Dict]:
+        """创建上游会话并返回会话信息，不写入会话存储（由调用方自行保存，例如 WebSocket 连接）"""
+        user_id = user_id_for(session_id)
+        app_conversation_id = self.create_conversation(user_id)
+        if not app_conversation_id:
+            return None
+        return {
+            "app_conversation_id": app_conversation_id,
+            "user_id": user_id
+        }
+
     def get_or_create_conversation(self, session_id: str) -> Optional[Dict]:
         """获取或创建会话"""
         # 清理过期会话
         self.cleanup_old_conversations()
         
-        if session_id not in self.conversations:
-            user_id = f"user_{session_id}"
-            app_conversation_id = self.create_conversation(user_id)
-            if app_conversation_id:
-                self.conversations[session_id] = {
-                    "app_conversation_id": app_conversation_id,
-                    "user_id": user_id
-                }
-                self.conversation_timestamps[session_id] = time.time()
+        conv_info = self.sessions.get(session_id)
+        if conv_info is None:
+            check_deadline("conversation")
+            conv_info = self.new_conversation(session_id)
+            if conv_info:
+                self.sessions.set(session_id, conv_info)
             else:
                 return None
         else:
             # 更新时间戳
-            self.conversation_timestamps[session_id] = time.time()
+            self.sessions.touch(session_id)
             
-        return self.conversations[session_id]
+        return conv_info
 
     def chat_stream(self, session_id: str, conversation_content: str) -> Optional[Generator[str, None, None]]:
-        """流式聊天 - 现在接受完整的格式化对话内容，包括系统提示词和对话历史"""
+        """流式聊天 - 现在接受完整的格式化对话内容，包括系统提示词和对话历史
+
+        上游回答失败或流在 message_end 之前结束时，迭代过程中抛出 UpstreamError。
+        """
         conv_info = self.get_or_create_conversation(session_id)
         if not conv_info:
             return None
-            
+        return self.query_stream(conv_info, conversation_content)
+
+    def query_stream(self, conv_info: Dict, conversation_content: str) -> Optional[Generator[str, None, None]]:
+        """在指定的上游会话中流式查询，返回回答增量的生成器；无法建立连接时返回 None"""
         endpoint = "/api/proxy/api/v1/chat_query_v2"
         payload = {
             "AppConversationID": conv_info["app_conversation_id"],
@@ -142,20 +257,38 @@ class AgentService:
             "ResponseMode": "streaming"
         }
 
+        check_deadline("query")
         response = self.make_streaming_request(endpoint, data=payload)
         if not response:
             return None
 
+        with self._streams_lock:
+            self._active_streams.add(response)
+
         def generate():
+            try:
+                yield from read_stream()
+            finally:
+                with self._streams_lock:
+                    self._active_streams.discard(response)
+                response.close()
+
+        def read_stream():
+            # 详细日志经非阻塞管道输出，sse / token 两类可按比例采样
+            verbose = settings.VERBOSE_LOGGING
+            # 请求过了截止时间后不再读取上游，关闭连接
+            deadline = deadline_var.get()
             for line in response.iter_lines(decode_unicode=True, chunk_size=1):
+                if deadline is not None:
+                    check_deadline("stream")
                 if line:
                     line = line.strip()
-                    if settings.VERBOSE_LOGGING:
-                        print(f"[DEBUG] 收到行: {line}")
+                    if verbose:
+                        logger.info("收到行: %s", line, extra={"category": "sse"})
                     data = self.parse_sse_line(line)
                     if data:
-                        if settings.VERBOSE_LOGGING:
-                            print(f"[DEBUG] 解析数据: {data}")
+                        if verbose:
+                            logger.info("解析数据: %s", data, extra={"category": "sse"})
                         event = data.get("event")
                         
                         if event == "message_start":
@@ -165,22 +298,31 @@ class AgentService:
                         elif event == "message":
                             answer_part = data.get("answer", "")
                             if answer_part:
-                                if settings.VERBOSE_LOGGING:
-                                    print(f"[DEBUG] 输出内容: {answer_part}")
+                                if verbose:
+                                    logger.info("输出内容: %s", answer_part, extra={"category": "token"})
                                 yield answer_part
                         elif event == "message_end":
-                            if settings.VERBOSE_LOGGING:
-                                print("[DEBUG] 消息结束")
-                            break
+                            if verbose:
+                                logger.info("消息结束", extra={"category": "upstream"})
+                            return
                         elif event == "message_failed":
                             error_msg = data.get("error", "未知错误")
-                            print(f"[ERROR] 消息失败: {error_msg}")
-                            break
+                            logger.error("消息失败: %s", error_msg, extra={"category": "upstream"})
+                            raise UpstreamError(f"上游回答失败: {error_msg}")
+            # 没有收到 message_end，已输出的内容不是完整的回答
+            raise UpstreamError("上游流在回答结束前中断")
 
         return generate()
 
-    def chat_blocking(self, session_id: str, conversation_content: str) -> Optional[str]:
-        """阻塞式聊天 - 现在接受完整的格式化对话内容，包括系统提示词和对话历史"""
+    def chat_blocking(self, session_id: str, conversation_content: str,
+                      limiter: Optional[CompletionLimiter] = None) -> Optional[str]:
+        """阻塞式聊天 - 现在接受完整的格式化对话内容，包括系统提示词和对话历史
+
+        limiter 用于执行 stop / max_tokens：流式获取时命中即关闭上游，阻塞模式下对完整回答截断。
+        """
+        if settings.BLOCKING_VIA_STREAM:
+            return self._chat_via_stream(session_id, conversation_content, limiter)
+
         conv_info = self.get_or_create_conversation(session_id)
         if not conv_info:
             return None
@@ -193,12 +335,54 @@ class AgentService:
             "ResponseMode": "blocking"
         }
 
+        check_deadline("query")
         response_data = self.make_api_request(endpoint, method="POST", data=payload)
         
         if response_data and "answer" in response_data:
-            return response_data["answer"]
+            answer = response_data["answer"]
+            if limiter and limiter.enabled:
+                answer = "".join(limiter.apply([answer]))
+            return answer
         return None
 
+    def _chat_via_stream(self, session_id: str, conversation_content: str,
+                         limiter: Optional[CompletionLimiter] = None) -> Optional[str]:
+        """通过上游流式模式获取完整回答
+
+        只受分片间空闲超时限制，长回答不会因整体超时失败；
+        与流式路径共用录制回放、活跃流登记（drain 时可被中断）等逻辑。
+        上游回答失败或中断时抛出 UpstreamError，不返回不完整的回答。
+        """
+        stream_generator = self.chat_stream(session_id, conversation_content)
+        if stream_generator is None:
+            return None
+        if limiter and limiter.enabled:
+            stream_generator = limiter.apply(stream_generator)
+        try:
+            return "".join(stream_generator)
+        except (DeadlineExceeded, UpstreamError):
+            raise
+        except Exception as e:
+            logger.error("流式请求错误: %s", e, extra={"category": "upstream"})
+            return None
+
+
+# 创建全局服务实例：首次使用时才创建会话存储和上游连接池
+agent_service: AgentService = LazyObject(AgentService)  # type: ignore[assignment]
+
+
+def close_agent_service():
+    """关闭全局服务实例的上游连接（尚未创建时无需关闭）"""
+    if agent_service.initialized:
+        agent_service.close()
+
 
-# 创建全局服务实例
-agent_service = AgentService() 
+@on_reload
+def _apply_settings(new, changed):
+    """配置重新加载后调整连接池，并按新的会话上限与超时立即清理"""
+    if not agent_service.initialized:
+        return
+    if "UPSTREAM_POOL_SIZE" in changed:
+        agent_service.resize_pool(new.UPSTREAM_POOL_SIZE)
+    if changed & {"MAX_CONVERSATIONS", "CONVERSATION_TIMEOUT"}:
+        agent_service.cleanup_old_conversations()
@@ -0,0 +1,527 @@
+import json
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import BinaryIO, Callable, Dict, Iterator, List, Optional, Set, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+from app.core.config import settings, PROJECT_ROOT
+from app.core.tunables import on_reload
+from app.models.batch import Batch, FileObject
+from app.utils.lazy import LazyObject
+
+logger = logging.getLogger(__name__)
+
+# 处理单个请求体的函数：输入请求体与批处理创建方，返回响应体，失败时抛出异常
+BatchHandler = Callable[[Dict, Optional[str]], Dict]
+
+# 文件与批处理 ID 的格式（均由本服务生成），拼接路径前必须校验，防止 ``../`` 等访问批处理目录之外的文件
+FILE_ID_PATTERN = re.compile(r"file-[0-9a-f]{32}")
+BATCH_ID_PATTERN = re.compile(r"batch_[0-9a-f]{32}")
+
+
+class _BatchRun:
+    """一次批处理运行的状态（输出文件句柄、计数与吞吐量）"""
+
+    def __init__(self, batch: Batch, output_file, error_file, lock_file):
+        self.batch = batch
+        self.lock_file = lock_file
+        self.output_file = output_file
+        self.error_file = error_file
+        self.lock = threading.Lock()
+        self.cancelled = threading.Event()
+        self.started = time.monotonic()
+        self.processed = 0  # 本次运行处理的请求数，用于计算吞吐量
+        self.last_saved = 0.0
+        self.last_cancel_check = 0.0
+
+
+class BatchService:
+    """批处理服务
+
+    按 OpenAI Batch API 格式处理 JSONL 输入文件：逐行读取、以有界并发调用处理函数，
+    每完成一个请求立即追加写入磁盘上的输出文件（不在内存中缓存结果）。
+    崩溃或重启后，未完成的批处理会跳过输出文件中已有的 custom_id 继续执行；
+    多进程部署时通过文件锁保证每个批处理只由一个工作进程执行，其他进程收到的取消请求写入取消标记文件，
+    由执行批处理的进程定期检查。
+    """
+
+    # 批处理状态写盘的最小间隔（秒）
+    SAVE_INTERVAL = 1.0
+
+    def __init__(self):
+        self.executor = ThreadPoolExecutor(max_workers=settings.BATCH_CONCURRENCY, thread_name_prefix="batch")
+        self._runs: Dict[str, _BatchRun] = {}
+        self._lock = threading.Lock()
+
+    def resize(self, concurrency: int):
+        """调整线程池大小，对之后启动的批处理生效；旧线程池中已提交的请求仍会执行完"""
+        self.executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="batch")
+
+    @property
+    def root(self) -> Path:
+        root = Path(settings.BATCH_DIR).expanduser()
+        if not root.is_absolute():
+            root = PROJECT_ROOT / root
+        return root
+
+    @staticmethod
+    def is_file_id(file_id: str) -> bool:
+        return FILE_ID_PATTERN.fullmatch(file_id) is not None
+
+    @staticmethod
+    def is_batch_id(batch_id: str) -> bool:
+        return BATCH_ID_PATTERN.fullmatch(batch_id) is not None
+
+    def _file_path(self, file_id: str) -> Path:
+        if not self.is_file_id(file_id):
+            raise ValueError(f"无效的文件 ID: {file_id!r}")
+        return self.root / "files" / f"{file_id}.jsonl"
+
+    def _file_meta_path(self, file_id: str) -> Path:
+        if not self.is_file_id(file_id):
+            raise ValueError(f"无效的文件 ID: {file_id!r}")
+        return self.root / "files" / f"{file_id}.json"
+
+    def _batch_path(self, batch_id: str) -> Path:
+        if not self.is_batch_id(batch_id):
+            raise ValueError(f"无效的批处理 ID: {batch_id!r}")
+        return self.root / "batches" / f"{batch_id}.json"
+
+    def _cancel_path(self, batch_id: str) -> Path:
+        """取消标记文件：存在即表示批处理已被请求取消"""
+        return self._batch_path(batch_id).with_suffix(".cancel")
+
+    @staticmethod
+    def _write_json(path: Path, content: str):
+        """原子写入，避免崩溃时留下半截文件"""
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f"{path.name}.{uuid.uuid4().hex[:8]}.tmp")
+        tmp_path.write_text(content, encoding="utf-8")
+        os.replace(tmp_path, path)
+
+    # ---- 文件 ----
+
+    @staticmethod
+    def _owned(obj, caller: Optional[str]) -> bool:
+        """caller 为 None 时不检查（服务内部调用）；否则只有创建方可以访问"""
+        return caller is None or obj.caller == caller
+
+    def _create_file(self, filename: str, purpose: str, caller: Optional[str], size: int = 0) -> FileObject:
+        file_obj = FileObject(
+            id=f"file-{uuid.uuid4().hex}", bytes=size, filename=filename, purpose=purpose, caller=caller
+        )
+        self._write_json(self._file_meta_path(file_obj.id), file_obj.model_dump_json())
+        return file_obj
+
+    def save_file(self, source: BinaryIO, filename: str, purpose: str, caller: str) -> FileObject:
+        """将上传的文件流式写入磁盘"""
+        file_obj = self._create_file(filename, purpose, caller)
+        path = self._file_path(file_obj.id)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        size = 0
+        with path.open("wb") as f:
+            while True:
+                chunk = source.read(1024 * 1024)
+                if not chunk:
+                    break
+                f.write(chunk)
+                size += len(chunk)
+        file_obj.bytes = size
+        self._write_json(self._file_meta_path(file_obj.id), file_obj.model_dump_json())
+        return file_obj
+
+    def get_file(self, file_id: str, caller: Optional[str] = None) -> Optional[FileObject]:
+        """获取文件信息，文件不存在或不属于 caller 时返回 None"""
+        if not self.is_file_id(file_id):
+            return None
+        meta_path = self._file_meta_path(file_id)
+        if not meta_path.exists():
+            return None
+        file_obj = FileObject.model_validate_json(meta_path.read_text(encoding="utf-8"))
+        if not self._owned(file_obj, caller):
+            return None
+        content_path = self._file_path(file_id)
+        if content_path.exists():
+            file_obj.bytes = content_path.stat().st_size
+        return file_obj
+
+    def file_content_path(self, file_id: str, caller: Optional[str] = None) -> Optional[Path]:
+        if self.get_file(file_id, caller) is None:
+            return None
+        path = self._file_path(file_id)
+        return path if path.exists() else None
+
+    def file_snapshot(self, file_id: str, caller: Optional[str] = None) -> Optional[Tuple[Path, int]]:
+        """文件路径与当前完整行的总字节数
+
+        批处理进行中输出文件仍在追加写入，下载时只发送此刻已写完的行，响应长度与 Content-Length 一致；
+        上传的文件不会再变化，按原样发送（最后一行可以没有换行符）。
+        """
+        file_obj = self.get_file(file_id, caller)
+        if file_obj is None:
+            return None
+        path = self._file_path(file_id)
+        if not path.exists():
+            return None
+        with path.open("rb") as f:
+            end = f.seek(0, os.SEEK_END)
+            if file_obj.purpose != "batch_output":
+                return path, end
+            return path, self._complete_length(f, end)
+
+    @staticmethod
+    def read_range(path: Path, length: int, chunk_size: int = 65536) -> Iterator[bytes]:
+        """按块读取文件的前 length 个字节"""
+        with path.open("rb") as f:
+            while length > 0:
+                chunk = f.read(min(chunk_size, length))
+                if not chunk:
+                    return
+                length -= len(chunk)
+                yield chunk
+
+    # ---- 批处理 ----
+
+    def create_batch(self, input_file_id: str, completion_window: str,
+                     metadata: Optional[Dict[str, str]], handler: BatchHandler, caller: str) -> Batch:
+        input_path = self.file_content_path(input_file_id, caller)
+        if input_path is None:
+            raise FileNotFoundError(f"输入文件不存在: {input_file_id}")
+
+        total = 0
+        with input_path.open("rb") as f:
+            for line in f:
+                if line.strip():
+                    total += 1
+
+        batch_id = f"batch_{uuid.uuid4().hex}"
+        output_file = self._create_file(f"{batch_id}_output.jsonl", "batch_output", caller)
+        error_file = self._create_file(f"{batch_id}_error.jsonl", "batch_output", caller)
+        batch = Batch(
+            id=batch_id,
+            endpoint="/v1/chat/completions",
+            input_file_id=input_file_id,
+            completion_window=completion_window,
+            status="in_progress",
+            output_file_id=output_file.id,
+            error_file_id=error_file.id,
+            in_progress_at=int(time.time()),
+            metadata=metadata,
+            caller=caller,
+        )
+        batch.request_counts.total = total
+        self._save_batch(batch)
+        self._start(batch, handler)
+        return batch
+
+    def get_batch(self, batch_id: str, caller: Optional[str] = None) -> Optional[Batch]:
+        """获取批处理，不存在或不属于 caller 时返回 None"""
+        with self._lock:
+            run = self._runs.get(batch_id)
+        if run is not None:
+            batch = run.batch
+        else:
+            if not self.is_batch_id(batch_id):
+                return None
+            path = self._batch_path(batch_id)
+            if not path.exists():
+                return None
+            batch = Batch.model_validate_json(path.read_text(encoding="utf-8"))
+        return batch if self._owned(batch, caller) else None
+
+    def list_batches(self, caller: str, limit: int = 20) -> List[Batch]:
+        """列出 caller 最近创建的批处理"""
+        batch_dir = self.root / "batches"
+        if not batch_dir.exists():
+            return []
+        paths = [path for path in batch_dir.glob("*.json") if self.is_batch_id(path.stem)]
+        batches = []
+        for path in sorted(paths, key=lambda p: p.stat().st_mtime, reverse=True):
+            batch = self.get_batch(path.stem, caller)
+            if batch is not None:
+                batches.append(batch)
+                if len(batches) >= limit:
+                    break
+        return batches
+
+    def cancel_batch(self, batch_id: str, caller: Optional[str] = None) -> Optional[Batch]:
+        """取消批处理：本进程执行的立即停止提交新请求；由其他工作进程执行的写入取消标记，由该进程稍后停止"""
+        with self._lock:
+            run = self._runs.get(batch_id)
+        if run is not None:
+            if not self._owned(run.batch, caller):
+                return None
+            run.batch.status = "cancelling"
+            run.cancelled.set()
+            self._save_batch(run.batch)
+            return run.batch
+        batch = self.get_batch(batch_id, caller)
+        if batch is not None and batch.status == "in_progress":
+            # 不改写批处理状态文件：执行它的进程会定期写入进度，由其发现标记后转为 cancelling
+            self._cancel_path(batch_id).touch()
+            batch.status = "cancelling"
+        return batch
+
+    def resume(self, handler: BatchHandler):
+        """继续执行上次未完成的批处理"""
+        batch_dir = self.root / "batches"
+        if not batch_dir.exists():
+            return
+        for path in batch_dir.glob("*.json"):
+            if not self.is_batch_id(path.stem):
+                continue
+            try:
+                batch = Batch.model_validate_json(path.read_text(encoding="utf-8"))
+            except Exception as e:
+                logger.warning("读取批处理状态 %s 失败: %s", path, e)
+                continue
+            if batch.status in ("in_progress", "cancelling"):
+                if batch.status == "cancelling" or self._cancel_path(batch.id).exists():
+                    self._finish(batch, "cancelled")
+                    continue
+                logger.info("继续执行未完成的批处理 %s", batch.id)
+                self._start(batch, handler)
+
+    def _save_batch(self, batch: Batch):
+        self._write_json(self._batch_path(batch.id), batch.model_dump_json())
+
+    def _finish(self, batch: Batch, status: str):
+        batch.status = status
+        now = int(time.time())
+        if status == "completed":
+            batch.completed_at = now
+        elif status == "cancelled":
+            batch.cancelled_at = now
+        elif status == "failed":
+            batch.failed_at = now
+        self._save_batch(batch)
+        self._cancel_path(batch.id).unlink(missing_ok=True)
+
+    def _acquire_lock(self, batch_id: str):
+        """获取批处理的独占文件锁，已被其他进程持有时返回 None"""
+        lock_path = self._batch_path(batch_id).with_suffix(".lock")
+        lock_path.parent.mkdir(parents=True, exist_ok=True)
+        lock_file = lock_path.open("a")
+        if fcntl is not None:
+            try:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                lock_file.close()
+                return None
+        return lock_file
+
+    @staticmethod
+    def _complete_length(f: BinaryIO, end: int) -> int:
+        """文件前 end 个字节中以换行符结尾的部分的长度（从末尾向前按块查找最后一个换行符）"""
+        position = end
+        while position > 0:
+            block_start = max(0, position - 65536)
+            f.seek(block_start)
+            block = f.read(position - block_start)
+            index = block.rfind(b"\n")
+            if index >= 0:
+                return block_start + index + 1
+            position = block_start
+        return 0
+
+    @classmethod
+    def _truncate_partial_line(cls, path: Path):
+        """崩溃时可能留下不完整的最后一行，续写前将其截掉"""
+        if not path.exists() or path.stat().st_size == 0:
+            return
+        with path.open("rb+") as f:
+            end = f.seek(0, os.SEEK_END)
+            length = cls._complete_length(f, end)
+            if length != end:
+                f.truncate(length)
+
+    @staticmethod
+    def _recorded(path: Path) -> Tuple[Set[str], Set[int]]:
+        """读取结果文件中已记录的 custom_id，以及没有 custom_id 的输入行（如无效的 JSON 行）的行号"""
+        done: Set[str] = set()
+        lines: Set[int] = set()
+        if not path.exists():
+            return done, lines
+        with path.open("r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # 崩溃时可能留下半行，忽略
+                    continue
+                if record.get("custom_id") is not None:
+                    done.add(record["custom_id"])
+                elif record.get("line") is not None:
+                    lines.add(record["line"])
+        return done, lines
+
+    def _start(self, batch: Batch, handler: BatchHandler):
+        lock_file = self._acquire_lock(batch.id)
+        if lock_file is None:
+            # 已由其他工作进程执行
+            return
+        output_path = self._file_path(batch.output_file_id)
+        error_path = self._file_path(batch.error_file_id)
+        self._truncate_partial_line(output_path)
+        self._truncate_partial_line(error_path)
+        completed_ids, completed_lines = self._recorded(output_path)
+        failed_ids, failed_lines = self._recorded(error_path)
+        batch.request_counts.completed = len(completed_ids) + len(completed_lines)
+        batch.request_counts.failed = len(failed_ids) + len(failed_lines)
+
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        run = _BatchRun(
+            batch, output_path.open("a", encoding="utf-8"), error_path.open("a", encoding="utf-8"), lock_file
+        )
+        with self._lock:
+            self._runs[batch.id] = run
+        thread = threading.Thread(
+            target=self._run, args=(run, handler, completed_ids | failed_ids, completed_lines | failed_lines),
+            name=f"batch-{batch.id[-8:]}", daemon=True
+        )
+        thread.start()
+
+    def _run(self, run: _BatchRun, handler: BatchHandler, done_ids: Set[str], done_lines: Set[int]):
+        batch = run.batch
+        concurrency = max(1, settings.BATCH_CONCURRENCY)
+        slots = threading.BoundedSemaphore(concurrency)
+        status = "completed"
+        try:
+            input_path = self._file_path(batch.input_file_id)
+            with input_path.open("r", encoding="utf-8") as f:
+                for number, line in enumerate(f, 1):
+                    self._check_cancel(run)
+                    if run.cancelled.is_set():
+                        status = "cancelled"
+                        break
+                    line = line.strip()
+                    if not line or number in done_lines:
+                        continue
+                    try:
+                        item = json.loads(line)
+                    except json.JSONDecodeError as e:
+                        self._record(run, None, error=f"无效的 JSON 行: {e}", line=number)
+                        continue
+                    if item.get("custom_id") in done_ids:
+                        continue
+                    slots.acquire()
+                    future = self.executor.submit(self._execute, run, item, handler, number)
+                    future.add_done_callback(lambda _: slots.release())
+            # 等待所有在途请求完成
+            for _ in range(concurrency):
+                slots.acquire()
+        except Exception as e:
+            logger.error("批处理 %s 执行失败: %s", batch.id, e)
+            batch.errors = {"object": "list", "data": [{"code": "batch_failed", "message": str(e)}]}
+            status = "failed"
+        finally:
+            run.output_file.close()
+            run.error_file.close()
+            with self._lock:
+                self._runs.pop(batch.id, None)
+            self._update_throughput(run)
+            self._finish(batch, status)
+            run.lock_file.close()
+            logger.info(
+                "批处理 %s 结束（%s）: 成功 %d，失败 %d，共 %d",
+                batch.id, status, batch.request_counts.completed,
+                batch.request_counts.failed, batch.request_counts.total,
+            )
+
+    def _check_cancel(self, run: _BatchRun):
+        """每隔 SAVE_INTERVAL 检查一次其他工作进程写入的取消标记"""
+        now = time.monotonic()
+        if run.cancelled.is_set() or now - run.last_cancel_check < self.SAVE_INTERVAL:
+            return
+        run.last_cancel_check = now
+        if self._cancel_path(run.batch.id).exists():
+            logger.info("批处理 %s 已被其他工作进程请求取消", run.batch.id)
+            run.batch.status = "cancelling"
+            run.cancelled.set()
+            self._save_batch(run.batch)
+
+    def _execute(self, run: _BatchRun, item: Dict, handler: BatchHandler, line: int):
+        custom_id = item.get("custom_id")
+        # 没有 custom_id 的行按行号记录，继续执行时据此跳过
+        line_number = None if custom_id is not None else line
+        if item.get("url", "/v1/chat/completions") != "/v1/chat/completions":
+            self._record(run, custom_id, error=f"不支持的 url: {item.get('url')}", status_code=400,
+                         line=line_number)
+            return
+        try:
+            body = handler(item.get("body") or {}, run.batch.caller)
+        except Exception as e:
+            self._record(run, custom_id, error=str(e), line=line_number)
+            return
+        self._record(run, custom_id, body=body, line=line_number)
+
+    def _record(self, run: _BatchRun, custom_id: Optional[str], body: Optional[Dict] = None,
+                error: Optional[str] = None, status_code: int = 500, line: Optional[int] = None):
+        """追加写入一条结果，立即刷新到磁盘；line 为没有 custom_id 的输入行的行号（扩展字段）"""
+        request_id = f"req_{uuid.uuid4().hex}"
+        if error is None:
+            record = {
+                "id": f"batch_req_{uuid.uuid4().hex}",
+                "custom_id": custom_id,
+                "response": {"status_code": 200, "request_id": request_id, "body": body},
+                "error": None,
+            }
+        else:
+            record = {
+                "id": f"batch_req_{uuid.uuid4().hex}",
+                "custom_id": custom_id,
+                "response": {
+                    "status_code": status_code,
+                    "request_id": request_id,
+                    "body": {"error": {"message": error, "type": "server_error" if status_code >= 500 else "invalid_request_error"}},
+                },
+                "error": None,
+            }
+        if line is not None:
+            record["line"] = line
+        content = json.dumps(record, ensure_ascii=False) + "\n"
+        with run.lock:
+            target = run.output_file if error is None else run.error_file
+            target.write(content)
+            target.flush()
+            if error is None:
+                run.batch.request_counts.completed += 1
+            else:
+                run.batch.request_counts.failed += 1
+            run.processed += 1
+            now = time.monotonic()
+            should_save = now - run.last_saved >= self.SAVE_INTERVAL
+            if should_save:
+                run.last_saved = now
+        if should_save:
+            self._update_throughput(run)
+            self._save_batch(run.batch)
+            self._check_cancel(run)
+
+    @staticmethod
+    def _update_throughput(run: _BatchRun):
+        elapsed = time.monotonic() - run.started
+        if elapsed > 0:
+            run.batch.throughput = round(run.processed / elapsed, 3)
+
+
+# 创建全局批处理服务实例：首次使用时才读取配置并创建线程池
+batch_service: BatchService = LazyObject(BatchService)  # type: ignore[assignment]
+
+
+@on_reload
+def _apply_settings(new, changed):
+    if not batch_service.initialized:
+        return
+    if "BATCH_CONCURRENCY" in changed:
+        batch_service.resize(new.BATCH_CONCURRENCY)
@@ -0,0 +1,169 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from app.core.config import settings
+from app.core.tunables import on_reload
+from app.models.chat import ChatMessage
+from app.services.prompt_index import prompt_index
+from app.utils.lazy import LazyObject
+from app.utils.text import estimate_tokens, truncate_to_tokens
+
+# 角色在上游 Query 中的标记
+ROLE_LABELS = {"system": "SYSTEM", "user": "USER", "assistant": "ASSISTANT"}
+# 每条消息的标记与分隔符大致占用的 token 数
+SEGMENT_OVERHEAD_TOKENS = 4
+SUMMARY_HEADER = "[SUMMARY]: 较早的对话已压缩，以下为各条消息的摘要："
+
+# 摘要行：(文本, token 数)
+SummaryLine = Tuple[str, int]
+
+
+class ContextCompactor:
+    """上下文预算：对话超出 token 预算时压缩中间部分
+
+    保留全部系统消息和尽可能多的最近消息，其余较早的消息压缩为本地生成的摘要（每条消息截取开头）。
+    摘要按摘要参数与对话前缀的哈希缓存：下一轮对话只需为新移出窗口的消息生成摘要行，整体为线性时间。
+    """
+
+    def __init__(self, cache_size: int = 1024):
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[bytes, Tuple[SummaryLine, ...]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.compacted = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    @classmethod
+    def from_settings(cls) -> "ContextCompactor":
+        return cls(settings.CONTEXT_CACHE_SIZE)
+
+    @staticmethod
+    def _segment(message: ChatMessage) -> str:
+        return f"[{ROLE_LABELS[message.role]}]: {message.content}"
+
+    def format(self, messages: Sequence[ChatMessage], max_tokens: int,
+               summary_tokens: int = 512, line_tokens: int = 48) -> str:
+        """格式化消息列表，超出 max_tokens 时压缩中间部分"""
+        # 系统提示词的片段与 token 数取自提示词索引，其他消息的片段在需要时再拼接
+        segments: List[Optional[str]] = []
+        tokens: List[int] = []
+        for message in messages:
+            entry = prompt_index.intern(message.content) if message.role == "system" else None
+            if entry is not None:
+                segments.append(entry.segment)
+                tokens.append(entry.tokens + SEGMENT_OVERHEAD_TOKENS)
+            else:
+                segments.append(None)
+                tokens.append(estimate_tokens(message.content) + SEGMENT_OVERHEAD_TOKENS)
+
+        def segment(index: int) -> str:
+            return segments[index] or self._segment(messages[index])
+
+        if sum(tokens) <= max_tokens:
+            return "\n\n".join(segment(index) for index in range(len(messages)))
+
+        system_tokens = sum(t for message, t in zip(messages, tokens) if message.role == "system")
+        available = max_tokens - system_tokens - summary_tokens
+
+        # 从后向前保留最近的消息，至少保留最后一条
+        cut = len(messages)
+        used = 0
+        for index in range(len(messages) - 1, -1, -1):
+            if messages[index].role == "system":
+                continue
+            if used + tokens[index] > available and cut < len(messages):
+                break
+            used += tokens[index]
+            cut = index
+
+        parts: List[str] = [segment(index) for index in range(cut) if messages[index].role == "system"]
+        if any(message.role != "system" for message in messages[:cut]):
+            parts.append(self._summary(messages, cut, summary_tokens, line_tokens))
+            with self._lock:
+                self.compacted += 1
+        parts.extend(segment(index) for index in range(cut, len(messages)))
+        return "\n\n".join(parts)
+
+    def _summary(self, messages: Sequence[ChatMessage], cut: int, summary_tokens: int, line_tokens: int) -> str:
+        """生成 messages[:cut] 的摘要，复用最长的已缓存前缀"""
+        # 前缀哈希链：digests[i] 标识 messages[:i + 1]；以摘要参数为起点，参数变化（如重新加载配置）后不复用旧摘要
+        digests: List[bytes] = []
+        digest = f"{summary_tokens}:{line_tokens}".encode()
+        for message in messages[:cut]:
+            h = hashlib.blake2b(digest, digest_size=16)
+            h.update(message.role.encode())
+            h.update(b"\0")
+            h.update(message.content.encode("utf-8"))
+            digest = h.digest()
+            digests.append(digest)
+
+        lines: Optional[Tuple[SummaryLine, ...]] = None
+        start = 0
+        with self._lock:
+            for index in range(cut - 1, -1, -1):
+                cached = self._cache.get(digests[index])
+                if cached is not None:
+                    self._cache.move_to_end(digests[index])
+                    lines, start = cached, index + 1
+                    break
+            if start == cut:
+                self.cache_hits += 1
+            else:
+                self.cache_misses += 1
+
+        if start < cut:
+            new_lines = list(lines or ())
+            for message in messages[start:cut]:
+                if message.role != "system":
+                    new_lines.append(self._summary_line(message, line_tokens))
+            # 只保留预算内最近的摘要行
+            total = 0
+            keep = len(new_lines)
+            while keep > 0 and total + new_lines[keep - 1][1] <= summary_tokens:
+                total += new_lines[keep - 1][1]
+                keep -= 1
+            lines = tuple(new_lines[keep:])
+            with self._lock:
+                self._cache[digests[cut - 1]] = lines
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+
+        return "\n".join([SUMMARY_HEADER, *(text for text, _ in lines)])
+
+    @staticmethod
+    def _summary_line(message: ChatMessage, line_tokens: int) -> SummaryLine:
+        head = truncate_to_tokens(message.content, line_tokens)
+        if len(head) < len(message.content):
+            head += "…"
+        text = f"- {ROLE_LABELS[message.role]}: {' '.join(head.split())}"
+        return text, estimate_tokens(text)
+
+    def resize(self, cache_size: int):
+        """调整摘要缓存容量，超出时淘汰最久未使用的摘要"""
+        with self._lock:
+            self.cache_size = cache_size
+            while len(self._cache) > cache_size:
+                self._cache.popitem(last=False)
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {
+                "compacted": self.compacted,
+                "summary_cache_size": len(self._cache),
+                "summary_cache_hits": self.cache_hits,
+                "summary_cache_misses": self.cache_misses,
+            }
+
+
+# 创建全局上下文压缩器：首次使用时才读取配置
+context_compactor: ContextCompactor = LazyObject(ContextCompactor.from_settings)  # type: ignore[assignment]
+
+
+@on_reload
+def _apply_settings(new, changed):
+    if not context_compactor.initialized:
+        return
+    if "CONTEXT_CACHE_SIZE" in changed:
+        context_compactor.resize(new.CONTEXT_CACHE_SIZE)
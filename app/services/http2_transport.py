@@ -0,0 +1,213 @@
+"""
+上游 HTTP/2 传输适配器
+
+requests 只支持 HTTP/1.1，每个上游流式响应独占一个 TCP 连接。这里实现一个 requests 传输适配器，
+底层使用 httpx 的 HTTP/2 客户端，把所有 chat_query_v2 流复用到少量连接上；AgentService 的其余代码
+（raise_for_status / json / iter_lines）保持不变。
+
+httpx 的同步 HTTP/2 实现在多线程并发发起请求时分配流 ID 与发送 HEADERS 之间没有加锁，
+高并发下会乱序发出流 ID，被上游以 PROTOCOL_ERROR 关闭整个连接。因此所有上游 I/O 都在一个后台
+事件循环线程中通过 AsyncClient 完成，调用线程只等待结果。
+
+https 上游通过 ALPN 协商 h2；明文 http 上游没有协商过程，直接以 prior knowledge 方式使用 h2c。
+并发流数由信号量限制：上游流结束时归还名额，名额用尽时请求最多等待连接超时时间。
+依赖可选组件 ``httpx[http2]``（即 httpx 与 h2），未安装时 ``http2_available()`` 返回 False。
+"""
+import asyncio
+import logging
+import queue
+import threading
+from typing import Optional
+
+import requests
+from requests.adapters import BaseAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+try:
+    import h2  # noqa: F401
+    import httpx
+except ImportError:  # pragma: no cover - 取决于运行环境
+    httpx = None
+
+# httpx 默认在 INFO 级别记录每个请求，上游请求量大时会淹没服务日志
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+# HTTP/2 禁止携带的逐跳首部，requests 默认会添加 Connection: keep-alive
+_HOP_BY_HOP_HEADERS = {"connection", "keep-alive", "proxy-connection", "transfer-encoding", "upgrade"}
+
+
+def http2_available() -> bool:
+    """是否已安装 HTTP/2 上游传输所需的可选依赖"""
+    return httpx is not None
+
+
+def _to_httpx_timeout(timeout) -> "httpx.Timeout":
+    """把 requests 风格的超时（总超时或 (连接, 读) 元组）转换为 httpx.Timeout"""
+    if isinstance(timeout, tuple):
+        connect, read = timeout
+        return httpx.Timeout(read, connect=connect)
+    return httpx.Timeout(timeout)
+
+
+def _to_requests_error(error: Exception, request=None) -> requests.exceptions.RequestException:
+    if isinstance(error, httpx.ConnectTimeout):
+        return requests.exceptions.ConnectTimeout(error, request=request)
+    if isinstance(error, httpx.TimeoutException):
+        return requests.exceptions.ReadTimeout(error, request=request)
+    return requests.exceptions.ConnectionError(error, request=request)
+
+
+class _StreamBody:
+    """把 httpx 流式响应包装成 requests.Response.raw 所需的文件对象
+
+    后台事件循环中的读取任务持续把分片放入线程安全队列，调用线程只从队列取数据，
+    避免每个分片都在线程之间往返调度一次。队列中最多暂存 ``MAX_BUFFERED_CHUNKS`` 个分片：
+    调用线程不再读取（如流缓冲因客户端过慢而暂停）时读取任务随之停止，由 HTTP/2 流控把背压传给上游。
+
+    与 urllib3 不同，read(amt) 返回当前已收到的整个分片（可能超过 amt）：AgentService 以
+    iter_lines(chunk_size=1) 读取流，逐字节返回会让 requests 对每个字节重新拼接和切分整行。
+    """
+
+    MAX_BUFFERED_CHUNKS = 16
+
+    def __init__(self, adapter: "HTTP2Adapter", response: "httpx.Response", read_timeout: Optional[float]):
+        self._adapter = adapter
+        self._response = response
+        self._read_timeout = read_timeout
+        self._queue: "queue.SimpleQueue" = queue.SimpleQueue()
+        # 队列的剩余容量：读取任务放入分片前获取，调用线程取走分片后归还
+        self._credits = asyncio.Semaphore(self.MAX_BUFFERED_CHUNKS)
+        self._closed = False
+        asyncio.run_coroutine_threadsafe(self._pump(), adapter._loop)
+
+    async def _pump(self):
+        try:
+            async for chunk in self._response.aiter_bytes():
+                await self._credits.acquire()
+                if self._closed:
+                    break
+                self._queue.put(chunk)
+            self._queue.put(None)
+        except httpx.HTTPError as e:
+            self._queue.put(e)
+        finally:
+            try:
+                await self._response.aclose()
+            finally:
+                # 上游流真正结束后才归还名额
+                self._adapter._streams.release()
+
+    def read(self, amt: Optional[int] = None, **kwargs) -> bytes:
+        if self._closed:
+            return b""
+        if amt is None:
+            parts = []
+            chunk = self._next_chunk()
+            while chunk is not None:
+                parts.append(chunk)
+                chunk = self._next_chunk()
+            self.close()
+            return b"".join(parts)
+        chunk = self._next_chunk()
+        if chunk is None:
+            self.close()
+            return b""
+        return chunk
+
+    def _next_chunk(self) -> Optional[bytes]:
+        try:
+            item = self._queue.get(timeout=self._read_timeout)
+        except queue.Empty:
+            self.close()
+            raise requests.exceptions.ReadTimeout(f"上游在 {self._read_timeout} 秒内没有返回数据")
+        if isinstance(item, Exception):
+            self.close()
+            raise _to_requests_error(item)
+        if item is not None:
+            self._adapter._loop.call_soon_threadsafe(self._credits.release)
+        return item
+
+    def close(self):
+        # 不取消读取任务：httpx 的 HTTP/2 连接在写出帧的过程中被取消会破坏整个连接的帧序列，
+        # 读取任务在下一个分片到达（或读超时）时发现已关闭，自行结束并关闭上游流；
+        # 等待队列容量的读取任务需要唤醒
+        if not self._closed:
+            self._closed = True
+            self._adapter._loop.call_soon_threadsafe(self._credits.release)
+
+
+class HTTP2Adapter(BaseAdapter):
+    """基于 httpx 的 HTTP/2 requests 传输适配器"""
+
+    def __init__(self, max_streams: int = 100, max_connections: int = 10):
+        if httpx is None:
+            raise RuntimeError("HTTP/2 上游传输需要安装 httpx[http2]")
+        super().__init__()
+        self.max_streams = max_streams
+        self._streams = threading.BoundedSemaphore(max_streams)
+        limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+        self._client = httpx.AsyncClient(http2=True, limits=limits)
+        self._h2c_client = httpx.AsyncClient(http1=False, http2=True, limits=limits)
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="upstream-http2", daemon=True)
+        self._thread.start()
+        self._closed = False
+        self._close_lock = threading.Lock()
+
+    def _call(self, coro):
+        """在后台事件循环中执行协程并等待结果"""
+        if self._closed:
+            coro.close()
+            raise requests.exceptions.ConnectionError("上游 HTTP/2 传输已关闭")
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result()
+
+    async def _open(self, client: "httpx.AsyncClient", request, headers, timeout: "httpx.Timeout"):
+        upstream_request = client.build_request(
+            request.method, request.url, headers=headers, content=request.body, timeout=timeout
+        )
+        try:
+            return await client.send(upstream_request, stream=True)
+        except httpx.WriteError:
+            # 复用的连接在空闲期间已被上游关闭，请求尚未发出，换新连接重试一次
+            return await client.send(upstream_request, stream=True)
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        httpx_timeout = _to_httpx_timeout(timeout)
+        # 名额用尽时最多等待连接超时时间，与 HTTP/1.1 连接池取连接的语义一致
+        if not self._streams.acquire(timeout=httpx_timeout.connect):
+            raise requests.exceptions.ConnectTimeout(f"上游 HTTP/2 并发流已达上限 {self.max_streams}")
+        try:
+            headers = [(name, value) for name, value in request.headers.items()
+                       if name.lower() not in _HOP_BY_HOP_HEADERS]
+            client = self._h2c_client if request.url.startswith("http://") else self._client
+            upstream_response = self._call(self._open(client, request, headers, httpx_timeout))
+        except httpx.HTTPError as e:
+            self._streams.release()
+            raise _to_requests_error(e, request)
+        except BaseException:
+            self._streams.release()
+            raise
+
+        response = requests.Response()
+        response.status_code = upstream_response.status_code
+        response.reason = upstream_response.reason_phrase
+        response.headers = CaseInsensitiveDict(upstream_response.headers)
+        response.encoding = get_encoding_from_headers(response.headers)
+        response.raw = _StreamBody(self, upstream_response, httpx_timeout.read)
+        response.url = request.url
+        response.request = request
+        response.connection = self
+        return response
+
+    def close(self):
+        # requests.Session 对挂载在多个前缀上的同一个适配器会重复调用 close
+        with self._close_lock:
+            if self._closed:
+                return
+            try:
+                self._call(self._client.aclose())
+                self._call(self._h2c_client.aclose())
+            finally:
+                self._closed = True
+                self._loop.call_soon_threadsafe(self._loop.stop)
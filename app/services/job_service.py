@@ -0,0 +1,227 @@
+import asyncio
+import contextvars
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, Optional
+
+from app.core.config import settings, PROJECT_ROOT
+from app.core.tunables import on_reload
+from app.models.chat import ChatCompletionResponse
+from app.utils.lazy import LazyObject
+
+# 任务由其他工作进程执行时，长轮询读取共享存储的间隔（秒）
+SHARED_POLL_INTERVAL = 0.2
+
+
+class Job:
+    """异步任务"""
+
+    def __init__(self, job_id: str, caller: str):
+        self.id = job_id
+        self.caller = caller  # 提交方（API 密钥摘要），只有提交方可以查询结果
+        self.status = "queued"
+        self.created = time.time()
+        self.completed: Optional[float] = None
+        self.result = None
+        self.error: Optional[str] = None
+        self.future: Optional[Future] = None
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("succeeded", "failed")
+
+
+class SqliteJobStore:
+    """基于 SQLite（WAL 模式）的共享任务存储
+
+    与会话存储使用同一个数据库文件；多进程部署时任务由提交它的工作进程执行，
+    状态与结果写入这里，任意工作进程都能查询。
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id TEXT PRIMARY KEY, "
+            "caller TEXT NOT NULL, "
+            "status TEXT NOT NULL, "
+            "created REAL NOT NULL, "
+            "completed REAL, "
+            "result TEXT, "
+            "error TEXT)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_completed ON jobs(completed)")
+
+    def _conn(self) -> sqlite3.Connection:
+        """每个线程使用独立连接"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.path), timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def save(self, job: Job):
+        result = job.result.model_dump_json() if job.result is not None else None
+        self._conn().execute(
+            "INSERT OR REPLACE INTO jobs (id, caller, status, created, completed, result, error) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (job.id, job.caller, job.status, job.created, job.completed, result, job.error),
+        )
+
+    def load(self, job_id: str) -> Optional[Job]:
+        row = self._conn().execute(
+            "SELECT caller, status, created, completed, result, error FROM jobs WHERE id = ?",
+            (job_id,),
+        ).fetchone()
+        if row is None:
+            return None
+        job = Job(job_id, row[0])
+        job.status, job.created, job.completed = row[1], row[2], row[3]
+        job.result = ChatCompletionResponse.model_validate_json(row[4]) if row[4] is not None else None
+        job.error = row[5]
+        return job
+
+    def cleanup(self, ttl: float):
+        """删除结果已过期的任务"""
+        self._conn().execute("DELETE FROM jobs WHERE completed < ?", (time.time() - ttl,))
+
+
+class JobQueueFullError(Exception):
+    """待处理任务数已达上限"""
+
+
+class JobService:
+    """异步任务服务：在有界线程池中执行耗时的阻塞式聊天，结果保留一段时间供轮询获取
+
+    会话存储为 sqlite 时任务状态同时写入共享的 SqliteJobStore，多进程部署下可在任意工作进程查询；
+    否则任务只存在于提交它的进程中。
+    """
+
+    # 两次清理之间的最小间隔（秒）
+    CLEANUP_INTERVAL = 1.0
+
+    def __init__(self):
+        self.executor = ThreadPoolExecutor(max_workers=settings.JOB_MAX_WORKERS, thread_name_prefix="job")
+        self.jobs: Dict[str, Job] = {}
+        self.pending = 0
+        self._lock = threading.Lock()
+        self._last_cleanup = 0.0
+        self.store = self._create_store()
+
+    @staticmethod
+    def _create_store() -> Optional[SqliteJobStore]:
+        """会话存储为 sqlite 时，任务与会话共用同一个数据库文件"""
+        if str(settings.SESSION_STORE).lower() != "sqlite":
+            return None
+        store_path = Path(settings.SESSION_STORE_PATH).expanduser()
+        if not store_path.is_absolute():
+            store_path = PROJECT_ROOT / store_path
+        return SqliteJobStore(store_path)
+
+    def resize(self, max_workers: int):
+        """调整线程池大小
+
+        新任务提交到新线程池；旧线程池不再被引用后，已排队的任务仍会执行完，空闲线程随后自行退出。
+        """
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+
+    def submit(self, fn: Callable, *args, caller: str) -> Job:
+        """以 caller 的身份提交任务，待处理任务数超过上限时抛出 JobQueueFullError"""
+        with self._lock:
+            self._cleanup()
+            if self.pending >= settings.JOB_MAX_PENDING:
+                raise JobQueueFullError("待处理任务过多，请稍后重试")
+            job = Job(f"job-{uuid.uuid4().hex}", caller)
+            self._save(job)
+            self.jobs[job.id] = job
+            self.pending += 1
+        # 在提交方的上下文中运行，任务日志带有提交请求的关联 ID
+        context = contextvars.copy_context()
+        job.future = self.executor.submit(context.run, self._run, job, fn, args)
+        return job
+
+    def _save(self, job: Job):
+        if self.store is not None:
+            self.store.save(job)
+
+    def _run(self, job: Job, fn: Callable, args):
+        job.status = "running"
+        try:
+            self._save(job)
+            job.result = fn(*args)
+            job.status = "succeeded"
+        except Exception as e:
+            job.error = str(e)
+            job.status = "failed"
+        finally:
+            job.completed = time.time()
+            with self._lock:
+                self.pending -= 1
+            self._save(job)
+
+    def get(self, job_id: str) -> Optional[Job]:
+        """查询任务：先查本进程，再查共享存储（由其他工作进程执行的任务）"""
+        with self._lock:
+            self._cleanup()
+            job = self.jobs.get(job_id)
+        if job is None and self.store is not None:
+            job = self.store.load(job_id)
+        return job
+
+    async def wait(self, job: Job, timeout: float) -> Job:
+        """长轮询：等待任务结束，最多 timeout 秒，返回最新的任务状态"""
+        if timeout <= 0 or job.finished:
+            return job
+        if job.future is not None:
+            await asyncio.wait({asyncio.wrap_future(job.future)}, timeout=timeout)
+            return job
+        # 由其他工作进程执行：轮询共享存储
+        deadline = time.monotonic() + timeout
+        while not job.finished and time.monotonic() < deadline:
+            await asyncio.sleep(min(SHARED_POLL_INTERVAL, max(0.0, deadline - time.monotonic())))
+            job = await asyncio.to_thread(self.store.load, job.id) or job
+        return job
+
+    def _cleanup(self):
+        """删除结果已过期的任务"""
+        now = time.time()
+        if now - self._last_cleanup < self.CLEANUP_INTERVAL:
+            return
+        self._last_cleanup = now
+        expired = [
+            job_id for job_id, job in self.jobs.items()
+            if job.completed is not None and now - job.completed > settings.JOB_RESULT_TTL
+        ]
+        for job_id in expired:
+            del self.jobs[job_id]
+        if self.store is not None:
+            self.store.cleanup(settings.JOB_RESULT_TTL)
+
+    def snapshot(self) -> Dict:
+        return {
+            "jobs": len(self.jobs),
+            "pending": self.pending,
+            "max_workers": settings.JOB_MAX_WORKERS,
+            "shared": self.store is not None,
+        }
+
+
+# 创建全局任务服务实例：首次使用时才读取配置并创建线程池
+job_service: JobService = LazyObject(JobService)  # type: ignore[assignment]
+
+
+@on_reload
+def _apply_settings(new, changed):
+    if not job_service.initialized:
+        return
+    if "JOB_MAX_WORKERS" in changed:
+        job_service.resize(new.JOB_MAX_WORKERS)
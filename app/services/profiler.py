@@ -0,0 +1,110 @@
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, Optional
+
+# 视为空闲等待的叶子帧（文件名, 函数名），默认不计入采样结果
+IDLE_FRAMES = {
+    ("threading.py", "wait"),
+    ("threading.py", "_wait_for_tstate_lock"),
+    ("selectors.py", "select"),
+    ("queue.py", "get"),
+    ("socket.py", "accept"),
+}
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class SamplingProfiler:
+    """基于 sys._current_frames 的采样分析器
+
+    仅在采样期间启动采样循环，空闲时除路由标记外没有任何开销。
+    输出为 collapsed stacks 格式（每行 ``帧;帧;帧 次数``），可直接交给 flamegraph.pl / speedscope。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()  # 同一时间只允许一次采样
+        self._thread_routes: Dict[int, str] = {}  # 线程ID -> 当前正在处理的路由
+
+    @contextmanager
+    def route(self, name: str):
+        """在当前线程上标记正在处理的路由，用于按路由过滤采样"""
+        ident = threading.get_ident()
+        previous = self._thread_routes.get(ident)
+        self._thread_routes[ident] = name
+        try:
+            yield
+        finally:
+            if previous is None:
+                self._thread_routes.pop(ident, None)
+            else:
+                self._thread_routes[ident] = previous
+
+    def tag_iter(self, name: str, iterable: Iterable) -> Iterator:
+        """包装迭代器，使每次 next() 所在的线程（如线程池中的工作线程）都带上路由标记"""
+        iterator = iter(iterable)
+        while True:
+            with self.route(name):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+
+    def current_route(self, ident: int) -> Optional[str]:
+        """获取指定线程当前标记的路由"""
+        return self._thread_routes.get(ident)
+
+    def active_routes(self) -> Counter:
+        """统计当前各路由占用的线程数"""
+        return Counter(list(self._thread_routes.values()))
+
+    @property
+    def running(self) -> bool:
+        return self._lock.locked()
+
+    def profile(self, duration: float, interval: float = 0.005,
+                route: Optional[str] = None, include_idle: bool = False) -> Counter:
+        """采样 duration 秒，返回 collapsed stack -> 采样次数"""
+        if not self._lock.acquire(blocking=False):
+            raise RuntimeError("已有采样正在进行")
+        try:
+            own_ident = threading.get_ident()
+            counts: Counter = Counter()
+            deadline = time.monotonic() + duration
+            while time.monotonic() < deadline:
+                thread_names = {t.ident: t.name for t in threading.enumerate()}
+                for ident, frame in sys._current_frames().items():
+                    if ident == own_ident:
+                        continue
+                    thread_route = self._thread_routes.get(ident)
+                    if route is not None and thread_route != route:
+                        continue
+                    if not include_idle and (os.path.basename(frame.f_code.co_filename),
+                                             frame.f_code.co_name) in IDLE_FRAMES:
+                        continue
+                    stack = []
+                    while frame is not None:
+                        stack.append(_frame_label(frame))
+                        frame = frame.f_back
+                    stack.append(thread_route or thread_names.get(ident, f"thread-{ident}"))
+                    counts[";".join(reversed(stack))] += 1
+                time.sleep(interval)
+            return counts
+        finally:
+            self._lock.release()
+
+    @staticmethod
+    def format_collapsed(counts: Counter) -> str:
+        """格式化为 collapsed stacks 文本"""
+        return "\n".join(f"{stack} {count}" for stack, count in counts.most_common())
+
+
+# 创建全局分析器实例
+profiler = SamplingProfiler()
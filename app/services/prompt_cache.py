@@ -0,0 +1,259 @@
+"""
+近似重复提示词的回答缓存
+
+FAQ 类问题大量重复，但往往只在空白、标点、大小写或个别措辞上不同，按原文精确匹配几乎不会命中。
+这里以 MinHash 局部敏感哈希索引“命名空间 + 最后一条用户消息”：
+- 命名空间（调用方、模型与系统提示词）必须完全相同（按摘要分区），一个调用方的回答不会返回给其他调用方或其他模型；
+  ``PROMPT_CACHE_SHARED`` 开启时调用方之间共享，模型与系统提示词仍需相同
+- 用户消息归一化（NFKC、小写、去掉空白与标点）后取字符 2-gram 集合
+- 每个问题计算 ``BANDS × ROWS`` 个 MinHash 值并分成 ``BANDS`` 段，只有至少一段完全相同的条目才作为候选，
+  查找耗时与缓存条目数基本无关；Jaccard 相似度为 0.9 / 0.85 的问题成为候选的概率约 99% / 92%，0.3 的约 0.05%
+- 候选再按 2-gram 集合的精确 Jaccard 相似度校验，不低于 ``threshold`` 才算命中，LSH 的误报不会返回错误回答
+- 只缓存以 stop 正常结束的完整回答，超出容量或存活时间时按写入顺序淘汰最早的条目
+- 只对显式开启的调用方（API 密钥摘要）生效，且只处理没有历史回答、n = 1、未设置 stop / max_tokens 的请求
+
+每个工作进程各自维护缓存，不跨进程共享。
+"""
+import hashlib
+import re
+import struct
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, FrozenSet, List, NamedTuple, Optional, Sequence, Tuple, Union
+
+from app.core.config import settings
+from app.core.tunables import on_reload
+from app.utils.lazy import LazyObject
+
+SHINGLE_SIZE = 2
+BANDS = 8
+ROWS = 8
+
+# 归一化时去掉的字符：空白、标点与下划线
+_NON_WORD = re.compile(r"[\W_]+")
+
+# MinHash：每个特征用 SHAKE-128 一次生成 BANDS × ROWS 个 32 位哈希值，逐列取最小值即为签名。
+# 哈希与内容一一对应、不依赖进程的随机种子，各进程、各次启动得到相同的签名
+_SIGNATURE = struct.Struct(f"<{BANDS * ROWS}I")
+
+
+def normalize(text: str) -> str:
+    """归一化：全角半角统一、小写、去掉空白与标点"""
+    return _NON_WORD.sub("", unicodedata.normalize("NFKC", text).casefold())
+
+
+def shingles(text: str) -> FrozenSet[str]:
+    """归一化文本的字符 2-gram 集合"""
+    if len(text) <= SHINGLE_SIZE:
+        return frozenset((text,))
+    return frozenset(text[i:i + SHINGLE_SIZE] for i in range(len(text) - SHINGLE_SIZE + 1))
+
+
+def jaccard(a: FrozenSet[str], b: FrozenSet[str]) -> float:
+    return len(a & b) / len(a | b)
+
+
+def minhash(features: FrozenSet[str]) -> List[int]:
+    """计算 BANDS × ROWS 个 MinHash 值"""
+    size = _SIGNATURE.size
+    rows = [_SIGNATURE.unpack(hashlib.shake_128(feature.encode("utf-8")).digest(size)) for feature in features]
+    return list(map(min, zip(*rows)))
+
+
+class CacheHit(NamedTuple):
+    answer: str
+    similarity: float
+
+
+class _Entry:
+    __slots__ = ("normalized", "band_keys", "answer", "created", "hits")
+
+    def __init__(self, normalized: str, band_keys: List[int], answer: str):
+        self.normalized = normalized
+        self.band_keys = band_keys
+        self.answer = answer
+        self.created = time.monotonic()
+        self.hits = 0
+
+
+class PromptCache:
+    """近似重复提示词的回答缓存（MinHash 分段索引 + Jaccard 校验）"""
+
+    def __init__(self, max_entries: int = 100000, threshold: float = 0.85, ttl: float = 3600):
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self.ttl = ttl
+        self._entries: "OrderedDict[int, _Entry]" = OrderedDict()  # 条目编号 -> 条目，按写入顺序
+        # 段键 -> 条目编号；绝大多数段只属于一个条目，只有一个条目时直接存编号，省去列表的内存
+        self._buckets: Dict[int, Union[int, List[int]]] = {}
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.candidates = 0  # 查找时校验过的候选总数
+
+    @classmethod
+    def from_settings(cls) -> "PromptCache":
+        return cls(settings.PROMPT_CACHE_SIZE, settings.PROMPT_CACHE_THRESHOLD, settings.PROMPT_CACHE_TTL)
+
+    @staticmethod
+    def _band_keys(namespace: str, features: FrozenSet[str]) -> List[int]:
+        """各段的键：(命名空间摘要, 段号, 段内 ROWS 个 MinHash 值) 的 64 位摘要"""
+        partition = hashlib.blake2b(namespace.encode("utf-8"), digest_size=8).digest()
+        signature = minhash(features)
+        keys = []
+        for band in range(BANDS):
+            values = signature[band * ROWS:(band + 1) * ROWS]
+            data = partition + band.to_bytes(1, "little") + b"".join(v.to_bytes(4, "little") for v in values)
+            keys.append(int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), "little"))
+        return keys
+
+    def lookup(self, namespace: str, query: str) -> Optional[CacheHit]:
+        """在命名空间内查找近似重复的问题，命中时返回缓存的回答与 Jaccard 相似度"""
+        normalized = normalize(query)
+        if not normalized or self.max_entries <= 0:
+            return None
+        features = shingles(normalized)
+        keys = self._band_keys(namespace, features)
+        now = time.monotonic()
+        with self._lock:
+            candidates = set()
+            for key in keys:
+                bucket = self._buckets.get(key)
+                if bucket is None:
+                    continue
+                if isinstance(bucket, int):
+                    candidates.add(bucket)
+                else:
+                    candidates.update(bucket)
+            # 段中的编号可能已不在条目表中，跳过而不是报错
+            entries = [entry for entry in map(self._entries.get, candidates) if entry is not None]
+            self.candidates += len(entries)
+        best: Optional[_Entry] = None
+        best_similarity = self.threshold
+        for entry in entries:
+            if now - entry.created > self.ttl:
+                continue
+            similarity = 1.0 if entry.normalized == normalized else jaccard(features, shingles(entry.normalized))
+            if similarity >= best_similarity:
+                best, best_similarity = entry, similarity
+        with self._lock:
+            if best is None:
+                self.misses += 1
+                return None
+            best.hits += 1
+            self.hits += 1
+        return CacheHit(best.answer, round(best_similarity, 4))
+
+    def store(self, namespace: str, query: str, answer: str):
+        """在命名空间内缓存一个完整回答"""
+        normalized = normalize(query)
+        if not normalized or self.max_entries <= 0:
+            return
+        entry = _Entry(normalized, self._band_keys(namespace, shingles(normalized)), answer)
+        with self._lock:
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = entry
+            for key in entry.band_keys:
+                bucket = self._buckets.get(key)
+                if bucket is None:
+                    self._buckets[key] = entry_id
+                elif isinstance(bucket, int):
+                    self._buckets[key] = [bucket, entry_id]
+                else:
+                    bucket.append(entry_id)
+            self.stores += 1
+            self._evict()
+
+    def _evict(self):
+        """淘汰超出容量或过期的最早条目（调用方持有锁）"""
+        now = time.monotonic()
+        while self._entries:
+            entry_id, entry = next(iter(self._entries.items()))
+            if len(self._entries) <= self.max_entries and now - entry.created <= self.ttl:
+                break
+            del self._entries[entry_id]
+            for key in entry.band_keys:
+                bucket = self._buckets.get(key)
+                if bucket is None:
+                    continue
+                if isinstance(bucket, int):
+                    if bucket == entry_id:
+                        del self._buckets[key]
+                    continue
+                if entry_id in bucket:
+                    bucket.remove(entry_id)
+                if len(bucket) == 1:
+                    self._buckets[key] = bucket[0]
+                elif not bucket:
+                    del self._buckets[key]
+
+    def resize(self, max_entries: int, threshold: float, ttl: float):
+        """调整容量、相似度阈值与存活时间（阈值只影响校验，索引无需重建）"""
+        with self._lock:
+            self.max_entries = max(max_entries, 0)
+            self.threshold = threshold
+            self.ttl = ttl
+            self._evict()
+
+    def snapshot(self) -> Dict:
+        """导出缓存统计"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+                "stores": self.stores,
+                "avg_candidates": round(self.candidates / lookups, 2) if lookups else None,
+                "threshold": self.threshold,
+            }
+
+
+def cache_namespace(caller: str, model: str, system: str) -> str:
+    """缓存命名空间：调用方（``PROMPT_CACHE_SHARED`` 开启时为共享）、模型与系统提示词"""
+    scope = "*" if settings.PROMPT_CACHE_SHARED else caller
+    return "\x00".join((scope, model, system))
+
+
+def cache_key(messages: Sequence, caller: str, model: str, n: int = 1, stop=None,
+              token_limit: Optional[int] = None) -> Optional[Tuple[str, str]]:
+    """请求可以使用近似重复缓存时返回 (命名空间, 用户消息)，否则返回 None
+
+    只有开启缓存的调用方、没有历史回答（只有系统提示词与一条用户消息）、n = 1 且未设置 stop / max_tokens
+    的请求才使用缓存，这些请求的回答只取决于模型、系统提示词与问题本身。
+    """
+    if not settings.PROMPT_CACHE_ENABLED or n != 1 or stop or token_limit is not None:
+        return None
+    callers = settings.PROMPT_CACHE_CALLERS
+    if "*" not in callers and caller not in callers:
+        return None
+    system_parts = []
+    query = None
+    for message in messages:
+        if message.role == "system" and query is None:
+            system_parts.append(message.content)
+        elif message.role == "user" and query is None:
+            query = message.content
+        else:
+            return None
+    if query is None:
+        return None
+    return cache_namespace(caller, model, "\n\n".join(system_parts)), query
+
+
+# 创建全局近似重复缓存：首次使用时才读取配置
+prompt_cache: PromptCache = LazyObject(PromptCache.from_settings)  # type: ignore[assignment]
+
+
+@on_reload
+def _apply_settings(new, changed):
+    if not prompt_cache.initialized:
+        return
+    if changed & {"PROMPT_CACHE_SIZE", "PROMPT_CACHE_THRESHOLD", "PROMPT_CACHE_TTL"}:
+        prompt_cache.resize(new.PROMPT_CACHE_SIZE, new.PROMPT_CACHE_THRESHOLD, new.PROMPT_CACHE_TTL)
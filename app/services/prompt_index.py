@@ -0,0 +1,146 @@
+import hashlib
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+from app.core.config import settings
+from app.core.tunables import on_reload
+from app.utils.lazy import LazyObject
+from app.utils.text import estimate_tokens
+
+# 单个提示词占用超过字节预算的 1/MAX_ENTRY_SHARE 时不驻留，避免一个超长提示词挤掉其他所有提示词
+MAX_ENTRY_SHARE = 8
+
+
+class PromptEntry:
+    """已驻留的系统提示词"""
+
+    __slots__ = ("fingerprint", "content", "segment", "tokens", "size", "hits", "first_seen", "last_seen")
+
+    def __init__(self, content: str):
+        self.fingerprint = hashlib.blake2b(content.encode("utf-8"), digest_size=8).hexdigest()
+        self.content = content
+        self.segment = f"[SYSTEM]: {content}"  # 预先格式化的 Query 片段
+        self.tokens = estimate_tokens(content)
+        self.size = sys.getsizeof(content) + sys.getsizeof(self.segment)
+        self.hits = 0
+        self.first_seen = self.last_seen = time.time()
+
+
+class PromptIndex:
+    """系统提示词指纹索引
+
+    大多数请求复用少数几个很长的系统提示词：按内容驻留一份，之后的请求直接复用预先格式化的
+    ``[SYSTEM]: ...`` 片段和 token 估算结果，不再重复拼接；同时统计各提示词的使用次数，
+    作为缓存与会话复用决策的依据。按最近使用淘汰，条目数不超过 max_entries、占用内存不超过 max_bytes；
+    只驻留长度不小于 min_length、占用不超过 max_bytes 的 1/MAX_ENTRY_SHARE 的提示词。
+    """
+
+    def __init__(self, max_entries: int = 256, min_length: int = 256, max_bytes: int = 16 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.min_length = min_length
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        # 以内容本身为键：字符串哈希与比较都在 C 层完成，比先计算摘要更快
+        self._entries: "OrderedDict[str, PromptEntry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.oversized = 0  # 因过大未驻留的次数
+
+    @classmethod
+    def from_settings(cls) -> "PromptIndex":
+        return cls(settings.PROMPT_INDEX_SIZE, settings.PROMPT_INDEX_MIN_LENGTH, settings.PROMPT_INDEX_MAX_BYTES)
+
+    def intern(self, content: str) -> Optional[PromptEntry]:
+        """查找或驻留系统提示词，过短或过大的提示词返回 None"""
+        if self.max_entries <= 0 or len(content) < self.min_length:
+            return None
+        # 片段与原文各占一份，在计算摘要与格式化片段之前排除过大的提示词
+        if 2 * sys.getsizeof(content) > self.max_bytes // MAX_ENTRY_SHARE:
+            with self._lock:
+                self.oversized += 1
+            return None
+        with self._lock:
+            entry = self._entries.get(content)
+            if entry is not None:
+                self._entries.move_to_end(content)
+                entry.hits += 1
+                entry.last_seen = time.time()
+                self.hits += 1
+                return entry
+            self.misses += 1
+        entry = PromptEntry(content)
+        entry.hits = 1
+        with self._lock:
+            # 并发时可能已被其他请求驻留，以先驻留的为准
+            existing = self._entries.setdefault(content, entry)
+            if existing is not entry:
+                existing.hits += 1
+                return existing
+            self.total_bytes += entry.size
+            self._evict()
+        return entry
+
+    def _evict(self):
+        """淘汰最久未使用的提示词，直到条目数与占用都不超过上限（调用方持有锁）"""
+        while self._entries and (len(self._entries) > self.max_entries or self.total_bytes > self.max_bytes):
+            _content, entry = self._entries.popitem(last=False)
+            self.total_bytes -= entry.size
+
+    def resize(self, max_entries: int, min_length: int, max_bytes: int):
+        """调整驻留容量、最小长度与字节预算，超出时淘汰最久未使用的提示词"""
+        with self._lock:
+            self.max_entries = max_entries
+            self.min_length = min_length
+            self.max_bytes = max_bytes
+            self._evict()
+
+    def system_segment(self, content: str) -> str:
+        """返回系统提示词的 Query 片段，长提示词复用驻留的片段"""
+        entry = self.intern(content)
+        return entry.segment if entry is not None else f"[SYSTEM]: {content}"
+
+    def top(self, limit: int = 10) -> List[Dict]:
+        """使用次数最多的提示词指纹"""
+        with self._lock:
+            entries = sorted(self._entries.values(), key=lambda entry: entry.hits, reverse=True)[:limit]
+        return [
+            {
+                "fingerprint": entry.fingerprint,
+                "hits": entry.hits,
+                "length": len(entry.content),
+                "tokens": entry.tokens,
+                "first_seen": int(entry.first_seen),
+                "last_seen": int(entry.last_seen),
+            }
+            for entry in entries
+        ]
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            entries = len(self._entries)
+            hits, misses = self.hits, self.misses
+            total_bytes, oversized = self.total_bytes, self.oversized
+        return {
+            "entries": entries,
+            "bytes": total_bytes,
+            "hits": hits,
+            "misses": misses,
+            "oversized": oversized,
+            "top": self.top(settings.PROMPT_INDEX_TOP),
+        }
+
+
+# 创建全局系统提示词索引：首次使用时才读取配置
+prompt_index: PromptIndex = LazyObject(PromptIndex.from_settings)  # type: ignore[assignment]
+
+
+@on_reload
+def _apply_settings(new, changed):
+    if not prompt_index.initialized:
+        return
+    if changed & {"PROMPT_INDEX_SIZE", "PROMPT_INDEX_MIN_LENGTH", "PROMPT_INDEX_MAX_BYTES"}:
+        prompt_index.resize(new.PROMPT_INDEX_SIZE, new.PROMPT_INDEX_MIN_LENGTH, new.PROMPT_INDEX_MAX_BYTES)
@@ -0,0 +1,220 @@
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+from anyio import to_thread
+
+from app.core.tunables import on_reload
+from app.services.profiler import profiler
+
+logger = logging.getLogger(__name__)
+
+# 事件循环阻塞告警中列出的在途请求数
+STALL_REPORT_REQUESTS = 3
+
+
+class RuntimeMonitor:
+    """事件循环延迟与线程池饱和度监控
+
+    事件循环内的采样协程按固定间隔测量调度延迟和各线程池（anyio 默认线程池、流缓冲生产者线程池、
+    n > 1 的选择线程）的占用；独立的看门狗线程在事件循环卡住期间捕获其调用栈，
+    并列出运行时间最长的在途请求（由 InflightMiddleware 在事件循环上登记），便于定位阻塞来源。
+    """
+
+    def __init__(self):
+        self.interval = 0.5
+        self.lag_threshold = 0.2
+        self._task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+        self._loop_ident: Optional[int] = None
+        self._heartbeat = time.monotonic()
+        self._stall_reported = False
+        # 在途请求：id -> (路径, 开始时间)，仅在事件循环线程上修改
+        self._inflight: Dict[int, Tuple[str, float]] = {}
+        self._choice_lock = threading.Lock()
+        # 指标
+        self.loop_lag = 0.0
+        self.loop_lag_max = 0.0
+        self.stall_count = 0
+        self.threadpool_busy = 0
+        self.threadpool_size = 0
+        self.threadpool_waiting = 0
+        self.threadpool_waiting_max = 0
+        self.threadpool_saturated_count = 0
+        self.stream_pool_busy = 0
+        self.stream_pool_size = 0
+        self.stream_pool_saturated_count = 0
+        self.choice_threads_busy = 0
+        self.choice_threads_max = 0
+
+    def request_started(self, key: int, path: str):
+        """登记一个在途请求（在事件循环上调用）"""
+        self._inflight[key] = (path, time.monotonic())
+
+    def request_finished(self, key: int):
+        """移除在途请求（在事件循环上调用）"""
+        self._inflight.pop(key, None)
+
+    def longest_requests(self, limit: int = STALL_REPORT_REQUESTS) -> List[Tuple[str, float]]:
+        """运行时间最长的在途请求：[(路径, 已运行秒数)]，可在任意线程调用"""
+        # dict.copy() 在持有 GIL 时一次完成，不会与事件循环上的修改交错
+        inflight = self._inflight.copy()
+        now = time.monotonic()
+        oldest = sorted(inflight.values(), key=lambda item: item[1])[:limit]
+        return [(path, now - started) for path, started in oldest]
+
+    @contextmanager
+    def choice_thread(self):
+        """标记当前线程正在为 n > 1 的请求生成一个选择"""
+        with self._choice_lock:
+            self.choice_threads_busy += 1
+            self.choice_threads_max = max(self.choice_threads_max, self.choice_threads_busy)
+        try:
+            yield
+        finally:
+            with self._choice_lock:
+                self.choice_threads_busy -= 1
+
+    def start(self, interval: float, lag_threshold: float):
+        """在当前事件循环中启动监控"""
+        if self._task:
+            return
+        self.interval = interval
+        self.lag_threshold = lag_threshold
+        self._loop_ident = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._stopped.clear()
+        self._task = asyncio.get_running_loop().create_task(self._sample_loop())
+        self._watchdog = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._watchdog.start()
+
+    async def stop(self):
+        """停止监控"""
+        self._stopped.set()
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self._watchdog = None
+
+    async def _sample_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - expected)
+            self._heartbeat = time.monotonic()
+            self._stall_reported = False
+            self.loop_lag = lag
+            self.loop_lag_max = max(self.loop_lag_max, lag)
+            self._sample_threadpool()
+            self._sample_stream_pool()
+
+    def _sample_threadpool(self):
+        limiter = to_thread.current_default_thread_limiter()
+        statistics = limiter.statistics()
+        self.threadpool_busy = statistics.borrowed_tokens
+        self.threadpool_size = int(statistics.total_tokens)
+        self.threadpool_waiting = statistics.tasks_waiting
+        self.threadpool_waiting_max = max(self.threadpool_waiting_max, statistics.tasks_waiting)
+        if statistics.tasks_waiting > 0 and statistics.borrowed_tokens >= statistics.total_tokens:
+            self.threadpool_saturated_count += 1
+            logger.warning(
+                "线程池已满: 忙碌线程 %d/%d，排队任务 %d，占用路由 %s",
+                statistics.borrowed_tokens, self.threadpool_size, statistics.tasks_waiting,
+                dict(profiler.active_routes()),
+            )
+
+    def _sample_stream_pool(self):
+        from app.core.config import settings
+        from app.services.stream_buffer import stream_registry
+        self.stream_pool_busy = stream_registry.active
+        self.stream_pool_size = settings.STREAM_WORKERS
+        if self.stream_pool_busy >= self.stream_pool_size:
+            self.stream_pool_saturated_count += 1
+            logger.warning(
+                "流缓冲线程池已满: 生产者 %d/%d，选择线程 %d，占用路由 %s",
+                self.stream_pool_busy, self.stream_pool_size, self.choice_threads_busy,
+                dict(profiler.active_routes()),
+            )
+
+    def _watch(self):
+        while not self._stopped.wait(self.interval / 2):
+            stalled_for = time.monotonic() - self._heartbeat - self.interval
+            if stalled_for < self.lag_threshold or self._stall_reported:
+                continue
+            self._stall_reported = True
+            self.stall_count += 1
+            requests = ", ".join(
+                f"{path} ({elapsed:.1f}s)" for path, elapsed in self.longest_requests()
+            )
+            frame = sys._current_frames().get(self._loop_ident)
+            location = "未知"
+            if frame is not None:
+                code = frame.f_code
+                location = f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})"
+            logger.warning(
+                "事件循环阻塞已超过 %.0fms，位置: %s，在途请求（%d 个，最长的 %d 个）: %s",
+                stalled_for * 1000, location, len(self._inflight),
+                min(len(self._inflight), STALL_REPORT_REQUESTS), requests or "无",
+            )
+
+    def snapshot(self) -> Dict:
+        """导出当前指标"""
+        return {
+            "loop_lag_ms": round(self.loop_lag * 1000, 3),
+            "loop_lag_max_ms": round(self.loop_lag_max * 1000, 3),
+            "loop_stall_count": self.stall_count,
+            "threadpool_busy": self.threadpool_busy,
+            "threadpool_size": self.threadpool_size,
+            "threadpool_waiting": self.threadpool_waiting,
+            "threadpool_waiting_max": self.threadpool_waiting_max,
+            "threadpool_saturated_count": self.threadpool_saturated_count,
+            "stream_pool_busy": self.stream_pool_busy,
+            "stream_pool_size": self.stream_pool_size,
+            "stream_pool_saturated_count": self.stream_pool_saturated_count,
+            "choice_threads_busy": self.choice_threads_busy,
+            "choice_threads_max": self.choice_threads_max,
+            "inflight_requests": len(self._inflight),
+        }
+
+
+class InflightMiddleware:
+    """在事件循环上登记在途的 HTTP 请求与 WebSocket 连接（路径与开始时间），供阻塞告警定位路由"""
+
+    def __init__(self, app, monitor: RuntimeMonitor):
+        self.app = app
+        self.monitor = monitor
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] not in ("http", "websocket"):
+            await self.app(scope, receive, send)
+            return
+        key = id(scope)
+        self.monitor.request_started(key, f"{scope.get('method', 'WS')} {scope['path']}")
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.monitor.request_finished(key)
+
+
+# 创建全局监控实例
+runtime_monitor = RuntimeMonitor()
+
+
+@on_reload
+def _apply_settings(new, changed):
+    # 监控循环每次都读取这两个属性，直接修改即可生效
+    if not changed & {"MONITOR_INTERVAL", "LOOP_LAG_THRESHOLD"}:
+        return
+    runtime_monitor.interval = new.MONITOR_INTERVAL
+    runtime_monitor.lag_threshold = new.LOOP_LAG_THRESHOLD
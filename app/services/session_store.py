@@ -0,0 +1,171 @@
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Optional, Union
+
+
+def user_id_for(session_id: str) -> str:
+    """会话对应的上游用户ID"""
+    return f"user_{session_id}"
+
+
+def _pack_id(value: str) -> Union[bytes, str]:
+    """规范格式的 UUID 字符串压缩为 16 字节，其他ID保持原样"""
+    if len(value) == 36:
+        try:
+            packed = uuid.UUID(value)
+        except ValueError:
+            return value
+        if str(packed) == value:
+            return packed.bytes
+    return value
+
+
+def _unpack_id(value: Union[bytes, str]) -> str:
+    if isinstance(value, bytes):
+        return str(uuid.UUID(bytes=value))
+    return value
+
+
+class SessionRecord:
+    """单个会话的紧凑记录：user_id 由会话ID推导，只有与推导结果不同时才单独保存"""
+
+    __slots__ = ("app_conversation_id", "updated_at", "user_id")
+
+    def __init__(self, app_conversation_id: Union[bytes, str], updated_at: float, user_id: Optional[str] = None):
+        self.app_conversation_id = app_conversation_id
+        self.updated_at = updated_at
+        self.user_id = user_id
+
+
+class MemorySessionStore:
+    """进程内会话存储（单进程默认）
+
+    每个会话一条 SessionRecord，UUID 形式的ID压缩为 16 字节；记录按最近使用时间排序，
+    清理时只需从最旧的一端弹出，不再扫描全部会话。
+    """
+
+    def __init__(self):
+        self.records: "OrderedDict[Union[bytes, str], SessionRecord]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, session_id: str) -> Optional[Dict]:
+        record = self.records.get(_pack_id(session_id))
+        if record is None:
+            return None
+        return {
+            "app_conversation_id": _unpack_id(record.app_conversation_id),
+            "user_id": record.user_id or user_id_for(session_id)
+        }
+
+    def set(self, session_id: str, info: Dict):
+        user_id = info["user_id"]
+        record = SessionRecord(
+            _pack_id(info["app_conversation_id"]),
+            time.time(),
+            None if user_id == user_id_for(session_id) else user_id
+        )
+        key = _pack_id(session_id)
+        with self._lock:
+            self.records[key] = record
+            self.records.move_to_end(key)
+
+    def touch(self, session_id: str):
+        """更新会话时间戳"""
+        key = _pack_id(session_id)
+        with self._lock:
+            record = self.records.get(key)
+            if record is not None:
+                record.updated_at = time.time()
+                self.records.move_to_end(key)
+
+    def cleanup(self, timeout: float, max_conversations: int):
+        """清理过期的会话，会话数量超过限制时删除最旧的会话"""
+        expire_before = time.time() - timeout
+        with self._lock:
+            records = self.records
+            while records:
+                oldest = records[next(iter(records))]
+                if oldest.updated_at >= expire_before and len(records) <= max_conversations:
+                    break
+                records.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+
+class SqliteSessionStore:
+    """基于 SQLite（WAL 模式）的本地共享会话存储，供同一主机上的多个工作进程读写"""
+
+    # 两次清理之间的最小间隔（秒），避免每个请求都扫描全表
+    CLEANUP_INTERVAL = 1.0
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        self._last_cleanup = 0.0
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS conversations ("
+            "session_id TEXT PRIMARY KEY, "
+            "app_conversation_id TEXT NOT NULL, "
+            "user_id TEXT NOT NULL, "
+            "updated_at REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_conversations_updated_at ON conversations(updated_at)")
+        conn.commit()
+
+    def _conn(self) -> sqlite3.Connection:
+        """每个线程使用独立连接"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.path), timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, session_id: str) -> Optional[Dict]:
+        row = self._conn().execute(
+            "SELECT app_conversation_id, user_id FROM conversations WHERE session_id = ?",
+            (session_id,),
+        ).fetchone()
+        if row is None:
+            return None
+        return {"app_conversation_id": row[0], "user_id": row[1]}
+
+    def set(self, session_id: str, info: Dict):
+        self._conn().execute(
+            "INSERT OR REPLACE INTO conversations (session_id, app_conversation_id, user_id, updated_at) "
+            "VALUES (?, ?, ?, ?)",
+            (session_id, info["app_conversation_id"], info["user_id"], time.time()),
+        )
+
+    def touch(self, session_id: str):
+        self._conn().execute(
+            "UPDATE conversations SET updated_at = ? WHERE session_id = ?",
+            (time.time(), session_id),
+        )
+
+    def cleanup(self, timeout: float, max_conversations: int):
+        """清理过期的会话，并在超过数量上限时删除最旧的会话"""
+        now = time.time()
+        if now - self._last_cleanup < self.CLEANUP_INTERVAL:
+            return
+        self._last_cleanup = now
+        conn = self._conn()
+        conn.execute("DELETE FROM conversations WHERE updated_at < ?", (now - timeout,))
+        count = conn.execute("SELECT COUNT(*) FROM conversations").fetchone()[0]
+        if count > max_conversations:
+            conn.execute(
+                "DELETE FROM conversations WHERE session_id IN ("
+                "SELECT session_id FROM conversations ORDER BY updated_at LIMIT ?)",
+                (count - max_conversations,),
+            )
+
+    def __len__(self) -> int:
+        return self._conn().execute("SELECT COUNT(*) FROM conversations").fetchone()[0]
@@ -0,0 +1,367 @@
+import asyncio
+import contextvars
+import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from typing import AsyncIterator, Dict, Iterable, List, Optional, Tuple
+
+from app.core.config import settings
+from app.services.profiler import profiler
+
+# 缓冲中的单个事件：(SSE 事件名, 数据)
+StreamEvent = Tuple[Optional[str], str]
+
+# 暂停读取上游时重新检查全局预算的间隔（秒）：其他流结束或被淘汰时不会通知暂停中的流
+_PAUSE_POLL_INTERVAL = 0.1
+
+# /stats 中列出的缓冲最多的流数量
+_TOP_STREAMS = 10
+
+
+class StreamOverflow(Exception):
+    """客户端读取过慢，缓冲超过上限（drop 策略）或暂停超过宽限期（pause 策略）"""
+
+
+class StreamCapacityError(Exception):
+    """同时进行的流已达到 ``STREAM_WORKERS`` 上限"""
+
+
+def _event_size(event: StreamEvent) -> int:
+    return sys.getsizeof(event[1])
+
+
+class BufferedStream:
+    """单个流式补全的事件缓冲
+
+    上游内容由独立的生产者线程写入，与客户端连接解耦；
+    客户端可以从任意序号开始读取，断线重连时据此续传，不需要重新请求上游。
+    已发送给客户端的事件保留用于续传，内存紧张时可以丢弃（``trim_delivered``），之后从这些序号续传返回 404。
+    """
+
+    def __init__(self, stream_id: str, caller: Optional[str] = None):
+        self.stream_id = stream_id
+        self.caller = caller  # 发起请求的调用方（API 密钥摘要），只有该调用方可以续传
+        self.events: List[StreamEvent] = []  # events[i] 的序号为 base + i
+        self.base = 0  # 已丢弃的事件数
+        self.size = 0  # 缓冲占用的字节数（估算）
+        self.pending = 0  # 尚未发送给客户端的字节数
+        self.delivered = 0  # 已发送给客户端的事件数（多个读取方时取最靠前者）
+        self.done = False
+        self.created_at = time.monotonic()
+        self.finished_at: Optional[float] = None
+        self.paused_since: Optional[float] = None  # 因客户端读取过慢暂停读取上游的开始时间
+        self.cancelled = False  # 不再需要后续内容（见 StreamRegistry.discard），生产者在下一个事件前停止
+        self._lock = threading.Lock()
+        self._readable = threading.Condition(self._lock)  # 客户端读取后通知暂停中的生产者
+        self._waiters: List[Tuple[asyncio.AbstractEventLoop, asyncio.Event]] = []
+
+    def append(self, event: StreamEvent) -> int:
+        """追加事件，返回增加的字节数"""
+        size = _event_size(event)
+        with self._lock:
+            self.events.append(event)
+            self.size += size
+            self.pending += size
+            waiters = self._waiters
+            self._waiters = []
+        self._notify(waiters)
+        return size
+
+    def finish(self):
+        with self._lock:
+            self.done = True
+            self.finished_at = time.monotonic()
+            waiters = self._waiters
+            self._waiters = []
+        self._notify(waiters)
+
+    @staticmethod
+    def _notify(waiters):
+        for loop, waiter in waiters:
+            try:
+                loop.call_soon_threadsafe(waiter.set)
+            except RuntimeError:
+                # 事件循环已关闭
+                pass
+
+    def _mark_delivered(self, count: int):
+        """记录前 count 个事件已发送给客户端，唤醒暂停中的生产者"""
+        with self._lock:
+            if count <= self.delivered:
+                return
+            for offset in range(max(self.delivered - self.base, 0), count - self.base):
+                self.pending -= _event_size(self.events[offset])
+            self.delivered = count
+            self._readable.notify_all()
+
+    def wait_readable(self, timeout: float):
+        """等待客户端读取或取消（生产者线程中调用）"""
+        with self._lock:
+            if not self.cancelled:
+                self._readable.wait(timeout)
+
+    def cancel(self):
+        """取消流：生产者在下一个事件前停止并关闭上游，暂停中的生产者立即醒来"""
+        with self._lock:
+            self.cancelled = True
+            self._readable.notify_all()
+
+    def trim_delivered(self) -> int:
+        """丢弃已发送给客户端的事件，返回释放的字节数"""
+        with self._lock:
+            count = self.delivered - self.base
+            if count <= 0:
+                return 0
+            freed = sum(_event_size(event) for event in self.events[:count])
+            del self.events[:count]
+            self.base = self.delivered
+            self.size -= freed
+            return freed
+
+    async def aiter_from(self, start: int = 0) -> AsyncIterator[Tuple[int, StreamEvent]]:
+        """从序号 start 开始异步读取事件，直到流结束；start 之前的事件已被丢弃时直接结束"""
+        index = start
+        loop = asyncio.get_running_loop()
+        while True:
+            with self._lock:
+                offset = index - self.base
+                if offset < 0:
+                    return
+                if offset < len(self.events):
+                    event = self.events[offset]
+                elif self.done:
+                    return
+                else:
+                    event = None
+                    waiter = asyncio.Event()
+                    self._waiters.append((loop, waiter))
+            if event is None:
+                await waiter.wait()
+                continue
+            yield index, event
+            # 生成器恢复执行说明上一个事件已交给客户端连接
+            index += 1
+            self._mark_delivered(index)
+
+
+class StreamRegistry:
+    """流缓冲注册表
+
+    - 单个流：尚未发送给客户端的字节数超过 ``STREAM_BUFFER_STREAM_MAX_BYTES`` 时按 ``STREAM_BUFFER_OVERFLOW``
+      处理：``pause`` 暂停读取上游直到降到上限的一半，暂停时间达到宽限期 ``STREAM_BUFFER_GRACE`` 后中断；
+      ``drop`` 不等待，立即中断。中断时向客户端发送错误事件并关闭上游。上限在写入事件之前检查，
+      因此未发送的内容最多超出上限一个事件（中断时再加上一个错误事件）
+    - 全部流：总字节数超过 ``STREAM_BUFFER_MAX_BYTES`` 时依次淘汰已结束的流、丢弃进行中的流已发送的事件，
+      仍然超出时写入事件的流按上述策略处理
+    - 已结束的流按存活时间淘汰
+    - 生产者运行在大小为 ``STREAM_WORKERS`` 的线程池中，已满时拒绝新的流（``StreamCapacityError``）
+    - 注册表在进程内，多进程部署时只有连接落到同一工作进程才能续传
+    """
+
+    def __init__(self):
+        self._streams: "OrderedDict[str, BufferedStream]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._workers = 0
+        self.active = 0  # 正在运行的生产者数
+        self.rejected = 0  # 因线程池已满被拒绝的流
+        self.total_bytes = 0  # 所有流缓冲的字节数
+        self.paused = 0  # 暂停读取上游的次数
+        self.pause_seconds = 0.0
+        self.dropped = 0  # 因客户端读取过慢被中断的流
+        self.trimmed_bytes = 0  # 内存紧张时丢弃的已发送事件字节数
+
+    def _pool(self) -> ThreadPoolExecutor:
+        """生产者线程池，``STREAM_WORKERS`` 变化时重建；旧线程池中的流继续运行到结束（调用方持有锁）"""
+        workers = settings.STREAM_WORKERS
+        if self._executor is None or self._workers != workers:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+            self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="stream")
+            self._workers = workers
+        return self._executor
+
+    def start(self, stream_id: str, source: Iterable[StreamEvent], route: Optional[str] = None,
+              caller: Optional[str] = None) -> BufferedStream:
+        """注册新流并在线程池中启动生产者，将 source 的内容写入缓冲；线程池已满时抛出 StreamCapacityError"""
+        buffered = BufferedStream(stream_id, caller)
+        with self._lock:
+            if self.active >= settings.STREAM_WORKERS:
+                self.rejected += 1
+                rejected = True
+            else:
+                rejected = False
+                self.active += 1
+                self._evict()
+                self._streams[stream_id] = buffered
+                pool = self._pool()
+        if rejected:
+            close = getattr(source, "close", None)
+            if close is not None:
+                close()
+            raise StreamCapacityError(f"同时进行的流式响应已达上限 {settings.STREAM_WORKERS}")
+        # 生产者沿用请求的上下文（日志关联 ID、截止时间等）
+        pool.submit(contextvars.copy_context().run, self._pump, buffered, source, route)
+        return buffered
+
+    def _pump(self, buffered: BufferedStream, source: Iterable[StreamEvent], route: Optional[str]):
+        try:
+            self._produce(buffered, source, route)
+        finally:
+            with self._lock:
+                self.active -= 1
+
+    def _produce(self, buffered: BufferedStream, source: Iterable[StreamEvent], route: Optional[str]):
+        try:
+            with profiler.route(route) if route else nullcontext():
+                for event in source:
+                    if buffered.cancelled:
+                        break
+                    self._admit(buffered)
+                    self._append(buffered, event)
+        except StreamOverflow as e:
+            self._append(buffered, ("error", f'{{"error": "{e}"}}'))
+        finally:
+            # 提前结束时关闭生成器，由其关闭上游连接
+            close = getattr(source, "close", None)
+            if close is not None:
+                close()
+            buffered.finish()
+            if buffered.cancelled:
+                with self._lock:
+                    self._remove(buffered)
+
+    def _append(self, buffered: BufferedStream, event: StreamEvent):
+        size = buffered.append(event)
+        with self._lock:
+            self.total_bytes += size
+
+    def _over_limit(self, buffered: BufferedStream, resuming: bool = False) -> bool:
+        """写入下一个事件前检查单个流与全局的上限（全局超限时先尝试释放内存）
+
+        暂停中的流要等未发送的内容降到上限的一半才恢复，避免每读走一个事件就恢复一次、写入一个事件又暂停。
+        """
+        max_bytes = settings.STREAM_BUFFER_STREAM_MAX_BYTES
+        if max_bytes and buffered.pending > (max_bytes // 2 if resuming else max_bytes):
+            return True
+        if self.total_bytes <= settings.STREAM_BUFFER_MAX_BYTES:
+            return False
+        with self._lock:
+            self._evict()
+            if self.total_bytes > settings.STREAM_BUFFER_MAX_BYTES:
+                self._trim()
+            return self.total_bytes > settings.STREAM_BUFFER_MAX_BYTES
+
+    def _admit(self, buffered: BufferedStream):
+        """写入下一个事件前执行上限：超过时按溢出策略立即中断，或暂停直到低于上限、宽限期后中断（生产者线程中调用）"""
+        if not self._over_limit(buffered):
+            return
+        if settings.STREAM_BUFFER_OVERFLOW != "pause":
+            # 全局超限时 _over_limit 已淘汰已结束的流并丢弃已发送的事件，仍然超出说明必须中断
+            self._count_dropped()
+            raise StreamOverflow("客户端读取过慢，流已中断")
+
+        grace = settings.STREAM_BUFFER_GRACE
+        now = time.monotonic()
+        buffered.paused_since = now
+        with self._lock:
+            self.paused += 1
+        try:
+            while not buffered.cancelled and self._over_limit(buffered, resuming=True):
+                remaining = grace - (time.monotonic() - now)
+                if remaining <= 0:
+                    self._count_dropped()
+                    raise StreamOverflow("客户端读取过慢，流已中断")
+                buffered.wait_readable(min(remaining, _PAUSE_POLL_INTERVAL))
+        finally:
+            buffered.paused_since = None
+            with self._lock:
+                self.pause_seconds += time.monotonic() - now
+
+    def _count_dropped(self):
+        with self._lock:
+            self.dropped += 1
+
+    def discard(self, buffered: BufferedStream):
+        """移除不需要续传的流（如 WebSocket 的一轮）：仍在运行时取消生产者，由其结束时移除"""
+        buffered.cancel()
+        with self._lock:
+            if buffered.done:
+                self._remove(buffered)
+
+    def _remove(self, buffered: BufferedStream):
+        """移除流并释放其缓冲（调用方持有锁）"""
+        if self._streams.get(buffered.stream_id) is buffered:
+            del self._streams[buffered.stream_id]
+            self.total_bytes -= buffered.size
+
+    def get(self, stream_id: str) -> Optional[BufferedStream]:
+        with self._lock:
+            self._evict()
+            return self._streams.get(stream_id)
+
+    def _evict(self):
+        """淘汰过期的已结束流；总内存超限时从最旧的已结束流开始淘汰（调用方持有锁）"""
+        now = time.monotonic()
+        expired = [
+            stream_id for stream_id, buffered in self._streams.items()
+            if buffered.done and now - buffered.finished_at > settings.STREAM_BUFFER_TTL
+        ]
+        for stream_id in expired:
+            self.total_bytes -= self._streams.pop(stream_id).size
+
+        max_bytes = settings.STREAM_BUFFER_MAX_BYTES
+        if self.total_bytes <= max_bytes:
+            return
+        for stream_id in [sid for sid, buffered in self._streams.items() if buffered.done]:
+            self.total_bytes -= self._streams.pop(stream_id).size
+            if self.total_bytes <= max_bytes:
+                break
+
+    def _trim(self):
+        """从最旧的进行中的流开始丢弃已发送的事件，直到总内存不超过上限（调用方持有锁）"""
+        max_bytes = settings.STREAM_BUFFER_MAX_BYTES
+        for buffered in list(self._streams.values()):
+            freed = buffered.trim_delivered()
+            self.total_bytes -= freed
+            self.trimmed_bytes += freed
+            if self.total_bytes <= max_bytes:
+                break
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            streams = list(self._streams.values())
+            totals = {
+                "buffered_bytes": self.total_bytes,
+                "paused": self.paused,
+                "pause_seconds": round(self.pause_seconds, 3),
+                "dropped": self.dropped,
+                "trimmed_bytes": self.trimmed_bytes,
+                "producers": self.active,
+                "rejected": self.rejected,
+            }
+        running = [buffered for buffered in streams if not buffered.done]
+        largest = sorted(running, key=lambda buffered: buffered.size, reverse=True)[:_TOP_STREAMS]
+        return {
+            "streams": len(streams),
+            "running": len(running),
+            **totals,
+            "pending_bytes": sum(buffered.pending for buffered in streams),
+            "paused_streams": sum(1 for buffered in running if buffered.paused_since is not None),
+            "budget_bytes": settings.STREAM_BUFFER_MAX_BYTES,
+            "stream_max_bytes": settings.STREAM_BUFFER_STREAM_MAX_BYTES,
+            "overflow": settings.STREAM_BUFFER_OVERFLOW,
+            "workers": settings.STREAM_WORKERS,
+            "largest": [
+                {"id": buffered.stream_id, "buffered_bytes": buffered.size, "pending_bytes": buffered.pending,
+                 "paused": buffered.paused_since is not None}
+                for buffered in largest
+            ],
+        }
+
+
+# 创建全局流缓冲注册表
+stream_registry = StreamRegistry()
@@ -0,0 +1,185 @@
+import json
+import threading
+import time
+from collections import deque
+from pathlib import Path
+from typing import Deque, Dict, Iterator, List, Optional, Tuple
+
+
+def _dumps(record: Dict) -> str:
+    """紧凑地序列化一条录制记录"""
+    return json.dumps(record, ensure_ascii=False, separators=(",", ":"))
+
+
+class TrafficRecorder:
+    """上游流量录制器，将请求/响应对及完整 SSE 流（含时间信息）追加写入 JSONL 文件"""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._file = self.path.open("a", encoding="utf-8")
+
+    def _write(self, record: Dict):
+        line = _dumps(record)
+        with self._lock:
+            self._file.write(line + "\n")
+            self._file.flush()
+
+    def record_request(self, endpoint: str, method: str, payload: Optional[Dict],
+                       status: int, response_data: Optional[Dict], elapsed: float):
+        """录制一次普通请求"""
+        self._write({
+            "type": "request",
+            "ts": time.time(),
+            "endpoint": endpoint,
+            "method": method.upper(),
+            "payload": payload,
+            "status": status,
+            "response": response_data,
+            "elapsed": round(elapsed, 6),
+        })
+
+    def wrap_stream(self, endpoint: str, payload: Optional[Dict], response, started: float) -> "RecordingStreamResponse":
+        """包装流式响应，在读取的同时录制每一行及其相对时间"""
+        return RecordingStreamResponse(self, endpoint, payload, response, started)
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+class RecordingStreamResponse:
+    """边读边录制的流式响应代理，接口与 requests.Response 的流式用法保持一致"""
+
+    def __init__(self, recorder: TrafficRecorder, endpoint: str, payload: Optional[Dict], response, started: float):
+        self._recorder = recorder
+        self._endpoint = endpoint
+        self._payload = payload
+        self._response = response
+        self._started = started
+        self._lines: List[Tuple[float, str]] = []
+        self._ttfb = time.perf_counter() - started
+        self._finished = False
+        self.status_code = response.status_code
+
+    def iter_lines(self, decode_unicode: bool = True, chunk_size: int = 1) -> Iterator[str]:
+        try:
+            for line in self._response.iter_lines(decode_unicode=decode_unicode, chunk_size=chunk_size):
+                if line:
+                    self._lines.append((round(time.perf_counter() - self._started, 6), line))
+                yield line
+        finally:
+            self._finish()
+
+    def _finish(self):
+        if self._finished:
+            return
+        self._finished = True
+        self._recorder._write({
+            "type": "stream",
+            "ts": time.time(),
+            "endpoint": self._endpoint,
+            "payload": self._payload,
+            "status": self.status_code,
+            "ttfb": round(self._ttfb, 6),
+            "elapsed": round(time.perf_counter() - self._started, 6),
+            "lines": self._lines,
+        })
+
+    def close(self):
+        self._finish()
+        self._response.close()
+
+
+class TrafficReplayer:
+    """上游流量回放器，按录制内容返回响应，不访问真实上游"""
+
+    def __init__(self, path: Path, speed: float = 1.0):
+        self.path = path
+        self.speed = speed
+        self._lock = threading.Lock()
+        # (类型, 端点) -> 记录队列，按轮询方式回放
+        self._by_endpoint: Dict[Tuple[str, str], Deque[Dict]] = {}
+        # (类型, 端点, Query) -> 记录队列，优先精确匹配同一问题
+        self._by_query: Dict[Tuple[str, str, str], Deque[Dict]] = {}
+        self._load()
+
+    def _load(self):
+        with self.path.open("r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                kind = record.get("type")
+                endpoint = record.get("endpoint")
+                if kind not in ("request", "stream") or not endpoint:
+                    continue
+                self._by_endpoint.setdefault((kind, endpoint), deque()).append(record)
+                query = (record.get("payload") or {}).get("Query")
+                if query is not None:
+                    self._by_query.setdefault((kind, endpoint, query), deque()).append(record)
+
+    def _next(self, kind: str, endpoint: str, payload: Optional[Dict]) -> Optional[Dict]:
+        query = (payload or {}).get("Query")
+        with self._lock:
+            candidates = None
+            if query is not None:
+                candidates = self._by_query.get((kind, endpoint, query))
+            if not candidates:
+                candidates = self._by_endpoint.get((kind, endpoint))
+            if not candidates:
+                return None
+            record = candidates[0]
+            candidates.rotate(-1)
+            return record
+
+    def _sleep(self, seconds: float):
+        if self.speed > 0 and seconds > 0:
+            time.sleep(seconds / self.speed)
+
+    def replay_request(self, endpoint: str, payload: Optional[Dict]) -> Optional[Dict]:
+        """回放一次普通请求，返回录制的 JSON 响应"""
+        record = self._next("request", endpoint, payload)
+        if not record:
+            return None
+        self._sleep(record.get("elapsed", 0.0))
+        return record.get("response")
+
+    def replay_stream(self, endpoint: str, payload: Optional[Dict]) -> Optional["ReplayStreamResponse"]:
+        """回放一次流式请求"""
+        record = self._next("stream", endpoint, payload)
+        if not record:
+            return None
+        return ReplayStreamResponse(record, self._sleep)
+
+    @property
+    def record_count(self) -> int:
+        return sum(len(records) for records in self._by_endpoint.values())
+
+
+class ReplayStreamResponse:
+    """回放的流式响应，按原始时间间隔（或尽可能快地）逐行输出"""
+
+    def __init__(self, record: Dict, sleep):
+        self._record = record
+        self._sleep = sleep
+        self._closed = False
+        self.status_code = record.get("status", 200)
+
+    def iter_lines(self, decode_unicode: bool = True, chunk_size: int = 1) -> Iterator[str]:
+        self._sleep(self._record.get("ttfb", 0.0))
+        previous = self._record.get("ttfb", 0.0)
+        for offset, line in self._record.get("lines", []):
+            if self._closed:
+                return
+            self._sleep(offset - previous)
+            previous = offset
+            yield line
+
+    def close(self):
+        self._closed = True
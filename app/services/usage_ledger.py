@@ -0,0 +1,174 @@
+"""
+用量台账
+
+按调用方（API 密钥摘要）与模型在内存中累计请求数与 token 用量，由后台线程定时把上次落盘以来的增量
+批量追加写入 JSONL 文件：
+- 请求路径上只在锁内更新一个计数字典，开销恒定，从不等待磁盘
+- 每次落盘把所有增量拼成一次 write 追加到文件末尾，多个工作进程可以写同一个文件；每行带有 pid 与时间区间
+- 文件只追加不修改，按调用方或模型汇总即可得到任意时间段的用量
+"""
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from app.core.config import PROJECT_ROOT, settings
+from app.core.tunables import on_reload
+from app.models.chat import UsageInfo
+from app.utils.json_codec import dumps
+
+logger = logging.getLogger(__name__)
+
+# 每个 (调用方, 模型) 的计数：[请求数, prompt_tokens, completion_tokens]
+Counters = Dict[Tuple[str, str], List[int]]
+
+
+class UsageLedger:
+    """按调用方与模型累计用量，定时批量追加写入本地文件"""
+
+    # 调用方与模型都来自请求，限制不同组合的数量，超出后计入 OVERFLOW_KEY
+    MAX_ENTRIES = 10000
+    OVERFLOW_KEY = ("other", "other")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._totals: Counters = {}  # 进程启动以来的累计
+        self._pending: Counters = {}  # 上次落盘以来的增量
+        self._pending_since = time.time()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.path: Optional[Path] = None
+        self.interval = 10.0
+        self.flushed_lines = 0
+        self.flush_errors = 0
+
+    def start(self, path: str, interval: float):
+        """启动定时落盘线程"""
+        if self._thread is not None:
+            return
+        resolved = Path(path)
+        self.path = resolved if resolved.is_absolute() else PROJECT_ROOT / resolved
+        self.interval = interval
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._flush_loop, name="usage-flush", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """停止落盘线程并写出剩余的增量"""
+        if self._thread is None:
+            return
+        self._stopped.set()
+        self._thread.join()
+        self._thread = None
+        self.flush()
+
+    def record(self, caller: str, model: str, usage: UsageInfo):
+        """记录一次请求的用量"""
+        key = (caller, model)
+        with self._lock:
+            if key not in self._totals and len(self._totals) >= self.MAX_ENTRIES:
+                key = self.OVERFLOW_KEY
+            for counters in (self._totals, self._pending):
+                entry = counters.get(key)
+                if entry is None:
+                    counters[key] = [1, usage.prompt_tokens, usage.completion_tokens]
+                else:
+                    entry[0] += 1
+                    entry[1] += usage.prompt_tokens
+                    entry[2] += usage.completion_tokens
+
+    def _flush_loop(self):
+        while not self._stopped.wait(self.interval):
+            self.flush()
+
+    def flush(self):
+        """把上次落盘以来的增量追加写入文件"""
+        until = time.time()
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            since, self._pending_since = self._pending_since, until
+        if not pending or self.path is None:
+            return
+        lines = [
+            dumps({
+                "since": round(since, 3), "until": round(until, 3), "pid": os.getpid(),
+                "caller": caller, "model": model, "requests": requests,
+                "prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+            })
+            for (caller, model), (requests, prompt_tokens, completion_tokens) in pending.items()
+        ]
+        data = ("\n".join(lines) + "\n").encode("utf-8")
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, data)
+            finally:
+                os.close(fd)
+            self.flushed_lines += len(lines)
+        except OSError as e:
+            # 写入失败时把增量合并回去，下次重试
+            self.flush_errors += 1
+            logger.error("写入用量台账失败: %s", e)
+            with self._lock:
+                self._pending_since = since
+                for key, values in pending.items():
+                    entry = self._pending.get(key)
+                    if entry is None:
+                        self._pending[key] = values
+                    else:
+                        for i, value in enumerate(values):
+                            entry[i] += value
+
+    def snapshot(self, by_caller: bool = False) -> Dict:
+        """导出累计用量：按模型汇总，by_caller 时另按调用方细分"""
+        with self._lock:
+            totals = {key: list(values) for key, values in self._totals.items()}
+            pending = len(self._pending)
+        models: Dict[str, Dict[str, int]] = {}
+        callers: Dict[str, Dict[str, Dict[str, int]]] = {}
+        for (caller, model), (requests, prompt_tokens, completion_tokens) in totals.items():
+            entry = models.setdefault(model, {"requests": 0, "prompt_tokens": 0, "completion_tokens": 0})
+            entry["requests"] += requests
+            entry["prompt_tokens"] += prompt_tokens
+            entry["completion_tokens"] += completion_tokens
+            if by_caller:
+                callers.setdefault(caller, {})[model] = {
+                    "requests": requests, "prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                }
+        result = {
+            "models": models,
+            "pending_entries": pending,
+            "flushed_lines": self.flushed_lines,
+            "flush_errors": self.flush_errors,
+        }
+        if by_caller:
+            result["callers"] = callers
+        return result
+
+
+def make_usage(prompt_tokens: int, completion_tokens: int) -> UsageInfo:
+    return UsageInfo(
+        prompt_tokens=prompt_tokens,
+        completion_tokens=completion_tokens,
+        total_tokens=prompt_tokens + completion_tokens,
+    )
+
+
+def record_usage(caller: str, model: str, usage: UsageInfo):
+    """启用用量统计时记录一次请求的用量"""
+    if settings.USAGE_ENABLED:
+        usage_ledger.record(caller, model, usage)
+
+
+# 创建全局用量台账
+usage_ledger = UsageLedger()
+
+
+@on_reload
+def _apply_settings(new, changed):
+    # 落盘线程每轮都读取该属性，下一轮起生效
+    if "USAGE_FLUSH_INTERVAL" in changed:
+        usage_ledger.interval = new.USAGE_FLUSH_INTERVAL
@@ -0,0 +1,27 @@
+"""
+JSON 编解码：安装了 orjson 时使用 orjson，否则退回标准库 json
+"""
+import json
+from typing import Any, Union
+
+try:
+    import orjson
+except ImportError:  # 可选依赖
+    orjson = None
+
+# 与 json.JSONDecodeError 兼容（orjson.JSONDecodeError 是其子类）
+JSONDecodeError = json.JSONDecodeError
+
+
+def loads(data: Union[bytes, str]) -> Any:
+    """解析 JSON"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def dumps(obj: Any) -> str:
+    """序列化为紧凑的 JSON 字符串，保留非 ASCII 字符"""
+    if orjson is not None:
+        return orjson.dumps(obj).decode("utf-8")
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
@@ -0,0 +1,57 @@
+"""
+延迟构建的全局对象
+
+``settings``、``agent_service`` 等全局单例在导入时不做任何 I/O，首次访问属性时才真正构建，
+多进程模式的主进程和只需要部分模块的脚本都不必为用不到的对象付出启动开销。
+"""
+import threading
+from typing import Callable, Generic, TypeVar
+
+T = TypeVar("T")
+
+
+class LazyObject(Generic[T]):
+    """首次访问属性时调用 factory 构建实例，之后的属性读写都转发给该实例（线程安全）"""
+
+    __slots__ = ("_factory", "_instance", "_lock")
+
+    def __init__(self, factory: Callable[[], T]):
+        object.__setattr__(self, "_factory", factory)
+        object.__setattr__(self, "_instance", None)
+        object.__setattr__(self, "_lock", threading.Lock())
+
+    def _resolve(self) -> T:
+        instance = self._instance
+        if instance is None:
+            with self._lock:
+                if self._instance is None:
+                    object.__setattr__(self, "_instance", self._factory())
+                instance = self._instance
+        return instance
+
+    @property
+    def initialized(self) -> bool:
+        """实例是否已经构建"""
+        return self._instance is not None
+
+    def __getattr__(self, name):
+        return getattr(self._resolve(), name)
+
+    def __setattr__(self, name, value):
+        setattr(self._resolve(), name, value)
+
+    def __repr__(self) -> str:
+        if self._instance is None:
+            return f"<LazyObject {getattr(self._factory, '__qualname__', self._factory)} (未构建)>"
+        return repr(self._instance)
+
+
+def resolve(proxy: LazyObject[T]) -> T:
+    """取得代理背后的实例（尚未构建时先构建）"""
+    return proxy._resolve()
+
+
+def replace(proxy: LazyObject[T], instance: T):
+    """原子地替换代理背后的实例：之后的属性访问立即看到新实例，已取得旧实例的调用不受影响"""
+    with proxy._lock:
+        object.__setattr__(proxy, "_instance", instance)
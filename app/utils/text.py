@@ -0,0 +1,189 @@
+"""
+文本工具：停止序列匹配与 token 数估算
+
+上游不支持 stop / max_tokens，由本服务在流式输出过程中逐片检查，命中后立即结束读取并关闭上游连接。
+"""
+import math
+from typing import Generator, Iterable, List, Optional, Tuple, Union
+
+# 中日韩文字及全角标点（UTF-8 编码为 3 字节及以上）每个字符大致对应一个 token，
+# 其他字符平均约 4 个对应一个 token
+_CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text: str) -> int:
+    """快速估算文本的 token 数（不依赖分词器）
+
+    CJK 字符的 UTF-8 编码为 3 字节、ASCII 为 1 字节，由编码长度与字符数之差即可估出 CJK 字符数，
+    全程在 C 层完成，不需要逐字符判断。
+    """
+    if not text:
+        return 0
+    cjk = min(len(text), (len(text.encode("utf-8")) - len(text)) // 2)
+    return cjk + math.ceil((len(text) - cjk) / _CHARS_PER_TOKEN)
+
+
+class TokenCounter:
+    """增量 token 计数：逐片累加字符数与 CJK 字符数，结果与对拼接后的全文调用 estimate_tokens 一致
+
+    每个分片只做一次编码长度计算，不保留文本，流式输出时每片的开销恒定。
+    """
+
+    __slots__ = ("chars", "cjk")
+
+    def __init__(self):
+        self.chars = 0
+        self.cjk = 0
+
+    def add(self, text: str):
+        if text:
+            length = len(text)
+            self.chars += length
+            self.cjk += min(length, (len(text.encode("utf-8")) - length) // 2)
+
+    @property
+    def tokens(self) -> int:
+        return self.cjk + math.ceil((self.chars - self.cjk) / _CHARS_PER_TOKEN)
+
+
+def truncate_to_tokens(text: str, budget: int) -> str:
+    """截取文本开头不超过 budget 个 token 的部分"""
+    if budget <= 0:
+        return ""
+    # 按字符累计权重：CJK 字符记 1，其他字符记 1/4，与 estimate_tokens 一致
+    units = budget * _CHARS_PER_TOKEN
+    for i, char in enumerate(text):
+        units -= _CHARS_PER_TOKEN if ord(char) >= 0x800 else 1
+        if units < 0:
+            return text[:i]
+    return text
+
+
+# 停止序列的数量与长度上限：数量与 OpenAI 一致，长度决定匹配时最多暂存的字符数
+MAX_STOP_SEQUENCES = 4
+MAX_STOP_LENGTH = 256
+
+
+def check_stop(stop: Optional[Union[str, List[str]]]):
+    """校验停止序列的数量与长度，超出上限时抛出 ValueError"""
+    stops = [stop] if isinstance(stop, str) else stop or []
+    if len(stops) > MAX_STOP_SEQUENCES:
+        raise ValueError(f"stop 最多包含 {MAX_STOP_SEQUENCES} 个停止序列")
+    if any(len(item) > MAX_STOP_LENGTH for item in stops):
+        raise ValueError(f"停止序列的长度不能超过 {MAX_STOP_LENGTH} 个字符")
+
+
+def _prefix_function(pattern: str) -> List[int]:
+    """KMP 前缀函数：failure[i] 为 pattern[:i + 1] 最长的、同时是其后缀的真前缀长度"""
+    failure = [0] * len(pattern)
+    k = 0
+    for i in range(1, len(pattern)):
+        while k and pattern[i] != pattern[k]:
+            k = failure[k - 1]
+        if pattern[i] == pattern[k]:
+            k += 1
+        failure[i] = k
+    return failure
+
+
+class StopMatcher:
+    """增量多模式停止序列匹配器
+
+    逐片输入文本，返回可以安全输出的部分；停止序列可能跨分片出现，
+    因此末尾可能构成某个停止序列前缀的文本会暂存，直到确认不匹配为止。
+    暂存长度由 KMP 自动机扫描末尾（不超过停止序列长度）得到，每个分片的开销与停止序列长度成线性关系。
+    """
+
+    def __init__(self, stops: Iterable[str]):
+        self.stops: List[str] = [stop for stop in stops if stop]
+        self._failures = [_prefix_function(stop) for stop in self.stops]
+        self._pending = ""
+        self.stopped = False
+
+    def _held(self, buffer: str) -> int:
+        """buffer 末尾构成某个停止序列真前缀的最长长度（buffer 中不含完整的停止序列）"""
+        hold = 0
+        for stop, failure in zip(self.stops, self._failures):
+            if len(stop) == 1:
+                continue
+            # 只有末尾 len(stop) - 1 个字符可能构成真前缀，从这里开始运行自动机
+            k = 0
+            for char in buffer[-(len(stop) - 1):]:
+                while k and char != stop[k]:
+                    k = failure[k - 1]
+                if char == stop[k]:
+                    k += 1
+            hold = max(hold, k)
+        return hold
+
+    def feed(self, text: str) -> str:
+        """输入一个分片，返回确认不含停止序列的文本；命中时返回停止序列之前的文本并置 stopped"""
+        if self.stopped:
+            return ""
+        buffer = self._pending + text
+        hits = [index for index in (buffer.find(stop) for stop in self.stops) if index >= 0]
+        if hits:
+            self.stopped = True
+            self._pending = ""
+            return buffer[:min(hits)]
+
+        hold = self._held(buffer)
+        self._pending = buffer[len(buffer) - hold:] if hold else ""
+        return buffer[:len(buffer) - hold]
+
+    def flush(self) -> str:
+        """上游结束时取出暂存的文本"""
+        rest, self._pending = self._pending, ""
+        return rest
+
+
+class CompletionLimiter:
+    """按 stop / max_tokens 限制回答，并记录 finish_reason"""
+
+    def __init__(self, stop: Optional[Union[str, List[str]]] = None, max_tokens: Optional[int] = None):
+        if isinstance(stop, str):
+            stop = [stop]
+        self.matcher = StopMatcher(stop) if stop else None
+        self.max_tokens = max_tokens
+        self.tokens = 0
+        self.finish_reason = "stop"
+
+    @property
+    def enabled(self) -> bool:
+        return self.matcher is not None or self.max_tokens is not None
+
+    def _take(self, text: str) -> Tuple[str, bool]:
+        """按剩余 token 额度截取文本，返回 (文本, 是否已用尽额度)"""
+        if self.max_tokens is None or not text:
+            return text, False
+        tokens = estimate_tokens(text)
+        if self.tokens + tokens <= self.max_tokens:
+            self.tokens += tokens
+            return text, self.tokens >= self.max_tokens
+        text = truncate_to_tokens(text, self.max_tokens - self.tokens)
+        self.tokens = self.max_tokens
+        return text, True
+
+    def apply(self, chunks: Iterable[str]) -> Generator[str, None, None]:
+        """限制分片流；提前结束时关闭 chunks，从而关闭上游连接"""
+        try:
+            for chunk in chunks:
+                text = self.matcher.feed(chunk) if self.matcher else chunk
+                text, exhausted = self._take(text)
+                if text:
+                    yield text
+                if exhausted:
+                    self.finish_reason = "length"
+                    return
+                if self.matcher and self.matcher.stopped:
+                    return
+            if self.matcher:
+                text, exhausted = self._take(self.matcher.flush())
+                if text:
+                    yield text
+                if exhausted:
+                    self.finish_reason = "length"
+        finally:
+            close = getattr(chunks, "close", None)
+            if close:
+                close()
@@ -2,18 +2,73 @@
 """
 Agent API 主入口文件
 """
-import uvicorn
-from app import create_app
+import argparse
+import importlib.util
+import logging
+from app import configure_logging
 from app.core.config import settings
 
-# 创建应用实例
-app = create_app()
+
+def __getattr__(name):
+    """首次访问 main.app 时才创建应用实例
+
+    多进程模式的主进程只需要配置，不必导入 FastAPI 与各路由模块；
+    工作进程以 spawn 方式启动时会重新执行本模块，再通过 "main:app" 加载应用，延迟创建避免重复创建。
+    """
+    if name == "app":
+        from app import create_app
+        application = create_app()
+        globals()["app"] = application
+        return application
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def parse_args():
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description="Agent API 服务")
+    parser.add_argument("--host", default=settings.SERVER_HOST, help="监听地址")
+    parser.add_argument("--port", type=int, default=settings.SERVER_PORT, help="监听端口")
+    parser.add_argument(
+        "--workers", type=int, default=settings.SERVER_WORKERS,
+        help="工作进程数：0 为开发模式（单进程 + 自动重载），>= 1 为多进程生产模式"
+    )
+    parser.add_argument(
+        "--http2", action=argparse.BooleanOptionalAction, default=settings.SERVER_HTTP2,
+        help="以 hypercorn 提供 HTTP/2 服务（需安装 hypercorn）"
+    )
+    return parser.parse_args()
+
 
 if __name__ == "__main__":
-    uvicorn.run(
-        "main:app",
-        host=settings.SERVER_HOST,
-        port=settings.SERVER_PORT,
-        reload=True,
-        log_level=settings.LOG_LEVEL.lower()
-    ) 
+    args = parse_args()
+    configure_logging()
+    if args.http2 and importlib.util.find_spec("hypercorn") is None:
+        raise SystemExit("HTTP/2 模式需要安装 hypercorn：pip install hypercorn 或 uv sync --extra http2")
+    if args.http2 and args.workers < 1:
+        # HTTP/2 由多进程服务器中的 hypercorn 工作进程提供，不支持自动重载
+        logging.getLogger(__name__).warning("HTTP/2 模式不支持自动重载，以单个工作进程运行")
+        args.workers = 1
+    if args.workers >= 1:
+        from app.core.server import serve
+        if args.workers > 1 and str(settings.SESSION_STORE).lower() == "memory":
+            logging.getLogger(__name__).warning(
+                "多进程模式下使用 memory 会话存储，各工作进程的会话状态与异步任务互不共享；建议设置 session.store 为 sqlite"
+            )
+        serve(
+            args.host,
+            args.port,
+            args.workers,
+            log_level=settings.LOG_LEVEL.lower(),
+            graceful_timeout=settings.SERVER_GRACEFUL_TIMEOUT,
+            drain_timeout=settings.SERVER_DRAIN_TIMEOUT,
+            http2=args.http2
+        )
+    else:
+        import uvicorn
+        uvicorn.run(
+            "main:app",
+            host=args.host,
+            port=args.port,
+            reload=True,
+            log_level=settings.LOG_LEVEL.lower()
+        )
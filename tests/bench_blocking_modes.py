@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+非流式请求的两种上游模式对比基准测试
+
+启动本地模拟上游（回答长度随请求随机），分别以
+- blocking：上游阻塞模式，受整体超时（agent.timeout）限制
+- stream：内部使用上游流式模式并拼接回答，只受分片间空闲超时（agent.idle_timeout）限制
+并发执行同一组请求，比较尾延迟与失败率。
+
+用法:
+    python bench_blocking_modes.py --requests 200 --concurrency 16 --timeout 2 --delay 0.01 --chunks 20 --chunks-max 400
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from mock_upstream import start_mock_upstream
+
+
+def percentile(values, q):
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+def run_mode(agent_service, settings, via_stream: bool, requests_count: int, concurrency: int):
+    """以指定模式执行所有请求，返回 (成功请求的耗时列表, 失败数, 总耗时)"""
+    settings.BLOCKING_VIA_STREAM = via_stream
+
+    def one(i):
+        started = time.perf_counter()
+        answer = agent_service.chat_blocking(f"bench-{i}", f"[USER]: 问题 {i}")
+        return answer is not None, time.perf_counter() - started
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        results = list(pool.map(one, range(requests_count)))
+    elapsed = time.perf_counter() - started
+    latencies = [latency for ok, latency in results if ok]
+    return latencies, len(results) - len(latencies), elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="非流式请求的上游模式对比基准测试")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--timeout", type=float, default=2, help="阻塞模式整体超时（秒）")
+    parser.add_argument("--idle-timeout", type=float, default=2, help="流式模式分片间空闲超时（秒）")
+    parser.add_argument("--delay", type=float, default=0.01, help="上游分片间隔（秒）")
+    parser.add_argument("--chunks", type=int, default=20, help="回答的最少分片数")
+    parser.add_argument("--chunks-max", type=int, default=400, help="回答的最多分片数")
+    args = parser.parse_args()
+
+    server, base_url = start_mock_upstream(0, args.delay, args.chunks, args.chunks_max)
+    workdir = tempfile.mkdtemp(prefix="bench_blocking_")
+    config_path = Path(workdir) / "config.yaml"
+    config_path.write_text(
+        "agent:\n"
+        f"  api_base_url: \"{base_url}\"\n"
+        "  app_id: \"bench_app_id\"\n"
+        "  api_key: \"bench_api_key\"\n"
+        f"  timeout: {args.timeout}\n"
+        f"  idle_timeout: {args.idle_timeout}\n"
+        f"  pool_size: {args.concurrency}\n"
+        "session:\n"
+        f"  max_conversations: {args.requests * 2}\n",
+        encoding="utf-8",
+    )
+    os.environ["AGENT_CONFIG_FILE"] = str(config_path)
+
+    from app.core.config import settings
+    from app.services.agent_service import agent_service
+
+    print("非流式请求上游模式对比基准测试")
+    print("=" * 72)
+    print(f"请求数: {args.requests}，并发: {args.concurrency}，"
+          f"回答耗时: {args.delay * args.chunks:.1f}s ~ {args.delay * args.chunks_max:.1f}s")
+    print(f"阻塞模式整体超时: {args.timeout}s，流式模式空闲超时: {args.idle_timeout}s")
+    print(f"{'模式':>8} {'成功':>6} {'失败率':>8} {'p50(s)':>8} {'p95(s)':>8} {'p99(s)':>8} {'总耗时(s)':>10}")
+    try:
+        for name, via_stream in (("blocking", False), ("stream", True)):
+            latencies, failed, elapsed = run_mode(
+                agent_service, settings, via_stream, args.requests, args.concurrency
+            )
+            print(f"{name:>8} {len(latencies):>6} {failed / args.requests:>8.1%} "
+                  f"{percentile(latencies, 0.5):>8.2f} {percentile(latencies, 0.95):>8.2f} "
+                  f"{percentile(latencies, 0.99):>8.2f} {elapsed:>10.1f}")
+    finally:
+        agent_service.close()
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+响应压缩基准测试
+
+直接驱动 CompressionMiddleware（不经过网络），比较各编码下：
+- SSE 流：每个流的线上字节数、压缩率、压缩 CPU 耗时，以及按慢速移动网络带宽估算的传输时间；
+  额外给出“每个事件独立压缩”（不保留压缩上下文）的 gzip 作为对照，说明持续上下文的收益
+- 非流式响应：不同大小的 JSON 响应体的压缩率与耗时
+
+事件内容与 /v1/chat/completions 的流式输出格式一致（chat.completion.chunk + SSE 编码）。
+
+用法:
+    python bench_compression.py --streams 200 --events 300
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import uuid
+import zlib
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+from sse_starlette.sse import ServerSentEvent
+
+SENTENCES = [
+    "北京理工大学创建于1940年，是中国共产党创办的第一所理工科大学。",
+    "学校设有多个学院，涵盖工学、理学、管理学、文学、法学等学科门类。",
+    "在校学生可以通过教务系统查询课程安排、考试时间和成绩信息。",
+    "图书馆提供纸质图书借阅、电子资源访问以及自习座位预约服务。",
+    "如果遇到网络问题，请先检查校园网账号状态，再联系信息化中心。",
+    "研究生培养方案包括课程学习、科研训练和学位论文三个主要环节。",
+    "根据最新通知，本学期的选课时间为开学前一周，请同学们按时完成。",
+    "食堂营业时间一般为早上六点半至晚上八点，节假日可能有所调整。",
+]
+
+
+def make_events(count: int, seed: int):
+    """生成一个回答的 SSE 事件（按 2~6 个字符切分的增量）"""
+    rng = random.Random(seed)
+    text = "".join(rng.choice(SENTENCES) for _ in range(count))
+    completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+    created = int(time.time())
+    events = []
+    pos = 0
+    for seq in range(count):
+        step = rng.randint(2, 6)
+        delta = text[pos:pos + step]
+        pos += step
+        data = json.dumps({
+            "id": completion_id, "object": "chat.completion.chunk", "created": created, "model": "agent-model",
+            "choices": [{"index": 0, "delta": {"role": None, "content": delta}, "finish_reason": None}],
+        }, ensure_ascii=False)
+        events.append(ServerSentEvent(data=data, id=f"{completion_id}:{seq}").encode())
+    events.append(ServerSentEvent(data="[DONE]", id=f"{completion_id}:{count}").encode())
+    return events
+
+
+def make_body(size: int) -> bytes:
+    """生成约 size 字节的非流式 JSON 响应体"""
+    rng = random.Random(size)
+    content = ""
+    while len(content.encode("utf-8")) < size:
+        content += rng.choice(SENTENCES)
+    return json.dumps({
+        "id": f"chatcmpl-{uuid.uuid4().hex}", "object": "chat.completion", "model": "agent-model",
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+    }, ensure_ascii=False).encode("utf-8")[:max(size, 1)]
+
+
+def streaming_app(events):
+    async def app(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200,
+                    "headers": [(b"content-type", b"text/event-stream; charset=utf-8")]})
+        for event in events:
+            await send({"type": "http.response.body", "body": event, "more_body": True})
+        await send({"type": "http.response.body", "body": b"", "more_body": False})
+    return app
+
+
+def blocking_app(body: bytes):
+    async def app(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200,
+                    "headers": [(b"content-type", b"application/json"),
+                                (b"content-length", str(len(body)).encode())]})
+        await send({"type": "http.response.body", "body": body, "more_body": False})
+    return app
+
+
+async def run_response(app, encoding: str, min_size: int) -> int:
+    """经过压缩中间件运行一个响应，返回线上字节数"""
+    wire = 0
+
+    async def send(message):
+        nonlocal wire
+        if message["type"] == "http.response.body":
+            wire += len(message.get("body", b""))
+
+    from app.core.compression import CompressionMiddleware, CompressionStats
+
+    middleware = CompressionMiddleware(app, encodings=encoding or "", min_size=min_size, stats=CompressionStats())
+    scope = {"type": "http", "headers": [(b"accept-encoding", encoding.encode())] if encoding else []}
+    await middleware(scope, None, send)
+    return wire
+
+
+def per_event_gzip(events) -> int:
+    """对照：每个事件使用独立的压缩上下文"""
+    wire = 0
+    for event in events:
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+        wire += len(compressor.compress(event) + compressor.flush())
+    return wire
+
+
+async def bench_streams(args):
+    from app.core.compression import available_encoders
+
+    streams = [make_events(args.events, seed) for seed in range(args.streams)]
+    plain = sum(len(e) for events in streams for e in events) / len(streams)
+    encodings = [None] + [name for name in ("gzip", "br", "zstd") if name in available_encoders()]
+
+    print(f"SSE 流：{args.streams} 个流，每个流 {args.events} 个事件，平均原始大小 {plain / 1024:.1f} KB")
+    print("=" * 84)
+    print(f"{'编码':>16} {'线上(KB)':>10} {'压缩率':>8} {'CPU(ms/流)':>12} {'CPU(µs/事件)':>13} "
+          f"{f'{args.bandwidth}Mbps 传输(ms)':>18}")
+    for encoding in encodings:
+        wire = 0
+        started = time.process_time()
+        for events in streams:
+            wire += await run_response(streaming_app(events), encoding, args.min_size)
+        cpu = time.process_time() - started
+        wire /= len(streams)
+        cpu_ms = cpu * 1000 / len(streams)
+        print(f"{encoding or 'identity':>16} {wire / 1024:>10.1f} {wire / plain:>8.3f} {cpu_ms:>12.2f} "
+              f"{cpu_ms * 1000 / (args.events + 1):>13.1f} {wire * 8 / (args.bandwidth * 1000):>18.0f}")
+
+    started = time.process_time()
+    wire = sum(per_event_gzip(events) for events in streams) / len(streams)
+    cpu_ms = (time.process_time() - started) * 1000 / len(streams)
+    print(f"{'gzip(每事件独立)':>16} {wire / 1024:>10.1f} {wire / plain:>8.3f} {cpu_ms:>12.2f} "
+          f"{cpu_ms * 1000 / (args.events + 1):>13.1f} {wire * 8 / (args.bandwidth * 1000):>18.0f}")
+    print("（identity 的 CPU 为中间件本身的开销基线）")
+
+
+async def bench_blocking(args):
+    print()
+    print(f"非流式响应体（min_size = {args.min_size} 字节，更小的响应体不压缩）")
+    print("=" * 84)
+    from app.core.compression import available_encoders
+
+    encodings = [name for name in ("gzip", "br", "zstd") if name in available_encoders()]
+    print(f"{'大小':>10}" + "".join(f" {name + ' 压缩率':>12} {name + ' µs':>10}" for name in encodings))
+    rounds = 200
+    for size in (200, 1024, 10 * 1024, 100 * 1024):
+        body = make_body(size)
+        row = f"{len(body):>10}"
+        for encoding in encodings:
+            started = time.process_time()
+            for _ in range(rounds):
+                wire = await run_response(blocking_app(body), encoding, args.min_size)
+            cpu_us = (time.process_time() - started) * 1e6 / rounds
+            row += f" {wire / len(body):>12.3f} {cpu_us:>10.0f}"
+        print(row)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="响应压缩基准测试")
+    parser.add_argument("--streams", type=int, default=200, help="SSE 流数量")
+    parser.add_argument("--events", type=int, default=300, help="每个流的事件数")
+    parser.add_argument("--min-size", type=int, default=512, help="不压缩的响应体大小阈值（字节）")
+    parser.add_argument("--bandwidth", type=float, default=1.0, help="估算传输时间使用的带宽（Mbps）")
+    args = parser.parse_args()
+
+    # 压缩不访问上游，配置只需通过校验
+    config_path = Path(tempfile.mkdtemp(prefix="bench_compression_")) / "config.yaml"
+    config_path.write_text("agent:\n  app_id: \"bench_app_id\"\n  api_key: \"bench_api_key\"\n", encoding="utf-8")
+    os.environ["AGENT_CONFIG_FILE"] = str(config_path)
+
+    asyncio.run(bench_streams(args))
+    asyncio.run(bench_blocking(args))
+
+
+if __name__ == "__main__":
+    main()
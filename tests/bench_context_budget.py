@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+上下文预算基准测试
+
+模拟一段不断增长的多轮对话（每轮追加一问一答），分别在不限制上下文（压缩前）与
+设置上下文预算（压缩后）两种情况下，测量不同历史长度时：
+- format_messages_for_agent 的耗时
+- 发送给上游的 Query 大小
+- 经过模拟上游的端到端延迟（上游按请求体大小增加处理时间，模拟长 Query 带来的上游延迟）
+
+用法:
+    python bench_context_budget.py --lengths 10 100 1000 5000 --budget 4000
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from mock_upstream import start_mock_upstream
+
+SYSTEM_PROMPT = "你是一个乐于助人的助手，请用简洁的中文回答用户的问题。" * 20
+
+
+def build_history(length: int):
+    from app.models.chat import ChatMessage
+    messages = [ChatMessage(role="system", content=SYSTEM_PROMPT)]
+    for i in range(length):
+        role = "user" if i % 2 == 0 else "assistant"
+        messages.append(ChatMessage(role=role, content=f"第{i}条消息：" + "这是一段对话内容，包含一些细节。" * 8))
+    return messages
+
+
+def measure(messages, format_messages, agent_service, repeat: int):
+    """返回 (格式化平均耗时 ms, Query 字节数, 端到端平均延迟 ms)"""
+    started = time.perf_counter()
+    for _ in range(repeat):
+        query = format_messages(messages)
+    format_ms = (time.perf_counter() - started) / repeat * 1000
+
+    started = time.perf_counter()
+    for i in range(repeat):
+        agent_service.chat_blocking(f"bench-{len(messages)}-{i}", format_messages(messages))
+    e2e_ms = (time.perf_counter() - started) / repeat * 1000
+    return format_ms, len(query.encode("utf-8")), e2e_ms
+
+
+def main():
+    parser = argparse.ArgumentParser(description="上下文预算基准测试")
+    parser.add_argument("--lengths", type=int, nargs="+", default=[10, 100, 1000, 5000])
+    parser.add_argument("--budget", type=int, default=4000, help="上下文 token 预算")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--per-kb-delay", type=float, default=0.002, help="模拟上游每 KB 请求体的处理时间（秒）")
+    args = parser.parse_args()
+
+    server, base_url = start_mock_upstream(0, 0, 5, per_kb_delay=args.per_kb_delay)
+    workdir = tempfile.mkdtemp(prefix="bench_context_")
+    config_path = Path(workdir) / "config.yaml"
+    config_path.write_text(
+        "agent:\n"
+        f"  api_base_url: \"{base_url}\"\n"
+        "  app_id: \"bench_app_id\"\n"
+        "  api_key: \"bench_api_key\"\n"
+        "session:\n"
+        "  max_conversations: 100000\n",
+        encoding="utf-8",
+    )
+    os.environ["AGENT_CONFIG_FILE"] = str(config_path)
+
+    from app.api.endpoints.chat import format_messages_for_agent
+    from app.core.config import settings
+    from app.services.agent_service import agent_service
+    from app.services.context_compactor import context_compactor
+
+    print("上下文预算基准测试")
+    print("=" * 84)
+    print(f"上下文预算: {args.budget} tokens，模拟上游每 KB 处理时间: {args.per_kb_delay * 1000:.1f}ms")
+    print(f"{'历史长度':>8} | {'压缩前 格式化(ms)':>16} {'Query(KB)':>10} {'端到端(ms)':>10} "
+          f"| {'压缩后 格式化(ms)':>16} {'Query(KB)':>10} {'端到端(ms)':>10}")
+    try:
+        for length in args.lengths:
+            messages = build_history(length)
+            settings.CONTEXT_MAX_TOKENS = 0
+            before = measure(messages, format_messages_for_agent, agent_service, args.repeat)
+            settings.CONTEXT_MAX_TOKENS = args.budget
+            # 先格式化前一轮的历史，使摘要缓存处于多轮对话中的常态
+            format_messages_for_agent(messages[:-2])
+            after = measure(messages, format_messages_for_agent, agent_service, args.repeat)
+            print(f"{length:>8} | {before[0]:>16.2f} {before[1] / 1024:>10.1f} {before[2]:>10.1f} "
+                  f"| {after[0]:>16.2f} {after[1] / 1024:>10.1f} {after[2]:>10.1f}")
+        print(f"\n摘要缓存: {context_compactor.snapshot()}")
+    finally:
+        agent_service.close()
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
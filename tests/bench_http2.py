@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+上游 HTTP/1.1 与 HTTP/2 传输对比基准测试
+
+启动支持 h2c 的本地模拟上游（mock_upstream.py --http2），分别以 requests 的 HTTP/1.1 连接池和
+HTTP2Adapter 作为 AgentService 的上游传输，同时发起 N 个 chat_stream（含 create_conversation），比较：
+- 上游 TCP 连接数峰值
+- 客户端进程与模拟上游进程的 RSS 增量
+- 每个流的完成耗时（p50 / p99）、总耗时与客户端 CPU 时间
+
+每种传输在独立的子进程中运行，避免互相影响内存统计。
+
+用法:
+    python bench_http2.py --streams 1000
+"""
+
+import argparse
+import json
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+TESTS_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+
+def rss_kb(pid: int) -> int:
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1])
+    return 0
+
+
+def established_connections(port: int) -> int:
+    """统计连向指定端口的已建立 TCP 连接数（客户端一侧）"""
+    count = 0
+    for table in ("/proc/net/tcp", "/proc/net/tcp6"):
+        try:
+            with open(table) as f:
+                next(f)
+                for line in f:
+                    fields = line.split()
+                    if fields[3] == "01" and int(fields[2].rsplit(":", 1)[1], 16) == port:
+                        count += 1
+        except FileNotFoundError:
+            continue
+    return count
+
+
+def run_child(mode: str, streams: int, upstream_port: int, upstream_pid: int):
+    """在子进程中以指定传输运行 N 个并发流，输出 JSON 结果"""
+    config_path = Path(tempfile.mkdtemp(prefix="bench_h2_")) / "config.yaml"
+    config_path.write_text(
+        "agent:\n"
+        f"  api_base_url: \"http://127.0.0.1:{upstream_port}\"\n"
+        "  app_id: \"bench_app_id\"\n"
+        "  api_key: \"bench_api_key\"\n"
+        f"  pool_size: {streams}\n"
+        f"  http2: {'true' if mode == 'h2' else 'false'}\n"
+        f"  http2_max_streams: {streams}\n"
+        "session:\n"
+        f"  max_conversations: {streams * 2}\n",
+        encoding="utf-8",
+    )
+    os.environ["AGENT_CONFIG_FILE"] = str(config_path)
+    from app.services.agent_service import AgentService
+
+    service = AgentService()
+    barrier = threading.Barrier(streams + 1)
+    latencies = []
+    failures = [0]
+    lock = threading.Lock()
+
+    def worker(index: int):
+        barrier.wait()
+        started = time.perf_counter()
+        stream = service.chat_stream(f"bench-{index}", f"[USER]: 第 {index} 个问题")
+        if stream is None:
+            with lock:
+                failures[0] += 1
+            return
+        content = "".join(stream)
+        elapsed = time.perf_counter() - started
+        with lock:
+            if content:
+                latencies.append(elapsed)
+            else:
+                failures[0] += 1
+
+    threads = [threading.Thread(target=worker, args=(i,), daemon=True) for i in range(streams)]
+    for t in threads:
+        t.start()
+    time.sleep(0.5)
+    client_baseline = rss_kb(os.getpid())
+    upstream_baseline = rss_kb(upstream_pid)
+    peak = {"connections": 0, "client": client_baseline, "upstream": upstream_baseline}
+
+    barrier.wait()
+    started = time.perf_counter()
+    cpu_started = resource.getrusage(resource.RUSAGE_SELF)
+    while any(t.is_alive() for t in threads):
+        peak["connections"] = max(peak["connections"], established_connections(upstream_port))
+        peak["client"] = max(peak["client"], rss_kb(os.getpid()))
+        peak["upstream"] = max(peak["upstream"], rss_kb(upstream_pid))
+        time.sleep(0.05)
+    wall = time.perf_counter() - started
+    cpu_finished = resource.getrusage(resource.RUSAGE_SELF)
+    cpu = (cpu_finished.ru_utime - cpu_started.ru_utime) + (cpu_finished.ru_stime - cpu_started.ru_stime)
+    service.close()
+
+    ordered = sorted(latencies) or [0.0]
+    print(json.dumps({
+        "connections": peak["connections"],
+        "client_mb": (peak["client"] - client_baseline) / 1024,
+        "upstream_mb": (peak["upstream"] - upstream_baseline) / 1024,
+        "p50": statistics.median(ordered),
+        "p99": ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))],
+        "wall": wall,
+        "cpu": cpu,
+        "failures": failures[0],
+    }))
+
+
+def run_mode(mode: str, args) -> dict:
+    upstream = subprocess.Popen(
+        [sys.executable, str(TESTS_DIR / "mock_upstream.py"), "--http2", "--port", str(args.upstream_port),
+         "--delay", str(args.delay), "--chunks", str(args.chunks), "--max-streams", str(args.streams * 2)],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        time.sleep(2)
+        result = subprocess.run(
+            [sys.executable, __file__, "--child", mode, "--streams", str(args.streams),
+             "--upstream-port", str(args.upstream_port), "--upstream-pid", str(upstream.pid)],
+            capture_output=True, text=True, cwd=PROJECT_ROOT,
+        )
+        return json.loads(result.stdout.strip().splitlines()[-1])
+    finally:
+        upstream.terminate()
+        upstream.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="上游 HTTP/1.1 与 HTTP/2 传输对比基准测试")
+    parser.add_argument("--streams", type=int, default=1000, help="并发流数")
+    parser.add_argument("--delay", type=float, default=0.05, help="模拟上游分片间隔（秒）")
+    parser.add_argument("--chunks", type=int, default=20, help="每个回答的分片数")
+    parser.add_argument("--upstream-port", type=int, default=18080)
+    parser.add_argument("--child", choices=("h1", "h2"), help=argparse.SUPPRESS)
+    parser.add_argument("--upstream-pid", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child, args.streams, args.upstream_port, args.upstream_pid)
+        return
+
+    print("上游 HTTP/1.1 与 HTTP/2 传输对比基准测试")
+    print(f"{args.streams} 个并发流，每个回答 {args.chunks} 个分片，分片间隔 {args.delay}s")
+    print("=" * 96)
+    print(f"{'传输':>8} {'连接数':>8} {'客户端(MB)':>12} {'上游(MB)':>10} {'p50(s)':>8} {'p99(s)':>8} "
+          f"{'总耗时(s)':>10} {'客户端CPU(s)':>12} {'失败':>6}")
+    for mode in ("h1", "h2"):
+        r = run_mode(mode, args)
+        print(f"{mode:>8} {r['connections']:>8} {r['client_mb']:>12.1f} {r['upstream_mb']:>10.1f} "
+              f"{r['p50']:>8.2f} {r['p99']:>8.2f} {r['wall']:>10.2f} {r['cpu']:>12.2f} {r['failures']:>6}")
+
+
+if __name__ == "__main__":
+    main()
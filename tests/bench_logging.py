@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+日志管道基准测试
+
+模拟开启详细日志时流式请求的热路径：多个线程各自输出大量 token 事件日志，日志写到一个很慢的输出
+（每次写入阻塞 ``--write-delay`` 毫秒，相当于终端或管道被写满），比较：
+- direct：日志处理器在调用方线程中同步写出（等价于 print）
+- pipeline：非阻塞日志管道，全部保留
+- pipeline+采样：非阻塞日志管道，token 类别只保留 ``--sample`` 比例
+输出调用方的吞吐量、单次日志调用的 p50 / p99 / 最大耗时，以及管道丢弃与采样掉的条数。
+
+用法:
+    python bench_logging.py --threads 8 --events 5000 --write-delay 0.2
+"""
+
+import argparse
+import io
+import logging
+import sys
+import threading
+import time
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+
+class SlowStream(io.TextIOBase):
+    """每次写入都阻塞一段时间的输出"""
+
+    def __init__(self, delay: float):
+        self.delay = delay
+        self.lines = 0
+
+    def write(self, text: str) -> int:
+        time.sleep(self.delay)
+        self.lines += text.count("\n")
+        return len(text)
+
+
+def run_callers(logger: logging.Logger, threads: int, events: int):
+    """多个线程并发输出 token 日志，返回总耗时与单次调用耗时样本"""
+    samples = []
+    lock = threading.Lock()
+
+    def worker():
+        local = []
+        for i in range(events):
+            started = time.perf_counter()
+            logger.info("输出内容: %s", f"token-{i}", extra={"category": "token"})
+            local.append(time.perf_counter() - started)
+        with lock:
+            samples.extend(local)
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    started = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return time.perf_counter() - started, samples
+
+
+def report(name: str, elapsed: float, samples, extra: str = ""):
+    samples.sort()
+    p50 = samples[len(samples) // 2] * 1e6
+    p99 = samples[int(len(samples) * 0.99)] * 1e6
+    print(f"{name:>14} {len(samples) / elapsed:>12.0f} {p50:>10.1f} {p99:>10.1f} {samples[-1] * 1e6:>12.0f}  {extra}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="日志管道基准测试")
+    parser.add_argument("--threads", type=int, default=8, help="并发输出日志的线程数")
+    parser.add_argument("--events", type=int, default=5000, help="每个线程输出的日志条数")
+    parser.add_argument("--write-delay", type=float, default=0.2, help="输出每次写入的阻塞时间（毫秒）")
+    parser.add_argument("--queue-size", type=int, default=10000, help="管道队列容量")
+    parser.add_argument("--sample", type=float, default=0.01, help="采样模式下 token 日志的保留比例")
+    args = parser.parse_args()
+
+    from app.core.log_pipeline import LogPipeline
+
+    delay = args.write_delay / 1000
+    total = args.threads * args.events
+    print(f"日志管道：{args.threads} 个线程 × {args.events} 条日志，输出每次写入阻塞 {args.write_delay} ms")
+    print("=" * 84)
+    print(f"{'模式':>14} {'吞吐(条/s)':>12} {'p50(µs)':>10} {'p99(µs)':>10} {'最大(µs)':>12}")
+
+    # direct 模式总耗时约为 条数 × 写入延迟，条数过多时只跑一部分
+    direct_events = min(args.events, max(int(2 / delay / args.threads), 1)) if delay else args.events
+    logger = logging.getLogger("bench.direct")
+    logger.propagate = False
+    stream = SlowStream(delay)
+    logger.addHandler(logging.StreamHandler(stream))
+    logger.setLevel(logging.INFO)
+    elapsed, samples = run_callers(logger, args.threads, direct_events)
+    report("direct", elapsed, samples, f"（每线程 {direct_events} 条）")
+
+    for name, rates in (("pipeline", {}), ("pipeline+采样", {"token": args.sample})):
+        pipeline = LogPipeline()
+        stream = SlowStream(delay)
+        pipeline.install(level="INFO", queue_size=args.queue_size, sample_rates=rates, stream=stream)
+        root_logger = logging.getLogger()
+        elapsed, samples = run_callers(logging.getLogger("bench.pipeline"), args.threads, args.events)
+        stats = pipeline.snapshot()
+        report(name, elapsed, samples,
+               f"入队 {stats['enqueued']}，队列满丢弃 {stats['dropped']}，采样掉 {sum(stats['sampled_out'].values())}")
+        pipeline.stop()
+        root_logger.removeHandler(pipeline.handler)
+
+    print(f"（共 {total} 条日志；管道模式下调用方只入队，写出在后台线程中进行）")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+"""
+近似重复缓存基准测试
+
+- 查找耗时：缓存中分别有 1 万 / 10 万 / 30 万个不同问题时，单次查找（未命中与命中）的 p50 / p99 耗时、
+  平均候选数与写入耗时，并与逐条计算相似度的线性扫描对比
+- 命中率与误命中率：在带标注的问题集上按不同阈值统计
+  - 真重复：同一问题只在空白、标点、大小写、全角半角或“请问 / 呢”等语气词上不同，应当命中
+  - 近似但不同：同一句式中只替换一个关键词（周一 / 周日、本科生 / 研究生），命中即为误命中
+- ``--corpus``：读取上游流量录制文件（``recording.mode: record`` 生成的 JSONL），按时间顺序先查找再写入，
+  统计各阈值的命中率，并列出相似度最低的命中供人工检查是否为误命中
+
+用法:
+    python bench_prompt_cache.py --sizes 10000,100000,300000 --lookups 2000
+    python bench_prompt_cache.py --corpus ../data/recording.jsonl --show 20
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+SYSTEM = "你是北京理工大学的校园助手，请简洁地回答同学的问题。"
+THRESHOLDS = (0.7, 0.75, 0.8, 0.85, 0.9, 0.95)
+
+# 问题模板：{0} 为可替换的关键词，同一模板下替换关键词得到“近似但不同”的问题
+TEMPLATES = [
+    ("图书馆{0}的开放时间是几点到几点", ["周一", "周日", "寒假", "暑假", "考试周"]),
+    ("{0}申请国家奖学金需要准备哪些材料", ["本科生", "研究生", "博士生", "留学生"]),
+    ("{0}几点关门，晚上回去晚了怎么办", ["食堂", "宿舍", "体育馆", "实验楼"]),
+    ("校园网{0}忘记了应该怎么找回", ["账号密码", "邮箱密码", "统一身份认证密码"]),
+    ("从{0}到中关村校区有没有班车", ["良乡校区", "西山校区", "北京南站", "首都机场"]),
+    ("{0}的成绩什么时候可以在教务系统查到", ["期中考试", "期末考试", "补考", "四六级考试"]),
+    ("怎么申请{0}的学生证补办", ["本学期", "研究生", "本科生"]),
+    ("How do I reset my {0} password?", ["campus Wi-Fi", "email", "library account"]),
+]
+
+# 真重复的改写方式
+VARIANTS = [
+    lambda q: q,
+    lambda q: f"请问{q}？",
+    lambda q: f"{q}呢？",
+    lambda q: f"  {q}  ",
+    lambda q: " ".join(q),
+    lambda q: q.upper(),
+    lambda q: q.replace("，", ", ").replace("?", "？"),
+    lambda q: f"{q}!!",
+]
+
+# 生成大量互不相同的问题，用于填充缓存
+SUBJECTS = ["课程", "实验室", "社团", "宿舍", "图书馆", "食堂", "校医院", "体育馆", "教务处", "学院", "校车", "讲座"]
+ACTIONS = ["怎么预约", "在哪里报名", "需要交多少钱", "几点开门", "怎么联系", "如何办理", "有什么要求", "能不能取消"]
+
+
+def synthetic_question(rng: random.Random) -> str:
+    return (f"{rng.choice(SUBJECTS)}{rng.randint(1, 999)}号{rng.choice(SUBJECTS)}"
+            f"{rng.choice(ACTIONS)}，编号{rng.randint(1000, 99999)}")
+
+
+def percentile(samples, ratio: float) -> float:
+    return sorted(samples)[min(int(len(samples) * ratio), len(samples) - 1)]
+
+
+def bench_scale(sizes, lookups: int):
+    from app.services.prompt_cache import PromptCache, jaccard, normalize, shingles
+
+    rng = random.Random(42)
+    print(f"查找耗时：每种规模 {lookups} 次未命中查找与 {lookups} 次命中查找")
+    print("=" * 96)
+    print(f"{'条目数':>8} {'写入(µs/条)':>12} {'未命中 p50':>10} {'p99':>8} {'命中 p50':>10} {'p99':>8} "
+          f"{'平均候选数':>10} {'线性扫描(ms)':>12}")
+    for size in sizes:
+        cache = PromptCache(max_entries=size, threshold=0.85, ttl=3600)
+        questions = [synthetic_question(rng) for _ in range(size)]
+        started = time.perf_counter()
+        for question in questions:
+            cache.store(SYSTEM, question, "回答")
+        store_cost = (time.perf_counter() - started) / size
+
+        misses = []
+        for _ in range(lookups):
+            query = synthetic_question(rng)
+            started = time.perf_counter()
+            cache.lookup(SYSTEM, query)
+            misses.append(time.perf_counter() - started)
+        hits = []
+        for _ in range(lookups):
+            query = f"请问{rng.choice(questions)}？"
+            started = time.perf_counter()
+            cache.lookup(SYSTEM, query)
+            hits.append(time.perf_counter() - started)
+        stats = cache.snapshot()
+
+        # 对照：逐条计算 Jaccard 相似度（只扫描前 1 万条并按比例外推）
+        sample = [shingles(normalize(question)) for question in questions[:10000]]
+        features = shingles(normalize(synthetic_question(rng)))
+        started = time.perf_counter()
+        for candidate in sample:
+            jaccard(features, candidate)
+        linear = (time.perf_counter() - started) * size / len(sample)
+
+        print(f"{size:>8} {store_cost * 1e6:>12.1f} {percentile(misses, 0.5) * 1e6:>8.0f}µs "
+              f"{percentile(misses, 0.99) * 1e6:>6.0f}µs {percentile(hits, 0.5) * 1e6:>8.0f}µs "
+              f"{percentile(hits, 0.99) * 1e6:>6.0f}µs {stats['avg_candidates']:>10} {linear * 1000:>12.1f}")
+        del cache, questions, sample
+
+
+def bench_accuracy():
+    from app.services.prompt_cache import PromptCache
+
+    print()
+    print("命中率与误命中率（带标注的问题集）")
+    print("=" * 96)
+    print(f"{'阈值':>6} {'真重复命中率':>12} {'误命中率':>10}  （真重复 / 近似但不同的查找次数）")
+    for threshold in THRESHOLDS:
+        true_hits = true_total = false_hits = false_total = 0
+        for template, keywords in TEMPLATES:
+            for index, keyword in enumerate(keywords):
+                # 每轮只缓存一个关键词的问题，用其余关键词的问题查找
+                cache = PromptCache(max_entries=1000, threshold=threshold, ttl=3600)
+                cache.store(SYSTEM, template.format(keyword), keyword)
+                for variant in VARIANTS:
+                    true_total += 1
+                    hit = cache.lookup(SYSTEM, variant(template.format(keyword)))
+                    true_hits += hit is not None and hit.answer == keyword
+                for other in keywords[:index] + keywords[index + 1:]:
+                    for variant in VARIANTS:
+                        false_total += 1
+                        false_hits += cache.lookup(SYSTEM, variant(template.format(other))) is not None
+        print(f"{threshold:>6} {true_hits / true_total:>12.1%} {false_hits / false_total:>10.1%}  "
+              f"（{true_total} / {false_total}）")
+
+
+def load_corpus(path: Path):
+    """从上游流量录制文件中提取 (系统提示词, 用户问题)，只保留单轮问题"""
+    items = []
+    with path.open(encoding="utf-8") as f:
+        for line in f:
+            try:
+                query = (json.loads(line).get("payload") or {}).get("Query")
+            except ValueError:
+                continue
+            if not query:
+                continue
+            parts = query.split("\n\n")
+            users = [i for i, part in enumerate(parts) if part.startswith("[USER]: ")]
+            if len(users) != 1 or any(part.startswith("[ASSISTANT]: ") for part in parts):
+                continue
+            system = "\n\n".join(parts[:users[0]])
+            items.append((system, "\n\n".join(parts[users[0]:])[len("[USER]: "):]))
+    return items
+
+
+def bench_corpus(path: Path, show: int):
+    from app.services.prompt_cache import PromptCache
+
+    items = load_corpus(path)
+    print()
+    print(f"录制文件：{path}，{len(items)} 个单轮问题（按顺序先查找、未命中时写入）")
+    print("=" * 96)
+    if not items:
+        return
+    print(f"{'阈值':>6} {'命中率':>10} {'其中完全相同':>12} {'p50(µs)':>10}")
+    lowest = []
+    for threshold in THRESHOLDS:
+        cache = PromptCache(max_entries=len(items), threshold=threshold, ttl=float("inf"))
+        texts = {}
+        hits = exact = 0
+        samples = []
+        for system, query in items:
+            started = time.perf_counter()
+            hit = cache.lookup(system, query)
+            samples.append(time.perf_counter() - started)
+            if hit is None:
+                cache.store(system, query, query)
+                continue
+            hits += 1
+            exact += hit.similarity == 1.0
+            if threshold == min(THRESHOLDS) and hit.similarity < 1.0:
+                texts[(hit.answer, query)] = hit.similarity
+        if texts:
+            lowest = sorted(texts.items(), key=lambda item: item[1])
+        print(f"{threshold:>6} {hits / len(items):>10.1%} {exact / len(items):>12.1%} "
+              f"{percentile(samples, 0.5) * 1e6:>10.0f}")
+    if show and lowest:
+        print()
+        print(f"相似度最低的 {min(show, len(lowest))} 个近似命中（阈值 {min(THRESHOLDS)}，请检查是否为误命中）：")
+        for (cached, query), similarity in lowest[:show]:
+            print(f"  {similarity:.3f}  {cached[:40]!r} <- {query[:40]!r}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="近似重复缓存基准测试")
+    parser.add_argument("--sizes", default="10000,100000,300000", help="缓存条目数，逗号分隔")
+    parser.add_argument("--lookups", type=int, default=2000, help="每种规模的查找次数")
+    parser.add_argument("--corpus", type=Path, help="上游流量录制文件（JSONL）")
+    parser.add_argument("--show", type=int, default=10, help="列出的最低相似度命中数量")
+    args = parser.parse_args()
+
+    # 不访问上游，配置只需通过校验
+    config_path = Path(tempfile.mkdtemp(prefix="bench_prompt_cache_")) / "config.yaml"
+    config_path.write_text("agent:\n  app_id: \"bench_app_id\"\n  api_key: \"bench_api_key\"\n", encoding="utf-8")
+    os.environ["AGENT_CONFIG_FILE"] = str(config_path)
+
+    bench_scale([int(size) for size in args.sizes.split(",") if size], args.lookups)
+    bench_accuracy()
+    if args.corpus:
+        bench_corpus(args.corpus, args.show)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+聊天请求解析基准测试
+
+比较 /v1/chat/completions 请求体的两种解析方式在不同消息数下的耗时：
+- fastapi：FastAPI 默认路径，json.loads 后校验为 ChatCompletionRequest 及 ChatMessage 列表（原有方式）
+- pydantic-json：pydantic 直接从 JSON 字节校验（作为参照）
+- fast：parse_chat_request 快速解析为轻量对象（orjson 可用时使用 orjson）
+
+用法:
+    python bench_request_parsing.py --messages 10 100 1000 --repeat 200
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+
+
+def build_body(count: int) -> bytes:
+    messages = [{"role": "system", "content": "你是一个乐于助人的助手。" * 20}]
+    for i in range(count - 1):
+        role = "user" if i % 2 == 0 else "assistant"
+        messages.append({"role": role, "content": f"第{i}条消息：" + "这是一段对话内容，包含一些细节。" * 8})
+    body = {"model": "agent-model", "messages": messages, "temperature": 0.7, "stream": True}
+    return json.dumps(body, ensure_ascii=False).encode("utf-8")
+
+
+def timeit(fn, body: bytes, repeat: int) -> float:
+    fn(body)
+    started = time.perf_counter()
+    for _ in range(repeat):
+        fn(body)
+    return (time.perf_counter() - started) / repeat * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="聊天请求解析基准测试")
+    parser.add_argument("--messages", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    # 解析不访问上游，配置只需通过校验
+    config_path = Path(tempfile.mkdtemp(prefix="bench_parsing_")) / "config.yaml"
+    config_path.write_text("agent:\n  app_id: \"bench_app_id\"\n  api_key: \"bench_api_key\"\n", encoding="utf-8")
+    os.environ["AGENT_CONFIG_FILE"] = str(config_path)
+
+    from app.models.chat import ChatCompletionRequest
+    from app.models.slim import parse_chat_request
+    from app.utils import json_codec
+
+    print("聊天请求解析基准测试")
+    print("=" * 72)
+    print(f"JSON 解码器: {'orjson' if json_codec.orjson is not None else 'json（标准库）'}")
+    print(f"{'消息数':>8} {'请求体(KB)':>10} {'fastapi(us)':>12} {'pydantic-json(us)':>18} {'fast(us)':>10} {'加速比':>8}")
+    for count in args.messages:
+        body = build_body(count)
+        repeat = max(5, args.repeat * 10 // max(count, 10))
+        default = timeit(lambda data: ChatCompletionRequest.model_validate(json.loads(data)), body, repeat)
+        from_json = timeit(ChatCompletionRequest.model_validate_json, body, repeat)
+        fast = timeit(parse_chat_request, body, repeat)
+        print(f"{count:>8} {len(body) / 1024:>10.1f} {default:>12.1f} {from_json:>18.1f} {fast:>10.1f} "
+              f"{default / fast:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
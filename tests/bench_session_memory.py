@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+会话存储内存基准测试
+
+分别向原有的双字典布局（会话ID -> {app_conversation_id, user_id} 字典 + 会话ID -> 时间戳）
+与 MemorySessionStore 的紧凑记录写入 N 个会话，用 tracemalloc 统计每个会话占用的字节数
+（包括会话ID和上游会话ID字符串本身），并测量会话数达到上限时每次请求的清理耗时。
+
+用法:
+    python bench_session_memory.py --sessions 100000 1000000
+"""
+
+import argparse
+import gc
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+import uuid
+from pathlib import Path
+from typing import Dict
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+
+class LegacySessionStore:
+    """原有布局：两个平行字典，按会话保存 user_id，清理时扫描全部时间戳"""
+
+    def __init__(self):
+        self.conversations: Dict[str, Dict] = {}
+        self.conversation_timestamps: Dict[str, float] = {}
+
+    def set(self, session_id: str, info: Dict):
+        self.conversations[session_id] = info
+        self.conversation_timestamps[session_id] = time.time()
+
+    def cleanup(self, timeout: float, max_conversations: int):
+        current_time = time.time()
+        expired = [sid for sid, ts in self.conversation_timestamps.items() if current_time - ts > timeout]
+        for session_id in expired:
+            del self.conversations[session_id]
+            del self.conversation_timestamps[session_id]
+        if len(self.conversations) > max_conversations:
+            sorted_sessions = sorted(self.conversation_timestamps.items(), key=lambda x: x[1])
+            for session_id, _ in sorted_sessions[:len(self.conversations) - max_conversations]:
+                del self.conversations[session_id]
+                del self.conversation_timestamps[session_id]
+
+
+def fill(store, count: int, user_id_for):
+    for _ in range(count):
+        session_id = str(uuid.uuid4())
+        store.set(session_id, {"app_conversation_id": str(uuid.uuid4()), "user_id": user_id_for(session_id)})
+
+
+def measure(factory, count: int, user_id_for):
+    """返回 (每个会话的字节数, 达到上限后单次清理耗时 ms)"""
+    gc.collect()
+    tracemalloc.start()
+    store = factory()
+    fill(store, count, user_id_for)
+    used, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    # 模拟稳定状态：会话数处于上限，每个请求新增一个会话并触发清理
+    rounds = 20
+    started = time.perf_counter()
+    for _ in range(rounds):
+        fill(store, 1, user_id_for)
+        store.cleanup(3600, count)
+    cleanup_ms = (time.perf_counter() - started) / rounds * 1000
+    del store
+    gc.collect()
+    return used / count, cleanup_ms
+
+
+def main():
+    parser = argparse.ArgumentParser(description="会话存储内存基准测试")
+    parser.add_argument("--sessions", type=int, nargs="+", default=[100000, 1000000])
+    parser.add_argument("--memory-limit", type=int, default=512, help="容器内存上限（MB），用于估算可容纳的会话数")
+    args = parser.parse_args()
+
+    config_path = Path(tempfile.mkdtemp(prefix="bench_sessions_")) / "config.yaml"
+    config_path.write_text("agent:\n  app_id: \"bench_app_id\"\n  api_key: \"bench_api_key\"\n", encoding="utf-8")
+    os.environ["AGENT_CONFIG_FILE"] = str(config_path)
+    from app.services.session_store import MemorySessionStore, user_id_for
+
+    print("会话存储内存基准测试")
+    print("=" * 76)
+    print(f"{'会话数':>10} {'实现':>8} {'字节/会话':>10} {'总计(MB)':>10} {'清理(ms/请求)':>14} "
+          f"{f'{args.memory_limit}MB 可容纳':>14}")
+    for count in args.sessions:
+        for name, factory in (("legacy", LegacySessionStore), ("compact", MemorySessionStore)):
+            per_session, cleanup_ms = measure(factory, count, user_id_for)
+            capacity = args.memory_limit * 1024 * 1024 / per_session
+            print(f"{count:>10} {name:>8} {per_session:>10.0f} {per_session * count / 1024 / 1024:>10.1f} "
+                  f"{cleanup_ms:>14.3f} {capacity:>14,.0f}")
+
+
+if __name__ == "__main__":
+    main()
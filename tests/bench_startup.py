@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+冷启动基准测试
+
+测量服务从进程启动到可以接收请求的耗时，用于检查启动预算：
+- import：全新解释器中 ``import main`` 的耗时（多进程模式的主进程只需要这一步）
+- app：全新解释器中导入 main 并取得 ``main.app``（工作进程加载应用）的耗时
+- health：``python main.py --workers 1`` 启动到 /health 首次返回 200 的耗时（含工作进程 spawn）
+同时列出加载应用时自身耗时最多的模块（python -X importtime），便于定位新增的导入期开销。
+
+用法:
+    python bench_startup.py --repeat 5 --budget 1500
+"""
+
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+
+
+def run_python(code: str, env: dict, *flags) -> subprocess.CompletedProcess:
+    return subprocess.run([sys.executable, *flags, "-c", code], cwd=PROJECT_ROOT, env=env,
+                          capture_output=True, text=True, check=True)
+
+
+def measure_import(env: dict, target: str) -> float:
+    """在全新解释器中测量导入耗时（毫秒）"""
+    code = (
+        "import time\n"
+        "started = time.perf_counter()\n"
+        "import main\n"
+        f"{'main.app' if target == 'app' else 'pass'}\n"
+        "print((time.perf_counter() - started) * 1000)\n"
+    )
+    return float(run_python(code, env).stdout.strip().splitlines()[-1])
+
+
+def health_ok(port: int) -> bool:
+    try:
+        with socket.create_connection(("127.0.0.1", port), timeout=0.5) as conn:
+            conn.sendall(b"GET /health HTTP/1.1\r\nHost: localhost\r\nConnection: close\r\n\r\n")
+            return conn.recv(32).startswith(b"HTTP/1.1 200")
+    except OSError:
+        return False
+
+
+def measure_health(env: dict, port: int, timeout: float = 60) -> float:
+    """启动单工作进程服务，测量到 /health 返回 200 的耗时（毫秒）"""
+    started = time.perf_counter()
+    process = subprocess.Popen([sys.executable, "main.py", "--workers", "1", "--port", str(port)],
+                               cwd=PROJECT_ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while time.perf_counter() - started < timeout:
+            if health_ok(port):
+                return (time.perf_counter() - started) * 1000
+            time.sleep(0.005)
+        raise RuntimeError(f"服务在 {timeout} 秒内未就绪")
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def slowest_modules(env: dict, top: int):
+    """加载应用时自身耗时最多的模块"""
+    result = run_python("import main; main.app", env, "-X", "importtime")
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        rows.append((int(self_us), int(cumulative_us), name.strip()))
+    return sorted(rows, reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="冷启动基准测试")
+    parser.add_argument("--repeat", type=int, default=5, help="每项测量的重复次数（取中位数）")
+    parser.add_argument("--port", type=int, default=18200)
+    parser.add_argument("--top", type=int, default=15, help="列出自身耗时最多的模块数")
+    parser.add_argument("--budget", type=float, default=0, help="health 耗时预算（毫秒），超出时以非零状态退出")
+    args = parser.parse_args()
+
+    # 启动不访问上游，配置只需通过校验
+    config_path = Path(tempfile.mkdtemp(prefix="bench_startup_")) / "config.yaml"
+    config_path.write_text(
+        "agent:\n  app_id: \"bench_app_id\"\n  api_key: \"bench_api_key\"\n"
+        "logging:\n  level: \"WARNING\"\n"
+        "monitor:\n  enabled: false\n",
+        encoding="utf-8",
+    )
+    env = {**os.environ, "AGENT_CONFIG_FILE": str(config_path)}
+
+    print("冷启动基准测试")
+    print("=" * 64)
+    results = {}
+    for name, measure in (
+        ("import", lambda: measure_import(env, "import")),
+        ("app", lambda: measure_import(env, "app")),
+        ("health", lambda: measure_health(env, args.port)),
+    ):
+        samples = [measure() for _ in range(args.repeat)]
+        results[name] = statistics.median(samples)
+        print(f"{name:>8}: 中位数 {results[name]:>8.1f} ms  最小 {min(samples):>8.1f} ms  最大 {max(samples):>8.1f} ms")
+
+    print()
+    print(f"加载应用时自身耗时最多的 {args.top} 个模块")
+    print("=" * 64)
+    print(f"{'自身(ms)':>10} {'累计(ms)':>10}  模块")
+    for self_us, cumulative_us, name in slowest_modules(env, args.top):
+        print(f"{self_us / 1000:>10.1f} {cumulative_us / 1000:>10.1f}  {name}")
+
+    if args.budget:
+        print()
+        if results["health"] > args.budget:
+            print(f"超出启动预算：{results['health']:.0f} ms > {args.budget:.0f} ms")
+            sys.exit(1)
+        print(f"满足启动预算：{results['health']:.0f} ms <= {args.budget:.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+流缓冲背压基准测试
+
+模拟上游较快、部分客户端读得很慢的流式场景：``--streams`` 个流各自由生产者线程每隔 ``--produce-delay`` 毫秒
+写入一个事件，共 ``--events`` 个，
+其中 ``--slow`` 比例的客户端每读一个事件等待 ``--read-delay`` 毫秒，其余客户端尽快读取。比较三种配置：
+- 不限制：单个流与全局都不设上限（旧行为）
+- pause：单个流未发送的内容超过上限时暂停读取上游
+- drop：超过上限时立即中断慢速客户端的流
+输出峰值缓冲字节数与未发送字节数、暂停 / 中断次数、快速客户端的完成耗时以及慢速客户端收到的事件数。
+
+用法:
+    python bench_stream_backpressure.py --streams 200 --events 2000 --slow 0.25 --read-delay 2
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+
+def source(events: int, payload: str, delay: float):
+    for i in range(events):
+        if delay:
+            time.sleep(delay)
+        yield None, payload
+    yield None, "[DONE]"
+
+
+async def consume(buffered, delay: float):
+    started = time.perf_counter()
+    received = 0
+    async for _, (event, _data) in buffered.aiter_from(0):
+        received += 1
+        if event == "error":
+            break
+        if delay:
+            await asyncio.sleep(delay)
+    return time.perf_counter() - started, received
+
+
+async def run_scenario(args, stream_max_bytes: int, budget: int, overflow: str, grace: float):
+    from app.core.config import settings
+    from app.services.stream_buffer import StreamRegistry
+
+    settings.STREAM_BUFFER_STREAM_MAX_BYTES = stream_max_bytes
+    settings.STREAM_BUFFER_MAX_BYTES = budget
+    settings.STREAM_BUFFER_OVERFLOW = overflow
+    settings.STREAM_BUFFER_GRACE = grace
+    registry = StreamRegistry()
+    payload = "x" * args.event_bytes
+    slow_count = int(args.streams * args.slow)
+
+    peak = {"buffered": 0, "pending": 0}
+    stop = asyncio.Event()
+
+    async def sample():
+        while not stop.is_set():
+            snapshot = registry.snapshot()
+            peak["buffered"] = max(peak["buffered"], snapshot["buffered_bytes"])
+            peak["pending"] = max(peak["pending"], snapshot["pending_bytes"])
+            await asyncio.sleep(0.01)
+
+    sampler = asyncio.create_task(sample())
+    started = time.perf_counter()
+    tasks = []
+    for index in range(args.streams):
+        buffered = registry.start(f"bench-{index}", source(args.events, payload, args.produce_delay / 1000))
+        delay = args.read_delay / 1000 if index < slow_count else 0
+        tasks.append(asyncio.create_task(consume(buffered, delay)))
+    results = await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await sampler
+
+    fast = sorted(duration for duration, _ in results[slow_count:]) or [0.0]
+    slow_received = [received for _, received in results[:slow_count]] or [0]
+    snapshot = registry.snapshot()
+    return {
+        "elapsed": elapsed,
+        "peak_buffered": peak["buffered"],
+        "peak_pending": peak["pending"],
+        "paused": snapshot["paused"],
+        "dropped": snapshot["dropped"],
+        "trimmed": snapshot["trimmed_bytes"],
+        "fast_p50": fast[len(fast) // 2],
+        "slow_received": sum(slow_received) / len(slow_received),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="流缓冲背压基准测试")
+    parser.add_argument("--streams", type=int, default=200, help="并发流数量")
+    parser.add_argument("--events", type=int, default=2000, help="每个流的事件数")
+    parser.add_argument("--event-bytes", type=int, default=512, help="每个事件的数据字节数")
+    parser.add_argument("--produce-delay", type=float, default=0.5, help="上游每个事件的间隔（毫秒）")
+    parser.add_argument("--slow", type=float, default=0.25, help="慢速客户端的比例")
+    parser.add_argument("--read-delay", type=float, default=2.0, help="慢速客户端每个事件的读取间隔（毫秒）")
+    parser.add_argument("--stream-max-bytes", type=int, default=64 * 1024, help="单个流未发送字节数上限")
+    parser.add_argument("--budget", type=int, default=32 * 1024 * 1024, help="所有流缓冲的总预算（字节）")
+    parser.add_argument("--grace", type=float, default=5.0, help="超过上限后的宽限期（秒）")
+    args = parser.parse_args()
+
+    # 不访问上游，配置只需通过校验
+    config_path = Path(tempfile.mkdtemp(prefix="bench_backpressure_")) / "config.yaml"
+    config_path.write_text("agent:\n  app_id: \"bench_app_id\"\n  api_key: \"bench_api_key\"\n", encoding="utf-8")
+    os.environ["AGENT_CONFIG_FILE"] = str(config_path)
+
+    total = args.streams * args.events * args.event_bytes
+    print(f"流缓冲背压：{args.streams} 个流 × {args.events} 个事件 × {args.event_bytes} 字节"
+          f"（共 {total / 2 ** 20:.0f} MiB），{args.slow:.0%} 的客户端每个事件读取间隔 {args.read_delay} ms")
+    print("=" * 110)
+    print(f"{'配置':>8} {'总耗时(s)':>10} {'峰值缓冲(MiB)':>14} {'峰值未发送(MiB)':>16} {'暂停':>6} {'中断':>6} "
+          f"{'丢弃已发送(MiB)':>16} {'快速客户端 p50(s)':>18} {'慢速客户端收到':>14}")
+    scenarios = [
+        ("不限制", 0, 1 << 40, "pause", args.grace),
+        ("pause", args.stream_max_bytes, args.budget, "pause", args.grace),
+        ("drop", args.stream_max_bytes, args.budget, "drop", args.grace),
+    ]
+    for name, stream_max_bytes, budget, overflow, grace in scenarios:
+        result = asyncio.run(run_scenario(args, stream_max_bytes, budget, overflow, grace))
+        print(f"{name:>8} {result['elapsed']:>10.2f} {result['peak_buffered'] / 2 ** 20:>14.1f} "
+              f"{result['peak_pending'] / 2 ** 20:>16.1f} {result['paused']:>6} {result['dropped']:>6} "
+              f"{result['trimmed'] / 2 ** 20:>16.1f} {result['fast_p50']:>18.2f} {result['slow_received']:>14.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+用量统计基准测试
+
+测量用量统计在请求路径上的开销，确认其为常数、与已统计的调用方数量和台账文件大小无关：
+- 流式增量逐片计数（TokenCounter.add）的单片耗时，对比每片调用 estimate_tokens 与对全文重新估算
+- 台账记录（UsageLedger.record）在不同调用方数量下的单次耗时，以及多线程并发记录的吞吐量
+- 后台落盘一次的耗时（不在请求路径上，仅供参考）
+
+用法:
+    python bench_usage.py --chunks 2000 --records 200000 --threads 8
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+CHUNKS = ["北京理工", "大学创建于", "1940年，", "是中国共产党", "创办的第一所", "理工科大学。", " Hello", " world!"]
+
+
+def bench_counter(chunks: int):
+    from app.utils.text import TokenCounter, estimate_tokens
+
+    deltas = [CHUNKS[i % len(CHUNKS)] for i in range(chunks)]
+    print(f"流式增量计数：{chunks} 个分片")
+    print("=" * 72)
+
+    started = time.perf_counter()
+    counter = TokenCounter()
+    for delta in deltas:
+        counter.add(delta)
+    incremental = time.perf_counter() - started
+
+    started = time.perf_counter()
+    total = sum(estimate_tokens(delta) for delta in deltas)
+    per_chunk = time.perf_counter() - started
+
+    # 对照：每收到一片都对已生成的全文重新估算，开销随回答长度线性增长
+    started = time.perf_counter()
+    text = ""
+    for delta in deltas:
+        text += delta
+        estimate_tokens(text)
+    rescan = time.perf_counter() - started
+
+    print(f"{'TokenCounter.add':>24}: {incremental * 1e6 / chunks:>8.2f} µs/片  共 {counter.tokens} tokens"
+          f"（全文估算 {estimate_tokens(''.join(deltas))}）")
+    print(f"{'逐片 estimate_tokens':>24}: {per_chunk * 1e6 / chunks:>8.2f} µs/片  共 {total} tokens（逐片取整偏大）")
+    print(f"{'每片重新估算全文':>24}: {rescan * 1e6 / chunks:>8.2f} µs/片")
+
+
+def bench_ledger(records: int, threads: int):
+    from app.services.usage_ledger import UsageLedger, make_usage
+
+    usage = make_usage(120, 480)
+    print()
+    print(f"台账记录：每轮 {records} 次")
+    print("=" * 72)
+    for callers in (1, 100, 10000):
+        ledger = UsageLedger()
+        keys = [f"caller-{i:05d}" for i in range(callers)]
+        started = time.perf_counter()
+        for i in range(records):
+            ledger.record(keys[i % callers], "agent-model", usage)
+        elapsed = time.perf_counter() - started
+        print(f"{callers:>8} 个调用方: {elapsed * 1e9 / records:>8.0f} ns/次")
+
+    ledger = UsageLedger()
+    per_thread = records // threads
+
+    def worker(index: int):
+        for i in range(per_thread):
+            ledger.record(f"caller-{(index * per_thread + i) % 100}", "agent-model", usage)
+
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    started = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    print(f"{threads:>8} 个线程并发: {per_thread * threads / elapsed:>8.0f} 次/s")
+
+    with tempfile.TemporaryDirectory(prefix="bench_usage_") as directory:
+        ledger.path = Path(directory) / "usage.jsonl"
+        started = time.perf_counter()
+        ledger.flush()
+        elapsed = time.perf_counter() - started
+        print(f"{'落盘一次':>14}: {elapsed * 1000:>8.2f} ms（{ledger.flushed_lines} 行，"
+              f"{os.path.getsize(ledger.path)} 字节，后台线程执行）")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="用量统计基准测试")
+    parser.add_argument("--chunks", type=int, default=2000, help="一个流式回答的分片数")
+    parser.add_argument("--records", type=int, default=200000, help="台账记录次数")
+    parser.add_argument("--threads", type=int, default=8, help="并发记录的线程数")
+    args = parser.parse_args()
+
+    # 不访问上游，配置只需通过校验
+    config_path = Path(tempfile.mkdtemp(prefix="bench_usage_")) / "config.yaml"
+    config_path.write_text("agent:\n  app_id: \"bench_app_id\"\n  api_key: \"bench_api_key\"\n", encoding="utf-8")
+    os.environ["AGENT_CONFIG_FILE"] = str(config_path)
+
+    bench_counter(args.chunks)
+    bench_ledger(args.records, args.threads)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""
+WebSocket 与 SSE 多轮聊天对比基准测试
+
+启动本地模拟上游和单进程服务，比较：
+- 每轮开销：同一段多轮对话分别通过 SSE（每轮一个新请求，携带完整历史）和
+  WebSocket（一个连接，每轮只发送新消息）完成，统计每轮延迟与请求体大小
+- 每连接内存：C 个客户端同时处于一轮回答中时，服务进程 RSS 的增量 / C
+
+用法:
+    python bench_websocket.py --turns 50 --connections 200
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import requests
+from websockets.sync.client import connect
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+TESTS_DIR = Path(__file__).resolve().parent
+
+
+def rss_kb(pid: int) -> int:
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1])
+    return 0
+
+
+def start_server(port: int, upstream_port: int, workdir: str) -> subprocess.Popen:
+    config_path = Path(workdir) / f"config_{upstream_port}.yaml"
+    config_path.write_text(
+        "agent:\n"
+        f"  api_base_url: \"http://127.0.0.1:{upstream_port}\"\n"
+        "  app_id: \"bench_app_id\"\n"
+        "  api_key: \"bench_api_key\"\n"
+        "  pool_size: 1000\n"
+        "session:\n"
+        "  max_conversations: 100000\n"
+        "logging:\n"
+        "  level: \"WARNING\"\n",
+        encoding="utf-8",
+    )
+    env = dict(os.environ, AGENT_CONFIG_FILE=str(config_path))
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+         "--log-level", "warning", "--limit-concurrency", "10000"],
+        cwd=PROJECT_ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            if requests.get(f"http://127.0.0.1:{port}/health", timeout=1).status_code == 200:
+                return server
+        except requests.RequestException:
+            time.sleep(0.2)
+    server.terminate()
+    raise RuntimeError("服务启动失败")
+
+
+def sse_turn(session: requests.Session, base_url: str, history) -> int:
+    body = json.dumps({"model": "agent-model", "messages": history, "stream": True}, ensure_ascii=False).encode()
+    with session.post(f"{base_url}/v1/chat/completions", data=body,
+                      headers={"Content-Type": "application/json"}, stream=True, timeout=60) as response:
+        for line in response.iter_lines():
+            if line == b"data: [DONE]":
+                break
+    return len(body)
+
+
+def ws_turn(ws, content: str) -> int:
+    frame = json.dumps({"content": content}, ensure_ascii=False)
+    ws.send(frame)
+    while True:
+        message = json.loads(ws.recv())
+        if message["t"] in ("e", "err"):
+            break
+    return len(frame.encode())
+
+
+def bench_turns(base_url: str, turns: int):
+    """返回 {模式: (每轮延迟列表, 平均请求体字节数)}"""
+    results = {}
+    question = "请继续介绍一下这个话题的细节。" * 3
+
+    history = [{"role": "system", "content": "你是一个乐于助人的助手。" * 10}]
+    latencies, sizes = [], []
+    with requests.Session() as session:
+        for i in range(turns):
+            history.append({"role": "user", "content": f"{i}: {question}"})
+            started = time.perf_counter()
+            sizes.append(sse_turn(session, base_url, history))
+            latencies.append(time.perf_counter() - started)
+            history.append({"role": "assistant", "content": "这是上一轮的回答。" * 20})
+    results["sse"] = (latencies, statistics.mean(sizes))
+
+    latencies, sizes = [], []
+    with connect(base_url.replace("http://", "ws://") + "/v1/chat/ws") as ws:
+        ws.recv()
+        for i in range(turns):
+            started = time.perf_counter()
+            sizes.append(ws_turn(ws, f"{i}: {question}"))
+            latencies.append(time.perf_counter() - started)
+    results["websocket"] = (latencies, statistics.mean(sizes))
+    return results
+
+
+def bench_memory(base_url: str, server_pid: int, connections: int, hold: float):
+    """C 个客户端同时处于一轮回答中，返回 {模式: 每连接 RSS 增量 KB}"""
+    results = {}
+    for mode in ("sse", "websocket"):
+        time.sleep(1)
+        baseline = rss_kb(server_pid)
+        barrier = threading.Barrier(connections + 1)
+        peak = [baseline]
+
+        def client():
+            try:
+                if mode == "sse":
+                    with requests.Session() as session:
+                        barrier.wait()
+                        sse_turn(session, base_url, [{"role": "user", "content": "你好"}])
+                else:
+                    with connect(base_url.replace("http://", "ws://") + "/v1/chat/ws", open_timeout=60) as ws:
+                        ws.recv()
+                        barrier.wait()
+                        ws_turn(ws, "你好")
+            except Exception:
+                pass
+
+        threads = [threading.Thread(target=client, daemon=True) for _ in range(connections)]
+        for t in threads:
+            t.start()
+        try:
+            barrier.wait(timeout=120)
+        except threading.BrokenBarrierError:
+            pass
+        deadline = time.time() + hold
+        while time.time() < deadline:
+            peak[0] = max(peak[0], rss_kb(server_pid))
+            time.sleep(0.1)
+        for t in threads:
+            t.join(timeout=60)
+        results[mode] = (peak[0] - baseline) / connections
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="WebSocket 与 SSE 多轮聊天对比基准测试")
+    parser.add_argument("--turns", type=int, default=50)
+    parser.add_argument("--connections", type=int, default=200)
+    parser.add_argument("--port", type=int, default=18000)
+    parser.add_argument("--upstream-port", type=int, default=18080)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench_ws_")
+    base_url = f"http://127.0.0.1:{args.port}"
+    print("WebSocket 与 SSE 多轮聊天对比基准测试")
+    print("=" * 64)
+
+    # 每轮开销：上游无延迟，突出服务自身的开销
+    upstream = subprocess.Popen([sys.executable, str(TESTS_DIR / "mock_upstream.py"),
+                                 "--port", str(args.upstream_port), "--delay", "0", "--chunks", "20"])
+    server = start_server(args.port, args.upstream_port, workdir)
+    try:
+        results = bench_turns(base_url, args.turns)
+    finally:
+        server.terminate()
+        server.wait()
+        upstream.terminate()
+        upstream.wait()
+    print(f"每轮开销（{args.turns} 轮对话）")
+    print(f"{'模式':>10} {'平均(ms)':>10} {'p50(ms)':>10} {'p95(ms)':>10} {'最后一轮(ms)':>14} {'平均请求(B)':>12}")
+    for mode, (latencies, size) in results.items():
+        ordered = sorted(latencies)
+        print(f"{mode:>10} {statistics.mean(latencies) * 1000:>10.2f} {ordered[len(ordered) // 2] * 1000:>10.2f} "
+              f"{ordered[int(len(ordered) * 0.95)] * 1000:>10.2f} {latencies[-1] * 1000:>14.2f} {size:>12.0f}")
+
+    # 每连接内存：上游回答持续约 5 秒，期间所有连接都处于回答中
+    upstream = subprocess.Popen([sys.executable, str(TESTS_DIR / "mock_upstream.py"),
+                                 "--port", str(args.upstream_port), "--delay", "0.25", "--chunks", "20"])
+    server = start_server(args.port, args.upstream_port, workdir)
+    try:
+        memory = bench_memory(base_url, server.pid, args.connections, hold=4)
+    finally:
+        server.terminate()
+        server.wait()
+        upstream.terminate()
+        upstream.wait()
+    print(f"\n每连接内存（{args.connections} 个并发连接）")
+    for mode, per_connection in memory.items():
+        print(f"{mode:>10} {per_connection:>10.1f} KB/连接")
+
+
+if __name__ == "__main__":
+    main()
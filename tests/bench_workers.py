@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+多进程模式吞吐量基准测试
+
+启动本地模拟上游，分别以不同工作进程数启动服务，
+用多个客户端进程并发发送非流式聊天请求，比较每秒请求数随工作进程数的扩展情况。
+
+用法:
+    python bench_workers.py --workers 1 2 4 --duration 10 --concurrency 64
+"""
+
+import argparse
+import multiprocessing
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import requests
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+TESTS_DIR = Path(__file__).resolve().parent
+
+
+def _wait_until_healthy(base_url: str, timeout: float = 30) -> bool:
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if requests.get(f"{base_url}/health", timeout=1).status_code == 200:
+                return True
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    return False
+
+
+def _client(args):
+    """单个客户端进程：多线程循环发送请求，返回成功与失败次数"""
+    base_url, threads, duration = args
+    import threading
+
+    counts = {"ok": 0, "failed": 0}
+    lock = threading.Lock()
+    deadline = time.time() + duration
+    payload = {"model": "agent-model", "messages": [{"role": "user", "content": "你好"}]}
+
+    def worker():
+        session = requests.Session()
+        ok = failed = 0
+        while time.time() < deadline:
+            try:
+                response = session.post(f"{base_url}/v1/chat/completions", json=payload, timeout=30)
+                if response.status_code == 200:
+                    ok += 1
+                else:
+                    failed += 1
+            except requests.RequestException:
+                failed += 1
+        with lock:
+            counts["ok"] += ok
+            counts["failed"] += failed
+
+    pool = [threading.Thread(target=worker) for _ in range(threads)]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    return counts["ok"], counts["failed"]
+
+
+def run_load(base_url: str, concurrency: int, duration: float, client_processes: int):
+    per_process = max(1, concurrency // client_processes)
+    with multiprocessing.Pool(client_processes) as pool:
+        results = pool.map(_client, [(base_url, per_process, duration)] * client_processes)
+    ok = sum(r[0] for r in results)
+    failed = sum(r[1] for r in results)
+    return ok, failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="多进程模式吞吐量基准测试")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--client-processes", type=int, default=4)
+    parser.add_argument("--port", type=int, default=18000)
+    parser.add_argument("--upstream-port", type=int, default=18080)
+    args = parser.parse_args()
+
+    upstream = subprocess.Popen(
+        [sys.executable, str(TESTS_DIR / "mock_upstream.py"), "--port", str(args.upstream_port),
+         "--delay", "0", "--chunks", "20"],
+    )
+    workdir = tempfile.mkdtemp(prefix="bench_workers_")
+    config_path = Path(workdir) / "config.yaml"
+    config_path.write_text(
+        "agent:\n"
+        f"  api_base_url: \"http://127.0.0.1:{args.upstream_port}\"\n"
+        "  app_id: \"bench_app_id\"\n"
+        "  api_key: \"bench_api_key\"\n"
+        "session:\n"
+        "  store: \"sqlite\"\n"
+        f"  store_path: \"{Path(workdir) / 'sessions.db'}\"\n"
+        "logging:\n"
+        "  level: \"WARNING\"\n",
+        encoding="utf-8",
+    )
+    env = dict(os.environ, AGENT_CONFIG_FILE=str(config_path))
+    base_url = f"http://127.0.0.1:{args.port}"
+
+    print("多进程吞吐量基准测试")
+    print("=" * 60)
+    print(f"并发: {args.concurrency}，时长: {args.duration}s，客户端进程: {args.client_processes}")
+    print(f"{'工作进程':>8} {'成功':>10} {'失败':>8} {'请求/秒':>10} {'加速比':>8}")
+
+    baseline = None
+    try:
+        for workers in args.workers:
+            server = subprocess.Popen(
+                [sys.executable, "main.py", "--workers", str(workers), "--port", str(args.port),
+                 "--host", "127.0.0.1"],
+                cwd=PROJECT_ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+            )
+            try:
+                if not _wait_until_healthy(base_url):
+                    print(f"{workers:>8} 服务启动失败")
+                    continue
+                ok, failed = run_load(base_url, args.concurrency, args.duration, args.client_processes)
+                rps = ok / args.duration
+                baseline = baseline or rps
+                print(f"{workers:>8} {ok:>10} {failed:>8} {rps:>10.1f} {rps / baseline:>8.2f}")
+            finally:
+                server.send_signal(signal.SIGTERM)
+                server.wait(60)
+                time.sleep(1)
+    finally:
+        upstream.terminate()
+        upstream.wait()
+
+
+if __name__ == "__main__":
+    main()
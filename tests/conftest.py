@@ -0,0 +1,35 @@
+"""
+单元测试的公共配置
+
+单元测试不访问上游，配置只需通过校验：在导入 app 之前指向一个临时配置文件，
+避免读取开发者本地的 config.local.yaml。需要上游的测试使用 ``upstream`` 夹具替代上游接口。
+"""
+
+import os
+import tempfile
+from pathlib import Path
+
+import pytest
+
+_config_path = Path(tempfile.mkdtemp(prefix="agent_tests_")) / "config.yaml"
+_config_path.write_text("agent:\n  app_id: \"test_app_id\"\n  api_key: \"test_api_key\"\n", encoding="utf-8")
+os.environ["AGENT_CONFIG_FILE"] = str(_config_path)
+
+# 交互式测试脚本需要运行中的服务，不作为单元测试收集
+collect_ignore = ["test_client.py", "test_config.py", "test_env.py", "simple_test.py"]
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    """所有上游请求改由 FakeUpstream 处理，非流式请求也经流式模式获取"""
+    from app.core.config import settings
+    from app.services.agent_service import AgentService
+    from tests.fake_upstream import FakeUpstream
+
+    fake = FakeUpstream()
+    monkeypatch.setattr(AgentService, "create_conversation",
+                        lambda self, user_id, inputs=None: fake.create_conversation(user_id, inputs))
+    monkeypatch.setattr(AgentService, "make_streaming_request",
+                        lambda self, endpoint, data=None: fake.make_streaming_request(endpoint, data))
+    monkeypatch.setattr(settings, "BLOCKING_VIA_STREAM", True)
+    return fake
@@ -0,0 +1,63 @@
+"""
+单元测试使用的脚本化上游
+
+替代 AgentService 的 create_conversation 与 make_streaming_request（见 conftest.py 的 ``upstream`` 夹具），
+按预设的事件列表返回上游 SSE 流，不需要启动 mock_upstream.py。
+"""
+
+import json
+import threading
+from typing import Dict, List, Optional
+
+
+def message(answer: str) -> Dict:
+    return {"event": "message", "answer": answer}
+
+
+MESSAGE_END = {"event": "message_end"}
+
+
+def failed(error: str = "upstream error") -> Dict:
+    return {"event": "message_failed", "error": error}
+
+
+class FakeResponse:
+    """上游流式响应：逐行输出 SSE 事件，可在指定事件前等待 gate"""
+
+    def __init__(self, events: List[Dict], gate: Optional[threading.Event] = None, gate_at: int = 0):
+        self.events = events
+        self.gate = gate
+        self.gate_at = gate_at
+        self.closed = False
+
+    def iter_lines(self, decode_unicode=True, chunk_size=1):
+        for index, event in enumerate(self.events):
+            if self.gate is not None and index == self.gate_at:
+                self.gate.wait(5)
+            yield "data: " + json.dumps(event, ensure_ascii=False)
+            yield ""
+
+    def close(self):
+        self.closed = True
+
+
+class FakeUpstream:
+    """替代上游接口：按 replies 依次返回流式事件（为空时返回 "ok"），记录创建的会话与收到的查询"""
+
+    def __init__(self):
+        self.conversations: List[str] = []
+        self.queries: List[tuple] = []  # (AppConversationID, Query)
+        self.replies: List = []  # 事件列表或 FakeResponse
+        self.responses: List[FakeResponse] = []
+
+    def create_conversation(self, user_id: str, inputs: Optional[Dict] = None) -> str:
+        conversation_id = f"conv-{len(self.conversations)}"
+        self.conversations.append(conversation_id)
+        return conversation_id
+
+    def make_streaming_request(self, endpoint: str, data: Optional[Dict] = None) -> FakeResponse:
+        self.queries.append((data["AppConversationID"], data["Query"]))
+        reply = self.replies.pop(0) if self.replies else [message("ok"), MESSAGE_END]
+        response = reply if isinstance(reply, FakeResponse) else FakeResponse(reply)
+        self.responses.append(response)
+        return response
@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+"""
+模拟上游 Agent API（agent.bit.edu.cn）的本地服务，用于基准测试
+
+支持 create_conversation 以及 chat_query_v2 的 blocking / streaming 两种模式。
+指定 --per-kb-delay 时按请求体大小额外等待，模拟长 Query 带来的上游处理时间。
+指定 --chunks-max 时每个回答的分片数在 [chunks, chunks_max] 间按 Query 确定性地随机选取，用于模拟长短不一的回答。
+指定 --http2 时改用 hypercorn 运行等价的 ASGI 实现，同时支持 HTTP/1.1 与明文 HTTP/2（h2c）。
+
+用法:
+    python mock_upstream.py --port 18080 --delay 0.01 --chunks 20 --chunks-max 200
+    python mock_upstream.py --port 18080 --http2 --max-streams 1000
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class MockUpstreamHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # 每个流式分片之间的延迟（秒）与分片数量
+    delay = 0.01
+    chunks = 20
+    chunks_max = 0
+    per_kb_delay = 0.0
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, data):
+        body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _write_chunk(self, data: bytes):
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+
+    def _write_event(self, event):
+        self._write_chunk(("data: " + json.dumps(event, ensure_ascii=False) + "\n\n").encode("utf-8"))
+
+    def do_HEAD(self):
+        self.send_response(200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_GET(self):
+        self._send_json({})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        payload = json.loads(self.rfile.read(length) or b"{}")
+        if self.per_kb_delay and not self.path.endswith("/create_conversation"):
+            time.sleep(length / 1024 * self.per_kb_delay)
+
+        if self.path.endswith("/create_conversation"):
+            self._send_json({"Conversation": {"AppConversationID": str(uuid.uuid4())}})
+            return
+
+        chunks = self.chunks
+        if self.chunks_max > chunks:
+            chunks = random.Random(payload.get("Query")).randint(chunks, self.chunks_max)
+        parts = [f"这是第{i}段回答。" for i in range(chunks)]
+        if payload.get("ResponseMode") == "blocking":
+            time.sleep(self.delay * chunks)
+            self._send_json({"answer": "".join(parts)})
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream; charset=utf-8")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        try:
+            self._write_event({"event": "message_start", "task_id": str(uuid.uuid4())})
+            for part in parts:
+                if self.delay:
+                    time.sleep(self.delay)
+                self._write_event({"event": "message", "answer": part})
+            self._write_event({"event": "message_end"})
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+
+class MockUpstreamServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # 客户端超时断开是基准测试中的预期情况，不打印堆栈
+        pass
+
+
+def start_mock_upstream(port: int = 0, delay: float = 0.01, chunks: int = 20, chunks_max: int = 0,
+                        per_kb_delay: float = 0.0):
+    """在后台线程中启动模拟上游，返回 (server, base_url)"""
+    handler = type("Handler", (MockUpstreamHandler,), {
+        "delay": delay, "chunks": chunks, "chunks_max": chunks_max, "per_kb_delay": per_kb_delay
+    })
+    server = MockUpstreamServer(("127.0.0.1", port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def create_asgi_upstream(delay: float = 0.01, chunks: int = 20):
+    """与 MockUpstreamHandler 等价的 ASGI 实现，用于 HTTP/2 模拟上游"""
+
+    async def app(scope, receive, send):
+        if scope["type"] == "lifespan":
+            while True:
+                message = await receive()
+                if message["type"] == "lifespan.startup":
+                    await send({"type": "lifespan.startup.complete"})
+                elif message["type"] == "lifespan.shutdown":
+                    await send({"type": "lifespan.shutdown.complete"})
+                    return
+        body = b""
+        while True:
+            message = await receive()
+            body += message.get("body", b"")
+            if not message.get("more_body"):
+                break
+        payload = json.loads(body or b"{}")
+
+        async def send_json(data):
+            await send({"type": "http.response.start", "status": 200,
+                        "headers": [(b"content-type", b"application/json; charset=utf-8")]})
+            await send({"type": "http.response.body", "body": json.dumps(data, ensure_ascii=False).encode("utf-8")})
+
+        if scope["path"].endswith("/create_conversation"):
+            await send_json({"Conversation": {"AppConversationID": str(uuid.uuid4())}})
+            return
+        parts = [f"这是第{i}段回答。" for i in range(chunks)]
+        if payload.get("ResponseMode") == "blocking":
+            await asyncio.sleep(delay * chunks)
+            await send_json({"answer": "".join(parts)})
+            return
+
+        def event(data):
+            return {"type": "http.response.body", "more_body": True,
+                    "body": ("data: " + json.dumps(data, ensure_ascii=False) + "\n\n").encode("utf-8")}
+
+        await send({"type": "http.response.start", "status": 200,
+                    "headers": [(b"content-type", b"text/event-stream; charset=utf-8")]})
+        await send(event({"event": "message_start", "task_id": str(uuid.uuid4())}))
+        for part in parts:
+            if delay:
+                await asyncio.sleep(delay)
+            await send(event({"event": "message", "answer": part}))
+        await send(event({"event": "message_end"}))
+        await send({"type": "http.response.body", "body": b""})
+
+    return app
+
+
+def serve_http2_upstream(port: int, delay: float, chunks: int, max_streams: int):
+    """以 hypercorn 运行模拟上游（HTTP/1.1 + h2c），阻塞直到进程退出"""
+    from hypercorn.asyncio import serve
+    from hypercorn.config import Config
+
+    config = Config()
+    config.bind = [f"127.0.0.1:{port}"]
+    config.h2_max_concurrent_streams = max_streams
+    # hypercorn 默认每个连接处理 1000 个请求后发送 GOAWAY，基准测试中不希望连接被轮换
+    config.keep_alive_max_requests = 1_000_000
+    config.backlog = 4096
+    config.loglevel = "WARNING"
+    print(f"模拟上游已启动（HTTP/2）: http://127.0.0.1:{port}")
+    asyncio.run(serve(create_asgi_upstream(delay, chunks), config))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="模拟上游 Agent API")
+    parser.add_argument("--port", type=int, default=18080)
+    parser.add_argument("--delay", type=float, default=0.01, help="流式分片间隔（秒）")
+    parser.add_argument("--chunks", type=int, default=20, help="每个回答的分片数")
+    parser.add_argument("--chunks-max", type=int, default=0, help="大于 --chunks 时每个回答的分片数随机")
+    parser.add_argument("--per-kb-delay", type=float, default=0.0, help="每 KB 请求体额外的处理时间（秒）")
+    parser.add_argument("--http2", action="store_true", help="使用 hypercorn 运行，支持 HTTP/2（h2c）")
+    parser.add_argument("--max-streams", type=int, default=1000, help="HTTP/2 每个连接的最大并发流数")
+    args = parser.parse_args()
+
+    if args.http2:
+        serve_http2_upstream(args.port, args.delay, args.chunks, args.max_streams)
+        return
+
+    server, base_url = start_mock_upstream(args.port, args.delay, args.chunks, args.chunks_max, args.per_kb_delay)
+    print(f"模拟上游已启动: {base_url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""上游流式回答：message_failed 或缺少 message_end 时不当作正常结束"""
+
+import uuid
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.services.agent_service import UpstreamError, agent_service
+from tests.fake_upstream import MESSAGE_END, failed, message
+
+
+def session_id() -> str:
+    return str(uuid.uuid4())
+
+
+def test_stream_ends_at_message_end(upstream):
+    upstream.replies.append([message("a"), message("b"), MESSAGE_END, message("ignored")])
+    assert list(agent_service.chat_stream(session_id(), "q")) == ["a", "b"]
+    assert upstream.responses[0].closed
+
+
+@pytest.mark.parametrize("events", [
+    [message("partial "), failed("boom")],
+    [message("partial ")],
+])
+def test_stream_raises_without_message_end(upstream, events):
+    upstream.replies.append(events)
+    stream = agent_service.chat_stream(session_id(), "q")
+    assert next(stream) == "partial "
+    with pytest.raises(UpstreamError):
+        next(stream)
+    assert upstream.responses[0].closed
+
+
+def test_blocking_via_stream_raises_on_failure(upstream):
+    upstream.replies.append([message("partial "), failed("boom")])
+    with pytest.raises(UpstreamError, match="boom"):
+        agent_service.chat_blocking(session_id(), "q")
+
+
+@pytest.fixture(scope="module")
+def client():
+    from main import app
+    return TestClient(app)
+
+
+CHAT = {"model": "m", "messages": [{"role": "user", "content": "q"}]}
+
+
+def test_endpoint_returns_502_on_upstream_failure(upstream, client):
+    upstream.replies.append([message("partial "), failed("boom")])
+    response = client.post("/v1/chat/completions", json=CHAT)
+    assert response.status_code == 502
+    assert "boom" in response.json()["detail"]
+
+
+def test_stream_endpoint_sends_error_event(upstream, client):
+    upstream.replies.append([message("partial "), failed("boom")])
+    response = client.post("/v1/chat/completions", json={**CHAT, "stream": True})
+    assert response.status_code == 200
+    assert "event: error" in response.text
+    assert "boom" in response.text
+    assert '"finish_reason":"stop"' not in response.text.replace(" ", "")
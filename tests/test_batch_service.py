@@ -0,0 +1,195 @@
+"""批处理：崩溃后继续执行时跳过已完成的 custom_id 与无效行、跨进程取消、下载快照、ID 校验与调用方隔离"""
+
+import io
+import json
+import threading
+import time
+
+import pytest
+
+from app.core.config import settings
+from app.models.batch import Batch
+from app.services.batch_service import BatchService
+
+ITEMS = [{"custom_id": custom_id, "body": {"q": custom_id}} for custom_id in ("a", "b", "c", "d")]
+
+
+@pytest.fixture
+def service(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "BATCH_DIR", str(tmp_path))
+    monkeypatch.setattr(settings, "BATCH_CONCURRENCY", 2)
+    return BatchService()
+
+
+def upload(service: BatchService, caller: str = "alice"):
+    content = "".join(json.dumps(item) + "\n" for item in ITEMS)
+    return service.save_file(io.BytesIO(content.encode()), "input.jsonl", "batch", caller)
+
+
+def wait_finished(service: BatchService, batch_id: str) -> Batch:
+    deadline = time.monotonic() + 5
+    while True:
+        batch = service.get_batch(batch_id)
+        if batch.status not in ("in_progress", "cancelling"):
+            return batch
+        assert time.monotonic() < deadline, "批处理未在预期时间内结束"
+        time.sleep(0.02)
+
+
+def read_lines(service: BatchService, file_id: str):
+    with service.file_content_path(file_id).open(encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def test_resume_skips_completed_custom_ids(service):
+    input_file = upload(service)
+    output_file = service._create_file("output.jsonl", "batch_output", "alice")
+    error_file = service._create_file("error.jsonl", "batch_output", "alice")
+    batch = Batch(
+        id="batch_" + "0" * 32, endpoint="/v1/chat/completions", input_file_id=input_file.id,
+        completion_window="24h", status="in_progress", output_file_id=output_file.id,
+        error_file_id=error_file.id, caller="alice",
+    )
+    batch.request_counts.total = len(ITEMS)
+    service._save_batch(batch)
+    # 模拟崩溃前的进度：a 已成功、b 已失败，输出文件末尾留下半行
+    with service._file_path(output_file.id).open("w", encoding="utf-8") as f:
+        f.write(json.dumps({"custom_id": "a", "response": {"status_code": 200}}) + "\n")
+        f.write('{"custom_id": "c", "resp')
+    with service._file_path(error_file.id).open("w", encoding="utf-8") as f:
+        f.write(json.dumps({"custom_id": "b", "response": {"status_code": 500}}) + "\n")
+
+    handled = []
+
+    def handler(body, caller):
+        handled.append(body["q"])
+        return {"answer": body["q"]}
+
+    service.resume(handler)
+    batch = wait_finished(service, batch.id)
+
+    assert sorted(handled) == ["c", "d"]
+    assert batch.status == "completed"
+    assert batch.request_counts.completed == 3
+    assert batch.request_counts.failed == 1
+    assert sorted(line["custom_id"] for line in read_lines(service, output_file.id)) == ["a", "c", "d"]
+
+
+def test_create_batch_runs_every_line(service):
+    input_file = upload(service)
+
+    def handler(body, caller):
+        if body["q"] == "b":
+            raise ValueError("失败")
+        return {"answer": body["q"]}
+
+    batch = wait_finished(service, service.create_batch(input_file.id, "24h", None, handler, "alice").id)
+    assert batch.request_counts.total == 4
+    assert batch.request_counts.completed == 3
+    assert batch.request_counts.failed == 1
+    assert [line["custom_id"] for line in read_lines(service, batch.error_file_id)] == ["b"]
+
+
+@pytest.mark.parametrize("file_id", ["../../etc/passwd", "file-../../x", "file-" + "A" * 32, "file-" + "0" * 31])
+def test_rejects_malformed_file_ids(service, file_id):
+    upload(service)
+    assert service.get_file(file_id) is None
+    assert service.file_content_path(file_id) is None
+    with pytest.raises(FileNotFoundError):
+        service.create_batch(file_id, "24h", None, lambda body, caller: body, "alice")
+
+
+def test_rejects_malformed_batch_ids(service):
+    assert service.get_batch("../batches/x") is None
+    assert service.cancel_batch("batch_../../x") is None
+
+
+def test_files_and_batches_are_scoped_to_caller(service):
+    input_file = upload(service, caller="alice")
+    assert service.get_file(input_file.id, "alice") is not None
+    assert service.get_file(input_file.id, "bob") is None
+    assert service.file_content_path(input_file.id, "bob") is None
+    with pytest.raises(FileNotFoundError):
+        service.create_batch(input_file.id, "24h", None, lambda body, caller: body, "bob")
+
+    batch = wait_finished(service, service.create_batch(input_file.id, "24h", None, lambda body, caller: body, "alice").id)
+    assert service.get_batch(batch.id, "bob") is None
+    assert service.cancel_batch(batch.id, "bob") is None
+    assert service.file_content_path(batch.output_file_id, "bob") is None
+    assert [item.id for item in service.list_batches("alice")] == [batch.id]
+    assert service.list_batches("bob") == []
+
+
+def test_handler_runs_as_batch_caller(service):
+    input_file = upload(service, caller="alice")
+    callers = []
+
+    def handler(body, caller):
+        callers.append(caller)
+        return {"answer": body["q"]}
+
+    wait_finished(service, service.create_batch(input_file.id, "24h", None, handler, "alice").id)
+    assert callers == ["alice"] * len(ITEMS)
+
+
+def test_invalid_lines_are_not_recorded_again_on_resume(service):
+    content = json.dumps(ITEMS[0]) + "\n{not json\n" + json.dumps({"body": {"q": "无 ID"}}) + "\n"
+    input_file = service.save_file(io.BytesIO(content.encode()), "input.jsonl", "batch", "alice")
+    handled = []
+
+    def handler(body, caller):
+        handled.append(body["q"])
+        return {"answer": body["q"]}
+
+    batch = wait_finished(service, service.create_batch(input_file.id, "24h", None, handler, "alice").id)
+    assert (batch.request_counts.completed, batch.request_counts.failed) == (2, 1)
+    assert [line.get("line") for line in read_lines(service, batch.error_file_id)] == [2]
+
+    # 模拟崩溃后重启：已记录的行（包括无效行与没有 custom_id 的行）不再处理或记录
+    batch.status = "in_progress"
+    service._save_batch(batch)
+    handled.clear()
+    service.resume(handler)
+    batch = wait_finished(service, batch.id)
+    assert handled == []
+    assert (batch.request_counts.completed, batch.request_counts.failed) == (2, 1)
+    assert len(read_lines(service, batch.error_file_id)) == 1
+    assert len(read_lines(service, batch.output_file_id)) == 2
+
+
+def test_cancel_from_another_worker(service, monkeypatch):
+    monkeypatch.setattr(BatchService, "SAVE_INTERVAL", 0.0)
+    monkeypatch.setattr(settings, "BATCH_CONCURRENCY", 1)
+    runner = BatchService()
+    other = BatchService()
+    input_file = upload(runner)
+    release = threading.Event()
+
+    def handler(body, caller):
+        release.wait(5)
+        return {"answer": body["q"]}
+
+    batch = runner.create_batch(input_file.id, "24h", None, handler, "alice")
+    assert other.cancel_batch(batch.id, "bob") is None
+    assert other.cancel_batch(batch.id, "alice").status == "cancelling"
+    release.set()
+    batch = wait_finished(runner, batch.id)
+    assert batch.status == "cancelled"
+    assert batch.request_counts.completed < len(ITEMS)
+    assert not runner._cancel_path(batch.id).exists()
+
+
+def test_snapshot_excludes_partial_line(service):
+    input_file = upload(service)
+    output_file = service._create_file("output.jsonl", "batch_output", "alice")
+    complete = json.dumps({"custom_id": "a"}) + "\n"
+    with service._file_path(output_file.id).open("w", encoding="utf-8") as f:
+        f.write(complete + '{"custom_id": "b", "resp')
+    path, length = service.file_snapshot(output_file.id, "alice")
+    assert length == len(complete.encode())
+    assert b"".join(service.read_range(path, length, chunk_size=7)) == complete.encode()
+
+    # 上传的文件按原样发送
+    _, input_length = service.file_snapshot(input_file.id, "alice")
+    assert input_length == service._file_path(input_file.id).stat().st_size
+    assert service.file_snapshot(output_file.id, "bob") is None
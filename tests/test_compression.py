@@ -0,0 +1,35 @@
+"""Accept-Encoding 协商"""
+
+import pytest
+
+from app.core.compression import negotiate
+
+SERVER = ["zstd", "gzip", "br"]
+
+
+@pytest.mark.parametrize("accept_encoding, expected", [
+    ("", None),
+    ("identity", None),
+    ("gzip", "gzip"),
+    # q 值相同时按服务端优先级
+    ("gzip, br, zstd", "zstd"),
+    ("br, gzip", "gzip"),
+    # q 值高者优先
+    ("gzip;q=0.5, br", "br"),
+    ("zstd;q=0.1, gzip;q=0.9, br;q=0.5", "gzip"),
+    ("GZIP; q=0.8, Br;q=0.9", "br"),
+    # q=0 表示不接受
+    ("gzip;q=0", None),
+    ("gzip;q=0, *", "zstd"),
+    ("*;q=0.5, zstd;q=0", "gzip"),
+    ("*", "zstd"),
+    # 无法解析的 q 值按不接受处理
+    ("gzip;q=abc, br", "br"),
+])
+def test_negotiate(accept_encoding, expected):
+    assert negotiate(accept_encoding, SERVER) == expected
+
+
+def test_negotiate_only_offers_server_encodings():
+    assert negotiate("br, deflate", ["gzip"]) is None
+    assert negotiate("br, gzip;q=0.1", ["gzip"]) == "gzip"
@@ -0,0 +1,79 @@
+"""请求截止时间：来源、检查与上游超时收紧"""
+
+import contextvars
+import time
+
+import pytest
+
+from app.core.config import settings
+from app.core.deadline import (
+    Deadline, DeadlineExceeded, check_deadline, clamp_timeout, deadline_stats, deadline_var, request_deadline,
+)
+
+
+def run_with(deadline, fn, *args):
+    """在设置了截止时间的独立上下文中执行，避免影响其他测试"""
+    def call():
+        deadline_var.set(deadline)
+        return fn(*args)
+    return contextvars.copy_context().run(call)
+
+
+def test_clamp_without_deadline_is_unchanged():
+    assert clamp_timeout(30) == 30
+    assert clamp_timeout((5, 60)) == (5, 60)
+
+
+def test_clamp_to_remaining_time():
+    clamped = deadline_stats.clamped
+    timeout = run_with(Deadline(2), clamp_timeout, 30)
+    assert 1.5 < timeout <= 2
+    connect, read = run_with(Deadline(2), clamp_timeout, (1, 60))
+    assert connect == 1
+    assert 1.5 < read <= 2
+    assert deadline_stats.clamped == clamped + 2
+
+
+def test_clamp_keeps_shorter_timeouts():
+    clamped = deadline_stats.clamped
+    assert run_with(Deadline(60), clamp_timeout, (1, 5)) == (1, 5)
+    assert deadline_stats.clamped == clamped
+
+
+def test_clamp_never_returns_zero_after_expiry():
+    expired = Deadline(1, started=time.monotonic() - 10)
+    assert run_with(expired, clamp_timeout, 30) == 0.001
+    assert run_with(expired, clamp_timeout, (5, 30)) == (0.001, 0.001)
+
+
+def test_check_deadline_raises_with_stage():
+    run_with(Deadline(60), check_deadline, "query")
+    before = deadline_stats.snapshot()["expired"]["query"]
+    with pytest.raises(DeadlineExceeded) as info:
+        run_with(Deadline(1, started=time.monotonic() - 10), check_deadline, "query")
+    assert info.value.stage == "query"
+    assert deadline_stats.snapshot()["expired"]["query"] == before + 1
+
+
+def test_request_deadline_from_header(monkeypatch):
+    monkeypatch.setattr(settings, "DEADLINE_DEFAULT_TIMEOUT", 0)
+    monkeypatch.setattr(settings, "DEADLINE_CALLER_TIMEOUTS", {})
+    deadline = request_deadline("2.5", "alice", started=100.0)
+    assert deadline.timeout == 2.5
+    assert deadline.expires_at == 102.5
+
+
+@pytest.mark.parametrize("header", ["0", "-1", "nan", "abc", ""])
+def test_request_deadline_rejects_invalid_header(header):
+    with pytest.raises(ValueError):
+        request_deadline(header, "alice")
+
+
+def test_request_deadline_defaults(monkeypatch):
+    monkeypatch.setattr(settings, "DEADLINE_DEFAULT_TIMEOUT", 0)
+    monkeypatch.setattr(settings, "DEADLINE_CALLER_TIMEOUTS", {"alice": 8})
+    assert request_deadline(None, "alice").timeout == 8
+    assert request_deadline(None, "bob") is None
+
+    monkeypatch.setattr(settings, "DEADLINE_DEFAULT_TIMEOUT", 30)
+    assert request_deadline(None, "bob").timeout == 30
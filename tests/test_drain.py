@@ -0,0 +1,128 @@
+"""优雅关闭：在途流等待与中断、drain 期间拒绝新请求、生产模式入口收到 SIGTERM 时让流式响应完成"""
+
+import asyncio
+import os
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+
+import pytest
+import requests
+from fastapi.testclient import TestClient
+
+from app.core.drain import DrainController, drain_controller
+from tests.mock_upstream import start_mock_upstream
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+async def slow_stream(count: int, interval: float):
+    for index in range(count):
+        await asyncio.sleep(interval)
+        yield index
+
+
+async def consume(controller: DrainController, count: int, interval: float):
+    return [item async for item in controller.track(slow_stream(count, interval))]
+
+
+def test_drain_waits_for_inflight_streams():
+    async def run():
+        controller = DrainController()
+        stream = asyncio.create_task(consume(controller, 5, 0.05))
+        await asyncio.sleep(0.01)
+        report = await controller.drain(5)
+        return await stream, report
+
+    items, report = asyncio.run(run())
+    assert items == [0, 1, 2, 3, 4]
+    assert report["drained_streams"] == 1
+    assert report["cut_streams"] == 0
+    assert report["elapsed"] < 5
+
+
+def test_drain_cuts_streams_after_timeout():
+    cut = []
+
+    async def run():
+        controller = DrainController()
+        stream = asyncio.create_task(consume(controller, 1000, 0.02))
+        await asyncio.sleep(0.01)
+        report = await controller.drain(0.2, on_cut=lambda: cut.append(True))
+        return await asyncio.wait_for(stream, 1), report
+
+    items, report = asyncio.run(run())
+    assert len(items) < 1000
+    assert report["cut_streams"] == 1
+    assert cut == [True]
+
+
+def test_draining_rejects_new_requests(monkeypatch):
+    from main import app
+    client = TestClient(app)
+    monkeypatch.setattr(drain_controller, "draining", True)
+    response = client.get("/v1/models")
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
+    health = client.get("/health")
+    assert health.status_code == 503
+    assert health.json()["status"] == "draining"
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@pytest.mark.skipif(not hasattr(signal, "SIGTERM") or sys.platform == "win32", reason="需要 POSIX 信号")
+def test_production_entrypoint_drains_streams_on_sigterm(tmp_path):
+    upstream, base_url = start_mock_upstream(delay=0.05, chunks=40)
+    config = tmp_path / "config.yaml"
+    config.write_text(
+        f'agent:\n  api_base_url: "{base_url}"\n  app_id: "test"\n  api_key: "test"\n'
+        "server:\n  drain_timeout: 10\n  graceful_timeout: 5\n",
+        encoding="utf-8"
+    )
+    port = free_port()
+    env = {**os.environ, "AGENT_CONFIG_FILE": str(config)}
+    process = subprocess.Popen(
+        [sys.executable, "main.py", "--workers", "1", "--port", str(port), "--host", "127.0.0.1"],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    url = f"http://127.0.0.1:{port}"
+    try:
+        deadline = time.monotonic() + 30
+        while True:
+            try:
+                if requests.get(f"{url}/health", timeout=1).status_code == 200:
+                    break
+            except requests.RequestException:
+                pass
+            assert time.monotonic() < deadline, "服务未能启动"
+            time.sleep(0.1)
+
+        response = requests.post(f"{url}/v1/chat/completions", stream=True, timeout=10, json={
+            "model": "m", "messages": [{"role": "user", "content": "q"}], "stream": True
+        })
+        lines = response.iter_lines(decode_unicode=True)
+        received = []
+        for line in lines:
+            received.append(line)
+            if line.startswith("data:"):
+                break
+        # 流进行中向主进程发送 SIGTERM（与 docker stop 相同）
+        process.send_signal(signal.SIGTERM)
+        received.extend(lines)
+        assert "data: [DONE]" in received
+        assert not any(line.startswith("event: error") for line in received)
+        assert process.wait(20) == 0
+    finally:
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+        upstream.shutdown()
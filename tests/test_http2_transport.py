@@ -0,0 +1,148 @@
+"""上游 HTTP/2 传输适配器：经 h2c 复用连接的请求、流式读取、并发流名额与超时"""
+
+import asyncio
+import json
+import socket
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+import requests
+
+from app.services.http2_transport import HTTP2Adapter, _StreamBody, http2_available
+from tests.mock_upstream import create_asgi_upstream
+
+pytestmark = pytest.mark.skipif(not http2_available(), reason="需要 httpx[http2]")
+hypercorn = pytest.importorskip("hypercorn")
+
+CHUNKS = 5
+LARGE_CHUNKS = 500
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture(scope="module")
+def base_url():
+    """在后台线程中以 hypercorn 运行模拟上游（h2c）"""
+    from hypercorn.asyncio import serve
+    from hypercorn.config import Config
+
+    port = free_port()
+    config = Config()
+    config.bind = [f"127.0.0.1:{port}"]
+    config.loglevel = "WARNING"
+    loop = asyncio.new_event_loop()
+    stop = asyncio.Event()
+    small = create_asgi_upstream(0.01, CHUNKS)
+    large = create_asgi_upstream(0, LARGE_CHUNKS)
+
+    async def app(scope, receive, send):
+        # /large 前缀的请求返回不间断的长回答
+        await (large if scope.get("path", "").startswith("/large") else small)(scope, receive, send)
+
+    thread = threading.Thread(
+        target=loop.run_until_complete, args=(serve(app, config, shutdown_trigger=stop.wait),), daemon=True
+    )
+    thread.start()
+    url = f"http://127.0.0.1:{port}"
+    for _ in range(100):
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.1).close()
+            break
+        except OSError:
+            threading.Event().wait(0.05)
+    yield url
+    loop.call_soon_threadsafe(stop.set)
+    thread.join(5)
+
+
+@pytest.fixture
+def session():
+    adapter = HTTP2Adapter(max_streams=4, max_connections=1)
+    http = requests.Session()
+    http.mount("http://", adapter)
+    yield http, adapter
+    http.close()
+
+
+def open_stream(http, url):
+    response = http.post(f"{url}/api/proxy/api/v1/chat_query_v2", json={"ResponseMode": "streaming"},
+                         stream=True, timeout=(5, 5))
+    response.raise_for_status()
+    return response
+
+
+def read_events(response):
+    events = [json.loads(line[5:]) for line in response.iter_lines(decode_unicode=True, chunk_size=1)
+              if line.startswith("data:")]
+    response.close()
+    return events
+
+
+def stream_answers(http, base_url):
+    return read_events(open_stream(http, base_url))
+
+
+def test_json_request(session, base_url):
+    http, _ = session
+    response = http.post(f"{base_url}/api/proxy/api/v1/create_conversation", json={"UserID": "u"}, timeout=5)
+    assert response.status_code == 200
+    assert response.json()["Conversation"]["AppConversationID"]
+
+
+def test_streaming_response(session, base_url):
+    http, _ = session
+    events = stream_answers(http, base_url)
+    assert [event["event"] for event in events] == ["message_start"] + ["message"] * CHUNKS + ["message_end"]
+    assert events[1]["answer"] == "这是第0段回答。"
+
+
+def test_concurrent_streams_share_connection_and_return_slots(session, base_url):
+    http, adapter = session
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        results = list(pool.map(lambda _: stream_answers(http, base_url), range(16)))
+    assert all(events[-1]["event"] == "message_end" for events in results)
+    # 所有流结束后名额全部归还
+    for _ in range(adapter.max_streams):
+        assert adapter._streams.acquire(timeout=1)
+
+
+def test_stream_slots_exhausted_raises_connect_timeout(session, base_url):
+    http, adapter = session
+    for _ in range(adapter.max_streams):
+        adapter._streams.acquire()
+    with pytest.raises(requests.exceptions.ConnectTimeout):
+        http.post(f"{base_url}/api/proxy/api/v1/create_conversation", json={}, timeout=(0.1, 1))
+
+
+def test_connection_error_is_mapped_to_requests(session):
+    http, _ = session
+    with pytest.raises(requests.exceptions.ConnectionError):
+        http.post(f"http://127.0.0.1:{free_port()}/x", json={}, timeout=(1, 1))
+
+
+def test_unread_stream_stops_reading_upstream(session, base_url):
+    http, _ = session
+    response = open_stream(http, f"{base_url}/large")
+    assert response.raw.read(1)
+    # 调用方不再读取时，读取任务最多暂存 MAX_BUFFERED_CHUNKS 个分片
+    threading.Event().wait(0.3)
+    assert response.raw._queue.qsize() <= _StreamBody.MAX_BUFFERED_CHUNKS
+    events = read_events(response)
+    assert events[-1]["event"] == "message_end"
+
+
+def test_closing_unread_stream_returns_slot(session, base_url):
+    http, adapter = session
+    for _ in range(3):
+        response = open_stream(http, f"{base_url}/large")
+        response.raw.read(1)
+        threading.Event().wait(0.1)
+        response.close()
+    # 等待容量的读取任务被唤醒，结束并归还名额
+    for _ in range(adapter.max_streams):
+        assert adapter._streams.acquire(timeout=2)
@@ -0,0 +1,106 @@
+"""异步任务：提交与长轮询、调用方隔离，以及多进程部署下经共享 SQLite 存储跨进程查询"""
+
+import asyncio
+import threading
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.core.config import settings
+from app.models.chat import ChatCompletionResponse, ChatCompletionResponseChoice, ChatMessage
+from app.services.job_service import JobService
+
+ALICE = {"Authorization": "Bearer alice"}
+BOB = {"Authorization": "Bearer bob"}
+
+
+@pytest.fixture
+def client(upstream):
+    from main import app
+    return TestClient(app)
+
+
+@pytest.fixture
+def shared(tmp_path, monkeypatch):
+    """两个共用同一 SQLite 文件的任务服务，模拟两个工作进程"""
+    monkeypatch.setattr(settings, "SESSION_STORE", "sqlite")
+    monkeypatch.setattr(settings, "SESSION_STORE_PATH", str(tmp_path / "sessions.db"))
+    return JobService(), JobService()
+
+
+def completion(answer: str) -> ChatCompletionResponse:
+    return ChatCompletionResponse(
+        id="chatcmpl-test", model="m", object="chat.completion",
+        choices=[ChatCompletionResponseChoice(
+            index=0, message=ChatMessage(role="assistant", content=answer), finish_reason="stop"
+        )],
+    )
+
+
+def test_submit_and_poll(client, upstream):
+    response = client.post("/v1/jobs", headers=ALICE, json={
+        "model": "m", "messages": [{"role": "user", "content": "你好"}]
+    })
+    assert response.status_code == 202
+    job_id = response.json()["id"]
+
+    status = client.get(f"/v1/jobs/{job_id}?wait=5", headers=ALICE).json()
+    assert status["status"] == "succeeded"
+    assert status["result"]["choices"][0]["message"]["content"] == "ok"
+    assert client.get(f"/v1/jobs/{job_id}", headers=BOB).status_code == 404
+    assert client.get("/v1/jobs/job-missing", headers=ALICE).status_code == 404
+
+
+def test_rejects_streaming_jobs(client):
+    response = client.post("/v1/jobs", json={
+        "model": "m", "stream": True, "messages": [{"role": "user", "content": "你好"}]
+    })
+    assert response.status_code == 400
+
+
+def test_job_is_visible_from_another_worker(shared):
+    worker_a, worker_b = shared
+    release = threading.Event()
+
+    def run():
+        release.wait(5)
+        return completion("完成")
+
+    job = worker_a.submit(run, caller="alice")
+    remote = worker_b.get(job.id)
+    assert remote is not None
+    assert remote.caller == "alice"
+    assert remote.status in ("queued", "running")
+    assert remote.future is None
+
+    async def poll():
+        threading.Timer(0.1, release.set).start()
+        return await worker_b.wait(remote, 5)
+
+    finished = asyncio.run(poll())
+    assert finished.status == "succeeded"
+    assert finished.result.choices[0].message.content == "完成"
+    assert worker_b.get("job-missing") is None
+
+
+def test_failed_job_is_visible_from_another_worker(shared):
+    worker_a, worker_b = shared
+
+    def run():
+        raise ValueError("上游失败")
+
+    job = worker_a.submit(run, caller="alice")
+    job.future.result(5)
+    remote = worker_b.get(job.id)
+    assert remote.status == "failed"
+    assert remote.error == "上游失败"
+    assert remote.result is None
+
+
+def test_expired_jobs_are_removed_from_shared_store(shared, monkeypatch):
+    worker_a, worker_b = shared
+    job = worker_a.submit(lambda: completion("完成"), caller="alice")
+    job.future.result(5)
+    monkeypatch.setattr(settings, "JOB_RESULT_TTL", -1)
+    worker_b._last_cleanup = 0.0
+    assert worker_b.get(job.id) is None
@@ -0,0 +1,65 @@
+"""日志管道：入队前格式化异常并释放栈帧、队列满时只丢弃 WARNING 以下的日志"""
+
+import gc
+import json
+import logging
+import queue
+import weakref
+
+from app.core.log_pipeline import BoundedQueueHandler, JsonFormatter, PipelineStats
+
+
+class Payload:
+    """异常发生时栈帧中的局部变量"""
+
+
+def make_handler(max_size: int = 10):
+    return BoundedQueueHandler(queue.Queue(), PipelineStats(), message_max_chars=4096, max_size=max_size)
+
+
+def make_logger(handler: logging.Handler) -> logging.Logger:
+    logger = logging.getLogger(f"test_log_pipeline.{id(handler)}")
+    logger.propagate = False
+    logger.handlers = [handler]
+    logger.setLevel(logging.DEBUG)
+    return logger
+
+
+def test_exception_is_formatted_and_frames_released():
+    handler = make_handler()
+    logger = make_logger(handler)
+
+    def fail():
+        payload = Payload()
+        try:
+            raise ValueError("失败")
+        except ValueError:
+            logger.exception("处理失败")
+        return weakref.ref(payload)
+
+    ref = fail()
+    gc.collect()
+    # 队列中的记录不再引用栈帧，局部变量已被回收
+    assert ref() is None
+    record = handler.queue.get_nowait()
+    assert record.exc_info is None
+    assert "ValueError: 失败" in record.exc_text
+
+    text = logging.Formatter("%(message)s").format(record)
+    assert text.startswith("处理失败\nTraceback")
+    entry = json.loads(JsonFormatter().format(record))
+    assert "ValueError: 失败" in entry["exc_info"]
+
+
+def test_full_queue_drops_only_below_warning():
+    handler = make_handler(max_size=2)
+    logger = make_logger(handler)
+    for index in range(3):
+        logger.info("info %d", index)
+    logger.warning("warning")
+    logger.error("error")
+
+    messages = [handler.queue.get_nowait().getMessage() for _ in range(handler.queue.qsize())]
+    assert messages == ["info 0", "info 1", "warning", "error"]
+    assert handler.stats.dropped == 1
+    assert handler.stats.enqueued == 4
@@ -0,0 +1,151 @@
+"""近似重复缓存：MinHash 候选 + Jaccard 校验、命名空间与淘汰、只缓存完整的回答"""
+
+import time
+import uuid
+from types import SimpleNamespace
+
+import pytest
+
+from app.core.config import settings
+from app.services.prompt_cache import PromptCache, cache_key, jaccard, normalize, shingles
+from tests.fake_upstream import MESSAGE_END, failed, message
+
+NAMESPACE = "caller\x00model\x00你是校园助手"
+QUESTION = "图书馆周一的开放时间是几点到几点"
+
+
+def test_normalize_and_jaccard():
+    assert normalize("  请问，Library  OPEN? ") == "请问libraryopen"
+    a = shingles(normalize(QUESTION))
+    assert jaccard(a, a) == 1.0
+    assert jaccard(a, shingles("完全无关的内容")) == 0.0
+
+
+def test_near_duplicate_hits():
+    cache = PromptCache(max_entries=100, threshold=0.85, ttl=3600)
+    cache.store(NAMESPACE, QUESTION, "8:00-22:00")
+    for variant in (QUESTION, f"  {QUESTION}？ ", QUESTION.replace("几点到几点", "几点到几点!!"), f"请问{QUESTION}"):
+        hit = cache.lookup(NAMESPACE, variant)
+        assert hit is not None, variant
+        assert hit.answer == "8:00-22:00"
+        assert hit.similarity >= 0.85
+    assert cache.lookup(NAMESPACE, QUESTION).similarity == 1.0
+
+
+def test_similar_but_different_question_misses():
+    cache = PromptCache(max_entries=100, threshold=0.85, ttl=3600)
+    cache.store(NAMESPACE, QUESTION, "8:00-22:00")
+    assert cache.lookup(NAMESPACE, QUESTION.replace("周一", "周日")) is None
+    assert cache.lookup(NAMESPACE, "食堂几点关门") is None
+    stats = cache.snapshot()
+    assert stats["hits"] == 0
+    assert stats["misses"] == 2
+
+
+def test_namespaces_are_isolated():
+    cache = PromptCache(max_entries=100, threshold=0.85, ttl=3600)
+    cache.store(NAMESPACE, QUESTION, "answer")
+    assert cache.lookup("other\x00model\x00你是校园助手", QUESTION) is None
+    assert cache.lookup("caller\x00other-model\x00你是校园助手", QUESTION) is None
+
+
+def test_capacity_evicts_oldest_entries():
+    cache = PromptCache(max_entries=2, threshold=0.85, ttl=3600)
+    questions = ["图书馆几点开门", "校园网密码怎么找回", "怎么申请国家奖学金"]
+    for question in questions:
+        cache.store(NAMESPACE, question, question)
+    assert cache.snapshot()["entries"] == 2
+    assert cache.lookup(NAMESPACE, questions[0]) is None
+    assert cache.lookup(NAMESPACE, questions[2]).answer == questions[2]
+
+    cache.resize(1, 0.85, 3600)
+    assert cache.snapshot()["entries"] == 1
+    assert cache.lookup(NAMESPACE, questions[1]) is None
+
+
+def test_expired_entries_are_not_returned():
+    cache = PromptCache(max_entries=100, threshold=0.85, ttl=0.01)
+    cache.store(NAMESPACE, QUESTION, "answer")
+    time.sleep(0.05)
+    assert cache.lookup(NAMESPACE, QUESTION) is None
+
+
+def test_stale_bucket_ids_are_skipped():
+    cache = PromptCache(max_entries=100, threshold=0.85, ttl=3600)
+    cache.store(NAMESPACE, QUESTION, "answer")
+    # 条目已不在条目表中，但段中仍有其编号
+    cache._entries.clear()
+    assert cache.lookup(NAMESPACE, QUESTION) is None
+
+
+def test_cache_key_partitions_by_caller_and_model(monkeypatch):
+    monkeypatch.setattr(settings, "PROMPT_CACHE_ENABLED", True)
+    monkeypatch.setattr(settings, "PROMPT_CACHE_CALLERS", ["*"])
+    monkeypatch.setattr(settings, "PROMPT_CACHE_SHARED", False)
+    messages = [SimpleNamespace(role="system", content="s"), SimpleNamespace(role="user", content="q")]
+
+    namespace, query = cache_key(messages, "alice", "model-a")
+    assert query == "q"
+    assert namespace != cache_key(messages, "bob", "model-a")[0]
+    assert namespace != cache_key(messages, "alice", "model-b")[0]
+
+    monkeypatch.setattr(settings, "PROMPT_CACHE_SHARED", True)
+    assert cache_key(messages, "alice", "model-a")[0] == cache_key(messages, "bob", "model-a")[0]
+
+
+def test_cache_key_skips_ineligible_requests(monkeypatch):
+    monkeypatch.setattr(settings, "PROMPT_CACHE_ENABLED", True)
+    monkeypatch.setattr(settings, "PROMPT_CACHE_CALLERS", ["alice"])
+    single = [SimpleNamespace(role="user", content="q")]
+    multi_turn = single + [SimpleNamespace(role="assistant", content="a"), SimpleNamespace(role="user", content="q2")]
+
+    assert cache_key(single, "alice", "m") is not None
+    assert cache_key(single, "bob", "m") is None
+    assert cache_key(multi_turn, "alice", "m") is None
+    assert cache_key(single, "alice", "m", n=2) is None
+    assert cache_key(single, "alice", "m", stop=["x"]) is None
+    assert cache_key(single, "alice", "m", token_limit=10) is None
+
+
+@pytest.fixture
+def cached_client(upstream, monkeypatch):
+    from fastapi.testclient import TestClient
+    from main import app
+    monkeypatch.setattr(settings, "PROMPT_CACHE_ENABLED", True)
+    monkeypatch.setattr(settings, "PROMPT_CACHE_CALLERS", ["*"])
+    monkeypatch.setattr(settings, "PROMPT_CACHE_SHARED", False)
+    return TestClient(app)
+
+
+def chat(question: str, **extra):
+    return {"model": "m", "messages": [{"role": "user", "content": question}], **extra}
+
+
+def test_failed_upstream_answer_is_not_cached(cached_client, upstream):
+    question = f"{uuid.uuid4().hex} 图书馆几点开门"
+    upstream.replies += [[message("partial "), failed()], [message("8:00"), MESSAGE_END]]
+
+    assert cached_client.post("/v1/chat/completions", json=chat(question)).status_code == 502
+    response = cached_client.post("/v1/chat/completions", json=chat(question))
+    assert response.headers["X-Prompt-Cache"] == "miss"
+    assert response.json()["choices"][0]["message"]["content"] == "8:00"
+
+    response = cached_client.post("/v1/chat/completions", json=chat(question))
+    assert response.headers["X-Prompt-Cache"].startswith("hit")
+    assert response.json()["choices"][0]["message"]["content"] == "8:00"
+
+
+def test_failed_stream_answer_is_not_cached(cached_client, upstream):
+    question = f"{uuid.uuid4().hex} 食堂几点关门"
+    upstream.replies += [[message("partial "), failed()], [message("partial ")]]
+
+    for _ in range(2):
+        response = cached_client.post("/v1/chat/completions", json=chat(question, stream=True))
+        assert response.headers["X-Prompt-Cache"] == "miss"
+        assert "event: error" in response.text
+
+    upstream.replies.append([message("21:00"), MESSAGE_END])
+    cached_client.post("/v1/chat/completions", json=chat(question, stream=True))
+    response = cached_client.post("/v1/chat/completions", json=chat(question))
+    assert response.headers["X-Prompt-Cache"].startswith("hit")
+    assert response.json()["choices"][0]["message"]["content"] == "21:00"
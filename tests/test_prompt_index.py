@@ -0,0 +1,48 @@
+"""系统提示词索引：条目数与字节预算淘汰、过大的提示词不驻留"""
+
+import sys
+
+from app.services.prompt_index import MAX_ENTRY_SHARE, PromptIndex
+
+
+def prompt(char: str, length: int = 1000) -> str:
+    return char * length
+
+
+def test_interns_and_reuses_long_prompts():
+    index = PromptIndex(max_entries=4, min_length=10)
+    assert index.intern("short") is None
+    entry = index.intern(prompt("a"))
+    assert index.intern(prompt("a")) is entry
+    assert index.system_segment(prompt("a")) == entry.segment
+    assert (index.hits, index.misses) == (2, 1)
+
+
+def test_evicts_by_byte_budget():
+    entry_size = 2 * sys.getsizeof(prompt("a"))
+    index = PromptIndex(max_entries=100, min_length=10, max_bytes=entry_size * MAX_ENTRY_SHARE)
+    for char in "abcdefghij":
+        index.intern(prompt(char))
+    snapshot = index.snapshot()
+    assert snapshot["entries"] < 10
+    assert 0 < snapshot["bytes"] <= index.max_bytes
+    # 最近使用的保留，最早的被淘汰
+    assert index.intern(prompt("j")).hits == 2
+    assert index.intern(prompt("a")).hits == 1
+
+
+def test_skips_oversized_prompts():
+    index = PromptIndex(max_entries=100, min_length=10, max_bytes=64 * 1024)
+    index.intern(prompt("a"))
+    assert index.intern(prompt("b", 64 * 1024)) is None
+    assert index.snapshot()["oversized"] == 1
+    assert index.snapshot()["entries"] == 1
+    assert index.system_segment(prompt("b", 64 * 1024)) == "[SYSTEM]: " + prompt("b", 64 * 1024)
+
+
+def test_resize_applies_byte_budget():
+    index = PromptIndex(max_entries=100, min_length=10, max_bytes=1024 * 1024)
+    for char in "abcd":
+        index.intern(prompt(char))
+    index.resize(100, 10, 2 * sys.getsizeof(prompt("a")) * 2 + 200)
+    assert index.snapshot()["entries"] == 2
@@ -0,0 +1,90 @@
+"""聊天请求的快速解析：校验错误与 FastAPI 一致（422），接口层的 400"""
+
+import json
+
+import pytest
+from fastapi.exceptions import RequestValidationError
+from fastapi.testclient import TestClient
+
+from app.models.slim import parse_chat_request
+
+VALID = {"model": "m", "messages": [{"role": "system", "content": "s"}, {"role": "user", "content": "q"}]}
+
+
+def body(**changes) -> bytes:
+    data = {**VALID, **changes}
+    return json.dumps({key: value for key, value in data.items() if value is not ...}).encode()
+
+
+def error_types(raw: bytes):
+    with pytest.raises(RequestValidationError) as info:
+        parse_chat_request(raw)
+    return [(error["type"], error["loc"]) for error in info.value.errors()]
+
+
+def test_parses_valid_request():
+    request = parse_chat_request(body(stop="END", max_tokens=10, n=2, stream=True, temperature=0.5))
+    assert request.model == "m"
+    assert [(message.role, message.content) for message in request.messages] == [("system", "s"), ("user", "q")]
+    assert request.stop == "END"
+    assert request.max_tokens == 10
+    assert request.n == 2
+    assert request.stream is True
+
+
+def test_defaults():
+    request = parse_chat_request(body())
+    assert request.n == 1
+    assert request.stream is False
+    assert request.stop is None
+
+
+@pytest.mark.parametrize("raw, expected", [
+    (b"{not json", [("json_invalid", ("body", 1))]),
+    (b"[]", [("model_attributes_type", ("body",))]),
+    (body(model=...), [("missing", ("body", "model"))]),
+    (body(model=1), [("string_type", ("body", "model"))]),
+    (body(messages=...), [("missing", ("body", "messages"))]),
+    (body(messages="hi"), [("list_type", ("body", "messages"))]),
+    (body(messages=["hi"]), [("model_attributes_type", ("body", "messages", 0))]),
+    (body(messages=[{"role": "bot", "content": "x"}]), [("literal_error", ("body", "messages", 0, "role"))]),
+    (body(messages=[{"role": "user", "content": None}]), [("string_type", ("body", "messages", 0, "content"))]),
+    (body(temperature="hot"), [("float_type", ("body", "temperature"))]),
+    (body(max_tokens=0), [("greater_than_equal", ("body", "max_tokens"))]),
+    (body(stop=["a", 1]), [("union_type", ("body", "stop"))]),
+    (body(n=0), [("greater_than_equal", ("body", "n"))]),
+    (body(n=True), [("greater_than_equal", ("body", "n"))]),
+    (body(stream="yes"), [("bool_type", ("body", "stream"))]),
+])
+def test_validation_errors(raw, expected):
+    assert error_types(raw) == expected
+
+
+def test_reports_all_errors_at_once():
+    errors = error_types(body(model=1, n=0, stream="yes"))
+    assert [loc for _, loc in errors] == [("body", "model"), ("body", "n"), ("body", "stream")]
+
+
+@pytest.fixture(scope="module")
+def client():
+    from main import app
+    return TestClient(app)
+
+
+def test_endpoint_returns_422_for_invalid_body(client):
+    response = client.post("/v1/chat/completions", json={"model": "m", "messages": "hi"})
+    assert response.status_code == 422
+    assert response.json()["detail"][0]["loc"] == ["body", "messages"]
+
+
+def test_endpoint_returns_400_for_empty_messages(client):
+    response = client.post("/v1/chat/completions", json={"model": "m", "messages": []})
+    assert response.status_code == 400
+    assert response.json()["detail"] == "消息列表不能为空"
+
+
+@pytest.mark.parametrize("stop", [["a", "b", "c", "d", "e"], "x" * 10000])
+def test_endpoint_returns_400_for_too_many_or_long_stops(client, stop):
+    response = client.post("/v1/chat/completions", json={"model": "m", "messages": [{"role": "user", "content": "q"}],
+                                                          "stop": stop})
+    assert response.status_code == 400
@@ -0,0 +1,99 @@
+"""运行时监控：阻塞告警列出在途请求，流缓冲线程池与选择线程的占用统计"""
+
+import asyncio
+import logging
+import time
+
+from app.core.config import settings
+from app.services import runtime_monitor as runtime_monitor_module
+from app.services.runtime_monitor import InflightMiddleware, RuntimeMonitor
+from app.services.stream_buffer import stream_registry
+
+
+class ListHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+
+def http_scope(path: str):
+    return {"type": "http", "method": "POST", "path": path, "headers": []}
+
+
+async def send_nothing(message):
+    pass
+
+
+def test_middleware_tracks_inflight_requests():
+    monitor = RuntimeMonitor()
+    seen = []
+
+    async def app(scope, receive, send):
+        seen.append(monitor.longest_requests())
+        assert monitor.snapshot()["inflight_requests"] == 1
+
+    asyncio.run(InflightMiddleware(app, monitor)(http_scope("/v1/chat/completions"), None, send_nothing))
+    assert [path for path, _ in seen[0]] == ["POST /v1/chat/completions"]
+    assert monitor.longest_requests() == []
+
+
+def test_longest_requests_are_oldest_first():
+    monitor = RuntimeMonitor()
+    monitor.request_started(1, "POST /new")
+    monitor.request_started(2, "POST /old")
+    monitor._inflight[2] = ("POST /old", time.monotonic() - 10)
+    assert [path for path, _ in monitor.longest_requests(limit=1)] == ["POST /old"]
+    monitor.request_finished(2)
+    assert [path for path, _ in monitor.longest_requests()] == ["POST /new"]
+
+
+def test_stall_warning_names_inflight_route():
+    monitor = RuntimeMonitor()
+    handler = ListHandler()
+    runtime_monitor_module.logger.addHandler(handler)
+
+    async def blocking_app(scope, receive, send):
+        # 同步阻塞事件循环
+        time.sleep(0.6)
+
+    async def main():
+        monitor.start(interval=0.05, lag_threshold=0.1)
+        await asyncio.sleep(0.1)
+        await InflightMiddleware(blocking_app, monitor)(http_scope("/v1/slow"), None, send_nothing)
+        await monitor.stop()
+
+    try:
+        asyncio.run(main())
+    finally:
+        runtime_monitor_module.logger.removeHandler(handler)
+    stalls = [message for message in handler.messages if "事件循环阻塞" in message]
+    assert monitor.stall_count >= 1
+    assert stalls and "POST /v1/slow" in stalls[0]
+    assert "blocking_app" in stalls[0]
+
+
+def test_stream_pool_saturation(monkeypatch):
+    monitor = RuntimeMonitor()
+    monkeypatch.setattr(settings, "STREAM_WORKERS", 2)
+    monkeypatch.setattr(stream_registry, "active", 1)
+    monitor._sample_stream_pool()
+    assert monitor.snapshot()["stream_pool_busy"] == 1
+    assert monitor.stream_pool_saturated_count == 0
+    monkeypatch.setattr(stream_registry, "active", 2)
+    monitor._sample_stream_pool()
+    snapshot = monitor.snapshot()
+    assert snapshot["stream_pool_size"] == 2
+    assert snapshot["stream_pool_saturated_count"] == 1
+
+
+def test_choice_threads_are_counted():
+    monitor = RuntimeMonitor()
+    with monitor.choice_thread():
+        with monitor.choice_thread():
+            assert monitor.snapshot()["choice_threads_busy"] == 2
+    snapshot = monitor.snapshot()
+    assert snapshot["choice_threads_busy"] == 0
+    assert snapshot["choice_threads_max"] == 2
@@ -0,0 +1,138 @@
+"""多进程服务器主进程：滚动重启在监控循环中逐步推进，不阻塞退出信号与工作进程回收"""
+
+import itertools
+import threading
+
+import pytest
+
+from app.core import server as server_module
+from app.core.server import PreforkServer
+
+_pids = itertools.count(1000)
+
+
+class FakeProcess:
+    """模拟工作进程：terminate() 只记录信号，由测试决定何时退出"""
+
+    def __init__(self):
+        self.pid = next(_pids)
+        self.alive = True
+        self.exitcode = None
+        self.terminations = 0
+        self.killed = False
+
+    def is_alive(self):
+        return self.alive
+
+    def terminate(self):
+        self.terminations += 1
+
+    def kill(self):
+        self.killed = True
+        self.exit()
+
+    def join(self, timeout=None):
+        pass
+
+    def exit(self, code=0):
+        self.alive = False
+        self.exitcode = code
+
+
+@pytest.fixture
+def prefork(monkeypatch):
+    server = PreforkServer("127.0.0.1", 0, workers=2)
+    spawned = []
+
+    def spawn():
+        process, ready = FakeProcess(), threading.Event()
+        server._started[process.pid] = server_module.time.monotonic()
+        spawned.append((process, ready))
+        return process, ready
+
+    monkeypatch.setattr(server, "_spawn", spawn)
+    server.spawned = spawned
+    server.workers = [spawn()[0] for _ in range(2)]
+    return server
+
+
+def test_rolling_restart_advances_without_blocking(prefork):
+    old = list(prefork.workers)
+    prefork.rolling_restart()
+    new, ready = prefork.spawned[-1]
+    assert prefork.workers == old
+
+    # 新进程未就绪时推进不做任何事，也不等待
+    prefork._advance_restart()
+    assert prefork.workers == old
+    assert old[0].terminations == 0
+
+    ready.set()
+    prefork._advance_restart()
+    assert prefork.workers == [old[1], new]
+    assert old[0].terminations == 1
+    assert old[0].pid in prefork._retiring
+    second, second_ready = prefork.spawned[-1]
+    assert second is not new
+
+    # 旧进程退出后被回收，不会被当作意外退出而重启
+    old[0].exit()
+    prefork._reap_workers()
+    prefork._check_retiring()
+    assert prefork._retiring == {}
+    assert prefork._respawns == []
+
+    second_ready.set()
+    prefork._advance_restart()
+    assert prefork.workers == [new, second]
+    assert prefork._restart_queue == []
+    assert prefork._incoming is None
+
+
+def test_crashed_worker_is_respawned_during_restart(prefork):
+    old = list(prefork.workers)
+    prefork.rolling_restart()
+    old[1].exit(1)
+    prefork._reap_workers()
+    assert old[1] not in prefork.workers
+    assert len(prefork._respawns) == 1
+
+
+def test_restart_aborts_when_new_worker_dies(prefork):
+    old = list(prefork.workers)
+    prefork.rolling_restart()
+    new, _ready = prefork.spawned[-1]
+    new.exit(1)
+    prefork._advance_restart()
+    assert prefork.workers == old
+    assert prefork._incoming is None
+    assert prefork._restart_queue == []
+
+
+def test_retiring_worker_is_killed_after_stop_timeout(prefork):
+    old = prefork.workers[0]
+    prefork.workers.remove(old)
+    prefork._retire(old)
+    prefork._check_retiring()
+    assert not old.killed
+    prefork._retiring[old.pid] = (old, 0.0)
+    prefork._check_retiring()
+    assert old.killed
+    assert prefork._retiring == {}
+
+
+def test_shutdown_during_restart_stops_every_process(prefork):
+    old = list(prefork.workers)
+    prefork.rolling_restart()
+    new, ready = prefork.spawned[-1]
+    ready.set()
+    prefork._advance_restart()
+    incoming, _ready = prefork.spawned[-1]
+
+    prefork._shutdown()
+    assert incoming.terminations == 1
+    assert new.terminations == 1
+    assert old[1].terminations == 1
+    # 正在退出的旧进程不再收到第二次 SIGTERM（否则会跳过 drain）
+    assert old[0].terminations == 1
+    assert prefork._retiring == {}
@@ -0,0 +1,187 @@
+"""流缓冲：续传、暂停与中断、生产者线程池上限"""
+
+import asyncio
+import inspect
+import threading
+import time
+
+import pytest
+
+from app.core.config import settings
+from app.services.stream_buffer import StreamCapacityError, StreamRegistry, _event_size
+
+CAP = 1000
+PAYLOAD = "x" * 100
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    monkeypatch.setattr(settings, "STREAM_BUFFER_STREAM_MAX_BYTES", CAP)
+    monkeypatch.setattr(settings, "STREAM_BUFFER_MAX_BYTES", 64 * 1024 * 1024)
+    monkeypatch.setattr(settings, "STREAM_BUFFER_OVERFLOW", "pause")
+    monkeypatch.setattr(settings, "STREAM_BUFFER_GRACE", 5)
+    monkeypatch.setattr(settings, "STREAM_WORKERS", 8)
+    return StreamRegistry()
+
+
+class Source:
+    """产生 count 个事件的上游，记录是否被关闭"""
+
+    def __init__(self, count: int, gate: threading.Event = None):
+        self.count = count
+        self.gate = gate
+        self.closed = False
+
+    def __iter__(self):
+        try:
+            if self.gate is not None:
+                self.gate.wait(5)
+            for index in range(self.count):
+                yield None, f"{index:03d}{PAYLOAD}"
+        finally:
+            self.closed = True
+
+    def generator(self):
+        return iter(self)
+
+
+def collect(buffered, start: int = 0):
+    async def run():
+        return [(seq, event) async for seq, event in buffered.aiter_from(start)]
+    return asyncio.run(run())
+
+
+def wait_for(predicate, timeout: float = 5.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "等待超时"
+        time.sleep(0.01)
+
+
+def max_pending() -> int:
+    return CAP + _event_size((None, f"000{PAYLOAD}"))
+
+
+def test_resume_from_sequence(registry):
+    buffered = registry.start("chatcmpl-a:", Source(5).generator(), caller="alice")
+    wait_for(lambda: buffered.done)
+    assert buffered.caller == "alice"
+
+    events = collect(buffered, 0)
+    assert [seq for seq, _ in events] == [0, 1, 2, 3, 4]
+    resumed = collect(buffered, 3)
+    assert resumed == events[3:]
+    assert collect(buffered, 5) == []
+
+
+def test_resume_before_trimmed_events_returns_nothing(registry):
+    buffered = registry.start("s", Source(5).generator())
+    wait_for(lambda: buffered.done)
+    collect(buffered, 0)
+    assert buffered.trim_delivered() > 0
+    assert buffered.base == 5
+    assert collect(buffered, 0) == []
+
+
+def test_pause_bounds_pending_until_client_reads(registry):
+    source = Source(50)
+    buffered = registry.start("s", source.generator())
+    wait_for(lambda: buffered.paused_since is not None)
+    assert not buffered.done
+    assert buffered.pending <= max_pending()
+
+    events = collect(buffered, 0)
+    assert [event[1][:3] for _, event in events] == [f"{index:03d}" for index in range(50)]
+    assert registry.paused >= 1
+    assert registry.dropped == 0
+
+
+def test_pause_drops_after_grace(registry, monkeypatch):
+    monkeypatch.setattr(settings, "STREAM_BUFFER_GRACE", 0.1)
+    source = Source(50)
+    buffered = registry.start("s", source.generator())
+    wait_for(lambda: buffered.done)
+    assert buffered.events[-1][0] == "error"
+    assert registry.dropped == 1
+    assert source.closed
+
+
+def test_drop_enforces_cap_immediately(registry, monkeypatch):
+    monkeypatch.setattr(settings, "STREAM_BUFFER_OVERFLOW", "drop")
+    source = Source(50)
+    buffered = registry.start("s", source.generator())
+    wait_for(lambda: buffered.done, timeout=1.0)
+    assert buffered.events[-1][0] == "error"
+    # 中断前写入的内容不超过上限加一个事件
+    assert buffered.pending - _event_size(buffered.events[-1]) <= max_pending()
+    assert registry.dropped == 1
+    assert source.closed
+
+
+def test_rejects_streams_when_workers_are_busy(registry, monkeypatch):
+    monkeypatch.setattr(settings, "STREAM_WORKERS", 1)
+    gate = threading.Event()
+    first = registry.start("first", Source(1, gate).generator())
+
+    rejected = Source(1).generator()
+    with pytest.raises(StreamCapacityError):
+        registry.start("second", rejected)
+    assert inspect.getgeneratorstate(rejected) == inspect.GEN_CLOSED
+    assert registry.get("second") is None
+    assert registry.snapshot()["rejected"] == 1
+
+    gate.set()
+    wait_for(lambda: first.done)
+    wait_for(lambda: registry.active == 0)
+    third = registry.start("third", Source(1).generator())
+    wait_for(lambda: third.done)
+
+
+def test_discard_cancels_running_producer(registry):
+    gate = threading.Event()
+    source = Source(50, gate)
+    buffered = registry.start("s", source.generator())
+    registry.discard(buffered)
+    gate.set()
+    wait_for(lambda: buffered.done)
+    assert source.closed
+    assert len(buffered.events) <= 1
+    assert registry.get("s") is None
+    assert registry.total_bytes == 0
+
+
+def test_discard_wakes_paused_producer(registry):
+    source = Source(50)
+    buffered = registry.start("s", source.generator())
+    wait_for(lambda: buffered.paused_since is not None)
+    registry.discard(buffered)
+    wait_for(lambda: buffered.done, timeout=1.0)
+    assert source.closed
+    assert registry.get("s") is None
+    assert registry.dropped == 0
+
+
+def test_merged_choices_stop_reading_when_consumer_stalls():
+    from app.api.endpoints.chat import MERGE_QUEUE_SIZE, merge_choice_streams
+
+    produced = [0, 0]
+    finished = threading.Event()
+
+    def source(index):
+        def generate():
+            try:
+                for item in range(10000):
+                    produced[index] += 1
+                    yield index, item
+            finally:
+                if all(count for count in produced):
+                    finished.set()
+        return generate
+
+    merged = merge_choice_streams([source(0), source(1)], concurrency=2)
+    assert next(merged) is not None
+    time.sleep(0.3)
+    # 合并队列已满时各选择停止读取：每个选择最多再多读一个等待放入队列的增量
+    assert sum(produced) <= MERGE_QUEUE_SIZE + 1 + 2
+    merged.close()
+    assert finished.wait(2)
@@ -0,0 +1,106 @@
+"""停止序列匹配与回答限制"""
+
+import pytest
+
+from app.utils.text import MAX_STOP_LENGTH, CompletionLimiter, StopMatcher, check_stop
+
+
+class ClosingSource:
+    """记录是否被关闭的分片来源"""
+
+    def __init__(self, chunks):
+        self.chunks = list(chunks)
+        self.closed = False
+
+    def __iter__(self):
+        return iter(self.chunks)
+
+    def close(self):
+        self.closed = True
+
+
+def test_stop_matcher_holds_possible_prefix_across_chunks():
+    matcher = StopMatcher(["END"])
+    assert matcher.feed("Hello EN") == "Hello "
+    assert not matcher.stopped
+    assert matcher.feed("D more") == ""
+    assert matcher.stopped
+    assert matcher.feed("ignored") == ""
+
+
+def test_stop_matcher_releases_held_text_when_prefix_does_not_match():
+    matcher = StopMatcher(["END"])
+    assert matcher.feed("abc E") == "abc "
+    assert matcher.feed("xit") == "Exit"
+    assert matcher.feed("E") == ""
+    assert matcher.flush() == "E"
+    assert not matcher.stopped
+
+
+def test_stop_matcher_stops_at_earliest_of_several_sequences():
+    matcher = StopMatcher(["\n\n", "Observation:"])
+    assert matcher.feed("answer Observation: x\n\n") == "answer "
+    assert matcher.stopped
+
+
+def test_stop_matcher_ignores_empty_sequences():
+    matcher = StopMatcher(["", "X"])
+    assert matcher.feed("abc") == "abc"
+
+
+def test_limiter_stop_sequence_split_across_chunks():
+    source = ClosingSource(["foo ST", "OP bar", "never read"])
+    limiter = CompletionLimiter("STOP")
+    assert "".join(limiter.apply(source)) == "foo "
+    assert limiter.finish_reason == "stop"
+    assert source.closed
+
+
+def test_limiter_flushes_held_text_at_end_of_stream():
+    limiter = CompletionLimiter(["STOP"])
+    assert "".join(limiter.apply(iter(["abc S", "T"]))) == "abc ST"
+    assert limiter.finish_reason == "stop"
+
+
+def test_limiter_max_tokens_truncates_and_reports_length():
+    # CJK 字符每个估算为 1 个 token
+    source = ClosingSource(["一二", "三四五", "六"])
+    limiter = CompletionLimiter(max_tokens=3)
+    assert list(limiter.apply(source)) == ["一二", "三"]
+    assert limiter.finish_reason == "length"
+    assert source.closed
+
+
+def test_limiter_without_limits_passes_chunks_through():
+    limiter = CompletionLimiter()
+    assert not limiter.enabled
+    assert list(limiter.apply(iter(["a", "b"]))) == ["a", "b"]
+    assert limiter.finish_reason == "stop"
+
+
+def test_stop_matcher_holds_longest_overlapping_prefix():
+    # 末尾 "abab" 的后缀 "ab"、"abab" 都是 "ababc" 的前缀，暂存最长的
+    matcher = StopMatcher(["ababc"])
+    assert matcher.feed("xxabab") == "xx"
+    assert matcher.feed("ab") == "ab"
+    assert matcher.feed("c") == ""
+    assert matcher.stopped
+
+
+def test_stop_matcher_memory_is_linear_in_stop_length():
+    stop = "x" * MAX_STOP_LENGTH
+    matcher = StopMatcher([stop])
+    assert sum(len(failure) for failure in matcher._failures) == len(stop)
+    assert matcher.feed("x" * (len(stop) - 1)) == ""
+    assert matcher.feed("y") == "x" * (len(stop) - 1) + "y"
+
+
+@pytest.mark.parametrize("stop", [None, "END", ["a", "b", "c", "d"], ["x" * MAX_STOP_LENGTH]])
+def test_check_stop_accepts(stop):
+    check_stop(stop)
+
+
+@pytest.mark.parametrize("stop", [["a", "b", "c", "d", "e"], "x" * (MAX_STOP_LENGTH + 1), ["ok", "x" * 10000]])
+def test_check_stop_rejects(stop):
+    with pytest.raises(ValueError):
+        check_stop(stop)
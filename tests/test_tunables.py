@@ -0,0 +1,108 @@
+"""运行时重新加载：可调参数的切换与回调、校验失败时整体拒绝并保持原配置、需要重启的配置只报告不切换"""
+
+import os
+from pathlib import Path
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.core import tunables
+from app.core.config import settings
+from app.core.tunables import ReloadError, reload_settings
+from app.utils.lazy import resolve
+
+BASE_CONFIG = 'agent:\n  app_id: "test_app_id"\n  api_key: "test_api_key"\n'
+
+
+@pytest.fixture
+def config_file():
+    """改写测试配置文件；结束时恢复原内容并重新加载，撤销已切换的可调参数"""
+    path = Path(os.environ["AGENT_CONFIG_FILE"])
+    original = path.read_text(encoding="utf-8")
+    yield path
+    path.write_text(original, encoding="utf-8")
+    reload_settings()
+
+
+@pytest.fixture
+def calls():
+    """记录 on_reload 回调收到的变化"""
+    received = []
+
+    def callback(new, changed):
+        received.append((new, changed))
+
+    tunables.on_reload(callback)
+    yield received
+    tunables._subscribers.remove(callback)
+
+
+def write(path: Path, extra: str):
+    path.write_text(BASE_CONFIG + extra, encoding="utf-8")
+
+
+def test_reload_switches_tunables_and_notifies(config_file, calls):
+    before = resolve(settings)
+    write(config_file, "  max_choices: 3\n  choice_concurrency: 2\n")
+    report = reload_settings()
+
+    assert report["changed"] == {"CHOICE_CONCURRENCY": [4, 2], "MAX_CHOICES": [8, 3]}
+    assert report["restart_required"] == []
+    assert (settings.MAX_CHOICES, settings.CHOICE_CONCURRENCY) == (3, 2)
+    # 切换为新的配置对象，已取得旧对象的在途请求不受影响
+    assert resolve(settings) is not before
+    assert before.MAX_CHOICES == 8
+    assert calls == [(resolve(settings), {"MAX_CHOICES", "CHOICE_CONCURRENCY"})]
+
+
+@pytest.mark.parametrize("extra", [
+    "  max_choices: 0\n",  # 低于下限
+    "prompt_cache:\n  threshold: 2\n",
+    "stream:\n  overflow: block\n",
+    "logging:\n  sample_rates:\n    token: 1.5\n",
+])
+def test_invalid_values_are_rejected_as_a_whole(config_file, calls, extra):
+    before = resolve(settings)
+    # 同一次重新加载中合法的变更也不会生效
+    write(config_file, extra + "deadline:\n  default_timeout: 5\n")
+    with pytest.raises(ReloadError):
+        reload_settings()
+    assert resolve(settings) is before
+    assert settings.DEADLINE_DEFAULT_TIMEOUT == 0
+    assert calls == []
+
+
+def test_unparseable_config_is_rejected(config_file, calls):
+    before = resolve(settings)
+    config_file.write_text("agent: [unclosed\n", encoding="utf-8")
+    with pytest.raises(ReloadError):
+        reload_settings()
+    assert resolve(settings) is before
+    assert calls == []
+
+
+def test_restart_required_settings_are_reported_not_applied(config_file, calls):
+    port = settings.SERVER_PORT
+    write(config_file, "server:\n  port: 9999\n")
+    report = reload_settings()
+    assert report["changed"] == {}
+    assert "SERVER_PORT" in report["restart_required"]
+    assert settings.SERVER_PORT == port
+    assert calls == []
+
+
+def test_admin_reload_returns_400_on_invalid_config(config_file, monkeypatch):
+    from main import app
+    monkeypatch.setattr(settings, "ADMIN_AUTH_KEY", "admin")
+    client = TestClient(app)
+    headers = {"Authorization": "Bearer admin"}
+
+    write(config_file, "  max_choices: 0\n")
+    response = client.post("/admin/reload", headers=headers)
+    assert response.status_code == 400
+    assert "MAX_CHOICES" in response.json()["detail"]
+
+    write(config_file, "  max_choices: 2\n")
+    response = client.post("/admin/reload", headers=headers)
+    assert response.status_code == 200
+    assert response.json()["changed"] == {"MAX_CHOICES": [8, 2]}
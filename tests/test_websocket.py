@@ -0,0 +1,102 @@
+"""WebSocket 多轮聊天：固定的上游会话、每轮的结束与错误、提前结束与排空"""
+
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect
+
+from app.core.config import settings
+from app.core.drain import drain_controller
+from app.services.agent_service import agent_service
+from app.services.stream_buffer import stream_registry
+from tests.fake_upstream import MESSAGE_END, failed, message
+
+
+@pytest.fixture
+def client(upstream):
+    from main import app
+    return TestClient(app)
+
+
+def turn(ws, content, **extra):
+    """发送一轮消息，返回 (拼接的增量, 结束帧或错误帧)"""
+    ws.send_text(json.dumps({"content": content, **extra}))
+    parts = []
+    while True:
+        frame = json.loads(ws.receive_text())
+        if frame["t"] == "d":
+            parts.append(frame["c"])
+        else:
+            return "".join(parts), frame
+
+
+def test_turns_share_one_upstream_conversation_across_store_eviction(client, upstream, monkeypatch):
+    upstream.replies += [[message("你好"), MESSAGE_END], [message("其他回答"), MESSAGE_END],
+                         [message("第二轮"), MESSAGE_END]]
+    with client.websocket_connect("/v1/chat/ws") as ws:
+        assert json.loads(ws.receive_text())["t"] == "ready"
+        text, end = turn(ws, "你好", system="你是助手")
+        assert text == "你好"
+        assert end["t"] == "e"
+        assert end["r"] == "stop"
+        assert end["u"][1] == 2
+
+        # 会话存储淘汰全部会话，并有其他请求创建新的会话
+        monkeypatch.setattr(settings, "MAX_CONVERSATIONS", 0)
+        agent_service.cleanup_old_conversations()
+        assert client.post("/v1/chat/completions", json={
+            "model": "m", "messages": [{"role": "user", "content": "其他请求"}]
+        }).status_code == 200
+
+        text, end = turn(ws, "继续")
+        assert text == "第二轮"
+        assert end["t"] == "e"
+
+    ws_queries = [query for query in upstream.queries if "其他请求" not in query[1]]
+    assert [conversation for conversation, _ in ws_queries] == ["conv-0", "conv-0"]
+    assert "你是助手" in ws_queries[0][1]
+    assert ws_queries[1][1] == "[USER]: 继续"
+    assert stream_registry.snapshot()["producers"] == 0
+
+
+def test_failed_turn_reports_error_and_keeps_connection(client, upstream):
+    upstream.replies += [[message("partial "), failed("boom")], [message("ok"), MESSAGE_END]]
+    with client.websocket_connect("/v1/chat/ws") as ws:
+        ws.receive_text()
+        text, frame = turn(ws, "q1")
+        assert text == "partial "
+        assert frame["t"] == "err"
+        assert "boom" in frame["m"]
+        assert turn(ws, "q2")[0] == "ok"
+
+
+def test_stop_sequence_ends_turn_and_closes_upstream(client, upstream):
+    upstream.replies.append([message("hello END world"), message("more"), MESSAGE_END])
+    with client.websocket_connect("/v1/chat/ws") as ws:
+        ws.receive_text()
+        text, frame = turn(ws, "q", stop="END")
+        assert text == "hello "
+        assert frame["r"] == "stop"
+    assert upstream.responses[0].closed
+
+
+def test_invalid_frame_is_rejected(client, upstream):
+    with client.websocket_connect("/v1/chat/ws") as ws:
+        ws.receive_text()
+        ws.send_text("not json")
+        assert json.loads(ws.receive_text())["t"] == "err"
+        ws.send_text(json.dumps({"content": "q", "stop": ["a", "b", "c", "d", "e"]}))
+        assert json.loads(ws.receive_text())["t"] == "err"
+    assert upstream.queries == []
+
+
+def test_draining_closes_after_turn(client, upstream, monkeypatch):
+    with client.websocket_connect("/v1/chat/ws") as ws:
+        ws.receive_text()
+        monkeypatch.setattr(drain_controller, "draining", True)
+        ws.send_text(json.dumps({"content": "q"}))
+        with pytest.raises(WebSocketDisconnect) as info:
+            ws.receive_text()
+        assert info.value.code == 1013
+    assert upstream.queries == []